@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Amazon Settlement Importer
+Liest JTL-Amazon-Rohdaten (pf_amazon_settlementpos als CSV, z.B. jtl-amazon-oktober-2025-ROHDATEN.csv)
+und erzeugt buchungsfertige Datensätze wie app/lib/fibu/amazon-import-v2.ts:
+
+- Pro OrderID und TransactionType eine Buchung je Block: Umsatz (ItemPrice Principal/Tax/Shipping/
+  ShippingTax -> 69001), Gebühren (Commission/ShippingHB -> 6770), Werbung (-> 6600),
+  Marketplace Facilitator VAT (-> 1370); Refunds als eine Buchung (ItemPrice + ItemFees -> 148328)
+- Einzeln: Geldtransit/Transfers und Zeilen ohne OrderID (-> 1460), ServiceFee (-> 6600 über 1813),
+  other-transaction (-> 6770)
+- Dazu eine Summe pro SettlementID
+
+Die Dateien werden in Blöcken (--chunk-rows) gelesen, Beträge und Zeitpunkte spaltenweise geparst.
+Die Rohdaten bleiben nicht im Speicher, wohl aber die Summen pro Order und Block bis zum Ende, weil die
+Zeilen einer Order über Blöcke und Dateien verteilt sein können; der Speicher wächst also mit der Zahl
+der Orders. Jeder Block wird für sich gruppiert und erst am Ende einmal zusammengefasst
+(SettlementAggregator), damit auch ein ganzes Jahr (mehrere Dateien in einem Aufruf) in einem
+Durchlauf importiert wird.
+
+CLI:
+    amazon_settlement_importer.py ROHDATEN.csv [...] [-o buchungen.jsonl|buchungen.parquet]
+                                  [--rechnungen rechnungen.json] [--chunk-rows N]
+Ohne -o gehen die Buchungen als JSON-Zeilen nach stdout, sonst wird dort die Zusammenfassung ausgegeben.
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Add invoice_parsers to path (Ereignisprotokoll)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
+
+from helpers.event_log import log
+
+# Zeilen pro Block beim Lesen
+CHUNK_ROWS = int(os.getenv("AMAZON_IMPORT_CHUNK_ROWS", "50000"))
+
+SPALTEN = [
+    "kMessageId", "PostedDateTime", "TransactionType", "OrderID", "MerchantOrderID", "AmountType",
+    "AmountDescription", "Amount", "QuantityPurchased", "SellerSKU", "MarketplaceName", "SettlementID",
+]
+BENOETIGTE_SPALTEN = ["kMessageId", "PostedDateTime", "TransactionType", "OrderID", "AmountType", "AmountDescription", "Amount"]
+
+# Konten wie in amazon-import-v2.ts
+BANK_KONTO = "1814"
+BANK_KONTO_SERVICEFEE = "1813"
+KONTO_SAMMELDEBITOR = "69001"
+KONTO_GEBUEHREN = "6770"
+KONTO_WERBUNG = "6600"
+KONTO_VORSTEUER = "1370"
+KONTO_GELDTRANSIT = "1460"
+KONTO_RUECKERSTATTUNG = "148328"
+STEUERSCHLUESSEL_VORSTEUER_19 = "401"
+
+UMSATZ_BESCHREIBUNGEN = ["Principal", "Tax", "Shipping", "ShippingTax"]
+GEBUEHREN_BESCHREIBUNGEN = ["Commission", "ShippingHB"]
+
+BLOCK_UMSATZ = "umsatz"
+BLOCK_GEBUEHREN = "gebuehren"
+BLOCK_WERBUNG = "werbung"
+BLOCK_VORSTEUER = "vorsteuer"
+BLOCK_REFUND = "refund"
+ART_TRANSFER = "transfer"
+ART_SERVICEFEE = "servicefee"
+ART_OTHER = "other"
+
+BUCHUNG_SPALTEN = [
+    "datum", "betrag", "waehrung", "bank_konto_nr", "gegenkonto_konto_nr", "order_id", "au_nummer",
+    "rechnungsnummer", "transaktionsId", "verwendungszweck", "bemerkung", "anbieter", "quelle",
+    "transaction_type", "amount_type", "amount_description", "steuerschluessel", "settlement_id", "marketplace",
+]
+
+GRUPPE = ["OrderID", "TransactionType"]
+
+
+def parse_betraege(spalte: pd.Series) -> pd.Series:
+    """
+    Beträge in Cent (Int64, <NA> bei ungültigen Werten); Punkt als Dezimaltrenner wie im JTL-Export,
+    Werte mit Komma werden deutsch gelesen ("1.234,56")
+    """
+    text = spalte.fillna("").str.strip()
+    deutsch = text.str.contains(",", regex=False)
+    if deutsch.any():
+        text = text.where(~deutsch, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    werte = pd.to_numeric(text, errors="coerce")
+    return (werte * 100).round().astype("Int64")
+
+
+def parse_zeitpunkte(spalte: pd.Series) -> pd.Series:
+    """
+    Zeitpunkte in UTC aus JavaScript-Datumstexten ("Wed Oct 01 2025 09:18:38 GMT+0000 (GMT)"),
+    andere Schreibweisen (ISO) als Rückfall
+    """
+    zeit = pd.to_datetime(spalte.str.slice(4, 24), format="%b %d %Y %H:%M:%S", errors="coerce")
+    offset = spalte.str.extract(r"GMT([+-])(\d{2})(\d{2})")
+    vorzeichen = np.where(offset[0] == "-", -1, 1)
+    minuten = pd.to_numeric(offset[1], errors="coerce").fillna(0) * 60 + pd.to_numeric(offset[2], errors="coerce").fillna(0)
+    zeit = zeit - pd.to_timedelta(vorzeichen * minuten, unit="min")
+    rest = zeit.isna() & spalte.notna()
+    if rest.any():
+        zeit[rest] = pd.to_datetime(spalte[rest], errors="coerce", utc=True, format="ISO8601").dt.tz_localize(None)
+    return zeit
+
+
+def classify(chunk: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """
+    Returns:
+        tuple: (Art der Einzelbuchung oder "", Block der Order-/Refund-Aggregation oder "")
+    """
+    tt = chunk["TransactionType"]
+    at = chunk["AmountType"]
+    ad = chunk["AmountDescription"]
+
+    transfer = (tt == "Transfer") | (at == "Transfer") | ad.str.contains("transfer", case=False, regex=False)
+    servicefee = ~transfer & (tt == "ServiceFee")
+    other = ~transfer & ~servicefee & (tt == "other-transaction")
+    # Ohne OrderID (und ohne andere Einordnung) als Geldtransit
+    transfer |= ~servicefee & ~other & (chunk["OrderID"] == "")
+    art = pd.Series(np.select([transfer, servicefee, other], [ART_TRANSFER, ART_SERVICEFEE, ART_OTHER], ""), index=chunk.index)
+
+    gruppe = art == ""
+    refund = gruppe & (tt == "Refund")
+    order = gruppe & ~refund
+    block = np.select(
+        [
+            refund & at.isin(["ItemPrice", "ItemFees"]),
+            order & (at == "ItemPrice") & ad.isin(UMSATZ_BESCHREIBUNGEN),
+            order & (at == "ItemFees") & ad.isin(GEBUEHREN_BESCHREIBUNGEN),
+            order & (at == "ItemFees") & (ad.str.contains("ServiceFee", regex=False) | ad.str.contains("Cost of Advertising", regex=False)),
+            order & (at == "ItemWithheldTax"),
+        ],
+        [BLOCK_REFUND, BLOCK_UMSATZ, BLOCK_GEBUEHREN, BLOCK_WERBUNG, BLOCK_VORSTEUER],
+        "",
+    )
+    return art, pd.Series(block, index=chunk.index)
+
+
+def au_nummern(merchant: pd.Series, order: pd.Series, zeit: pd.Series) -> pd.Series:
+    """AU-Nummer aus MerchantOrderID ("..._E_12345" -> AU<Jahr>-12345), sonst die OrderID."""
+    nummer = merchant.str.extract(r"_E_(\d+)", expand=False)
+    au = "AU" + zeit.dt.year.astype("Int64").astype(str) + "-" + nummer
+    return au.where(nummer.notna(), order)
+
+
+def _kunde(merchant: pd.Series, order: pd.Series) -> pd.Series:
+    return merchant.str.split("_").str[0].where(merchant != "", order)
+
+
+def _beleg(rechnungsnummer: str | None, au_nummer: str, refund: bool) -> str:
+    """Belegnummer XRE-... (Order) bzw. XRK-... (Refund) wie createXREBeleg/createXRKBeleg."""
+    nummer = au_nummer.split("-", 1)[1] if au_nummer.startswith("AU") and "-" in au_nummer else au_nummer.replace("AU", "")
+    if refund:
+        if rechnungsnummer and rechnungsnummer.startswith("XRE-"):
+            return "XRK-" + rechnungsnummer[4:]
+        if rechnungsnummer and rechnungsnummer.startswith("XRK-"):
+            return rechnungsnummer
+        return f"XRK-{nummer}" if nummer else ""
+    if rechnungsnummer:
+        return rechnungsnummer if rechnungsnummer.startswith("XRE-") else f"XRE-{rechnungsnummer}"
+    return f"XRE-{nummer}" if nummer else ""
+
+
+def _buchungen(basis: pd.DataFrame, **felder) -> pd.DataFrame:
+    """Buchungen mit BUCHUNG_SPALTEN aus gemeinsamen Spalten (datum, betrag, ...) und festen Werten."""
+    df = pd.DataFrame(index=basis.index)
+    for spalte in BUCHUNG_SPALTEN:
+        wert = felder.get(spalte, basis[spalte] if spalte in basis else None)
+        df[spalte] = wert
+    df["waehrung"] = "EUR"
+    df["anbieter"] = "Amazon"
+    df["quelle"] = "jtl_amazon_settlement"
+    return df
+
+
+def einzelbuchungen(chunk: pd.DataFrame, art: pd.Series) -> pd.DataFrame:
+    """Nicht aggregierte Zeilen (Transfer, ServiceFee, other-transaction), eine Buchung pro Zeile."""
+    zeilen = chunk[art != ""]
+    art = art[art != ""]
+    if zeilen.empty:
+        return pd.DataFrame(columns=BUCHUNG_SPALTEN)
+    k = zeilen["kMessageId"]
+    at, ad = zeilen["AmountType"], zeilen["AmountDescription"]
+    transfer, servicefee = art == ART_TRANSFER, art == ART_SERVICEFEE
+    basis = pd.DataFrame({
+        "datum": zeilen["zeit"].dt.strftime("%Y-%m-%d"),
+        "betrag": zeilen["cent"] / 100,
+        "order_id": zeilen["OrderID"],
+        "settlement_id": zeilen["SettlementID"],
+        "marketplace": zeilen["MarketplaceName"],
+    })
+    return _buchungen(
+        basis,
+        bank_konto_nr=np.where(servicefee, BANK_KONTO_SERVICEFEE, BANK_KONTO),
+        gegenkonto_konto_nr=np.select([transfer, servicefee], [KONTO_GELDTRANSIT, KONTO_WERBUNG], KONTO_GEBUEHREN),
+        au_nummer="",
+        rechnungsnummer=None,
+        transaktionsId=k + "_" + art.map({ART_TRANSFER: "transfer", ART_SERVICEFEE: "servicefee", ART_OTHER: "other"}),
+        verwendungszweck=np.select(
+            [transfer, servicefee], ["Amazon Geldtransit", "Kosten für Werbung"], ad.where(ad != "", "Sonstige Transaktion")
+        ),
+        bemerkung=np.select(
+            [transfer, servicefee], ["Transfer", "ServiceFee/" + at + "/" + ad], "other-transaction/" + at + "/" + ad
+        ),
+        transaction_type=np.select([transfer, servicefee], ["Transfer", "ServiceFee"], "other-transaction"),
+        amount_type=np.where(transfer, "Transfer", at),
+        amount_description=np.where(transfer, "Transfer", ad),
+        steuerschluessel=np.where(transfer, None, STEUERSCHLUESSEL_VORSTEUER_19),
+    )
+
+
+def _zusammenfassen(teile: list[pd.DataFrame], level: list[int], **aggregation) -> pd.DataFrame:
+    """
+    Fasst die Teilergebnisse der Blöcke zu einem zusammen und ersetzt sie dadurch
+    (ohne aggregation: die Werte der zuerst gelesenen Zeile je Schlüssel)
+    """
+    if len(teile) > 1:
+        gruppen = pd.concat(teile).groupby(level=level, sort=False)
+        teile[:] = [gruppen.agg(**aggregation) if aggregation else gruppen.first()]
+    return teile[0] if teile else pd.DataFrame()
+
+
+class SettlementAggregator:
+    """
+    Teilergebnisse pro gelesenem Block: Kopf pro (OrderID, TransactionType) mit den Werten der ersten
+    Zeile, Summen pro (OrderID, TransactionType, Block) und pro SettlementID. add() rechnet nur den
+    neuen Block, zusammengefasst wird einmal in buchungen() bzw. settlement_summen().
+    """
+
+    def __init__(self):
+        self._koepfe: list[pd.DataFrame] = []
+        self._bloecke: list[pd.DataFrame] = []
+        self._settlements: list[pd.DataFrame] = []
+
+    def add(self, chunk: pd.DataFrame, block: pd.Series, art: pd.Series):
+        gruppe = chunk[art == ""]
+        if not gruppe.empty:
+            self._koepfe.append(
+                gruppe.groupby(GRUPPE, sort=False)[["kMessageId", "zeit", "MerchantOrderID", "SettlementID", "MarketplaceName"]].first()
+            )
+        mit_block = gruppe.assign(block=block[art == ""])
+        mit_block = mit_block[mit_block["block"] != ""]
+        if not mit_block.empty:
+            self._bloecke.append(mit_block.groupby(GRUPPE + ["block"], sort=False).agg(
+                cent=("cent", "sum"), beschreibungen=("AmountDescription", ", ".join)
+            ))
+        if not chunk.empty:
+            self._settlements.append(chunk.groupby("SettlementID", sort=False).agg(
+                cent=("cent", "sum"), zeilen=("cent", "size"), von=("zeit", "min"), bis=("zeit", "max")
+            ))
+
+    @property
+    def koepfe(self) -> pd.DataFrame:
+        # Teilergebnisse in Lesereihenfolge, "first" bleibt die zuerst gelesene Zeile
+        return _zusammenfassen(self._koepfe, [0, 1])
+
+    @property
+    def bloecke(self) -> pd.DataFrame:
+        return _zusammenfassen(self._bloecke, [0, 1, 2], cent=("cent", "sum"), beschreibungen=("beschreibungen", ", ".join))
+
+    @property
+    def settlements(self) -> pd.DataFrame:
+        return _zusammenfassen(
+            self._settlements, [0], cent=("cent", "sum"), zeilen=("zeilen", "sum"), von=("von", "min"), bis=("bis", "max")
+        )
+
+    def buchungen(self, rechnungen: dict[str, str] | None = None) -> pd.DataFrame:
+        """Die aggregierten Order-/Refund-Buchungen (Beträge unter 1 Cent entfallen)."""
+        bloecke = self.bloecke
+        if bloecke.empty:
+            return pd.DataFrame(columns=BUCHUNG_SPALTEN)
+        df = bloecke.reset_index().merge(self.koepfe.reset_index(), on=GRUPPE, how="left")
+        df = df[df["cent"].abs() >= 1].reset_index(drop=True)
+
+        order, tt, block, b = df["OrderID"], df["TransactionType"], df["block"], df["beschreibungen"]
+        au = au_nummern(df["MerchantOrderID"], order, df["zeit"])
+        rechnungen = rechnungen or {}
+        rechnungsnummer = au.map(rechnungen).fillna(order.map(rechnungen))
+        refund = block == BLOCK_REFUND
+        beleg = pd.Series(
+            [_beleg(r if isinstance(r, str) else None, a, ist_refund) for r, a, ist_refund in zip(rechnungsnummer, au, refund)],
+            index=df.index, dtype=object,
+        )
+        kunde = _kunde(df["MerchantOrderID"], order)
+        ist = {name: block == name for name in (BLOCK_UMSATZ, BLOCK_GEBUEHREN, BLOCK_WERBUNG, BLOCK_VORSTEUER)}
+        bedingungen = [refund, ist[BLOCK_UMSATZ], ist[BLOCK_GEBUEHREN], ist[BLOCK_WERBUNG], ist[BLOCK_VORSTEUER]]
+
+        basis = pd.DataFrame({
+            "datum": df["zeit"].dt.strftime("%Y-%m-%d"),
+            "betrag": df["cent"] / 100,
+            "order_id": order,
+            "au_nummer": au,
+            "settlement_id": df["SettlementID"],
+            "marketplace": df["MarketplaceName"],
+        })
+        return _buchungen(
+            basis,
+            bank_konto_nr=BANK_KONTO,
+            gegenkonto_konto_nr=np.select(
+                bedingungen, [KONTO_RUECKERSTATTUNG, KONTO_SAMMELDEBITOR, KONTO_GEBUEHREN, KONTO_WERBUNG, KONTO_VORSTEUER], ""
+            ),
+            rechnungsnummer=beleg,
+            transaktionsId=df["kMessageId"] + block.map({
+                BLOCK_REFUND: "_refund", BLOCK_UMSATZ: "", BLOCK_GEBUEHREN: "_fees",
+                BLOCK_WERBUNG: "_werbung", BLOCK_VORSTEUER: "_vorsteuer",
+            }),
+            verwendungszweck=np.select(bedingungen, [
+                beleg + " " + kunde + " Rückerstattung: " + b,
+                beleg + " " + kunde + " " + b,
+                kunde + " Amazon " + b,
+                "Amazon Werbekosten " + b,
+                "Amazon Marketplace Facilitator VAT " + b,
+            ], ""),
+            bemerkung=np.select(bedingungen, [
+                "Refund/" + b,
+                tt + "/ItemPrice/Principal",
+                tt + "/ItemFees/Commission",
+                tt + "/ItemFees/" + b,
+                tt + "/ItemWithheldTax/MarketplaceFacilitatorVAT",
+            ], ""),
+            transaction_type=tt,
+            amount_type=np.select(bedingungen, ["Refund", "ItemPrice", "ItemFees", "ItemFees", "ItemWithheldTax"], ""),
+            amount_description=b,
+            steuerschluessel=np.where(ist[BLOCK_GEBUEHREN] | ist[BLOCK_WERBUNG], STEUERSCHLUESSEL_VORSTEUER_19, None),
+        )
+
+    def settlement_summen(self) -> list[dict]:
+        return [
+            {
+                "settlement_id": settlement_id,
+                "betrag": int(zeile.cent) / 100,
+                "zeilen": int(zeile.zeilen),
+                "von": zeile.von.strftime("%Y-%m-%d") if pd.notna(zeile.von) else None,
+                "bis": zeile.bis.strftime("%Y-%m-%d") if pd.notna(zeile.bis) else None,
+            }
+            for settlement_id, zeile in self.settlements.iterrows()
+        ]
+
+
+class BuchungsWriter:
+    """
+    Schreibt Buchungen als JSON-Zeilen oder Parquet (benötigt pyarrow)
+    Args:
+        path (str): Zieldatei, "-" für stdout (JSON-Zeilen); Format nach Endung .parquet/.jsonl
+    """
+
+    def __init__(self, path: str = "-"):
+        self.path = path
+        self.anzahl = 0
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        if self.parquet:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("Parquet-Ausgabe benötigt pyarrow (pip install pyarrow)") from None
+            self._pa = pyarrow
+            self._pq = pyarrow.parquet
+            self._schema = pyarrow.schema(
+                [(spalte, pyarrow.float64() if spalte == "betrag" else pyarrow.string()) for spalte in BUCHUNG_SPALTEN]
+            )
+            self._stream = None
+        else:
+            self._stream = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, buchungen: pd.DataFrame):
+        if buchungen.empty:
+            return
+        buchungen = buchungen[BUCHUNG_SPALTEN]
+        if self.parquet:
+            if self._writer is None:
+                self._writer = self._pq.ParquetWriter(self.path, self._schema)
+            self._writer.write_table(self._pa.Table.from_pandas(buchungen, schema=self._schema, preserve_index=False))
+        else:
+            werte = buchungen.astype(object).where(buchungen.notna(), None)
+            for buchung in werte.to_dict("records"):
+                self._stream.write(json.dumps(buchung, ensure_ascii=False) + "\n")
+            self._stream.flush()
+        self.anzahl += len(buchungen)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        elif self._stream is not None and self._stream is not sys.stdout:
+            self._stream.close()
+
+
+def read_chunks(path: str, chunk_rows: int = CHUNK_ROWS, encoding: str = "utf-8-sig"):
+    """Blöcke der Rohdaten mit Spalten cent (Int64) und zeit (UTC) statt Amount/PostedDateTime-Text."""
+    reader = pd.read_csv(
+        path, sep=";", dtype=str, keep_default_na=False, chunksize=chunk_rows,
+        encoding=encoding, usecols=lambda spalte: spalte in SPALTEN,
+    )
+    with reader:
+        for chunk in reader:
+            fehlend = [spalte for spalte in BENOETIGTE_SPALTEN if spalte not in chunk.columns]
+            if fehlend:
+                raise ValueError(f"{path}: Spalten fehlen: {', '.join(fehlend)}")
+            for spalte in SPALTEN:
+                if spalte not in chunk.columns:
+                    chunk[spalte] = ""
+                else:
+                    chunk[spalte] = chunk[spalte].str.strip()
+            chunk["cent"] = parse_betraege(chunk["Amount"])
+            chunk["zeit"] = parse_zeitpunkte(chunk["PostedDateTime"])
+            yield chunk
+
+
+def import_settlements(paths: list[str], writer: BuchungsWriter, rechnungen: dict[str, str] | None = None,
+                       chunk_rows: int = CHUNK_ROWS, encoding: str = "utf-8-sig") -> dict:
+    """
+    Importiert eine oder mehrere Rohdaten-Dateien in einem Durchlauf
+    Returns:
+        dict: Zusammenfassung (Zeilen, Buchungen, ignorierte/ungültige Zeilen, Summen pro Settlement)
+    """
+    start = time.perf_counter()
+    aggregator = SettlementAggregator()
+    zeilen = ungueltig = ignoriert = ignoriert_cent = 0
+    for path in paths:
+        for chunk in read_chunks(path, chunk_rows, encoding):
+            zeilen += len(chunk)
+            gueltig = chunk["cent"].notna() & chunk["zeit"].notna()
+            if not gueltig.all():
+                ungueltig += int((~gueltig).sum())
+                log.warning("amazon_rows_invalid", "Zeilen mit ungültigem Betrag/Datum übersprungen",
+                            path=path, rows=int((~gueltig).sum()))
+                chunk = chunk[gueltig]
+            art, block = classify(chunk)
+            # Order-Zeilen ohne Block (z.B. DigitalServicesFee) bucht auch amazon-import-v2.ts nicht
+            ohne_buchung = (art == "") & (block == "")
+            ignoriert += int(ohne_buchung.sum())
+            ignoriert_cent += int(chunk.loc[ohne_buchung, "cent"].sum())
+            writer.write(einzelbuchungen(chunk, art))
+            aggregator.add(chunk, block, art)
+    writer.write(aggregator.buchungen(rechnungen))
+    return {
+        "success": True,
+        "zeilen": zeilen,
+        "buchungen": writer.anzahl,
+        "ignoriert": ignoriert,
+        "ignoriert_betrag": ignoriert_cent / 100,
+        "ungueltig": ungueltig,
+        "settlements": aggregator.settlement_summen(),
+        "sekunden": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Amazon Settlement Importer (JTL-Rohdaten -> Buchungen)")
+    cli.add_argument("dateien", nargs="+", metavar="ROHDATEN", help="CSV-Dateien (;-getrennt) aus pf_amazon_settlementpos")
+    cli.add_argument("-o", "--output", default="-", help="Ziel: .jsonl oder .parquet (Standard: JSON-Zeilen nach stdout)")
+    cli.add_argument("--rechnungen", help="JSON-Objekt AU-Nummer/OrderID -> Rechnungsnummer für die Belegnummern")
+    cli.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Zeilen pro Block beim Lesen")
+    cli.add_argument("--encoding", default="utf-8-sig", help="Zeichensatz der CSV-Dateien")
+    args = cli.parse_args()
+
+    try:
+        rechnungen = None
+        if args.rechnungen:
+            with open(args.rechnungen, "r", encoding="utf-8") as f:
+                rechnungen = json.load(f)
+        writer = BuchungsWriter(args.output)
+        try:
+            with log.timed("amazon_import", files=len(args.dateien)) as felder:
+                zusammenfassung = import_settlements(args.dateien, writer, rechnungen, args.chunk_rows, args.encoding)
+                felder.update(rows=zusammenfassung["zeilen"], bookings=zusammenfassung["buchungen"])
+        finally:
+            writer.close()
+    except (OSError, ValueError, RuntimeError) as e:
+        log.error("amazon_import_failed", str(e))
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+        sys.exit(1)
+
+    if args.output == "-":
+        log.info("amazon_import_summary", "", **{k: v for k, v in zusammenfassung.items() if k != "settlements"})
+    else:
+        print(json.dumps({**zusammenfassung, "output": args.output}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
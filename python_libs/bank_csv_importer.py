@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Bank CSV Importer
+Liest Kontoumsätze aus Bank-CSV-Exporten (Postbank, Commerzbank) und gibt normalisierte
+Transaktionen als JSON-Zeilen aus, wie sie app/api/fibu/bank-import in fibu_bank_transaktionen ablegt.
+
+- Format-Profile pro Bank (BANK_PROFILE): Erkennung an der Kopfzeile, Spaltennamen je Feld
+- Zeichensatz und Trennzeichen werden am ersten KB der Datei erkannt, Vorspannzeilen (Postbank) übersprungen
+- Datum und Betrag (deutsche Schreibweise) werden spaltenweise geparst, Dateien in Blöcken gelesen
+- Rechnungs- und Auftragsnummern (RE2025-…, XRE-…, GU2025-…, AU2025-…, AU_…) aus dem Verwendungszweck
+  mit einem einzigen vorkompilierten Muster (REFERENZ_MUSTER)
+
+CLI:
+    bank_csv_importer.py KONTOUMSAETZE.csv [...] [-o transaktionen.jsonl] [--profil postbank|commerzbank]
+Ohne -o gehen die Transaktionen nach stdout, sonst wird dort die Zusammenfassung ausgegeben.
+"""
+
+import sys
+import os
+import re
+import csv
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Add invoice_parsers to path (Ereignisprotokoll)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
+
+from helpers.event_log import log
+
+# Zeilen pro Block beim Lesen
+CHUNK_ROWS = int(os.getenv("BANK_IMPORT_CHUNK_ROWS", "50000"))
+# Bytes für die Erkennung von Zeichensatz und Trennzeichen
+SNIFF_BYTES = 1024
+# Zeilen, in denen die Kopfzeile gesucht wird (Postbank hat Vorspannzeilen mit Konto und Zeitraum)
+HEADER_SUCHE_ZEILEN = 20
+TRENNZEICHEN = ";,\t|"
+
+# Profil -> Erkennung (alle Spalten müssen in der Kopfzeile stehen), Quelle und Spalten je Feld
+# (die erste vorhandene Spalte gilt); Reihenfolge wie die Format-Erkennung in bank-import/route.ts
+BANK_PROFILE = {
+    "postbank": {
+        "erkennung": ("Buchungstag", "Begünstigter / Auftraggeber", "Verwendungszweck"),
+        "quelle": "postbank",
+        "datum": ("Buchungstag", "Wert", "Wertstellung"),
+        "wertstellung": ("Wert", "Wertstellung"),
+        "verwendungszweck": ("Verwendungszweck",),
+        "auftraggeber": ("Begünstigter / Auftraggeber", "Auftraggeber", "Empfänger"),
+        "buchungstext": ("Umsatzart", "Buchungstext"),
+        "iban": ("IBAN / Kontonummer", "IBAN"),
+        "bic": ("BIC",),
+        # Getrennte Spalten: Haben positiv, Soll negativ
+        "soll": ("Soll",),
+        "haben": ("Haben",),
+        "betrag": ("Betrag",),
+        "waehrung": ("Währung",),
+        "referenz": (),
+    },
+    "postbank_alt": {
+        "erkennung": ("Buchungstag", "Verwendungszweck"),
+        "quelle": "postbank",
+        "datum": ("Buchungstag", "Wertstellung"),
+        "wertstellung": ("Wertstellung",),
+        "verwendungszweck": ("Verwendungszweck",),
+        "auftraggeber": ("Auftraggeber", "Empfänger"),
+        "buchungstext": ("Buchungstext",),
+        "iban": ("IBAN",),
+        "bic": ("BIC",),
+        "soll": ("Soll",),
+        "haben": ("Haben",),
+        "betrag": ("Betrag",),
+        "waehrung": ("Währung",),
+        "referenz": (),
+    },
+    "commerzbank": {
+        "erkennung": ("Buchungstag", "Umsatzart"),
+        "quelle": "Commerzbank",
+        "datum": ("Buchungstag", "Wertstellung"),
+        "wertstellung": ("Wertstellung",),
+        # Im Commerzbank-Export steht der Verwendungszweck in "Buchungstext"
+        "verwendungszweck": ("Verwendungszweck", "Vorgang/Verwendungszweck", "Buchungstext"),
+        "auftraggeber": ("Auftraggeber/Zahlungsempfänger", "Auftraggeber", "Zahlungsempfänger"),
+        "buchungstext": ("Umsatzart",),
+        "iban": ("IBAN Auftraggeberkonto", "IBAN"),
+        "bic": ("BIC Auftraggeberkonto", "BIC"),
+        "soll": (),
+        "haben": (),
+        "betrag": ("Betrag", "Umsatz in EUR"),
+        "waehrung": ("Währung",),
+        "referenz": ("Umsatzreferenz",),
+    },
+}
+
+# Rechnungen (VK RE2025-…, Amazon XRE-…, Gutschriften GU2025-…) und Aufträge (AU2025-…, AU_12345_SW6);
+# das Shop-Kürzel gehört zur Auftragsnummer (AU_PATTERNS in app/lib/fibu/matching-engine.ts)
+REFERENZ_MUSTER = re.compile(
+    r"(?<![A-Za-z0-9])(?:(?P<rechnung>XRE-\d+|RE\d{4}-\d+|GU\d{4}-\d+)"
+    r"|(?P<auftrag>AU\d{4}-\d+|AU[_-]\d+(?:_[A-Z0-9]+(?![A-Za-z0-9]))?))"
+)
+
+TRANSAKTION_SPALTEN = [
+    "datum", "wertstellung", "betrag", "waehrung", "verwendungszweck", "auftraggeber", "buchungstext",
+    "iban", "bic", "referenz", "quelle", "format", "rechnungsnummer", "auftragsnummer", "referenzen",
+]
+
+
+class BankFormatFehler(ValueError):
+    """Datei passt zu keinem Bank-Profil"""
+
+    def __init__(self, path: str, grund: str):
+        self.path = path
+        self.grund = grund
+        super().__init__(f"{path}: {grund}")
+
+
+def sniff(path: str) -> tuple[str, str]:
+    """
+    Zeichensatz und Trennzeichen aus dem ersten KB
+    Returns:
+        tuple: (encoding, delimiter); UTF-8 (mit/ohne BOM), sonst cp1252 wie bei Bank-Exporten üblich
+    """
+    with open(path, "rb") as f:
+        probe = f.read(SNIFF_BYTES)
+    if probe.startswith(b"\xef\xbb\xbf"):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            probe.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError as e:
+            # Am Ende abgeschnittenes Mehrbyte-Zeichen ist noch UTF-8
+            encoding = "utf-8" if e.start >= len(probe) - 3 and e.reason == "unexpected end of data" else "cp1252"
+    text = probe.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=TRENNZEICHEN).delimiter
+    except csv.Error:
+        delimiter = ";"
+    return encoding, delimiter
+
+
+def detect_profile(path: str, encoding: str, delimiter: str, profil: str | None = None) -> tuple[str, int, list[str]]:
+    """
+    Sucht die Kopfzeile in den ersten HEADER_SUCHE_ZEILEN Zeilen
+    Args:
+        profil: Profil erzwingen statt erkennen
+    Returns:
+        tuple: (Profil, Anzahl Zeilen vor der Kopfzeile, Spaltennamen)
+    """
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as f:
+        for nummer, zeile in enumerate(csv.reader(f, delimiter=delimiter)):
+            if nummer >= HEADER_SUCHE_ZEILEN:
+                break
+            spalten = [spalte.strip() for spalte in zeile]
+            for name, eigenschaften in BANK_PROFILE.items():
+                if profil not in (None, name) and not (profil == "postbank" and name == "postbank_alt"):
+                    continue
+                if all(spalte in spalten for spalte in eigenschaften["erkennung"]):
+                    return name, nummer, spalten
+    raise BankFormatFehler(path, "keine Kopfzeile eines bekannten Bank-Formats gefunden")
+
+
+def parse_betraege(spalte: pd.Series) -> pd.Series:
+    """Deutsche Beträge ("1.234,56", "-150,00 €", "+41,07") in Cent (Int64, <NA> bei leer/ungültig)."""
+    text = spalte.str.replace(r"[^\d,.\-+]", "", regex=True).str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    return (pd.to_numeric(text, errors="coerce") * 100).round().astype("Int64")
+
+
+def parse_daten(spalte: pd.Series) -> pd.Series:
+    """Datum TT.MM.JJJJ (auch TT.MM.JJ und ISO) als datetime64, NaT bei ungültigen Werten."""
+    text = spalte.str.strip()
+    datum = pd.to_datetime(text, format="%d.%m.%Y", errors="coerce")
+    rest = datum.isna() & (text != "")
+    if rest.any():
+        datum[rest] = pd.to_datetime(text[rest], format="%d.%m.%y", errors="coerce")
+        rest = datum.isna() & (text != "")
+        if rest.any():
+            datum[rest] = pd.to_datetime(text[rest], format="ISO8601", errors="coerce")
+    return datum
+
+
+def extract_references(verwendungszweck: pd.Series) -> pd.DataFrame:
+    """
+    Returns:
+        DataFrame: rechnungsnummer und auftragsnummer (jeweils der erste Treffer oder None)
+                   und referenzen (alle Treffer in Reihenfolge) pro Zeile
+    """
+    # Eine Zeile pro Treffer, Index (Zeile, Treffer); genau eine der beiden Gruppen ist gesetzt
+    treffer = verwendungszweck.str.extractall(REFERENZ_MUSTER)
+    zeilen = treffer.index.get_level_values(0)
+    referenzen = treffer["rechnung"].fillna(treffer["auftrag"]).groupby(zeilen).agg(list).reindex(verwendungszweck.index)
+    ergebnis = pd.DataFrame({
+        "rechnungsnummer": treffer["rechnung"].groupby(zeilen).first().reindex(verwendungszweck.index),
+        "auftragsnummer": treffer["auftrag"].groupby(zeilen).first().reindex(verwendungszweck.index),
+    }, index=verwendungszweck.index).astype(object)
+    ergebnis = ergebnis.where(ergebnis.notna(), None)
+    ergebnis["referenzen"] = referenzen.where(referenzen.notna(), pd.Series([[]] * len(referenzen), index=referenzen.index, dtype=object))
+    return ergebnis
+
+
+def _spalte(chunk: pd.DataFrame, namen: tuple) -> pd.Series:
+    for name in namen:
+        if name in chunk.columns:
+            return chunk[name].str.strip()
+    return pd.Series("", index=chunk.index, dtype=object)
+
+
+def normalize(chunk: pd.DataFrame, profil: str) -> tuple[pd.DataFrame, int]:
+    """
+    Normalisierte Transaktionen eines Blocks
+    Returns:
+        tuple: (Transaktionen mit TRANSAKTION_SPALTEN, Anzahl verworfener Zeilen ohne Datum/Betrag)
+    """
+    p = BANK_PROFILE[profil]
+    datum = parse_daten(_spalte(chunk, p["datum"]))
+    cent = parse_betraege(_spalte(chunk, p["betrag"]))
+    if p["haben"] and any(name in chunk.columns for name in p["haben"]):
+        haben = parse_betraege(_spalte(chunk, p["haben"])).fillna(0)
+        soll = parse_betraege(_spalte(chunk, p["soll"])).fillna(0)
+        cent = pd.Series(np.where(haben != 0, haben, -soll.abs()), index=chunk.index).astype("Int64")
+    # Nullbeträge und Fußzeilen (Kontostand o.ä.) überspringen, wie bank-import/route.ts
+    gueltig = datum.notna() & cent.notna() & (cent != 0)
+    chunk, datum, cent = chunk[gueltig], datum[gueltig], cent[gueltig]
+
+    wertstellung = parse_daten(_spalte(chunk, p["wertstellung"]))
+    verwendungszweck = _spalte(chunk, p["verwendungszweck"])
+    transaktionen = pd.DataFrame({
+        "datum": datum.dt.strftime("%Y-%m-%d"),
+        "wertstellung": wertstellung.dt.strftime("%Y-%m-%d").astype(object).where(wertstellung.notna(), None),
+        "betrag": cent.astype("float64") / 100,
+        "waehrung": _spalte(chunk, p["waehrung"]).replace("", "EUR"),
+        "verwendungszweck": verwendungszweck,
+        "auftraggeber": _spalte(chunk, p["auftraggeber"]),
+        "buchungstext": _spalte(chunk, p["buchungstext"]),
+        "iban": _spalte(chunk, p["iban"]),
+        "bic": _spalte(chunk, p["bic"]),
+        "referenz": _spalte(chunk, p["referenz"]),
+        "quelle": p["quelle"],
+        "format": profil,
+    }, index=chunk.index)
+    transaktionen = transaktionen.join(extract_references(verwendungszweck))
+    return transaktionen[TRANSAKTION_SPALTEN], int((~gueltig).sum())
+
+
+def read_transactions(path: str, profil: str | None = None, chunk_rows: int = CHUNK_ROWS):
+    """
+    Normalisierte Transaktionen einer Datei, blockweise
+    Yields:
+        tuple: (Transaktionen, Anzahl verworfener Zeilen) pro Block
+    """
+    encoding, delimiter = sniff(path)
+    profil, vorspann, _ = detect_profile(path, encoding, delimiter, profil)
+    log.debug("bank_csv_format", "", path=path, profile=profil, encoding=encoding, delimiter=delimiter)
+    reader = pd.read_csv(
+        path, sep=delimiter, encoding=encoding, encoding_errors="replace", skiprows=vorspann, dtype=str,
+        keep_default_na=False, chunksize=chunk_rows, on_bad_lines="skip", index_col=False,
+    )
+    with reader:
+        for chunk in reader:
+            chunk.columns = [str(spalte).strip() for spalte in chunk.columns]
+            yield normalize(chunk, profil)
+
+
+def import_files(paths: list[str], ausgabe, profil: str | None = None, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    Schreibt die Transaktionen aller Dateien als JSON-Zeilen nach ausgabe
+    Returns:
+        dict: Zusammenfassung (Transaktionen, verworfene Zeilen, mit Referenz, Summe pro Quelle)
+    """
+    start = time.perf_counter()
+    anzahl = verworfen = mit_referenz = 0
+    summen: dict[str, int] = {}
+    for path in paths:
+        for transaktionen, ungueltig in read_transactions(path, profil, chunk_rows):
+            verworfen += ungueltig
+            anzahl += len(transaktionen)
+            mit_referenz += int(transaktionen["referenzen"].map(bool).sum())
+            for quelle, summe in transaktionen.groupby("quelle")["betrag"].sum().items():
+                summen[quelle] = summen.get(quelle, 0) + round(summe * 100)
+            spalten = [transaktionen[spalte].tolist() for spalte in TRANSAKTION_SPALTEN]
+            ausgabe.writelines(
+                json.dumps(dict(zip(TRANSAKTION_SPALTEN, werte)), ensure_ascii=False) + "\n" for werte in zip(*spalten)
+            )
+    ausgabe.flush()
+    return {
+        "success": True,
+        "transaktionen": anzahl,
+        "verworfen": verworfen,
+        "mit_referenz": mit_referenz,
+        "summen": {quelle: cent / 100 for quelle, cent in summen.items()},
+        "sekunden": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Bank CSV Importer (Postbank, Commerzbank)")
+    cli.add_argument("dateien", nargs="+", metavar="CSV", help="Kontoumsätze als CSV")
+    cli.add_argument("-o", "--output", default="-", help="Ziel für die JSON-Zeilen (Standard: stdout)")
+    cli.add_argument("--profil", choices=["postbank", "commerzbank"], help="Format nicht erkennen, sondern vorgeben")
+    cli.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Zeilen pro Block beim Lesen")
+    args = cli.parse_args()
+
+    ausgabe = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        with log.timed("bank_import", files=len(args.dateien)) as felder:
+            zusammenfassung = import_files(args.dateien, ausgabe, args.profil, args.chunk_rows)
+            felder.update(transactions=zusammenfassung["transaktionen"], dropped=zusammenfassung["verworfen"])
+    except (OSError, ValueError) as e:
+        log.error("bank_import_failed", str(e))
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if ausgabe is not sys.stdout:
+            ausgabe.close()
+
+    if args.output != "-":
+        print(json.dumps({**zusammenfassung, "output": args.output}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+DATEV EXTF Writer (Buchungsstapel, Format 700 / Version 12) für den Import in Addison.
+
+Erzeugt Dateien im Format der bisherigen Monats-Exporte (z.B. jera-export-addison-oktober-2025.csv):
+Kopfzeile "EXTF";700;21;"Buchungsstapel";..., Zeile mit den 124 Spaltennamen, dann eine Zeile pro
+Buchung; cp1252, Semikolon, CRLF, Beträge mit Dezimalkomma, Textfelder in Anführungszeichen.
+
+Die Zeilenvorlage (feste und leere Spalten) wird einmal pro Datei erzeugt, pro Buchung werden nur
+die belegten Spalten formatiert. Die Zeilen gehen gesammelt (PUFFER_ZEILEN) und direkt in cp1252
+kodiert in die Datei, ohne dass die ganze Datei im Speicher liegt.
+
+CLI:
+    datev_extf_writer.py BUCHUNGEN.jsonl -o EXTF_Buchungsstapel.csv --berater 2006873 --mandant 2605
+                         --von 2025-10-01 --bis 2025-10-31 [--bezeichnung "Amazon 2025/10"]
+    datev_extf_writer.py --verify jera-export-addison-oktober-2025.csv
+BUCHUNGEN.jsonl enthält Buchungen wie unten (buchung) oder Datensätze von amazon_settlement_importer.
+"""
+
+import sys
+import os
+import io
+import json
+import argparse
+import datetime
+
+# Add invoice_parsers to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
+
+from helpers.event_log import log
+from helpers.number_helpers import in_cent
+
+ENCODING = "cp1252"
+ZEILENENDE = "\r\n"
+# Zeilen, die gesammelt kodiert und geschrieben werden
+PUFFER_ZEILEN = int(os.getenv("DATEV_BUFFER_ROWS", "5000"))
+
+# Spalten des Buchungsstapels in der Reihenfolge der Datei
+SPALTEN = [
+    "Umsatz (ohne Soll/Haben-Kz)", "Soll/Haben-Kennzeichen", "WKZ Umsatz", "Kurs", "Basis-Umsatz", "WKZ Basis-Umsatz",
+    "Konto", "Gegenkonto (ohne BU-Schlüssel)", "BU-Schlüssel", "Belegdatum", "Belegfeld 1", "Belegfeld 2", "Skonto",
+    "Buchungstext", "Postensperre", "Diverse Adressnummer", "Geschäftspartnerbank", "Sachverhalt", "Zinssperre",
+    "Beleglink",
+    *[f"Beleginfo - {teil} {i}" for i in range(1, 9) for teil in ("Art", "Inhalt")],
+    "KOST1 - Kostenstelle", "KOST2 - Kostenstelle", "Kost-Menge", "EU-Land und UStID (Bestimmung)",
+    "EU-Steuersatz (Bestimmung)", "Abw. Versteuerungsart", "Sachverhalt L+L", "Funktionsergänzung L+L",
+    "BU 49 Hauptfunktionstyp", "BU 49 Hauptfunktionsnummer", "BU 49 Funktionsergänzung",
+    # Schreibweise "Zusatzinformation- Inhalt" wie in der DATEV-Vorlage
+    *[spalte for i in range(1, 21) for spalte in (f"Zusatzinformation - Art {i}", f"Zusatzinformation- Inhalt {i}")],
+    "Stück", "Gewicht", "Zahlweise", "Forderungsart", "Veranlagungsjahr", "Zugeordnete Fälligkeit", "Skontotyp",
+    "Auftragsnummer", "Buchungstyp", "Ust-Schlüssel (Anzahlungen)", "EU-Land (Anzahlungen)",
+    "Sachverhalt L+L (Anzahlungen)", "EU-Steuersatz (Anzahlungen)", "Erlöskonto (Anzahlungen)", "Herkunft-Kz",
+    "Leerfeld", "KOST-Datum", "Mandatsreferenz", "Skontosperre", "Gesellschaftername", "Beteiligtennummer",
+    "Identifikationsnummer", "Zeichnernummer", "Postensperre bis", "Bezeichnung SoBil-Sachverhalt",
+    "Kennzeichen SoBil-Buchung", "Festschreibung", "Leistungsdatum", "Datum Zuord.Steuerperiode", "Fälligkeit",
+    "Generalumkehr (GU)", "Steuersatz", "Land", "Abrechnungsreferenz", "BVV-Postion", "EU-Land und UStID (Ursprung)",
+    "EU-Steuersatz (Ursprung)",
+]
+
+# Spalten ohne Anführungszeichen (Zahlen, Datumswerte, Kennzeichen), alle übrigen sind Textfelder
+ZAHLENSPALTEN = {
+    "Umsatz (ohne Soll/Haben-Kz)", "Kurs", "Basis-Umsatz", "Konto", "Gegenkonto (ohne BU-Schlüssel)", "Belegdatum",
+    "Skonto", "Postensperre", "Geschäftspartnerbank", "Sachverhalt", "Zinssperre", "Kost-Menge",
+    "EU-Steuersatz (Bestimmung)", "Sachverhalt L+L", "Funktionsergänzung L+L", "BU 49 Hauptfunktionstyp",
+    "BU 49 Hauptfunktionsnummer", "BU 49 Funktionsergänzung", "Stück", "Gewicht", "Zahlweise", "Veranlagungsjahr",
+    "Zugeordnete Fälligkeit", "Skontotyp", "Ust-Schlüssel (Anzahlungen)", "Sachverhalt L+L (Anzahlungen)",
+    "EU-Steuersatz (Anzahlungen)", "Erlöskonto (Anzahlungen)", "KOST-Datum", "Skontosperre", "Beteiligtennummer",
+    "Postensperre bis", "Kennzeichen SoBil-Buchung", "Festschreibung", "Leistungsdatum", "Datum Zuord.Steuerperiode",
+    "Fälligkeit", "Steuersatz", "Abrechnungsreferenz", "BVV-Postion", "EU-Steuersatz (Ursprung)",
+}
+
+# Maximale Länge der Textfelder laut DATEV; längere Texte werden abgeschnitten
+MAX_LAENGE = {"Belegfeld 1": 36, "Belegfeld 2": 12, "Buchungstext": 60}
+
+# Buchungsfeld -> Spalte; diese Spalten werden pro Buchung gefüllt
+BUCHUNG_SPALTEN = {
+    "umsatz": "Umsatz (ohne Soll/Haben-Kz)",
+    "soll_haben": "Soll/Haben-Kennzeichen",
+    "konto": "Konto",
+    "gegenkonto": "Gegenkonto (ohne BU-Schlüssel)",
+    "bu_schluessel": "BU-Schlüssel",
+    "belegdatum": "Belegdatum",
+    "belegfeld1": "Belegfeld 1",
+    "belegfeld2": "Belegfeld 2",
+    "buchungstext": "Buchungstext",
+    "veranlagungsjahr": "Veranlagungsjahr",
+}
+
+# Kopfzeile: Feld -> in Anführungszeichen; Diktatkürzel steht in den Addison-Exporten ohne
+KOPF_FELDER = [
+    ("kennzeichen", True), ("versionsnummer", False), ("formatkategorie", False), ("formatname", True),
+    ("formatversion", False), ("erzeugt_am", False), ("importiert", False), ("herkunft", True),
+    ("exportiert_von", True), ("importiert_von", True), ("beraternummer", False), ("mandantennummer", False),
+    ("wj_beginn", False), ("sachkontenlaenge", False), ("datum_von", False), ("datum_bis", False),
+    ("bezeichnung", True), ("diktatkuerzel", False), ("buchungstyp", False), ("rechnungslegungszweck", False),
+    ("festschreibung", False), ("wkz", True), ("reserviert_23", False), ("derivatskennzeichen", True),
+    ("reserviert_25", False), ("reserviert_26", False), ("sachkontenrahmen", True), ("branchenloesung", False),
+    ("reserviert_29", False), ("reserviert_30", True), ("anwendungsinformation", True),
+]
+KOPF_STANDARD = {
+    "kennzeichen": "EXTF",
+    "versionsnummer": "700",
+    "formatkategorie": "21",
+    "formatname": "Buchungsstapel",
+    "formatversion": "12",
+    "herkunft": "JE",
+    "exportiert_von": "JERA2FIBU",
+    "sachkontenlaenge": "4",
+    "diktatkuerzel": "JE",
+    "buchungstyp": "1",
+    "rechnungslegungszweck": "0",
+    "festschreibung": "0",
+    "wkz": "EUR",
+}
+
+
+class ExtfFehler(ValueError):
+    """Ungültige Kopfdaten oder Buchung"""
+
+    def __init__(self, grund: str, zeile: int | None = None):
+        self.grund = grund
+        self.zeile = zeile
+        super().__init__(f"Buchung {zeile}: {grund}" if zeile is not None else grund)
+
+
+def _text(wert, spalte: str | None = None) -> str:
+    text = "" if wert is None else str(wert)
+    if spalte in MAX_LAENGE:
+        text = text[:MAX_LAENGE[spalte]]
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _datum(wert) -> datetime.date:
+    """Datum aus date/datetime, "YYYY-MM-DD" oder "YYYYMMDD"."""
+    if isinstance(wert, datetime.datetime):
+        return wert.date()
+    if isinstance(wert, datetime.date):
+        return wert
+    text = str(wert or "").strip()
+    try:
+        if len(text) == 8 and text.isdigit():
+            return datetime.datetime.strptime(text, "%Y%m%d").date()
+        return datetime.date.fromisoformat(text[:10])
+    except ValueError:
+        raise ExtfFehler(f"Ungültiges Datum: {wert!r}") from None
+
+
+def format_umsatz(cent: int) -> str:
+    """Betrag ohne Vorzeichen mit Dezimalkomma, ohne Tausenderpunkt: 1234567 -> "12345,67"."""
+    cent = abs(cent)
+    return f"{cent // 100},{cent % 100:02d}"
+
+
+def kopfzeile(kopf: dict) -> str:
+    """
+    Erste Zeile der Datei
+    Args:
+        kopf: beraternummer, mandantennummer, datum_von, datum_bis (Pflicht), wj_beginn (Standard: 1.1. des
+              Jahres von datum_von), bezeichnung, erzeugt_am (datetime oder Text "YYYYMMDDHHMMSSfff") und
+              abweichende Werte für KOPF_STANDARD
+    """
+    werte = {**KOPF_STANDARD, **{k: v for k, v in kopf.items() if v is not None}}
+    for feld in ("beraternummer", "mandantennummer", "datum_von", "datum_bis"):
+        if not werte.get(feld):
+            raise ExtfFehler(f"Kopfdaten: {feld} fehlt")
+    von = _datum(werte["datum_von"])
+    werte["datum_von"] = von.strftime("%Y%m%d")
+    werte["datum_bis"] = _datum(werte["datum_bis"]).strftime("%Y%m%d")
+    werte["wj_beginn"] = _datum(werte["wj_beginn"]).strftime("%Y%m%d") if werte.get("wj_beginn") else f"{von.year}0101"
+    erzeugt = werte.get("erzeugt_am") or datetime.datetime.now()
+    if isinstance(erzeugt, datetime.datetime):
+        erzeugt = erzeugt.strftime("%Y%m%d%H%M%S") + f"{erzeugt.microsecond // 1000:03d}"
+    werte["erzeugt_am"] = erzeugt
+    return ";".join(
+        _text(werte.get(feld)) if quotiert else str(werte.get(feld) or "") for feld, quotiert in KOPF_FELDER
+    ) + ZEILENENDE
+
+
+def spaltenzeile() -> str:
+    return ";".join(SPALTEN) + ";" + ZEILENENDE
+
+
+def zeilen_vorlage(variable: list[str], feste_werte: dict[str, str]) -> str:
+    """
+    Vorlage für str.format: {0}.. für die Spalten in variable, feste Werte und leere Felder eingesetzt
+    """
+    teile = []
+    for spalte in SPALTEN:
+        if spalte in variable:
+            teile.append("{%d}" % variable.index(spalte))
+        elif spalte in feste_werte:
+            teile.append(feste_werte[spalte].replace("{", "{{").replace("}", "}}"))
+        else:
+            teile.append("" if spalte in ZAHLENSPALTEN else '""')
+    return ";".join(teile) + ";" + ZEILENENDE
+
+
+def buchung(umsatz, konto, gegenkonto, belegdatum, buchungstext="", belegfeld1="", belegfeld2="",
+            bu_schluessel="", soll_haben: str | None = None, **spalten) -> dict:
+    """
+    Buchung für ExtfWriter.write
+    Args:
+        umsatz: Betrag (Decimal, int, float oder deutscher Text); ohne soll_haben gilt positiv = Soll auf konto
+        belegdatum: date oder "YYYY-MM-DD"
+        spalten: weitere Spalten unter ihrem DATEV-Namen (müssen beim ExtfWriter angemeldet sein)
+    """
+    return {
+        "umsatz": umsatz, "soll_haben": soll_haben, "konto": konto, "gegenkonto": gegenkonto,
+        "bu_schluessel": bu_schluessel, "belegdatum": belegdatum, "belegfeld1": belegfeld1,
+        "belegfeld2": belegfeld2, "buchungstext": buchungstext, **spalten,
+    }
+
+
+def from_settlement(datensatz: dict) -> dict:
+    """Buchung aus einem Datensatz von amazon_settlement_importer (AmazonBuchung-Felder)."""
+    return buchung(
+        umsatz=datensatz["betrag"],
+        konto=datensatz["bank_konto_nr"],
+        gegenkonto=datensatz["gegenkonto_konto_nr"],
+        belegdatum=datensatz["datum"],
+        buchungstext=datensatz.get("verwendungszweck") or "",
+        belegfeld1=datensatz.get("rechnungsnummer") or "",
+        belegfeld2=datensatz.get("au_nummer") or "",
+        bu_schluessel=datensatz.get("steuerschluessel") or "",
+    )
+
+
+class ExtfWriter:
+    """
+    Schreibt einen Buchungsstapel; als Kontextmanager verwenden oder close() aufrufen
+    Args:
+        ziel: Dateipfad oder binärer Stream
+        kopf: Kopfdaten, siehe kopfzeile()
+        extra_spalten: weitere DATEV-Spalten, die aus den Buchungen (unter ihrem Spaltennamen) gefüllt werden
+    """
+
+    def __init__(self, ziel, kopf: dict, extra_spalten: list[str] = ()):
+        unbekannt = [spalte for spalte in extra_spalten if spalte not in SPALTEN]
+        if unbekannt:
+            raise ExtfFehler(f"Unbekannte Spalten: {', '.join(unbekannt)}")
+        self._variable = list(BUCHUNG_SPALTEN.values()) + [s for s in extra_spalten if s not in BUCHUNG_SPALTEN.values()]
+        self._extra = self._variable[len(BUCHUNG_SPALTEN):]
+        festschreibung = str(kopf.get("festschreibung") or KOPF_STANDARD["festschreibung"])
+        self._vorlage = zeilen_vorlage(self._variable, {"Skonto": "0,00", "Festschreibung": festschreibung}).format
+        self._kopf = kopfzeile(kopf)
+        self._eigene_datei = isinstance(ziel, (str, os.PathLike))
+        self._datei = open(ziel, "wb", buffering=1 << 20) if self._eigene_datei else ziel
+        self._puffer: list[str] = [self._kopf, spaltenzeile()]
+        self.anzahl = 0
+        self.uebersprungen = 0
+
+    def _zeile(self, b: dict, cent: int) -> str:
+        soll_haben = b.get("soll_haben") or ("S" if cent >= 0 else "H")
+        if soll_haben not in ("S", "H"):
+            raise ExtfFehler(f"Soll/Haben-Kennzeichen {soll_haben!r}", self.anzahl + 1)
+        datum = _datum(b["belegdatum"])
+        werte = [
+            format_umsatz(cent),
+            _text(soll_haben),
+            str(b["konto"]),
+            str(b["gegenkonto"]),
+            _text(b.get("bu_schluessel")),
+            datum.strftime("%d%m"),
+            _text(b.get("belegfeld1"), "Belegfeld 1"),
+            _text(b.get("belegfeld2"), "Belegfeld 2"),
+            _text(b.get("buchungstext"), "Buchungstext"),
+            str(b.get("veranlagungsjahr") or datum.year),
+        ]
+        for spalte in self._extra:
+            wert = b.get(spalte)
+            werte.append(("" if wert is None else str(wert)) if spalte in ZAHLENSPALTEN else _text(wert, spalte))
+        return self._vorlage(*werte)
+
+    def write(self, b: dict):
+        """Eine Buchung; Buchungen mit Umsatz 0 nimmt DATEV nicht an, sie werden übersprungen."""
+        cent = in_cent(b.get("umsatz"))
+        if cent is None:
+            raise ExtfFehler("Umsatz fehlt", self.anzahl + 1)
+        if cent == 0:
+            self.uebersprungen += 1
+            return
+        self._puffer.append(self._zeile(b, cent))
+        self.anzahl += 1
+        if len(self._puffer) >= PUFFER_ZEILEN:
+            self.flush()
+
+    def write_many(self, buchungen):
+        for b in buchungen:
+            self.write(b)
+
+    def flush(self):
+        if self._puffer:
+            self._datei.write("".join(self._puffer).encode(ENCODING, errors="replace"))
+            self._puffer = []
+
+    def close(self):
+        self.flush()
+        if self._eigene_datei:
+            self._datei.close()
+        else:
+            self._datei.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _felder(zeile: str) -> list[str]:
+    """Felder einer Zeile, Anführungszeichen entfernt ("" -> ")."""
+    felder, feld, in_text, i = [], [], False, 0
+    while i < len(zeile):
+        zeichen = zeile[i]
+        if in_text:
+            if zeichen == '"' and zeile[i + 1:i + 2] == '"':
+                feld.append('"')
+                i += 1
+            elif zeichen == '"':
+                in_text = False
+            else:
+                feld.append(zeichen)
+        elif zeichen == '"':
+            in_text = True
+        elif zeichen == ";":
+            felder.append("".join(feld))
+            feld = []
+        else:
+            feld.append(zeichen)
+        i += 1
+    felder.append("".join(feld))
+    return felder
+
+
+def read_extf(path: str) -> tuple[dict, object]:
+    """
+    Liest einen Buchungsstapel zeilenweise
+    Returns:
+        tuple: (Kopfdaten wie für kopfzeile, Iterator der Buchungen; weitere belegte Spalten unter ihrem DATEV-Namen)
+    """
+    datei = open(path, "r", encoding=ENCODING, newline="")
+    kopf_felder = _felder(datei.readline().rstrip("\r\n"))
+    if kopf_felder[0] != "EXTF":
+        datei.close()
+        raise ExtfFehler(f"{path}: keine EXTF-Datei")
+    kopf = {feld: wert for (feld, _), wert in zip(KOPF_FELDER, kopf_felder)}
+    kopf["datum_von"] = kopf["datum_von"][:4] + "-" + kopf["datum_von"][4:6] + "-" + kopf["datum_von"][6:]
+    kopf["datum_bis"] = kopf["datum_bis"][:4] + "-" + kopf["datum_bis"][4:6] + "-" + kopf["datum_bis"][6:]
+    spalten = _felder(datei.readline().rstrip("\r\n"))[:len(SPALTEN)]
+    if spalten != SPALTEN:
+        datei.close()
+        raise ExtfFehler(f"{path}: unerwartete Spalten")
+    jahr = kopf["datum_von"][:4]
+    bekannt = set(BUCHUNG_SPALTEN.values()) | {"Skonto", "Festschreibung"}
+
+    def zeilen():
+        with datei:
+            for zeile in datei:
+                werte = dict(zip(SPALTEN, _felder(zeile.rstrip("\r\n"))))
+                b = {feld: werte[spalte] for feld, spalte in BUCHUNG_SPALTEN.items()}
+                belegdatum = b["belegdatum"]
+                b["belegdatum"] = f"{b['veranlagungsjahr'] or jahr}-{belegdatum[2:4]}-{belegdatum[:2]}"
+                b.update({spalte: wert for spalte, wert in werte.items() if wert and spalte not in bekannt})
+                yield b
+
+    return kopf, zeilen()
+
+
+def verify(path: str) -> dict:
+    """
+    Liest einen vorhandenen Export ein, schreibt ihn mit ExtfWriter neu und vergleicht byteweise
+    Returns:
+        dict: identisch, Buchungen und bei Abweichung die erste abweichende Zeile
+    """
+    kopf, buchungen = read_extf(path)
+    buchungen = list(buchungen)
+    extra = sorted({k for b in buchungen for k in b if k in SPALTEN}, key=SPALTEN.index)
+    neu = io.BytesIO()
+    with ExtfWriter(neu, kopf, extra) as writer:
+        writer.write_many(buchungen)
+    with open(path, "rb") as f:
+        original = f.read()
+    ergebnis = {"identisch": neu.getvalue() == original, "buchungen": writer.anzahl}
+    if not ergebnis["identisch"]:
+        for nummer, (alt, jetzt) in enumerate(zip(original.split(b"\r\n"), neu.getvalue().split(b"\r\n")), 1):
+            if alt != jetzt:
+                ergebnis.update(zeile=nummer, erwartet=alt.decode(ENCODING), erzeugt=jetzt.decode(ENCODING))
+                break
+    return ergebnis
+
+
+def _jsonl(path: str):
+    datei = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    with datei:
+        for zeile in datei:
+            if zeile.strip():
+                datensatz = json.loads(zeile)
+                yield from_settlement(datensatz) if "bank_konto_nr" in datensatz else datensatz
+
+
+def main():
+    cli = argparse.ArgumentParser(description="DATEV EXTF Buchungsstapel (Addison) schreiben")
+    cli.add_argument("buchungen", nargs="?", default="-", help="JSON-Zeilen mit Buchungen (Standard: stdin)")
+    cli.add_argument("-o", "--output", default="-", help="Zieldatei (Standard: stdout)")
+    cli.add_argument("--berater", help="Beraternummer")
+    cli.add_argument("--mandant", help="Mandantennummer")
+    cli.add_argument("--von", help="Datum von (YYYY-MM-DD)")
+    cli.add_argument("--bis", help="Datum bis (YYYY-MM-DD)")
+    cli.add_argument("--wj-beginn", help="Beginn des Wirtschaftsjahres (Standard: 1.1.)")
+    cli.add_argument("--bezeichnung", default="", help="Bezeichnung des Stapels, z.B. \"Amazon 2025/10\"")
+    cli.add_argument("--verify", metavar="EXTF", help="Vorhandenen Export einlesen, neu schreiben und vergleichen")
+    args = cli.parse_args()
+
+    try:
+        if args.verify:
+            with log.timed("extf_verify", path=args.verify) as felder:
+                ergebnis = verify(args.verify)
+                felder.update(identical=ergebnis["identisch"], bookings=ergebnis["buchungen"])
+            print(json.dumps(ergebnis, ensure_ascii=False))
+            sys.exit(0 if ergebnis["identisch"] else 1)
+
+        kopf = {
+            "beraternummer": args.berater, "mandantennummer": args.mandant, "datum_von": args.von,
+            "datum_bis": args.bis, "wj_beginn": args.wj_beginn, "bezeichnung": args.bezeichnung,
+        }
+        ziel = sys.stdout.buffer if args.output == "-" else args.output
+        with log.timed("extf_write", output=args.output) as felder:
+            with ExtfWriter(ziel, kopf) as writer:
+                writer.write_many(_jsonl(args.buchungen))
+            felder.update(bookings=writer.anzahl, skipped=writer.uebersprungen)
+    except (OSError, ValueError) as e:
+        log.error("extf_failed", str(e))
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+
+    if args.output != "-":
+        print(json.dumps({"success": True, "buchungen": writer.anzahl, "uebersprungen": writer.uebersprungen,
+                          "output": args.output}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,166 +2,192 @@
 """
 Emergent Gemini Invoice Parser
 Nutzt Emergent Universal Key über emergentintegrations
+
+Batch-Modus (--batch): mehrere kleine Rechnungen (bis BATCH_MAX_PAGES Seiten) werden bis zu
+einem Token-Budget in eine Anfrage gepackt. Die Anweisungen sind für alle Anfragen gleich
+(SYSTEM_PREFIX in helpers.llm_prompts), die Antwort ist ein JSON-Array mit einem Objekt pro Dokument. Passt die
+Antwort nicht (Anzahl, Zuordnung, Pflichtfelder), werden die betroffenen Dokumente einzeln geparst.
 """
 
 import sys
 import os
 import json
 import base64
-from datetime import datetime
 import tempfile
 import asyncio
 
+# Add invoice_parsers to path (Ereignisprotokoll)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
+
+from helpers.event_log import current_document, log, set_document
+from helpers.llm_limiter import LLM_CALL_TIMEOUT_S, LlmUnavailable, limiter, llm_queue, within_budget
+from file_handlers.pdf_text import extract_page_texts
+from helpers.llm_line_items import (
+    ITEMS_SYSTEM_PREFIX, chunk_prompt, items_to_dataframe, merge_chunks, parse_items, plan_chunks, reconcile
+)
+from helpers.llm_prompts import SYSTEM_PREFIX, build_context_text, detect_vendor, document_prompt, user_prompt
+from helpers.llm_response import decode_json, invoice_result, merge_reask, reask_prompt, validate_invoice
+
 # Emergent Integrations
+# Fehlende Abhängigkeiten/Keys werden erst in main() bzw. check_available() gemeldet,
+# damit andere Skripte (z.B. fibu_invoice_parser für Scans) das Modul importieren können.
 try:
     from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
+    EMERGENT_INSTALLED = True
 except ImportError:
-    print(json.dumps({
-        "success": False,
-        "error": "emergentintegrations nicht installiert"
-    }))
-    sys.exit(1)
+    EMERGENT_INSTALLED = False
 
 # Konfiguriere API Key
 EMERGENT_LLM_KEY = os.getenv('EMERGENT_LLM_KEY') or os.getenv('GOOGLE_API_KEY', '')
 
-if not EMERGENT_LLM_KEY:
-    print(json.dumps({
-        "success": False,
-        "error": "EMERGENT_LLM_KEY oder GOOGLE_API_KEY nicht gesetzt"
-    }), file=sys.stdout)
-    sys.exit(0)
+MODEL = ("gemini", "gemini-2.0-flash")
+
+# Batch-Modus: Token-Budget pro Anfrage (Gemini rechnet ca. 258 Tokens pro PDF-Seite),
+# höchstens so viele Dokumente pro Anfrage, nur Dokumente bis BATCH_MAX_PAGES Seiten
+BATCH_TOKEN_BUDGET = int(os.getenv('EMERGENT_BATCH_TOKEN_BUDGET', '12000'))
+BATCH_MAX_DOCUMENTS = int(os.getenv('EMERGENT_BATCH_MAX_DOCUMENTS', '8'))
+BATCH_MAX_PAGES = 2
+TOKENS_PER_PAGE = 258
+# Grobe Schätzung für Text: 4 Zeichen pro Token
+CHARS_PER_TOKEN = 4
+
+BATCH_INSTRUCTIONS = """
+MEHRERE RECHNUNGEN: Im Anhang sind {anzahl} PDF-Dateien, jede ist eine eigene Rechnung (Dokument 1 bis {anzahl},
+in der Reihenfolge der Anhänge). Antworte mit einem JSON-Array mit genau {anzahl} solchen Objekten in derselben
+Reihenfolge. Jedes Objekt enthält zusätzlich "dokument": <Nummer des Dokuments>. Vermische keine Angaben zwischen
+den Dokumenten.
+"""
+
+
+def check_available() -> dict | None:
+    """
+    Prüft, ob der Parser nutzbar ist
+    Returns:
+        None wenn alles vorhanden ist, sonst das Fehler-Ergebnis
+    """
+    if not EMERGENT_INSTALLED:
+        return {
+            "success": False,
+            "error": "emergentintegrations nicht installiert"
+        }
+    if not EMERGENT_LLM_KEY:
+        return {
+            "success": False,
+            "error": "EMERGENT_LLM_KEY oder GOOGLE_API_KEY nicht gesetzt"
+        }
+    return None
+
+
+def new_chat(system_message: str = SYSTEM_PREFIX) -> "LlmChat":
+    """
+    Neue Session ohne Verlauf; LlmChat hängt jede Nachricht an den Verlauf der Session, eine geteilte Session
+    würde die Antworten (und Tokens) früherer Rechnungen mitschicken. Gleich bleiben nur die feste
+    System-Nachricht und das Modell.
+    """
+    return LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"invoice-parse-{os.getpid()}-{os.urandom(4).hex()}",
+        system_message=system_message
+    ).with_model(*MODEL)
+
+
+async def send_limited(user_message: "UserMessage", documents: int, chat: "LlmChat" = None) -> str:
+    """
+    Sendet die Anfrage innerhalb des Limiters mit Zeitlimit (höchstens bis kurz vor Ablauf des Dokumentbudgets)
+    Args:
+        chat: Session mit anderer System-Nachricht, Standard: new_chat() mit SYSTEM_PREFIX
+    Raises:
+        LlmUnavailable: Circuit offen, kein freier Platz oder Dokumentbudget aufgebraucht
+    """
+    async with limiter.aslot():
+        zeitlimit = within_budget(LLM_CALL_TIMEOUT_S)
+        with log.timed("llm_call", model=MODEL[1], documents=documents):
+            try:
+                return await asyncio.wait_for((chat or new_chat()).send_message(user_message), zeitlimit)
+            except asyncio.TimeoutError:
+                if zeitlimit < LLM_CALL_TIMEOUT_S:
+                    raise LlmUnavailable("budget") from None
+                raise
+
+
+async def complete_fields(pdf_path: str, felder: dict, fehlende: list[str]) -> tuple[dict, list[str]]:
+    """
+    Fragt nur die nach der Reparatur noch fehlenden Felder mit einer kurzen Nachfrage nach
+    Returns:
+        tuple: (Felder, weiterhin fehlende Felder)
+    """
+    if not fehlende:
+        return felder, fehlende
+    user_message = UserMessage(
+        text=reask_prompt(fehlende),
+        file_contents=[FileContentWithMimeType(file_path=pdf_path, mime_type="application/pdf")]
+    )
+    try:
+        antwort = await send_limited(user_message, 1)
+    except Exception as e:
+        # Das Ergebnis der ersten Antwort bleibt erhalten, die Felder bleiben als ungültig markiert
+        log.warning("llm_reask_failed", f"Nachfrage fehlgeschlagen: {e}", fields=fehlende)
+        return felder, fehlende
+    ergaenzt, rest = merge_reask(felder, antwort, fehlende)
+    log.info("llm_reask", f"{len(fehlende) - len(rest)} von {len(fehlende)} Feldern nachgefragt", fields=fehlende, still_invalid=rest)
+    return ergaenzt, rest
 
 
 async def parse_invoice_with_emergent_gemini(pdf_path: str, email_context: dict = None) -> dict:
     """
     Parst eine Rechnung mit Gemini via Emergent Integration
-    
+
     Args:
         pdf_path: Pfad zur PDF-Datei
         email_context: Dict mit from, subject, body
-    
+
     Returns:
         dict mit Parsing-Ergebnissen
     """
     try:
-        # Email-Kontext aufbauen
-        context_text = ""
-        if email_context:
-            context_text = "\n\nZUSÄTZLICHER KONTEXT AUS E-MAIL:\n"
-            if email_context.get('from'):
-                context_text += f"Absender: {email_context['from']}\n"
-            if email_context.get('subject'):
-                context_text += f"Betreff: {email_context['subject']}\n"
-            if email_context.get('body'):
-                body = email_context['body'][:500]
-                context_text += f"E-Mail-Text: {body}\n"
-        
-        # Prompt für deutsche Lieferantenrechnungen
-        query = f"""Extrahiere die folgenden Informationen aus dieser deutschen Lieferantenrechnung (EK-Rechnung):
-        - Rechnungsnummer
-        - Rechnungsdatum (Format: YYYY-MM-DD)
-        - Lieferantenname (vollständiger Firmenname)
-        - Gesamtbetrag (Brutto, mit MwSt) in Euro
-        - Nettobetrag (ohne MwSt) in Euro
-        - Mehrwertsteuerbetrag in Euro
-        - MwSt-Satz (z.B. 19, 7, 0)
-        
-        {context_text}
-        
-        KRITISCH WICHTIG: 
-        - Dies ist eine EINGANGSRECHNUNG (Lieferantenrechnung)
-        - Der LIEFERANT ist derjenige, der die Rechnung AUSSTELLT (oben auf der Rechnung)
-        - "Score Schleifwerkzeuge" ist NICHT der Lieferant! Das ist der EMPFÄNGER/KUNDE
-        - Ignoriere die Empfängeradresse - suche nur nach dem Absender/Rechnungssteller
-        - Nutze auch die Informationen aus dem E-Mail-Kontext.
-        - Der Lieferantenname kann aus dem E-Mail-Absender stammen.
-        - Bei deutschen Beträgen: 1.234,56 € = 1234.56
-        - Falls keine Beträge gefunden werden, setze sie auf 0
-        - Rechnungsnummer ist oft im Format: RE-123456, Invoice-789, etc.
-        
-        Formatiere die Antwort als JSON-Objekt:
-        {{
-          "rechnungsnummer": "string",
-          "datum": "YYYY-MM-DD",
-          "lieferant": "string",
-          "gesamtbetrag": number,
-          "nettobetrag": number,
-          "mehrwertsteuer": number,
-          "mwstSatz": number
-        }}
-        
-        Gib NUR das JSON zurück, keine Erklärungen."""
-        
-        # Initialize Chat mit Gemini
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"invoice-parse-{os.urandom(4).hex()}",
-            system_message="Du bist ein Experte für deutsche Buchhaltung und Rechnungsanalyse."
-        ).with_model("gemini", "gemini-2.0-flash")
-        
+        # Feste Anweisungen stehen in der System-Nachricht, hier nur Lieferanten-Hinweise und E-Mail-Kontext
+        query = user_prompt(detect_vendor(pdf_path, email_context), email_context)
+
         # PDF-Datei vorbereiten
         pdf_file = FileContentWithMimeType(
             file_path=pdf_path,
             mime_type="application/pdf"
         )
-        
+
         # Message erstellen
         user_message = UserMessage(
             text=query,
             file_contents=[pdf_file]
         )
-        
-        # Send Message
-        response = await chat.send_message(user_message)
-        text = response.strip()
-        
-        # Parse Response (remove markdown)
-        text = text.replace('```json', '').replace('```', '').strip()
-        
-        # Find JSON in response
-        import re
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
-            data = json.loads(json_match.group(0))
-        else:
+
+        # Send Message (über den gemeinsamen Limiter aller Parser-Prozesse)
+        response = await send_limited(user_message, 1)
+
+        # Schema-Prüfung mit Reparatur, nur ungültige Felder werden nachgefragt
+        data = decode_json(response)
+        if not isinstance(data, dict):
+            log.error("llm_invalid_json", "Kein JSON in Gemini-Response gefunden", response_chars=len(response))
             return {
                 "success": False,
                 "error": "Kein JSON in Gemini-Response gefunden"
             }
-        
-        # Validierung und Bereinigung
-        gesamtbetrag = float(data.get('gesamtbetrag', 0))
-        nettobetrag = float(data.get('nettobetrag', 0))
-        mehrwertsteuer = float(data.get('mehrwertsteuer', 0))
-        
-        # Wenn netto fehlt aber brutto da ist, berechne
-        if gesamtbetrag > 0 and nettobetrag == 0:
-            mwst_satz = int(data.get('mwstSatz', 19))
-            nettobetrag = gesamtbetrag / (1 + mwst_satz / 100)
-            mehrwertsteuer = gesamtbetrag - nettobetrag
-        
-        return {
-            "success": True,
-            "lieferant": data.get('lieferant', 'Unbekannt'),
-            "rechnungsnummer": data.get('rechnungsnummer', 'Unbekannt'),
-            "datum": data.get('datum', datetime.now().strftime('%Y-%m-%d')),
-            "gesamtbetrag": round(gesamtbetrag, 2),
-            "nettobetrag": round(nettobetrag, 2),
-            "steuerbetrag": round(mehrwertsteuer, 2),
-            "steuersatz": int(data.get('mwstSatz', 19)),
-            "kreditor": None,
-            "parsing_method": "emergent-gemini",
-            "confidence": 85 if gesamtbetrag > 0 else 60
-        }
-        
-    except json.JSONDecodeError as e:
+
+        felder, fehlende = validate_invoice(data)
+        felder, fehlende = await complete_fields(pdf_path, felder, fehlende)
+        return invoice_result(felder, fehlende, "emergent-gemini", 85, 60)
+
+    except LlmUnavailable as e:
+        # Anbieter überlastet: Dokument für später zurückstellen statt auf den Timeout zu warten
+        llm_queue.enqueue(pdf_path, current_document(), email_context, e.grund)
         return {
             "success": False,
-            "error": f"JSON Parse Error: {str(e)}",
+            "queued": True,
+            "error": str(e),
+            "retry_in": round(e.retry_in),
             "confidence": 0
         }
     except Exception as e:
+        log.error("llm_failed", str(e))
         return {
             "success": False,
             "error": str(e),
@@ -169,43 +195,331 @@ async def parse_invoice_with_emergent_gemini(pdf_path: str, email_context: dict
         }
 
 
+async def extract_chunk(pdf_path: str, von: int, bis: int, seiten: int, text: str | None) -> list[dict] | None:
+    """
+    Positionen eines Abschnitts (Seiten von..bis), ein Wiederholungsversuch bei Fehlern
+    Args:
+        text: Text der Seiten; None für Abschnitte mit gescannten Seiten (dann wird das PDF angehängt)
+    Returns:
+        list | None: None, wenn der Abschnitt nicht ausgewertet werden konnte
+    """
+    if text is None:
+        user_message = UserMessage(
+            text=chunk_prompt(von, bis, seiten),
+            file_contents=[FileContentWithMimeType(file_path=pdf_path, mime_type="application/pdf")]
+        )
+    else:
+        user_message = UserMessage(text=chunk_prompt(von, bis, seiten, text))
+    for versuch in range(1, 3):
+        try:
+            # Eigene Session pro Abschnitt, die Abschnitte laufen parallel
+            positionen = parse_items(await send_limited(user_message, 1, new_chat(ITEMS_SYSTEM_PREFIX)))
+        except LlmUnavailable as e:
+            log.warning("llm_chunk_failed", str(e), pages=f"{von}-{bis}")
+            return None
+        except Exception as e:
+            log.warning("llm_chunk_failed", str(e), pages=f"{von}-{bis}", attempt=versuch)
+            continue
+        if positionen is not None:
+            return positionen
+        log.warning("llm_chunk_invalid", "Keine gültigen Positionen in der Antwort", pages=f"{von}-{bis}", attempt=versuch)
+    return None
+
+
+async def parse_line_items(pdf_path: str, email_context: dict = None, kopf: dict = None) -> dict:
+    """
+    Kopfdaten und Positionen einer Rechnung; die Abschnitte (und ohne kopf die Kopfdaten) werden parallel angefragt
+
+    Args:
+        pdf_path: Pfad zur PDF-Datei
+        email_context: Dict mit from, subject, body
+        kopf: Bereits vorhandenes Ergebnis von parse_invoice_with_emergent_gemini
+
+    Returns:
+        dict: Ergebnis wie parse_invoice_with_emergent_gemini, dazu "positionen" (Zeilen mit INVOICE_COLUMNS)
+              und "abgleich" (Summe der Positionen gegen den Nettobetrag)
+    """
+    try:
+        texte = extract_page_texts(pdf_path)
+    except Exception as e:
+        log.error("pdf_read_failed", str(e))
+        return {"success": False, "error": f"PDF nicht lesbar: {e}", "confidence": 0}
+    seiten = len(texte)
+    bereiche = plan_chunks(seiten)
+
+    aufgaben = []
+    for von, bis in bereiche:
+        seiten_texte = texte[von - 1:bis]
+        text = None
+        if all(seite.strip() for seite in seiten_texte):
+            text = "\n".join(f"--- Seite {von + i} ---\n{seite}" for i, seite in enumerate(seiten_texte))
+        aufgaben.append(extract_chunk(pdf_path, von, bis, seiten, text))
+    if kopf is None:
+        aufgaben.append(parse_invoice_with_emergent_gemini(pdf_path, email_context))
+
+    with log.timed("llm_line_items", pages=seiten, chunks=len(bereiche)):
+        ergebnisse = await asyncio.gather(*aufgaben)
+    if kopf is None:
+        kopf = ergebnisse.pop()
+    if not kopf.get("success"):
+        return kopf
+
+    positionen = merge_chunks(ergebnisse)
+    abgleich = reconcile(positionen, kopf, bereiche, ergebnisse)
+    if not abgleich["ok"]:
+        log.warning("llm_items_mismatch", "Positionen passen nicht zum Nettobetrag", **abgleich)
+    df = items_to_dataframe(positionen, kopf)
+    return {**kopf, "positionen": df.to_dict("records"), "abgleich": abgleich}
+
+
+def count_pages(pdf_path: str) -> int | None:
+    try:
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        return None
+
+
+def estimate_tokens(seiten: int, email_context: dict = None) -> int:
+    return seiten * TOKENS_PER_PAGE + len(build_context_text(email_context)) // CHARS_PER_TOKEN
+
+
+def pack_batches(documents: list[dict], token_budget: int = BATCH_TOKEN_BUDGET,
+                 max_documents: int = BATCH_MAX_DOCUMENTS) -> tuple[list[list[dict]], list[dict]]:
+    """
+    Packt kleine Dokumente der Reihe nach in Anfragen bis zum Token-Budget
+    Args:
+        documents: Dicts mit id, pdf_path, email_context
+    Returns:
+        tuple: (Liste von Batches, Dokumente für den Einzelmodus)
+    """
+    basis = len(SYSTEM_PREFIX) // CHARS_PER_TOKEN
+    batches, einzeln = [], []
+    aktuell, tokens = [], basis
+    for document in documents:
+        seiten = count_pages(document["pdf_path"])
+        if seiten is None or seiten > BATCH_MAX_PAGES:
+            einzeln.append(document)
+            continue
+        kosten = estimate_tokens(seiten, document.get("email_context"))
+        if aktuell and (tokens + kosten > token_budget or len(aktuell) >= max_documents):
+            batches.append(aktuell)
+            aktuell, tokens = [], basis
+        aktuell.append(document)
+        tokens += kosten
+    if aktuell:
+        batches.append(aktuell)
+    return batches, einzeln
+
+
+def split_batch_response(data, anzahl: int) -> list[dict | None]:
+    """
+    Ordnet die Objekte des Antwort-Arrays den Dokumenten zu
+    Returns:
+        list: Pro Dokument das Objekt der Antwort, None wenn nicht eindeutig zuordenbar
+    """
+    zugeordnet: list[dict | None] = [None] * anzahl
+    if not isinstance(data, list):
+        return zugeordnet
+    objekte = [objekt for objekt in data if isinstance(objekt, dict)]
+    nummern = [objekt.get("dokument") for objekt in objekte]
+    if all(isinstance(nummer, int) for nummer in nummern) and len(set(nummern)) == len(nummern):
+        for objekt in objekte:
+            if 1 <= objekt["dokument"] <= anzahl:
+                zugeordnet[objekt["dokument"] - 1] = objekt
+    elif len(objekte) == anzahl:
+        # Ohne (eindeutige) Nummern nur über die Reihenfolge, und nur bei passender Anzahl
+        zugeordnet = list(objekte)
+    return zugeordnet
+
+
+async def parse_batch_request(batch: list[dict]) -> list[dict | None]:
+    """Eine Anfrage für mehrere Dokumente; None für Dokumente ohne brauchbares Ergebnis."""
+    kontexte = ""
+    for nummer, document in enumerate(batch, 1):
+        email_context = document.get("email_context")
+        kontext = document_prompt(detect_vendor(document["pdf_path"], email_context), email_context)
+        if kontext:
+            kontexte += f"\n\nDOKUMENT {nummer}:\n{kontext.strip()}\n"
+    query = (BATCH_INSTRUCTIONS.format(anzahl=len(batch)) + kontexte
+             + "\nGib NUR das JSON-Array zurück, keine Erklärungen.")
+    user_message = UserMessage(
+        text=query,
+        file_contents=[FileContentWithMimeType(file_path=document["pdf_path"], mime_type="application/pdf") for document in batch]
+    )
+    try:
+        response = await send_limited(user_message, len(batch))
+        data = decode_json(response, array=True)
+    except Exception as e:
+        log.warning("llm_batch_failed", f"Batch-Anfrage fehlgeschlagen, Einzelmodus: {e}", documents=len(batch))
+        return [None] * len(batch)
+
+    ergebnisse = []
+    for document, objekt in zip(batch, split_batch_response(data, len(batch))):
+        if objekt is None:
+            ergebnisse.append(None)
+            continue
+        # Fehlende Felder eines Dokuments nur nachfragen, nicht das ganze Dokument neu parsen
+        felder, fehlende = validate_invoice(objekt)
+        felder, fehlende = await complete_fields(document["pdf_path"], felder, fehlende)
+        ergebnisse.append(invoice_result(felder, fehlende, "emergent-gemini", 85, 60))
+    fehlend = sum(ergebnis is None for ergebnis in ergebnisse)
+    if fehlend:
+        log.warning("llm_batch_mismatch", f"{fehlend} von {len(batch)} Dokumenten nicht zuordenbar, Einzelmodus",
+                    documents=len(batch), fallback=fehlend)
+    return ergebnisse
+
+
+async def parse_invoices_batched(documents: list[dict], token_budget: int = BATCH_TOKEN_BUDGET) -> dict[str, dict]:
+    """
+    Parst mehrere Rechnungen mit möglichst wenigen Anfragen
+    Args:
+        documents: Dicts mit id, pdf_path, email_context
+    Returns:
+        dict: id -> Ergebnis wie parse_invoice_with_emergent_gemini (mit "batch_size")
+    """
+    batches, einzeln = pack_batches(documents, token_budget)
+    ergebnisse = {}
+    for batch in batches:
+        if len(batch) == 1:
+            einzeln.extend(batch)
+            continue
+        for document, ergebnis in zip(batch, await parse_batch_request(batch)):
+            if ergebnis is None:
+                einzeln.append(document)
+            else:
+                ergebnisse[document["id"]] = {**ergebnis, "batch_size": len(batch)}
+    for document in einzeln:
+        set_document(document["id"])
+        ergebnis = await parse_invoice_with_emergent_gemini(document["pdf_path"], document.get("email_context"))
+        ergebnisse[document["id"]] = {**ergebnis, "batch_size": 1}
+    set_document(None)
+    return ergebnisse
+
+
+def run_batch(manifest, output, token_budget: int = BATCH_TOKEN_BUDGET):
+    """
+    Batch-Modus: liest JSON-Zeilen {"id", "pdf_base64" oder "path", "filename", "email_context"}
+    und schreibt pro Dokument {"id", "result"}; die Reihenfolge entspricht der Eingabe
+    """
+    documents, temp_dateien, fehler = [], [], {}
+    reihenfolge = []
+    try:
+        for zeilennummer, zeile in enumerate(manifest, 1):
+            if not zeile.strip():
+                continue
+            record = json.loads(zeile)
+            doc_id = str(record.get("id") or record.get("path") or f"zeile-{zeilennummer}")
+            reihenfolge.append(doc_id)
+            pdf_path = record.get("path")
+            if not pdf_path:
+                if not record.get("pdf_base64"):
+                    fehler[doc_id] = {"success": False, "error": "Kein PDF Base64 bereitgestellt"}
+                    continue
+                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
+                    tmp_file.write(base64.b64decode(record["pdf_base64"]))
+                    pdf_path = tmp_file.name
+                temp_dateien.append(pdf_path)
+            documents.append({"id": doc_id, "pdf_path": pdf_path, "email_context": record.get("email_context")})
+
+        ergebnisse = asyncio.run(parse_invoices_batched(documents, token_budget))
+        ergebnisse.update(fehler)
+        for doc_id in reihenfolge:
+            output.write(json.dumps({"id": doc_id, "result": ergebnisse.get(doc_id)}, ensure_ascii=False) + "\n")
+        output.flush()
+    finally:
+        for tmp_path in temp_dateien:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
 def main():
     """
     CLI Interface
     Erwartet JSON via stdin mit: { "pdf_base64": "...", "filename": "...", "email_context": {...} }
+    und optional "id" (Kennung des Aufrufers für Ereignisprotokoll und LLM-Warteschlange, sonst filename)
+    Mit "line_items": true (oder --line-items) zusätzlich die Positionen (siehe parse_line_items)
+
+    Batch-Modus: emergent_gemini_parser.py --batch [manifest.jsonl] [--token-budget N]
+    (siehe run_batch; Manifest Standard: stdin)
+
+    Zurückgestellte Dokumente (Circuit offen, siehe helpers.llm_limiter):
+    emergent_gemini_parser.py --retry-queued verarbeitet die Warteschlange wie --batch;
+    die "id" der Ausgabezeilen ist die beim Zurückstellen übergebene "id"
     """
+    if not EMERGENT_INSTALLED:
+        print(json.dumps(check_available()))
+        sys.exit(1)
+    if not EMERGENT_LLM_KEY:
+        print(json.dumps(check_available()), file=sys.stdout)
+        sys.exit(0)
+
+    argumente = sys.argv[1:]
+    token_budget = BATCH_TOKEN_BUDGET
+    if "--token-budget" in argumente:
+        token_budget = int(argumente[argumente.index("--token-budget") + 1])
+    if "--retry-queued" in argumente:
+        manifest_pfad = llm_queue.take()
+        if manifest_pfad:
+            try:
+                with open(manifest_pfad, "r", encoding="utf-8") as manifest:
+                    run_batch(manifest, sys.stdout, token_budget)
+            except BaseException:
+                # Nichts geht verloren: der nächste Aufruf verarbeitet die Dokumente erneut
+                llm_queue.restore(manifest_pfad)
+                raise
+            # Erneut zurückgestellte Dokumente stehen als neue Kopie in der Warteschlange
+            llm_queue.done(manifest_pfad)
+        return
+    if "--batch" in argumente:
+        position = argumente.index("--batch") + 1
+        manifest_pfad = argumente[position] if position < len(argumente) and not argumente[position].startswith("--") else "-"
+        if manifest_pfad == "-":
+            run_batch(sys.stdin, sys.stdout, token_budget)
+        else:
+            with open(manifest_pfad, "r", encoding="utf-8") as manifest:
+                run_batch(manifest, sys.stdout, token_budget)
+        return
+
     try:
         input_data = json.loads(sys.stdin.read())
         pdf_base64 = input_data.get('pdf_base64', '')
         filename = input_data.get('filename', '')
         email_context = input_data.get('email_context', None)
-        
+
         if not pdf_base64:
             result = {
                 "success": False,
                 "error": "Kein PDF Base64 bereitgestellt"
             }
         else:
+            set_document(input_data.get('id') or filename or None)
             # Decode Base64
             pdf_bytes = base64.b64decode(pdf_base64)
-            
+
             # Erstelle temporäre Datei
             with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
                 tmp_file.write(pdf_bytes)
                 tmp_path = tmp_file.name
-            
+
             try:
                 # Parse mit Gemini
-                result = asyncio.run(parse_invoice_with_emergent_gemini(tmp_path, email_context))
+                if input_data.get('line_items') or "--line-items" in argumente:
+                    result = asyncio.run(parse_line_items(tmp_path, email_context))
+                else:
+                    result = asyncio.run(parse_invoice_with_emergent_gemini(tmp_path, email_context))
             finally:
                 # Cleanup
                 try:
                     os.unlink(tmp_path)
                 except:
                     pass
-        
+
         print(json.dumps(result, ensure_ascii=False))
-        
+
     except Exception as e:
         error_result = {
             "success": False,
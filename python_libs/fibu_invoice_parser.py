@@ -8,42 +8,65 @@ import sys
 import os
 import json
 import base64
+import asyncio
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from datetime import datetime
+from decimal import Decimal
 import tempfile
 
 # Add invoice_parsers to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
 
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
+from helpers.number_helpers import parse_spalte, runde
 from parsers.base_parser import BaseParser
-from parsers.rechnung_parser.invoice_klingspor import InvoiceKlingsporParser
-from parsers.rechnung_parser.invoice_pferd import InvoicePferdParser
-from parsers.rechnung_parser.invoice_vsm import InvoiceVSMParser
-from parsers.rechnung_parser.invoice_starcke import InvoiceStarckeParser
+from file_handlers.pdf_handler import get_parser, parser_version, source_hash
+from file_handlers.pdf_inspect import PDF_SCAN, classify_pdf
+from file_handlers.fingerprint_index import FingerprintIndex, fallback_to_text, identify_with_fingerprints
+from helpers.worker import DocumentTimeout, RecyclingWorker, Watchdog, at_worker_exit, set_stage, stage_timings
+from helpers.profiling import PROFILE_PATH, PROFILE_TOP, ProfileReport, StackSampler
+from helpers.event_log import log, set_document
 
 
+# Anzahl paralleler Worker-Prozesse im Batch-Modus (--workers)
+BATCH_WORKERS = int(os.getenv("FIBU_BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+# Parser-Key -> Firma im gemeinsamen Registry; das Parser-Modul wird erst bei Bedarf importiert
 PARSER_REGISTRY = {
-    "klingspor": InvoiceKlingsporParser,
-    "pferd": InvoicePferdParser,
-    "rüggeberg": InvoicePferdParser,
-    "ruggeberg": InvoicePferdParser,
-    "vsm": InvoiceVSMParser,
-    "starcke": InvoiceStarckeParser,
+    "klingspor": "Klingspor",
+    "pferd": "Pferd",
+    "rüggeberg": "Pferd",
+    "ruggeberg": "Pferd",
+    "vsm": "VSM",
+    "starcke": "Starcke",
 }
 
+LLM_PARSER_METHOD = "emergent-gemini"
+LLM_PARSER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emergent_gemini_parser.py')
+
+# Ein Fingerprint-Index pro Prozess, gespeichert am Ende des Aufrufs bzw. wenn der Batch-Worker endet
+_fingerprint_index: FingerprintIndex | None = None
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    global _fingerprint_index
+    if _fingerprint_index is None:
+        _fingerprint_index = FingerprintIndex()
+        at_worker_exit(_fingerprint_index.save)
+    return _fingerprint_index
+
 
 def identify_company(pdf_path: str) -> tuple[str, bool]:
     """
     Identifiziert den Lieferanten aus dem PDF-Text
     """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages[:2]:  # Nur erste 2 Seiten für Performance
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text.lower() + "\n"
+        text = extract_pdf_text(pdf_path, max_pages=2).lower()  # Nur erste 2 Seiten für Performance
         
         # Mapping für Firma -> Parser-Key
         if "klingspor" in text:
@@ -58,17 +81,78 @@ def identify_company(pdf_path: str) -> tuple[str, bool]:
             return "", False
             
     except Exception as e:
-        print(f"Fehler beim Identifizieren: {e}", file=sys.stderr)
+        log.error("identify_failed", f"Fehler beim Identifizieren: {e}")
         return "", False
 
 
-def parse_invoice_from_base64(pdf_base64: str, filename: str = "") -> dict:
+def parse_scan_with_llm(pdf_path: str, email_context: dict = None) -> dict:
+    """
+    Gescannte PDFs ohne Textebene direkt an den LLM-Parser geben.
+    Spart die wirkungslose Textextraktion und den zweiten Prozessstart im Node-Skript.
+    Mit FIBU_SCAN_LLM=0 wird nur die Klassifizierung zurückgegeben.
+    """
+    scan_result = {
+        "success": False,
+        "error": "Gescanntes PDF ohne Textebene",
+        "pdf_typ": PDF_SCAN,
+        "confidence": 0
+    }
+    if os.getenv('FIBU_SCAN_LLM', '1') == '0':
+        return scan_result
+
+    import emergent_gemini_parser
+    if emergent_gemini_parser.check_available():
+        scan_result["error"] += " - LLM-Parser nicht verfügbar"
+        return scan_result
+
+    result = asyncio.run(emergent_gemini_parser.parse_invoice_with_emergent_gemini(pdf_path, email_context))
+    result["pdf_typ"] = PDF_SCAN
+    result["parser_version"] = source_hash([LLM_PARSER_PATH])
+    return result
+
+
+def parser_versions() -> dict:
+    """Aktuelle Parser-Version je parsing_method, z.B. {"python-pferd-parser": "a63e63a636bd", ...}"""
+    versions = {f"python-{key}-parser": parser_version(firma) for key, firma in PARSER_REGISTRY.items()}
+    versions[LLM_PARSER_METHOD] = source_hash([LLM_PARSER_PATH])
+    return versions
+
+
+def find_stale(records, versions: dict = None):
+    """
+    Filtert gespeicherte Ergebnisse auf die, deren Parser sich seitdem geändert hat
+    Args:
+        records: Dicts mit id/_id und parsing_method + parser_version, oder Mongo-Export aus
+                 fibu_ek_rechnungen (parsing.method + parsing.parserVersion)
+        versions: Aktuelle Versionen (Standard: parser_versions())
+    Yields:
+        dict: id, parsing_method, parser_version (gespeichert), current_version
+    """
+    versions = versions or parser_versions()
+    for zeilennummer, record in enumerate(records, 1):
+        parsing = record.get("parsing") or {}
+        method = record.get("parsing_method") or parsing.get("method")
+        version = record.get("parser_version") or parsing.get("parserVersion")
+        current = versions.get(method)
+        # Unbekannte Methoden (manuell, andere LLM-Parser) kann dieser Parser nicht neu erzeugen
+        if current is None or version == current:
+            continue
+        yield {
+            "id": manifest_id(record, zeilennummer),
+            "parsing_method": method,
+            "parser_version": version,
+            "current_version": current
+        }
+
+
+def parse_invoice_from_base64(pdf_base64: str, filename: str = "", email_context: dict = None) -> dict:
     """
     Parst eine Rechnung aus Base64-kodiertem PDF
     
     Args:
         pdf_base64: Base64-kodierter PDF-Inhalt
         filename: Dateiname für Hinweise
+        email_context: Dict mit from, subject, body (nur für gescannte PDFs an den LLM-Parser)
     
     Returns:
         dict mit:
@@ -85,6 +169,7 @@ def parse_invoice_from_base64(pdf_base64: str, filename: str = "") -> dict:
     """
     try:
         # Decode Base64
+        set_stage("decode")
         pdf_bytes = base64.b64decode(pdf_base64)
         
         # Erstelle temporäre Datei
@@ -93,127 +178,158 @@ def parse_invoice_from_base64(pdf_base64: str, filename: str = "") -> dict:
             tmp_path = tmp_file.name
         
         try:
-            # 1. Identifiziere Firma
-            firma_key, found = identify_company(tmp_path)
-            
-            if not found:
-                return {
-                    "success": False,
-                    "error": "Lieferant konnte nicht identifiziert werden",
-                    "confidence": 0
-                }
-            
-            # 2. Hole passenden Parser
-            parser_class = PARSER_REGISTRY.get(firma_key)
-            if not parser_class:
-                return {
-                    "success": False,
-                    "error": f"Kein Parser verfügbar für {firma_key}",
-                    "confidence": 0
-                }
-            
-            # 3. Parse PDF
-            parser = parser_class()
-            df, identifier = parser.parse(tmp_path)
-            
-            if df.empty:
-                return {
-                    "success": False,
-                    "error": "Keine Daten aus PDF extrahiert",
-                    "confidence": 20
-                }
-            
-            # 4. Extrahiere Rechnungsdaten
-            # DataFrame hat Spalten mit deutschen Namen
-            first_row = df.iloc[0]
-            
-            lieferant = first_row.get('Lieferant', firma_key)
-            rechnungsnummer = identifier or first_row.get('Fremdbelegnummer (Eingangsrechnung)', 'Unbekannt')
-            datum_str = first_row.get('Belegdatum', '')
-            
-            # Parse Datum
+            return parse_invoice_file(tmp_path, filename, email_context)
+        finally:
+            # Cleanup
             try:
-                # Format: DD.MM.YYYY
-                if '.' in datum_str:
-                    parts = datum_str.split('.')
-                    datum = f"{parts[2]}-{parts[1].zfill(2)}-{parts[0].zfill(2)}"
-                else:
-                    datum = datetime.now().strftime('%Y-%m-%d')
+                os.unlink(tmp_path)
             except:
-                datum = datetime.now().strftime('%Y-%m-%d')
-            
-            # Berechne Gesamtbetrag aus allen Positionen
-            # WICHTIG: netto_ek ist bereits PREIS PRO STÜCK (durch divide_nettoEk_by_menge)
-            gesamtbetrag_netto = 0.0
-            netto_col = 'Netto-EK'
-            menge_col = 'Menge'
-            
-            if netto_col in df.columns and menge_col in df.columns:
-                for _, row in df.iterrows():
-                    try:
-                        # Parse deutsche Zahlenformatierung: 1.234,56 -> 1234.56
-                        netto_str = str(row[netto_col])
-                        if netto_str == "N/A":
-                            continue
-                        # netto_ek ist Komma-formatiert: 123,45
-                        netto = float(netto_str.replace(',', '.'))
-                        
-                        menge_str = str(row[menge_col])
-                        if menge_str == "N/A":
-                            continue
-                        # menge kann Punkt oder Komma haben: 1.234,5 oder 10
-                        menge = float(menge_str.replace('.', '').replace(',', '.'))
-                        
-                        gesamtbetrag_netto += netto * menge
-                    except Exception as e:
-                        print(f"Fehler bei Betragsberechnung: {e}", file=sys.stderr)
-                        pass
-            
-            # MwSt (meistens 19%)
-            mwst_satz = 19
-            if 'MwST' in df.columns:
-                try:
-                    mwst_satz_str = str(df.iloc[0]['MwST']).strip()
-                    mwst_satz = int(mwst_satz_str)
-                except:
-                    pass
-            
-            gesamtbetrag_brutto = gesamtbetrag_netto * (1 + mwst_satz / 100)
-            
-            # Kreditor-Mapping (hardcoded für bekannte Lieferanten)
-            kreditor_mapping = {
-                "klingspor": "70004",
-                "pferd": "70005",
-                "rüggeberg": "70005",
-                "ruggeberg": "70005",
-                "starcke": "70006",
-                "vsm": "70009"
+                pass
+                
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "confidence": 0
+        }
+
+
+def parse_invoice_file(pdf_path: str, filename: str = "", email_context: dict = None) -> dict:
+    """
+    Parst eine Rechnung aus einer PDF-Datei (Ergebnis wie parse_invoice_from_base64)
+    """
+    try:
+        # 0. Scans ohne Textebene direkt an den LLM-Parser
+        set_stage("classify")
+        if classify_pdf(pdf_path) == PDF_SCAN:
+            set_stage("llm")
+            return parse_scan_with_llm(pdf_path, email_context)
+
+        # 1. Identifiziere Firma - über Metadaten/Dateinamen, sonst über den Text
+        set_stage("identify")
+        fingerprint_index = get_fingerprint_index()
+        fingerprint_keys = fingerprint_index.keys_for(pdf_path, filename)
+        firma_key, found, fingerprint = identify_with_fingerprints(
+            fingerprint_index, fingerprint_keys, pdf_path, identify_company, PARSER_REGISTRY.__contains__
+        )
+        
+        if not found:
+            return {
+                "success": False,
+                "error": "Lieferant konnte nicht identifiziert werden",
+                "confidence": 0
             }
-            
-            kreditor = kreditor_mapping.get(firma_key, None)
-            
+        
+        # 2. Hole passenden Parser
+        firma = PARSER_REGISTRY.get(firma_key)
+        parser = get_parser(firma, "invoice") if firma else None
+        if not parser:
             return {
-                "success": True,
-                "lieferant": lieferant,
-                "rechnungsnummer": rechnungsnummer,
-                "datum": datum,
-                "gesamtbetrag": round(gesamtbetrag_brutto, 2),
-                "nettobetrag": round(gesamtbetrag_netto, 2),
-                "steuerbetrag": round(gesamtbetrag_brutto - gesamtbetrag_netto, 2),
-                "steuersatz": mwst_satz,
-                "kreditor": kreditor,
-                "parsing_method": f"python-{firma_key}-parser",
-                "confidence": 95,
-                "positions_count": len(df)
+                "success": False,
+                "error": f"Kein Parser verfügbar für {firma_key}",
+                "confidence": 0
             }
-            
-        finally:
-            # Cleanup
+        
+        # 3. Parse PDF
+        set_stage("parse")
+        df, identifier = parser.parse(pdf_path)
+        
+        if fingerprint and (df.empty or not identifier):
+            # Ohne Positionen oder Rechnungsnummer ist der Fingerprint evtl. veraltet - Lieferant doch über den Text bestimmen
+            text_key, abweichend = fallback_to_text(
+                fingerprint_index, fingerprint, firma_key, pdf_path, identify_company
+            )
+            text_parser = get_parser(PARSER_REGISTRY[text_key], "invoice") if abweichend and text_key in PARSER_REGISTRY else None
+            if text_parser:
+                text_df, text_identifier = text_parser.parse(pdf_path)
+                # Nur mit Positionen des anderen Parsers umschalten, sonst bleibt es beim Ergebnis des Fingerprints
+                if not text_df.empty:
+                    firma_key, parser, df, identifier = text_key, text_parser, text_df, text_identifier
+        
+        if df.empty:
+            return {
+                "success": False,
+                "error": "Keine Daten aus PDF extrahiert",
+                "confidence": 20,
+                "parser_version": parser_version(PARSER_REGISTRY[firma_key])
+            }
+        
+        # 4. Extrahiere Rechnungsdaten
+        set_stage("totals")
+        # DataFrame hat Spalten mit deutschen Namen
+        first_row = df.iloc[0]
+        
+        lieferant = first_row.get('Lieferant', firma_key)
+        rechnungsnummer = identifier or first_row.get('Fremdbelegnummer (Eingangsrechnung)', 'Unbekannt')
+        datum_str = first_row.get('Belegdatum', '')
+        
+        # Parse Datum
+        try:
+            # Format: DD.MM.YYYY
+            if '.' in datum_str:
+                parts = datum_str.split('.')
+                datum = f"{parts[2]}-{parts[1].zfill(2)}-{parts[0].zfill(2)}"
+            else:
+                datum = datetime.now().strftime('%Y-%m-%d')
+        except:
+            datum = datetime.now().strftime('%Y-%m-%d')
+        
+        # Berechne Gesamtbetrag aus allen Positionen
+        # WICHTIG: netto_ek ist bereits PREIS PRO STÜCK (durch divide_nettoEk_by_menge)
+        gesamtbetrag_netto = Decimal(0)
+        netto_col = 'Netto-EK'
+        menge_col = 'Menge'
+        
+        if netto_col in df.columns and menge_col in df.columns:
+            # Deutsche Zahlenformatierung exakt als Decimal (1.234,56 -> 1234.56), "N/A" -> None
+            netto = parse_spalte(df[netto_col])
+            menge = parse_spalte(df[menge_col])
+            for netto_wert, menge_wert in zip(netto, menge):
+                if netto_wert is None or menge_wert is None:
+                    continue
+                gesamtbetrag_netto += netto_wert * menge_wert
+        
+        # MwSt (meistens 19%)
+        mwst_satz = 19
+        if 'MwST' in df.columns:
             try:
-                os.unlink(tmp_path)
+                mwst_satz_str = str(df.iloc[0]['MwST']).strip()
+                mwst_satz = int(mwst_satz_str)
             except:
                 pass
-                
+        
+        gesamtbetrag_brutto = gesamtbetrag_netto * (1 + Decimal(mwst_satz) / 100)
+        
+        # Kreditor-Mapping (hardcoded für bekannte Lieferanten)
+        kreditor_mapping = {
+            "klingspor": "70004",
+            "pferd": "70005",
+            "rüggeberg": "70005",
+            "ruggeberg": "70005",
+            "starcke": "70006",
+            "vsm": "70009"
+        }
+        
+        kreditor = kreditor_mapping.get(firma_key, None)
+        
+        fingerprint_index.learn(fingerprint_keys, firma_key)
+        
+        return {
+            "success": True,
+            "lieferant": lieferant,
+            "rechnungsnummer": rechnungsnummer,
+            "datum": datum,
+            "gesamtbetrag": float(runde(gesamtbetrag_brutto)),
+            "nettobetrag": float(runde(gesamtbetrag_netto)),
+            "steuerbetrag": float(runde(gesamtbetrag_brutto - gesamtbetrag_netto)),
+            "steuersatz": mwst_satz,
+            "kreditor": kreditor,
+            "parsing_method": f"python-{firma_key}-parser",
+            "confidence": 95,
+            "positions_count": len(df),
+            "parser_version": parser_version(PARSER_REGISTRY[firma_key])
+        }
+        
     except Exception as e:
         return {
             "success": False,
@@ -222,17 +338,215 @@ def parse_invoice_from_base64(pdf_base64: str, filename: str = "") -> dict:
         }
 
 
+def report_timeout(timeout):
+    """
+    Timeout-Ergebnis auf stdout, damit der Batch das Dokument in die Quarantäne legen kann
+    (vom Watchdog aufgerufen, nie zusammen mit dem regulären Ergebnis, siehe Watchdog.final_output)
+    """
+    result = {
+        "success": False,
+        "error": str(timeout),
+        "confidence": 0,
+        **timeout.as_dict()
+    }
+    sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def manifest_id(record: dict, zeilennummer: int) -> str:
+    """ID eines Manifest-Eintrags: id, Mongo-_id ({"$oid": ...}), Pfad oder Zeilennummer."""
+    doc_id = record.get("id") or record.get("_id")
+    if isinstance(doc_id, dict):
+        doc_id = doc_id.get("$oid")
+    return str(doc_id or record.get("path") or f"zeile-{zeilennummer}")
+
+
+def read_manifest(stream):
+    """
+    Liest ein JSONL-Manifest zeilenweise
+    Jede Zeile ist ein Dateipfad oder ein JSON-Objekt:
+    - {"id": ..., "path": "/pfad/rechnung.pdf", "email_context": {...}}
+    - {"id": ..., "pdf_base64": "...", "filename": "...", "email_context": {...}}
+    - ein Mongo-Export aus fibu_email_inbox ({"_id": {"$oid": ...}, "pdfBase64", "filename", "emailFrom", "subject", "bodyText"})
+    Yields:
+        tuple: (ID, Eintrag) - ungültige Zeilen als Eintrag mit "manifest_error"
+    """
+    for zeilennummer, zeile in enumerate(stream, 1):
+        zeile = zeile.strip()
+        if not zeile or zeile.startswith("#"):
+            continue
+        if not zeile.startswith("{"):
+            yield zeile, {"path": zeile}
+            continue
+        try:
+            record = json.loads(zeile)
+        except ValueError as e:
+            yield f"zeile-{zeilennummer}", {"manifest_error": f"Ungültiges JSON: {e}"}
+            continue
+        yield manifest_id(record, zeilennummer), record
+
+
+def parse_manifest_record(record: dict) -> dict:
+    """Parst einen Manifest-Eintrag (läuft im Worker-Prozess), Ergebnis wie parse_invoice_from_base64."""
+    email_context = record.get("email_context")
+    if email_context is None and ("emailFrom" in record or "subject" in record):
+        email_context = {
+            "from": record.get("emailFrom"),
+            "subject": record.get("subject"),
+            "body": record.get("bodyText") or ""
+        }
+    if record.get("path"):
+        if not os.path.isfile(record["path"]):
+            return {
+                "success": False,
+                "error": f"Datei nicht gefunden: {record['path']}",
+                "confidence": 0
+            }
+        return parse_invoice_file(record["path"], record.get("filename") or os.path.basename(record["path"]), email_context)
+
+    pdf_base64 = record.get("pdf_base64") or record.get("pdfBase64")
+    if not pdf_base64:
+        return {
+            "success": False,
+            "error": "Kein PDF Base64 bereitgestellt"
+        }
+    return parse_invoice_from_base64(pdf_base64, record.get("filename", ""), email_context)
+
+
+def run_batch(manifest, output, workers: int = BATCH_WORKERS, profile: ProfileReport = None):
+    """
+    Verarbeitet ein Manifest mit einem Pool aus Worker-Prozessen
+    Pro Dokument wird eine JSON-Zeile geschrieben, sobald es fertig ist (Reihenfolge wie fertig, nicht wie Eingabe):
+    {"id", "result", "error", "timings": {"wait_ms", "total_ms", "stages", "rss_mb"}}
+    result ist das Ergebnis wie im Einzelmodus (auch bei success=false); error nur bei Abbruch
+    (Timeout, abgestürzter Worker, ungültige Manifest-Zeile).
+    Args:
+        manifest: Iterierbare Zeilen (Datei oder stdin)
+        output: Ausgabestream für die Ergebniszeilen
+        workers (int): Anzahl paralleler Worker-Prozesse
+        profile: Falls gesetzt, laufen die Worker mit Sampling-Profiler und sammeln hier Stacks und Zeiten
+    """
+    workers = max(1, workers)
+    lokal = threading.local()
+    alle_worker = []
+    ausgabe_lock = threading.Lock()
+    # Nur begrenzt viele Einträge gleichzeitig im Speicher (Base64-PDFs können groß sein)
+    plaetze = threading.BoundedSemaphore(workers * 2)
+
+    def verarbeite(doc_id: str, record: dict, eingang: float):
+        start = time.perf_counter()
+        set_document(doc_id)
+        zeile = {"id": doc_id, "result": None, "error": record.get("manifest_error")}
+        stages, rss = {}, 0.0
+        try:
+            if not zeile["error"]:
+                worker = getattr(lokal, "worker", None)
+                if worker is None:
+                    worker = lokal.worker = RecyclingWorker(profile=profile is not None)
+                    with ausgabe_lock:
+                        alle_worker.append(worker)
+                worker.begin_document(doc_id)
+                try:
+                    zeile["result"], zeile["error"], _ = worker.run("document", parse_manifest_record, record)
+                except DocumentTimeout as timeout:
+                    zeile["error"] = str(timeout)
+                    zeile["result"] = {"success": False, "error": str(timeout), "confidence": 0, **timeout.as_dict()}
+                except Exception as e:
+                    zeile["error"] = f"Batch-Fehler: {str(e)}"
+                finally:
+                    worker.end_document()
+                stages, rss = worker.timings, worker.rss
+            zeile["timings"] = {
+                "wait_ms": round((start - eingang) * 1000, 1),
+                "total_ms": round((time.perf_counter() - start) * 1000, 1),
+                "stages": stages,
+                "rss_mb": round(rss),
+            }
+            ergebnis = zeile["result"] or {}
+            log.log("error" if zeile["error"] else "info", "document_done", f"{doc_id}: {zeile['error'] or ergebnis.get('error') or 'ok'}",
+                    status=ergebnis.get("status") or ("ok" if ergebnis.get("success") else "failed"),
+                    parsing_method=ergebnis.get("parsing_method"), duration_ms=zeile["timings"]["total_ms"],
+                    wait_ms=zeile["timings"]["wait_ms"], stages=stages, rss_mb=zeile["timings"]["rss_mb"])
+            if profile is not None:
+                profile.add(doc_id, zeile["timings"]["total_ms"], stages, worker.stacks if stages else None)
+            with ausgabe_lock:
+                output.write(json.dumps(zeile, ensure_ascii=False) + "\n")
+                output.flush()
+        finally:
+            plaetze.release()
+
+    batch_start = time.perf_counter()
+    anzahl = 0
+    log.info("batch_start", f"Batch mit {workers} Workern", workers=workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for doc_id, record in read_manifest(manifest):
+            plaetze.acquire()
+            pool.submit(verarbeite, doc_id, record, time.perf_counter())
+            anzahl += 1
+    for worker in alle_worker:
+        worker.close()
+    log.info("batch_done", f"{anzahl} Dokumente verarbeitet", documents=anzahl,
+             duration_ms=round((time.perf_counter() - batch_start) * 1000, 1),
+             workers_recycled=sum(worker.recycled for worker in alle_worker))
+
+
 def main():
     """
     CLI Interface für direkte Nutzung
-    Erwartet JSON via stdin mit: { "pdf_base64": "...", "filename": "..." }
-    Gibt JSON via stdout zurück
+    Erwartet JSON via stdin mit: { "pdf_base64": "...", "filename": "...", "email_context": {...} }
+    und optional "id" (Kennung des Aufrufers für Ereignisprotokoll und LLM-Warteschlange, sonst filename)
+    Gibt JSON via stdout zurück; bei überschrittenem Budget mit "status": "timeout" und "stage"
+
+    Batch-Modus: fibu_invoice_parser.py --batch [manifest.jsonl] [--workers N]
+    Liest das Manifest (Datei oder stdin) und schreibt eine JSON-Zeile pro Dokument (siehe run_batch)
+
+    Versionen: --versions gibt die aktuelle Parser-Version je parsing_method aus,
+    --stale [records.jsonl] nur die gespeicherten Ergebnisse mit veralteter Version (siehe find_stale)
+
+    Profiling: --profile [--profile-out DATEI] [--top N] schreibt die Stacks (collapsed, für Flame Graphs)
+    nach DATEI und die langsamsten Dokumente mit Stufenzeiten nach stderr - stdout bleibt für Ergebnisse
     """
+    cli = argparse.ArgumentParser(description="FIBU Invoice Parser")
+    cli.add_argument("--batch", nargs="?", const="-", metavar="MANIFEST", help="JSONL-Manifest (Standard: stdin)")
+    cli.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Parallele Worker-Prozesse im Batch-Modus")
+    cli.add_argument("--versions", action="store_true", help="Aktuelle Parser-Versionen als JSON ausgeben")
+    cli.add_argument("--stale", nargs="?", const="-", metavar="RECORDS", help="JSONL gespeicherter Ergebnisse (Standard: stdin)")
+    cli.add_argument("--profile", action="store_true", help="Sampling-Profil pro Dokument bzw. Batch aufzeichnen")
+    cli.add_argument("--profile-out", default=PROFILE_PATH, metavar="DATEI", help="Ausgabedatei der Stacks (collapsed)")
+    cli.add_argument("--top", type=int, default=PROFILE_TOP, help="Anzahl der langsamsten Dokumente in der Übersicht")
+    args = cli.parse_args()
+    profile = ProfileReport() if args.profile else None
+    if args.versions:
+        print(json.dumps(parser_versions(), ensure_ascii=False))
+        return
+    if args.stale:
+        records = sys.stdin if args.stale == "-" else open(args.stale, "r", encoding="utf-8")
+        with records:
+            for stale in find_stale(json.loads(zeile) for zeile in records if zeile.strip()):
+                print(json.dumps(stale, ensure_ascii=False), flush=True)
+        return
+    if args.batch:
+        try:
+            if args.batch == "-":
+                run_batch(sys.stdin, sys.stdout, args.workers, profile)
+            else:
+                with open(args.batch, "r", encoding="utf-8") as manifest:
+                    run_batch(manifest, sys.stdout, args.workers, profile)
+        finally:
+            if profile is not None:
+                profile.finish(args.profile_out, args.top)
+        return
+
+    # Budget pro Dokument (INVOICE_DOCUMENT_TIMEOUT / INVOICE_DOCUMENT_MAX_RSS_MB): bei Überschreitung
+    # wird ein Timeout-Ergebnis mit der laufenden Stufe ausgegeben und der Prozess beendet
+    watchdog = Watchdog(report_timeout).start()
     try:
         # Lese Input von stdin
+        set_stage("input")
         input_data = json.loads(sys.stdin.read())
         pdf_base64 = input_data.get('pdf_base64', '')
         filename = input_data.get('filename', '')
+        email_context = input_data.get('email_context', None)
         
         if not pdf_base64:
             result = {
@@ -240,18 +554,39 @@ def main():
                 "error": "Kein PDF Base64 bereitgestellt"
             }
         else:
-            result = parse_invoice_from_base64(pdf_base64, filename)
+            set_document(input_data.get('id') or filename or None)
+            stage_timings()
+            start = time.perf_counter()
+            sampler = StackSampler(root=sys._getframe()).start() if profile is not None else None
+            try:
+                result = parse_invoice_from_base64(pdf_base64, filename, email_context)
+            finally:
+                dauer_ms = (time.perf_counter() - start) * 1000
+                stages = stage_timings()
+                if sampler is not None:
+                    profile.add(filename or "stdin", dauer_ms, stages, sampler.stop())
+                    profile.finish(args.profile_out, args.top)
+            log.info("document_done", f"{filename}: {result.get('error') or 'ok'}",
+                     status=result.get("status") or ("ok" if result.get("success") else "failed"),
+                     parsing_method=result.get("parsing_method"), duration_ms=round(dauer_ms, 1), stages=stages)
         
-        # Output als JSON
-        print(json.dumps(result, ensure_ascii=False))
+        if _fingerprint_index is not None:
+            _fingerprint_index.save()
+
+        # Output als JSON (nicht zusätzlich zum Timeout-Ergebnis des Watchdogs)
+        with watchdog.final_output():
+            print(json.dumps(result, ensure_ascii=False))
         
     except Exception as e:
         error_result = {
             "success": False,
             "error": f"Script-Fehler: {str(e)}"
         }
-        print(json.dumps(error_result, ensure_ascii=False))
+        with watchdog.final_output():
+            print(json.dumps(error_result, ensure_ascii=False))
         sys.exit(1)
+    finally:
+        watchdog.stop()
 
 
 if __name__ == "__main__":
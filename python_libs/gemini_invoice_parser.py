@@ -8,8 +8,17 @@ import sys
 import os
 import json
 import base64
-from datetime import datetime
 import tempfile
+import time
+
+# Add invoice_parsers to path (Ereignisprotokoll)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
+
+from helpers.event_log import log, set_document
+from file_handlers.upload_registry import UploadRegistry
+from helpers.llm_limiter import LLM_CALL_TIMEOUT_S, LlmUnavailable, limiter, llm_queue
+from helpers.llm_prompts import SYSTEM_PREFIX, detect_vendor, user_prompt
+from helpers.llm_response import decode_json, invoice_result, merge_reask, reask_prompt, validate_invoice
 
 # Google Generative AI
 try:
@@ -33,6 +42,18 @@ if not GOOGLE_API_KEY:
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
+# Ein Modell-Client für alle Aufrufe; der feste Anweisungsblock als system_instruction bleibt
+# zwischen den Aufrufen gleich, damit das Prompt-Caching von Gemini greift
+model = genai.GenerativeModel('gemini-2.0-flash-exp', system_instruction=SYSTEM_PREFIX)
+
+# Bereits hochgeladene PDFs (SHA-256 -> File-API-Handle) werden wiederverwendet statt erneut hochgeladen;
+# Uploads eines Batches (LLM_UPLOAD_BATCH) löscht --cleanup am Batch-Ende, die übrigen nach Ablauf
+upload_registry = UploadRegistry()
+
+
+def upload_pdf(pdf_path: str):
+    return genai.upload_file(pdf_path, mime_type='application/pdf')
+
 
 def parse_invoice_with_gemini(pdf_base64: str, filename: str = "", email_context: dict = None) -> dict:
     """
@@ -56,112 +77,66 @@ def parse_invoice_with_gemini(pdf_base64: str, filename: str = "", email_context
             tmp_path = tmp_file.name
         
         try:
-            # Email-Kontext aufbauen
-            context_text = ""
-            if email_context:
-                context_text = "\n\nZUSÄTZLICHER KONTEXT AUS E-MAIL:\n"
-                if email_context.get('from'):
-                    context_text += f"Absender: {email_context['from']}\n"
-                if email_context.get('subject'):
-                    context_text += f"Betreff: {email_context['subject']}\n"
-                if email_context.get('body'):
-                    body = email_context['body'][:500]
-                    context_text += f"E-Mail-Text: {body}\n"
-            
-            # Prompt für deutsche Lieferantenrechnungen
-            prompt = f"""Extrahiere die folgenden Informationen aus dieser deutschen Lieferantenrechnung (EK-Rechnung):
-            - Rechnungsnummer
-            - Rechnungsdatum (Format: YYYY-MM-DD)
-            - Lieferantenname (Firma)
-            - Gesamtbetrag (Brutto, mit MwSt)
-            - Nettobetrag (ohne MwSt)
-            - Mehrwertsteuerbetrag
-            - MwSt-Satz (z.B. 19, 7, 0)
-            
-            {context_text}
-            
-            WICHTIG: 
-            - Nutze auch die Informationen aus dem E-Mail-Kontext oben.
-            - Der Lieferantenname kann z.B. aus dem E-Mail-Absender stammen.
-            - Bei deutschen Beträgen: 1.234,56 € = 1234.56
-            - Falls keine Beträge gefunden werden, setze sie auf 0
-            
-            Formatiere die Antwort als JSON-Objekt:
-            {{
-              "rechnungsnummer": "string",
-              "datum": "YYYY-MM-DD",
-              "lieferant": "string",
-              "gesamtbetrag": number,
-              "nettobetrag": number,
-              "mehrwertsteuer": number,
-              "mwstSatz": number
-            }}
+            # Feste Anweisungen stehen in der system_instruction, hier nur Lieferanten-Hinweise und E-Mail-Kontext
+            prompt = user_prompt(detect_vendor(tmp_path, email_context), email_context)
             
-            Gib NUR das JSON zurück, keine Erklärungen."""
-            
-            # Upload PDF zu Gemini
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            
-            # Gemini File API für PDFs
-            uploaded_file = genai.upload_file(tmp_path, mime_type='application/pdf')
+            # Gemini File API für PDFs - ein noch gültiger Upload desselben Inhalts wird wiederverwendet
+            uploaded_file, _ = upload_registry.get_or_upload(tmp_path, upload_pdf, genai.get_file)
             
             # Generate Content
-            response = model.generate_content([prompt, uploaded_file])
-            
-            # Parse Response
-            text = response.text.strip()
-            
-            # Remove markdown code blocks
-            text = text.replace('```json', '').replace('```', '').strip()
-            
-            # Parse JSON
-            data = json.loads(text)
-            
-            # Validierung und Bereinigung
-            gesamtbetrag = float(data.get('gesamtbetrag', 0))
-            nettobetrag = float(data.get('nettobetrag', 0))
-            mehrwertsteuer = float(data.get('mehrwertsteuer', 0))
-            
-            # Wenn netto fehlt aber brutto da ist, berechne
-            if gesamtbetrag > 0 and nettobetrag == 0:
-                mwst_satz = int(data.get('mwstSatz', 19))
-                nettobetrag = gesamtbetrag / (1 + mwst_satz / 100)
-                mehrwertsteuer = gesamtbetrag - nettobetrag
-            
-            # Cleanup
-            try:
-                genai.delete_file(uploaded_file.name)
-            except:
-                pass
-            
+            # Gemeinsamer Limiter aller Parser-Prozesse (Concurrency, Circuit Breaker)
+            with limiter.slot(), log.timed("llm_call", model="gemini-2.0-flash-exp"):
+                response = model.generate_content(
+                    [prompt, uploaded_file],
+                    request_options={"timeout": LLM_CALL_TIMEOUT_S}
+                )
+            
+            # Schema-Prüfung mit Reparatur (deutsche Zahlen, Datumsformate, ableitbare Beträge)
+            data = decode_json(response.text)
+            if not isinstance(data, dict):
+                log.error("llm_invalid_json", "Kein JSON in Gemini-Response gefunden", response_chars=len(response.text))
+                return {
+                    "success": False,
+                    "error": "Kein JSON in Gemini-Response gefunden",
+                    "confidence": 0
+                }
+            felder, fehlende = validate_invoice(data)
+
+            # Nur die weiterhin ungültigen Felder kurz nachfragen (gleicher Upload)
+            if fehlende:
+                try:
+                    with limiter.slot(), log.timed("llm_call", model="gemini-2.0-flash-exp", reask=fehlende):
+                        nachtrag = model.generate_content(
+                            [reask_prompt(fehlende), uploaded_file],
+                            request_options={"timeout": LLM_CALL_TIMEOUT_S}
+                        )
+                    felder, fehlende = merge_reask(felder, nachtrag.text, fehlende)
+                except Exception as e:
+                    log.warning("llm_reask_failed", f"Nachfrage fehlgeschlagen: {e}", fields=fehlende)
+            
+            return invoice_result(felder, fehlende, "gemini-ai", 80, 50)
+            
+        except LlmUnavailable as e:
+            # Anbieter überlastet: Dokument für später zurückstellen statt auf den Timeout zu warten
+            llm_queue.enqueue(tmp_path, filename or None, email_context, e.grund)
             return {
-                "success": True,
-                "lieferant": data.get('lieferant', 'Unbekannt'),
-                "rechnungsnummer": data.get('rechnungsnummer', 'Unbekannt'),
-                "datum": data.get('datum', datetime.now().strftime('%Y-%m-%d')),
-                "gesamtbetrag": round(gesamtbetrag, 2),
-                "nettobetrag": round(nettobetrag, 2),
-                "steuerbetrag": round(mehrwertsteuer, 2),
-                "steuersatz": int(data.get('mwstSatz', 19)),
-                "kreditor": None,
-                "parsing_method": "gemini-ai",
-                "confidence": 80 if gesamtbetrag > 0 else 50
+                "success": False,
+                "queued": True,
+                "error": str(e),
+                "retry_in": round(e.retry_in),
+                "confidence": 0
             }
-            
         finally:
+            # Der Upload bleibt für Wiederholungen stehen (cleanup am Batch-Ende bzw. nach Ablauf)
+            upload_registry.save()
             # Cleanup temp file
             try:
                 os.unlink(tmp_path)
             except:
                 pass
                 
-    except json.JSONDecodeError as e:
-        return {
-            "success": False,
-            "error": f"JSON Parse Error: {str(e)}",
-            "confidence": 0
-        }
     except Exception as e:
+        log.error("llm_failed", str(e))
         return {
             "success": False,
             "error": str(e),
@@ -169,11 +144,66 @@ def parse_invoice_with_gemini(pdf_base64: str, filename: str = "", email_context
         }
 
 
+def run_batch(manifest, output):
+    """
+    Batch-Modus: liest JSON-Zeilen {"id", "pdf_base64" oder "path", "filename", "email_context"}
+    und schreibt pro Dokument {"id", "result"}. Die Uploads des Batches werden am Ende gelöscht.
+    """
+    if not upload_registry.batch:
+        upload_registry.batch = f"gemini-{os.getpid()}-{int(time.time())}"
+    try:
+        for zeilennummer, zeile in enumerate(manifest, 1):
+            if not zeile.strip():
+                continue
+            record = json.loads(zeile)
+            doc_id = str(record.get("id") or record.get("path") or f"zeile-{zeilennummer}")
+            pdf_base64 = record.get("pdf_base64")
+            if not pdf_base64 and record.get("path"):
+                with open(record["path"], "rb") as f:
+                    pdf_base64 = base64.b64encode(f.read()).decode("ascii")
+            set_document(doc_id)
+            if pdf_base64:
+                result = parse_invoice_with_gemini(pdf_base64, record.get("filename", ""), record.get("email_context"))
+            else:
+                result = {"success": False, "error": "Kein PDF Base64 bereitgestellt"}
+            output.write(json.dumps({"id": doc_id, "result": result}, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        set_document(None)
+        geloescht = upload_registry.cleanup(genai.delete_file, batch=upload_registry.batch)
+        log.info("upload_cleanup", f"{geloescht} Uploads des Batches gelöscht", batch=upload_registry.batch, deleted=geloescht)
+
+
 def main():
     """
     CLI Interface
     Erwartet JSON via stdin mit: { "pdf_base64": "...", "filename": "...", "email_context": {...} }
+
+    Batch-Modus: gemini_invoice_parser.py --batch [manifest.jsonl] (siehe run_batch; Manifest Standard: stdin)
+
+    Batch-Ende, wenn ein Skript die Parser pro Dokument mit LLM_UPLOAD_BATCH=<id> aufruft
+    (scripts/drain-llm-queue.js: cleanupUploads): gemini_invoice_parser.py --cleanup [--upload-batch <id>] [--all]
+    löscht die Uploads des Batches (Standard: LLM_UPLOAD_BATCH) sowie abgelaufene (mit --all: sämtliche)
+    Uploads der Registry bei Gemini und gibt {"deleted": n} aus
     """
+    argumente = sys.argv[1:]
+    if "--cleanup" in argumente:
+        batch = upload_registry.batch
+        if "--upload-batch" in argumente:
+            batch = argumente[argumente.index("--upload-batch") + 1]
+        geloescht = upload_registry.cleanup(genai.delete_file, alle="--all" in argumente, batch=batch or None)
+        print(json.dumps({"success": True, "deleted": geloescht}))
+        return
+    if "--batch" in argumente:
+        position = argumente.index("--batch") + 1
+        manifest_pfad = argumente[position] if position < len(argumente) and not argumente[position].startswith("--") else "-"
+        if manifest_pfad == "-":
+            run_batch(sys.stdin, sys.stdout)
+        else:
+            with open(manifest_pfad, "r", encoding="utf-8") as manifest:
+                run_batch(manifest, sys.stdout)
+        return
+
     try:
         input_data = json.loads(sys.stdin.read())
         pdf_base64 = input_data.get('pdf_base64', '')
@@ -186,6 +216,7 @@ def main():
                 "error": "Kein PDF Base64 bereitgestellt"
             }
         else:
+            set_document(filename or None)
             result = parse_invoice_with_gemini(pdf_base64, filename, email_context)
         
         print(json.dumps(result, ensure_ascii=False))
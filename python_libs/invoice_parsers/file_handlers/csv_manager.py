@@ -1,5 +1,6 @@
 import os
 import pandas as pd
+from helpers.event_log import log
 
 def update_ongoing_csv_file(csv_path: str, new_data_df: pd.DataFrame) -> bool:
     """
@@ -18,10 +19,10 @@ def update_ongoing_csv_file(csv_path: str, new_data_df: pd.DataFrame) -> bool:
             new_data_df.to_csv(csv_path, mode='a', header=False, index=False, sep=';', encoding='utf-8')
         return True
     except OSError as e:
-        print(f"Die große CSV Datei konnte nicht aktualisiert werden: {e}")
+        log.error("csv_failed", f"Die große CSV Datei konnte nicht aktualisiert werden: {e}", path=csv_path)
         return False
     except Exception as e:
-        print(f"Ein Fehler ist beim Aktualisieren der großen CSV Datei aufgetreten: {e}")
+        log.error("csv_failed", f"Ein Fehler ist beim Aktualisieren der großen CSV Datei aufgetreten: {e}", path=csv_path)
         return False
         
 
@@ -48,8 +49,8 @@ def create_csv_file(csv_path: str, new_data_df: pd.DataFrame) -> bool:
         new_data_df.to_csv(csv_path, index=False, sep=';', encoding='utf-8', header=False)
         return True
     except OSError as e:
-        print(f"Die CSV Datei konnte nicht gespeichert werden: {e}")
+        log.error("csv_failed", f"Die CSV Datei konnte nicht gespeichert werden: {e}", path=csv_path)
         return False
     except Exception as e:
-        print(f"Ein Fehler ist beim Speichern der CSV Datei aufgetreten: {e}")
+        log.error("csv_failed", f"Ein Fehler ist beim Speichern der CSV Datei aufgetreten: {e}", path=csv_path)
         return False
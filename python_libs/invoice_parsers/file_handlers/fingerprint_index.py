@@ -0,0 +1,215 @@
+"""
+Lieferantenerkennung über PDF-Metadaten und Dateinamen, ohne Text zu extrahieren.
+
+Nach jeder erfolgreich geparsten Rechnung wird gelernt, welcher Lieferant zu welchem
+Fingerprint (Producer/Creator/Author bzw. Dateinamensmuster) gehört. Ein Fingerprint
+löst erst auf, wenn er mehrfach und nur für einen Lieferanten gesehen wurde. Stichproben
+und fehlgeschlagene Parses werden gegen die Texterkennung geprüft; widerspricht diese zu
+oft, gilt der Fingerprint als veraltet.
+
+Ein Prozess hält einen Index und speichert ihn einmal am Ende (Batch-Worker beim Beenden).
+Gespeichert werden nur die eigenen Änderungen seit dem Laden: save() liest die Datei unter
+einem fcntl-Lock neu und addiert sie, damit parallele Prozesse sich nicht überschreiben.
+"""
+import fcntl
+import json
+import os
+import re
+import tempfile
+from typing import Callable
+
+from file_handlers.pdf_inspect import read_pdf_metadata
+
+FINGERPRINT_INDEX_PATH = os.getenv(
+    "INVOICE_FINGERPRINT_INDEX",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fingerprint_index.json"),
+)
+
+# Ab so vielen Beobachtungen (nur ein Lieferant) wird ein Fingerprint genutzt
+MIN_OBSERVATIONS = 2
+# Ab so vielen Widersprüchen der Texterkennung gilt ein Fingerprint als veraltet
+MAX_DISAGREEMENTS = 2
+# Jeder n-te Treffer wird zusätzlich per Texterkennung geprüft
+VERIFY_EVERY = 20
+
+_ZIFFERN = re.compile(r"\d+")
+_BUCHSTABEN = re.compile(r"[a-zäöüß]{3,}")
+
+
+def metadata_fingerprint(metadata: dict[str, str]) -> str | None:
+    if not metadata:
+        return None
+    teile = [f"{feld.lower()}={metadata[feld]}" for feld in sorted(metadata)]
+    return "meta:" + "|".join(teile)
+
+
+def filename_fingerprint(filename: str) -> str | None:
+    """Dateiname ohne Zahlen, z.B. "Pferd_RE_2025-123456.pdf" -> "name:pferd_re_#-#.pdf"."""
+    if not filename:
+        return None
+    muster = _ZIFFERN.sub("#", os.path.basename(filename).lower())
+    stamm = os.path.splitext(muster)[0]
+    # Zu allgemeine Namen ("#.pdf", "scan_#.pdf", "rechnung.pdf") erkennen keinen Lieferanten
+    if not _BUCHSTABEN.search(stamm) or stamm.strip("#_- ") in ("scan", "rechnung", "invoice", "dokument", "document"):
+        return None
+    return "name:" + muster
+
+
+def fingerprint_keys(metadata: dict[str, str], filename: str) -> list[str]:
+    """Fingerprints aus bereits gelesenen Metadaten und dem Dateinamen, Metadaten vor Dateiname."""
+    return [key for key in (metadata_fingerprint(metadata), filename_fingerprint(filename)) if key]
+
+
+def _neuer_eintrag() -> dict:
+    return {"vendors": {}, "hits": 0, "disagreements": 0}
+
+
+class FingerprintIndex:
+    """
+    Args:
+        path (str): JSON-Datei des Index (daneben <path>.lock)
+    """
+
+    def __init__(self, path: str = FINGERPRINT_INDEX_PATH):
+        self.path = path
+        self.fingerprints: dict[str, dict] = {}
+        # Änderungen dieses Prozesses seit dem letzten Laden/Speichern, werden in save() aufaddiert
+        self._aenderungen: dict[str, dict] = {}
+        self._geaendert = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.fingerprints = json.load(f).get("fingerprints", {})
+        except (OSError, ValueError):
+            self.fingerprints = {}
+
+    def _aenderung(self, key: str) -> dict:
+        return self._aenderungen.setdefault(key, _neuer_eintrag())
+
+    def save(self):
+        """Addiert die eigenen Änderungen zum aktuellen Stand der Datei (unter Lock) und schreibt sie."""
+        if not self._geaendert:
+            return
+        ordner = os.path.dirname(self.path) or "."
+        try:
+            with open(self.path + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    for key, aenderung in self._aenderungen.items():
+                        eintrag = self.fingerprints.setdefault(key, _neuer_eintrag())
+                        for vendor, anzahl in aenderung["vendors"].items():
+                            eintrag["vendors"][vendor] = eintrag["vendors"].get(vendor, 0) + anzahl
+                        eintrag["hits"] = eintrag.get("hits", 0) + aenderung["hits"]
+                        eintrag["disagreements"] = eintrag.get("disagreements", 0) + aenderung["disagreements"]
+                    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=ordner, suffix=".tmp", delete=False) as tmp:
+                        json.dump({"version": 1, "fingerprints": self.fingerprints}, tmp, ensure_ascii=False, indent=1)
+                    os.replace(tmp.name, self.path)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            self._aenderungen = {}
+            self._geaendert = False
+        except OSError:
+            # Der Index ist nur ein Beschleuniger - ohne Schreibrechte wird einfach nichts gelernt
+            pass
+
+    def keys_for(self, pdf_path: str, filename: str = "") -> list[str]:
+        """Fingerprints eines PDFs, Metadaten vor Dateiname."""
+        try:
+            metadata = read_pdf_metadata(pdf_path)
+        except Exception:
+            metadata = {}
+        return fingerprint_keys(metadata, filename)
+
+    def _vendor_for(self, key: str) -> str | None:
+        eintrag = self.fingerprints.get(key)
+        if not eintrag or eintrag.get("disagreements", 0) >= MAX_DISAGREEMENTS:
+            return None
+        vendors = eintrag.get("vendors", {})
+        if len(vendors) != 1:
+            return None
+        vendor, anzahl = next(iter(vendors.items()))
+        return vendor if anzahl >= MIN_OBSERVATIONS else None
+
+    def lookup(self, keys: list[str]) -> tuple[str | None, str | None, bool]:
+        """
+        Sucht den Lieferanten zu den Fingerprints
+        Returns:
+            tuple: (Lieferant, Fingerprint, verify) - verify=True heißt: per Text gegenprüfen
+        """
+        for key in keys:
+            vendor = self._vendor_for(key)
+            if vendor:
+                eintrag = self.fingerprints[key]
+                eintrag["hits"] = eintrag.get("hits", 0) + 1
+                # Treffer allein sind kein Grund zu speichern, sie werden mit der nächsten Änderung mitgeschrieben
+                self._aenderung(key)["hits"] += 1
+                return vendor, key, eintrag["hits"] % VERIFY_EVERY == 0
+        return None, None, False
+
+    def learn(self, keys: list[str], vendor: str):
+        """Merkt sich den Lieferanten einer erfolgreich geparsten Rechnung."""
+        vendor = vendor.lower()
+        for key in keys:
+            for eintrag in (self.fingerprints.setdefault(key, _neuer_eintrag()), self._aenderung(key)):
+                eintrag["vendors"][vendor] = eintrag["vendors"].get(vendor, 0) + 1
+        self._geaendert = bool(keys) or self._geaendert
+
+    def record_disagreement(self, key: str):
+        """Die Texterkennung widerspricht dem Fingerprint; der richtige Lieferant kommt über learn() dazu."""
+        eintrag = self.fingerprints.setdefault(key, _neuer_eintrag())
+        eintrag["disagreements"] = eintrag.get("disagreements", 0) + 1
+        self._aenderung(key)["disagreements"] += 1
+        self._geaendert = True
+
+
+def identify_with_fingerprints(
+    index: FingerprintIndex,
+    keys: list[str],
+    pdf_path: str,
+    identify_text: Callable[[str], tuple[str, bool]],
+    is_known: Callable[[str], bool],
+) -> tuple[str, bool, str | None]:
+    """
+    Erkennt den Lieferanten zuerst über die Fingerprints, sonst über identify_text(pdf_path).
+    Args:
+        index: Der Fingerprint-Index
+        keys: Fingerprints des PDFs (FingerprintIndex.keys_for)
+        pdf_path: Pfad zur PDF-Datei
+        identify_text: Texterkennung des Aufrufers, z.B. identify_company
+        is_known: Ob der Aufrufer für einen Lieferanten einen Parser hat
+    Returns:
+        tuple: (Lieferant, erkannt, Fingerprint falls ungeprüft über den Fingerprint erkannt)
+    """
+    vendor, fingerprint, verify = index.lookup(keys)
+    if vendor and is_known(vendor) and not verify:
+        return vendor, True, fingerprint
+
+    firma, found = identify_text(pdf_path)
+    if found and fingerprint and firma.lower() != vendor:
+        index.record_disagreement(fingerprint)
+    if not found and vendor and is_known(vendor):
+        # Stichprobe ohne Textergebnis: dem Fingerprint weiter vertrauen
+        return vendor, True, fingerprint
+    return firma, found, None
+
+
+def fallback_to_text(
+    index: FingerprintIndex,
+    fingerprint: str,
+    vendor: str,
+    pdf_path: str,
+    identify_text: Callable[[str], tuple[str, bool]],
+) -> tuple[str, bool]:
+    """
+    Der über den Fingerprint gewählte Parser hat nichts (Brauchbares) gefunden - Texterkennung als Fallback.
+    Returns:
+        tuple: (Lieferant laut Text, ob dieser vom Fingerprint abweicht)
+    """
+    firma, found = identify_text(pdf_path)
+    if found and firma.lower() != vendor.lower():
+        index.record_disagreement(fingerprint)
+        return firma, True
+    return vendor, False
@@ -1,30 +1,113 @@
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import os
+from importlib.metadata import entry_points
 from typing import Literal
 
-#from parsers.auftrags_parser.pferd_parser import PferdParser
-from parsers.rechnung_parser.invoice_pferd import InvoicePferdParser
-from parsers.rechnung_parser.invoice_klingspor import InvoiceKlingsporParser
-from parsers.rechnung_parser.invoice_norton import InvoiceNortonParser
-from parsers.rechnung_parser.invoice_rhodius import InvoiceRhodiusParser
-from parsers.rechnung_parser.invoice_vsm import InvoiceVSMParser
-from parsers.rechnung_parser.invoice_starcke import InvoiceStarckeParser
-from parsers.rechnung_parser.invoice_awuko import InvoiceAwukoParser
-from parsers.rechnung_parser.invoice_bosch import InvoiceBoschParser
-from parsers.rechnung_parser.invoice_plastimex import InvoicePlastimexParser
 from parsers.base_parser import BaseParser
 
-PARSER_REGISTRY = {
-    "Invoice_pferd": InvoicePferdParser,
-    "Invoice_klingspor": InvoiceKlingsporParser,
-    "Invoice_norton": InvoiceNortonParser,
-    "Invoice_rhodius": InvoiceRhodiusParser,
-    "Invoice_vsm": InvoiceVSMParser,
-    "Invoice_starcke": InvoiceStarckeParser,
-    "Invoice_awuko": InvoiceAwukoParser,
-    "Invoice_bosch": InvoiceBoschParser,
-    "Invoice_plastimex": InvoicePlastimexParser,
+# Registry-Key -> "modul:Klasse". Die Module werden erst beim ersten get_parser() importiert,
+# damit ein Prozess nur den Parser lädt, den das jeweilige PDF braucht.
+PARSER_REGISTRY: dict[str, str] = {
+    #"AB_pferd": "parsers.auftrags_parser.pferd_parser:PferdParser",
+    "Invoice_pferd": "parsers.rechnung_parser.invoice_pferd:InvoicePferdParser",
+    "Invoice_klingspor": "parsers.rechnung_parser.invoice_klingspor:InvoiceKlingsporParser",
+    "Invoice_norton": "parsers.rechnung_parser.invoice_norton:InvoiceNortonParser",
+    "Invoice_rhodius": "parsers.rechnung_parser.invoice_rhodius:InvoiceRhodiusParser",
+    "Invoice_vsm": "parsers.rechnung_parser.invoice_vsm:InvoiceVSMParser",
+    "Invoice_starcke": "parsers.rechnung_parser.invoice_starcke:InvoiceStarckeParser",
+    "Invoice_awuko": "parsers.rechnung_parser.invoice_awuko:InvoiceAwukoParser",
+    "Invoice_bosch": "parsers.rechnung_parser.invoice_bosch:InvoiceBoschParser",
+    "Invoice_plastimex": "parsers.rechnung_parser.invoice_plastimex:InvoicePlastimexParser",
     # Add other parsers here
 }
 
+# Plugins für neue Lieferanten, ohne diese Datei zu ändern:
+# - Entry Points der Gruppe PLUGIN_ENTRY_POINT_GROUP, z.B. "mirka = mirka_parser:InvoiceMirkaParser"
+# - Umgebungsvariable PLUGIN_ENV_VAR, z.B. "mirka=mirka_parser:InvoiceMirkaParser;sia=sia_parser:InvoiceSiaParser"
+# Der Name ist zugleich der Firmenname (Key "Invoice_<name>") und das Stichwort für identify_company.
+PLUGIN_ENTRY_POINT_GROUP = "score_zentrale.invoice_parsers"
+PLUGIN_ENV_VAR = "INVOICE_PARSER_PLUGINS"
+
+# Gemeinsame Module, von denen die Ausgabe aller Parser abhängt; sie gehen in den Versions-Hash
+# (parser_version) ein, auch wenn sie keine Basisklasse des Parsers sind
+PARSER_HELPER_MODULES = (
+    "helpers.helpers",
+    "helpers.number_helpers",
+    "helpers.date_helpers",
+    "helpers.constants",
+    "file_handlers.pdf_text",
+    "parsers.line_engine",
+)
+
+_parser_classes: dict[str, type[BaseParser]] = {}
+_parser_versions: dict[str, str] = {}
+_plugins: dict[str, str] | None = None
+
+
+def register_parser(firma: str, target: str, document_type: Literal["AB", "invoice"] = "invoice"):
+    """
+    Registriert einen Parser, ohne sein Modul zu importieren
+    Args:
+        firma (str): The company name
+        target (str): "modul:Klasse", z.B. "mirka_parser:InvoiceMirkaParser"
+        document_type (str): The document type ("AB" or "invoice")
+    """
+    key = _registry_key(firma, document_type)
+    PARSER_REGISTRY[key] = target
+    _parser_classes.pop(key, None)
+    _parser_versions.pop(key, None)
+
+
+def plugin_firmen() -> list[str]:
+    """Namen aller Plugin-Lieferanten (nur Metadaten, es wird nichts importiert)."""
+    return list(_load_plugins())
+
+
+def has_parser(firma: str, document_type: Literal["AB", "invoice"]) -> bool:
+    """Ob es für Firma und Dokumenttyp einen Parser gibt, ohne ihn zu importieren."""
+    key = _registry_key(firma, document_type)
+    if key not in PARSER_REGISTRY:
+        _load_plugins()
+    return key in PARSER_REGISTRY
+
+
+def _registry_key(firma: str, document_type: Literal["AB", "invoice"]) -> str:
+    return f"{'Invoice' if document_type == 'invoice' else ''}_{firma.lower()}"
+
+
+def _load_plugins() -> dict[str, str]:
+    global _plugins
+    if _plugins is None:
+        _plugins = {}
+        for entry_point in entry_points(group=PLUGIN_ENTRY_POINT_GROUP):
+            _plugins[entry_point.name.lower()] = entry_point.value
+        for eintrag in os.getenv(PLUGIN_ENV_VAR, "").split(";"):
+            if "=" in eintrag:
+                name, target = eintrag.split("=", 1)
+                _plugins[name.strip().lower()] = target.strip()
+        for name, target in _plugins.items():
+            PARSER_REGISTRY.setdefault(_registry_key(name, "invoice"), target)
+    return _plugins
+
+
+def _load_parser_class(key: str) -> type[BaseParser] | None:
+    if key in _parser_classes:
+        return _parser_classes[key]
+    target = PARSER_REGISTRY.get(key)
+    if target is None:
+        _load_plugins()
+        target = PARSER_REGISTRY.get(key)
+        if target is None:
+            return None
+    module_name, class_name = target.split(":")
+    parser_class = getattr(importlib.import_module(module_name), class_name)
+    _parser_classes[key] = parser_class
+    return parser_class
+
+
 def get_parser(firma: str, document_type: Literal["AB", "invoice"]) -> BaseParser | None:
     """
     Get the parser for the given company and document type
@@ -34,8 +117,53 @@ def get_parser(firma: str, document_type: Literal["AB", "invoice"]) -> BaseParse
     Returns:
         BaseParser: The parser for the given company and document type
     """
-    key = f"{'Invoice' if document_type == 'invoice' else ''}_{firma.lower()}"
-    parser = PARSER_REGISTRY.get(key, None)
+    parser = _load_parser_class(_registry_key(firma, document_type))
     if not parser:
         return None
-    return parser()
\ No newline at end of file
+    return parser()
+
+
+def source_hash(paths: list[str]) -> str:
+    """Kurzer SHA-256 über den Inhalt der Dateien (in der angegebenen Reihenfolge)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def parser_version(firma: str, document_type: Literal["AB", "invoice"] = "invoice") -> str | None:
+    """
+    Version des Parsers für die Firma: PARSER_VERSION der Klasse, sonst ein Hash über den Quelltext
+    der Klasse, ihrer Basisklassen und der PARSER_HELPER_MODULES (ändert sich also auch mit
+    base_parser.py, line_engine.py oder number_helpers.py)
+    Args:
+        firma (str): The company name
+        document_type (str): The document type ("AB" or "invoice")
+    Returns:
+        str | None: Die Version, None ohne Parser
+    """
+    key = _registry_key(firma, document_type)
+    if key in _parser_versions:
+        return _parser_versions[key]
+    parser_class = _load_parser_class(key)
+    if parser_class is None:
+        return None
+    version = parser_class.PARSER_VERSION
+    if not version:
+        paths = []
+        for cls in parser_class.__mro__:
+            try:
+                path = inspect.getsourcefile(cls)
+            except TypeError:
+                # object, ABC, ... haben keinen Quelltext
+                continue
+            if path and path not in paths:
+                paths.append(path)
+        for module_name in PARSER_HELPER_MODULES:
+            path = importlib.util.find_spec(module_name).origin
+            if path not in paths:
+                paths.append(path)
+        version = source_hash(paths)
+    _parser_versions[key] = version
+    return version
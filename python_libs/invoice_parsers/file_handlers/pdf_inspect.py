@@ -0,0 +1,101 @@
+"""
+Schnelle Vorprüfung von PDFs ohne Layout-Analyse.
+
+Es werden nur die Content-Streams der Seiten (und ihrer Form-XObjects) dekomprimiert
+und die Textobjekte (BT ... ET) gezählt. Seiten ohne Textobjekt haben keine Textebene
+und liefern bei pdfplumber keinen Text - solche PDFs gehen direkt an den LLM-Parser.
+"""
+import re
+
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import PDFStream, resolve1
+from pdfminer.utils import decode_text
+
+PDF_TEXT = "text"
+PDF_SCAN = "scan"
+PDF_MIXED = "mixed"
+PDF_UNKNOWN = "unknown"
+
+# Operator "BT" (Beginn eines Textobjekts) als eigenes Token im Content-Stream
+TEXT_OBJECT = re.compile(rb"(?<![A-Za-z0-9])BT(?![A-Za-z0-9])")
+
+# Verschachtelte Form-XObjects nur begrenzt verfolgen
+MAX_FORM_DEPTH = 3
+
+
+def _count_text_objects(data: bytes) -> int:
+    return len(TEXT_OBJECT.findall(data))
+
+
+def _xobject_text_objects(resources, depth: int) -> int:
+    """Zählt Textobjekte in Form-XObjects der Ressourcen (z.B. Seiten, die komplett als Form eingebettet sind)."""
+    if depth > MAX_FORM_DEPTH or not resources:
+        return 0
+    xobjects = resolve1(resolve1(resources).get("XObject")) or {}
+    anzahl = 0
+    for xobject in xobjects.values():
+        xobject = resolve1(xobject)
+        if not isinstance(xobject, PDFStream) or getattr(xobject.get("Subtype"), "name", None) != "Form":
+            continue
+        anzahl += _count_text_objects(xobject.get_data())
+        anzahl += _xobject_text_objects(xobject.get("Resources"), depth + 1)
+    return anzahl
+
+
+def count_text_objects_per_page(pdf_path: str) -> list[int]:
+    """Anzahl der Textobjekte pro Seite, ohne Text zu extrahieren."""
+    with open(pdf_path, "rb") as f:
+        document = PDFDocument(PDFParser(f))
+        anzahl_pro_seite = []
+        for page in PDFPage.create_pages(document):
+            anzahl = sum(_count_text_objects(stream.get_data()) for stream in page.contents if isinstance(stream, PDFStream))
+            if anzahl == 0:
+                anzahl = _xobject_text_objects(page.resources, 1)
+            anzahl_pro_seite.append(anzahl)
+    return anzahl_pro_seite
+
+
+def read_pdf_metadata(pdf_path: str, fields: tuple[str, ...] = ("Producer", "Creator", "Author")) -> dict[str, str]:
+    """
+    Liest Felder aus dem Info-Dictionary des PDFs (nur Trailer/XRef, keine Seiten)
+    Returns:
+        dict: Feld -> Text, fehlende Felder werden ausgelassen
+    """
+    metadata = {}
+    with open(pdf_path, "rb") as f:
+        document = PDFDocument(PDFParser(f))
+        for info in document.info:
+            for field in fields:
+                value = resolve1(info.get(field))
+                if isinstance(value, bytes):
+                    value = decode_text(value)
+                if isinstance(value, str) and value.strip():
+                    metadata.setdefault(field, value.strip())
+    return metadata
+
+
+def classify_pdf(pdf_path: str) -> str:
+    """
+    Klassifiziert ein PDF anhand seiner Content-Streams
+    Args:
+        pdf_path (str): Pfad zur PDF-Datei
+    Returns:
+        str: PDF_TEXT (alle Seiten mit Textebene), PDF_SCAN (keine Seite mit Textebene),
+             PDF_MIXED oder PDF_UNKNOWN, wenn das PDF nicht gelesen werden konnte
+    """
+    try:
+        anzahl_pro_seite = count_text_objects_per_page(pdf_path)
+    except Exception:
+        # Kaputte oder ungewöhnliche PDFs entscheidet der normale Weg
+        return PDF_UNKNOWN
+
+    if not anzahl_pro_seite:
+        return PDF_UNKNOWN
+    seiten_mit_text = sum(1 for anzahl in anzahl_pro_seite if anzahl > 0)
+    if seiten_mit_text == 0:
+        return PDF_SCAN
+    if seiten_mit_text == len(anzahl_pro_seite):
+        return PDF_TEXT
+    return PDF_MIXED
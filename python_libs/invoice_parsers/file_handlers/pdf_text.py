@@ -0,0 +1,41 @@
+"""
+Textextraktion mit begrenztem Speicher.
+
+pdfplumber behält für jede Seite Zeichen, Wörter und Layout-Objekte im Cache, solange das PDF
+geöffnet ist. Hier wird der Text Seite für Seite übernommen und der Cache der Seite direkt
+danach freigegeben, damit der Speicher nicht mit der größten Rechnung wächst.
+"""
+import pdfplumber
+
+
+def extract_pdf_text(pdf_path: str, max_pages: int | None = None) -> str:
+    """
+    Extrahiert den Text aller (bzw. der ersten max_pages) Seiten, jede Seite mit "\\n" abgeschlossen
+    Args:
+        pdf_path (str): Pfad zur PDF-Datei
+        max_pages (int): Nur die ersten Seiten lesen, z.B. für die Lieferantenerkennung
+    Returns:
+        str: Der Text des PDFs
+    """
+    pages = range(1, max_pages + 1) if max_pages else None
+    teile = []
+    with pdfplumber.open(pdf_path, pages=pages) as pdf:
+        for page in pdf.pages:
+            teile.append((page.extract_text() or "") + "\n")
+            # Zeichen-, Wort- und Textmap-Cache der Seite sofort freigeben
+            page.close()
+    return "".join(teile)
+
+
+def extract_page_texts(pdf_path: str) -> list[str]:
+    """
+    Wie extract_pdf_text, aber ein Text pro Seite (z.B. zum Aufteilen langer Rechnungen in Abschnitte)
+    Returns:
+        list[str]: Der Text jeder Seite, leer für Seiten ohne Textebene
+    """
+    texte = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            texte.append(page.extract_text() or "")
+            page.close()
+    return texte
@@ -0,0 +1,338 @@
+"""
+EK-Preisverlauf je Lieferant und Artikel, inkrementell aus den geparsten Rechnungen.
+
+Jede Zeitreihe besteht aus zwei parallelen, nach Datum sortierten Arrays (Tag als
+Ordinalzahl, Stück-EK in Zehntel-Cent - divide_nettoEk_by_menge rundet auf 3 Stellen),
+ein Eintrag pro Belegdatum. Der Preis zu einem Datum ist der letzte Eintrag davor
+(bisect, O(log n)); eine Preisänderung ist ein Eintrag mit anderem Preis als sein Vorgänger.
+
+Abfragen auf der Kommandozeile (aus dem Ordner invoice_parsers):
+    python -m file_handlers.price_history price --lieferant klingspor --artikel-lieferant 302501 --datum 2025-07-01
+    python -m file_handlers.price_history series --artikel 12345
+    python -m file_handlers.price_history rebuild rechnungen.db
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from array import array
+from bisect import bisect_right
+from decimal import Decimal
+
+import pandas as pd
+
+from helpers.constants import INVOICE_COLUMNS
+from helpers.event_log import log
+from helpers.number_helpers import format_deutsche_zahl, parse_deutsche_zahl, runde
+from file_handlers.sqlite_store import belegdatum_iso
+
+PRICE_HISTORY_PATH = os.getenv(
+    "INVOICE_PRICE_HISTORY",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "price_history.json"),
+)
+
+# Nachkommastellen des Stück-EK (wie divide_nettoEk_by_menge)
+PREIS_STELLEN = 3
+_SKALA = 10 ** PREIS_STELLEN
+
+
+def _in_einheiten(preis: Decimal) -> int:
+    return int(runde(preis, PREIS_STELLEN) * _SKALA)
+
+
+def _als_preis(einheiten: int) -> Decimal:
+    return Decimal(einheiten).scaleb(-PREIS_STELLEN)
+
+
+def _tag(datum_iso: str) -> int:
+    return datetime.date.fromisoformat(datum_iso).toordinal()
+
+
+def _datum(tag: int) -> str:
+    return datetime.date.fromordinal(tag).isoformat()
+
+
+def _leer(wert) -> bool:
+    return wert is None or str(wert).strip() in ("", "N/A")
+
+
+class PriceSeries:
+    """Stück-EK eines Artikels bei einem Lieferanten, ein Eintrag pro Belegdatum."""
+
+    __slots__ = ("artikelnummer", "tage", "preise")
+
+    def __init__(self, artikelnummer: str | None = None):
+        self.artikelnummer = artikelnummer
+        self.tage = array("l")
+        self.preise = array("q")
+
+    def __len__(self) -> int:
+        return len(self.tage)
+
+    def price_at(self, tag: int) -> int | None:
+        """Preis (Zehntel-Cent), der am Tag galt, None vor dem ersten Eintrag."""
+        i = bisect_right(self.tage, tag)
+        return self.preise[i - 1] if i else None
+
+    def add(self, tag: int, preis: int) -> tuple[bool, int | None]:
+        """
+        Trägt eine Beobachtung ein. Mehrere Preise am selben Tag: der zuletzt eingetragene gilt.
+        Returns:
+            tuple: (ob sich die Zeitreihe geändert hat, Preis am vorigen Beobachtungstag oder None)
+        """
+        i = bisect_right(self.tage, tag)
+        if i and self.tage[i - 1] == tag:
+            geaendert = self.preise[i - 1] != preis
+            self.preise[i - 1] = preis
+            return geaendert, self.preise[i - 2] if i > 1 else None
+        if i == len(self.tage):
+            # Der Normalfall: neuere Rechnung als alle bisherigen
+            self.tage.append(tag)
+            self.preise.append(preis)
+        else:
+            self.tage.insert(i, tag)
+            self.preise.insert(i, preis)
+        return True, self.preise[i - 1] if i else None
+
+
+class PriceHistory:
+    """
+    EK-Preisverlauf aller Artikel, Schlüssel: (Lieferant, Artikelnummer Lieferant bzw. Artikelnummer)
+    Args:
+        path (str): JSON-Datei, in der der Verlauf gespeichert wird
+    """
+
+    def __init__(self, path: str = PRICE_HISTORY_PATH):
+        self.path = path
+        self.serien: dict[tuple[str, str], PriceSeries] = {}
+        # Artikelnummer (JTL) -> Schlüssel der Zeitreihen, lieferantenübergreifend
+        self._nach_artikelnummer: dict[str, set[tuple[str, str]]] = {}
+        self._geaendert = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                daten = json.load(f).get("serien", {})
+        except (OSError, ValueError):
+            return
+        for schluessel, eintrag in daten.items():
+            lieferant, artikel = schluessel.split("|", 1)
+            serie = PriceSeries(eintrag.get("artikelnummer"))
+            serie.tage.extend(eintrag["tage"])
+            serie.preise.extend(eintrag["preise"])
+            self._register((lieferant, artikel), serie)
+
+    def save(self):
+        if not self._geaendert:
+            return
+        daten = {
+            f"{lieferant}|{artikel}": {"artikelnummer": serie.artikelnummer, "tage": serie.tage.tolist(), "preise": serie.preise.tolist()}
+            for (lieferant, artikel), serie in self.serien.items()
+        }
+        ordner = os.path.dirname(self.path) or "."
+        try:
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=ordner, suffix=".tmp", delete=False) as tmp:
+                json.dump({"version": 1, "stellen": PREIS_STELLEN, "serien": daten}, tmp, separators=(",", ":"))
+            os.replace(tmp.name, self.path)
+            self._geaendert = False
+        except OSError as e:
+            log.error("price_history_failed", f"Fehler beim Speichern des Preisverlaufs: {e}", path=self.path)
+
+    def _register(self, schluessel: tuple[str, str], serie: PriceSeries):
+        self.serien[schluessel] = serie
+        if serie.artikelnummer:
+            self._nach_artikelnummer.setdefault(serie.artikelnummer, set()).add(schluessel)
+
+    def _unregister_artikelnummer(self, schluessel: tuple[str, str], artikelnummer: str | None):
+        """Entfernt die Zeitreihe aus dem Index ihrer bisherigen Artikelnummer."""
+        schluessel_menge = self._nach_artikelnummer.get(artikelnummer)
+        if schluessel_menge is None:
+            return
+        schluessel_menge.discard(schluessel)
+        if not schluessel_menge:
+            del self._nach_artikelnummer[artikelnummer]
+
+    def add(self, lieferant_key: str, artikelnummer_lieferant, artikelnummer, datum_iso: str, netto_ek) -> dict | None:
+        """
+        Trägt einen Stück-EK ein
+        Args:
+            lieferant_key (str): Kurzname des Lieferanten, z.B. "klingspor"
+            artikelnummer_lieferant / artikelnummer: Wie in der Rechnungszeile ("N/A" = unbekannt)
+            datum_iso (str): Belegdatum als "YYYY-MM-DD"
+            netto_ek: Stück-EK in deutscher Schreibweise, z.B. "12,345"
+        Returns:
+            dict | None: Die Preisänderung (alt/neu, alt None beim ersten Preis), sonst None
+        """
+        artikel = None if _leer(artikelnummer_lieferant) else str(artikelnummer_lieferant)
+        artikelnummer = None if _leer(artikelnummer) else str(artikelnummer)
+        artikel = artikel or artikelnummer
+        if not artikel or not datum_iso:
+            return None
+        try:
+            preis = parse_deutsche_zahl(netto_ek)
+        except (ValueError, TypeError):
+            return None
+        if preis is None:
+            return None
+
+        schluessel = (lieferant_key.lower(), artikel)
+        serie = self.serien.get(schluessel)
+        if serie is None:
+            serie = PriceSeries(artikelnummer)
+            self._register(schluessel, serie)
+        elif artikelnummer and serie.artikelnummer != artikelnummer:
+            self._unregister_artikelnummer(schluessel, serie.artikelnummer)
+            serie.artikelnummer = artikelnummer
+            self._nach_artikelnummer.setdefault(artikelnummer, set()).add(schluessel)
+            self._geaendert = True
+
+        neu = _in_einheiten(preis)
+        geaendert, vorher = serie.add(_tag(datum_iso), neu)
+        self._geaendert = self._geaendert or geaendert
+        if not geaendert or vorher == neu:
+            return None
+        alt = None if vorher is None else _als_preis(vorher)
+        neu = _als_preis(neu)
+        return {
+            "lieferant": schluessel[0],
+            "artikel": artikel,
+            "artikelnummer": artikelnummer,
+            "datum": datum_iso,
+            "alt": alt,
+            "neu": neu,
+            "prozent": None if not alt else float(runde((neu - alt) / alt * 100, 1)),
+        }
+
+    def add_invoice(self, df: pd.DataFrame, lieferant_key: str) -> list[dict]:
+        """
+        Trägt alle Zeilen einer geparsten Rechnung (INVOICE_COLUMNS) ein
+        Returns:
+            list[dict]: Preisänderungen gegenüber dem bisherigen Verlauf (ohne erstmalige Preise)
+        """
+        aenderungen = []
+        for zeile in df[INVOICE_COLUMNS].itertuples(index=False, name=None):
+            werte = dict(zip(INVOICE_COLUMNS, zeile))
+            aenderung = self.add(
+                lieferant_key, werte["Artikelnummer Lieferant"], werte["Artikelnummer"],
+                belegdatum_iso(werte["Belegdatum"]), werte["Netto-EK"],
+            )
+            if aenderung and aenderung["alt"] is not None:
+                aenderungen.append(aenderung)
+        return aenderungen
+
+    def price_at(self, lieferant_key: str, artikel: str, datum_iso: str | None = None) -> Decimal | None:
+        """Stück-EK eines Artikels beim Lieferanten zum Datum (Standard: heute), None wenn unbekannt."""
+        serie = self.serien.get((lieferant_key.lower(), artikel))
+        if serie is None:
+            return None
+        tag = _tag(datum_iso) if datum_iso else datetime.date.today().toordinal()
+        preis = serie.price_at(tag)
+        return None if preis is None else _als_preis(preis)
+
+    def prices_for_article(self, artikelnummer: str, datum_iso: str | None = None) -> dict[str, Decimal]:
+        """Stück-EK einer JTL-Artikelnummer bei allen Lieferanten zum Datum."""
+        tag = _tag(datum_iso) if datum_iso else datetime.date.today().toordinal()
+        preise = {}
+        for lieferant, artikel in sorted(self._nach_artikelnummer.get(artikelnummer, ())):
+            preis = self.serien[(lieferant, artikel)].price_at(tag)
+            if preis is not None:
+                preise[lieferant] = _als_preis(preis)
+        return preise
+
+    def series(self, lieferant_key: str, artikel: str) -> list[tuple[str, Decimal]]:
+        """Alle Preisänderungen als (Datum, Stück-EK)."""
+        serie = self.serien.get((lieferant_key.lower(), artikel))
+        if serie is None:
+            return []
+        verlauf = []
+        for tag, preis in zip(serie.tage, serie.preise):
+            if not verlauf or verlauf[-1][1] != preis:
+                verlauf.append((tag, preis))
+        return [(_datum(tag), _als_preis(preis)) for tag, preis in verlauf]
+
+    def rebuild_from_store(self, db_path: str) -> int:
+        """
+        Baut den Verlauf aus der SQLite-Ablage (file_handlers.sqlite_store) neu auf
+        Returns:
+            int: Anzahl gelesener Zeilen
+        """
+        self.serien.clear()
+        self._nach_artikelnummer.clear()
+        conn = sqlite3.connect(db_path)
+        try:
+            zeilen = conn.execute(
+                "SELECT lieferant_key, artikelnummer_lieferant, artikelnummer, belegdatum_iso, netto_ek FROM rechnungszeilen "
+                "WHERE belegdatum_iso IS NOT NULL ORDER BY belegdatum_iso, rechnung_id, position"
+            )
+            anzahl = 0
+            for zeile in zeilen:
+                self.add(*zeile)
+                anzahl += 1
+        finally:
+            conn.close()
+        self._geaendert = True
+        return anzahl
+
+
+def _json(wert):
+    return format_deutsche_zahl(wert) if isinstance(wert, Decimal) else wert
+
+
+def main():
+    cli = argparse.ArgumentParser(description="EK-Preisverlauf aus den geparsten Rechnungen")
+    cli.add_argument("--datei", default=PRICE_HISTORY_PATH, help="JSON-Datei des Preisverlaufs")
+    befehle = cli.add_subparsers(dest="befehl", required=True)
+
+    price = befehle.add_parser("price", help="Stück-EK zu einem Datum")
+    price.add_argument("--lieferant")
+    price.add_argument("--artikel-lieferant")
+    price.add_argument("--artikel", help="Artikelnummer (JTL), ohne --lieferant: alle Lieferanten")
+    price.add_argument("--datum", help="YYYY-MM-DD, Standard: heute")
+
+    series = befehle.add_parser("series", help="Alle Preisänderungen eines Artikels")
+    series.add_argument("--lieferant")
+    series.add_argument("--artikel-lieferant")
+    series.add_argument("--artikel", help="Artikelnummer (JTL)")
+
+    rebuild = befehle.add_parser("rebuild", help="Verlauf aus der SQLite-Ablage neu aufbauen")
+    rebuild.add_argument("db")
+
+    args = cli.parse_args()
+    history = PriceHistory(args.datei)
+    if args.befehl == "rebuild":
+        anzahl = history.rebuild_from_store(args.db)
+        history.save()
+        print(f"{anzahl} Zeilen gelesen, {len(history.serien)} Zeitreihen gespeichert")
+        return
+
+    if args.lieferant:
+        artikel = args.artikel_lieferant or args.artikel
+        if not artikel:
+            cli.error("--artikel-lieferant oder --artikel angeben")
+        schluessel = [(args.lieferant.lower(), artikel)]
+    elif args.artikel:
+        schluessel = sorted(history._nach_artikelnummer.get(args.artikel, ()))
+    else:
+        cli.error("--lieferant oder --artikel angeben")
+
+    if args.befehl == "price" and not args.lieferant:
+        ergebnis = {"artikelnummer": args.artikel, "datum": args.datum, "preise": history.prices_for_article(args.artikel, args.datum)}
+    elif args.befehl == "price":
+        lieferant, artikel = schluessel[0]
+        ergebnis = {"lieferant": lieferant, "artikel": artikel, "datum": args.datum, "preis": history.price_at(lieferant, artikel, args.datum)}
+    else:
+        ergebnis = [
+            {"lieferant": lieferant, "artikel": artikel, "verlauf": history.series(lieferant, artikel)}
+            for lieferant, artikel in schluessel
+        ]
+    print(json.dumps(ergebnis, ensure_ascii=False, default=_json))
+    if not ergebnis:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
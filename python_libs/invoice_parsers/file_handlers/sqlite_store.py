@@ -0,0 +1,286 @@
+"""
+Optionale SQLite-Ablage der geparsten Rechnungszeilen, zusätzlich zu den CSV-Dateien.
+
+Die Datenbank läuft im WAL-Modus, Rechnungen werden in Transaktionen zu je BATCH_SIZE
+Rechnungen geschrieben. Indiziert sind Lieferant, Rechnungsnummer, Belegdatum, Artikelnummer
+und Artikelnummer Lieferant - Nachschlagen und Dublettenprüfung brauchen keinen Dateiscan.
+
+Eine erneut gespeicherte Rechnung ersetzt die alte (Schlüssel Lieferant + Rechnungsnummer). Ohne
+Rechnungsnummer ("N/A" bzw. leer) ist der Schlüssel die Quelle bzw. ein Hash der Zeilen, in
+rechnungen.rechnungsnummer steht dann "ohne-nummer:<quelle bzw. hash>".
+
+Abfragen auf der Kommandozeile (aus dem Ordner invoice_parsers):
+    python -m file_handlers.sqlite_store rechnungen.db lines --lieferant klingspor --artikel-lieferant 302501 --von 2025-07-01 --bis 2025-09-30
+    python -m file_handlers.sqlite_store rechnungen.db invoice 4711
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from helpers.constants import INVOICE_COLUMNS
+from helpers.date_helpers import parse_datum
+from helpers.event_log import log
+from helpers.number_helpers import parse_deutsche_zahl
+
+SQLITE_PATH = os.getenv("INVOICE_SQLITE_PATH", "")
+
+# Rechnungen pro Transaktion
+BATCH_SIZE = 50
+
+# Platzhalter der Parser, wenn keine Rechnungsnummer gefunden wurde
+OHNE_NUMMER = ("", "N/A")
+
+# INVOICE_COLUMNS -> Spaltenname in der Tabelle rechnungszeilen (Originaltext)
+SPALTEN = {
+    "Bestellnummer (JTL-Wawi)": "bestellnummer",
+    "Fremdbelegnummer (Eingangsrechnung)": "rechnungsnummer",
+    "Fremdbelegnummer (Liererantenbestellung)": "lieferantenbestellung",
+    "Lieferant": "lieferant",
+    "Zahlbar bis": "zahlbar_bis",
+    "Belegdatum": "belegdatum",
+    "Artikelnummer": "artikelnummer",
+    "Artikelnummer Lieferant": "artikelnummer_lieferant",
+    "Artikelnname": "artikelname",
+    "Hinweis": "hinweis",
+    "Menge": "menge",
+    "Netto-EK": "netto_ek",
+    "MwST": "mwst",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rechnungen (
+    id INTEGER PRIMARY KEY,
+    lieferant_key TEXT NOT NULL,
+    rechnungsnummer TEXT NOT NULL,
+    lieferant TEXT,
+    belegdatum_iso TEXT,
+    quelle TEXT,
+    importiert_am TEXT NOT NULL,
+    UNIQUE (lieferant_key, rechnungsnummer)
+);
+CREATE TABLE IF NOT EXISTS rechnungszeilen (
+    id INTEGER PRIMARY KEY,
+    rechnung_id INTEGER NOT NULL REFERENCES rechnungen(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    lieferant_key TEXT NOT NULL,
+    belegdatum_iso TEXT,
+    menge_wert REAL,
+    netto_ek_wert REAL,
+    {spalten}
+);
+CREATE INDEX IF NOT EXISTS idx_rechnungen_nummer ON rechnungen (rechnungsnummer);
+CREATE INDEX IF NOT EXISTS idx_zeilen_rechnung ON rechnungszeilen (rechnung_id);
+CREATE INDEX IF NOT EXISTS idx_zeilen_lieferant ON rechnungszeilen (lieferant_key, belegdatum_iso);
+CREATE INDEX IF NOT EXISTS idx_zeilen_rechnungsnummer ON rechnungszeilen (rechnungsnummer);
+CREATE INDEX IF NOT EXISTS idx_zeilen_belegdatum ON rechnungszeilen (belegdatum_iso);
+CREATE INDEX IF NOT EXISTS idx_zeilen_artikelnummer ON rechnungszeilen (artikelnummer, belegdatum_iso);
+CREATE INDEX IF NOT EXISTS idx_zeilen_artikelnummer_lieferant ON rechnungszeilen (artikelnummer_lieferant, lieferant_key, belegdatum_iso);
+""".replace("{spalten}", ",\n    ".join(f"{spalte} TEXT" for spalte in SPALTEN.values()))
+
+
+def belegdatum_iso(datum: str) -> str | None:
+    """"12.03.2025" bzw. "12.03.25" -> "2025-03-12", sonst None."""
+    for format in ("%d.%m.%Y", "%d.%m.%y"):
+        try:
+            return parse_datum(str(datum).strip(), format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _zahl(wert) -> float | None:
+    try:
+        zahl = parse_deutsche_zahl(wert)
+    except (ValueError, TypeError):
+        return None
+    return None if zahl is None else float(zahl)
+
+
+class SqliteStore:
+    """
+    Schreibt geparste Rechnungen (DataFrames mit INVOICE_COLUMNS) in eine SQLite-Datenbank
+    Args:
+        path (str): Pfad zur Datenbankdatei
+        batch_size (int): Rechnungen pro Transaktion
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self._offen = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def has_invoice(self, rechnungsnummer: str, lieferant_key: str | None = None) -> bool:
+        """Dublettenprüfung: Ist die Rechnung (optional dieses Lieferanten) schon erfasst?"""
+        if lieferant_key:
+            sql, params = "SELECT 1 FROM rechnungen WHERE rechnungsnummer = ? AND lieferant_key = ? LIMIT 1", (rechnungsnummer, lieferant_key.lower())
+        else:
+            sql, params = "SELECT 1 FROM rechnungen WHERE rechnungsnummer = ? LIMIT 1", (rechnungsnummer,)
+        return self.conn.execute(sql, params).fetchone() is not None
+
+    def add_invoice(self, df: pd.DataFrame, lieferant_key: str, quelle: str = "") -> bool:
+        """
+        Speichert die Zeilen einer Rechnung; eine bereits erfasste Rechnung (Lieferant + Rechnungsnummer,
+        ohne Rechnungsnummer: Lieferant + Quelle bzw. gleiche Zeilen) wird ersetzt
+        Args:
+            df (pd.DataFrame): Die Rechnungszeilen mit INVOICE_COLUMNS
+            lieferant_key (str): Kurzname des Lieferanten, z.B. "klingspor"
+            quelle (str): Herkunft, z.B. der Name der PDF-Datei
+        Returns:
+            success (bool): Ob das Speichern erfolgreich war
+        """
+        if df.empty:
+            return False
+        lieferant_key = lieferant_key.lower()
+        try:
+            erste = df.iloc[0]
+            rechnungsnummer = str(erste["Fremdbelegnummer (Eingangsrechnung)"])
+            zeilen = []
+            for position, zeile in enumerate(df[INVOICE_COLUMNS].itertuples(index=False, name=None), 1):
+                werte = dict(zip(INVOICE_COLUMNS, zeile))
+                zeilen.append((
+                    position, lieferant_key, belegdatum_iso(werte["Belegdatum"]),
+                    _zahl(werte["Menge"]), _zahl(werte["Netto-EK"]),
+                    *(None if werte[spalte] is None else str(werte[spalte]) for spalte in SPALTEN),
+                ))
+        except KeyError as e:
+            log.error("sqlite_failed", f"Die Rechnung konnte nicht in der SQLite-Datenbank gespeichert werden, Spalte fehlt: {e}", path=self.path)
+            return False
+        if rechnungsnummer.strip() in OHNE_NUMMER:
+            # Sonst ersetzt jede Rechnung ohne Nummer die vorige desselben Lieferanten
+            herkunft = quelle or hashlib.sha256(json.dumps(zeilen, default=str).encode()).hexdigest()[:16]
+            rechnungsnummer = f"ohne-nummer:{herkunft}"
+
+        # Eine Rechnung ist innerhalb der offenen Batch-Transaktion atomar
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.execute("SAVEPOINT rechnung")
+        try:
+            self.conn.execute(
+                "DELETE FROM rechnungen WHERE lieferant_key = ? AND rechnungsnummer = ?", (lieferant_key, rechnungsnummer)
+            )
+            rechnung_id = self.conn.execute(
+                "INSERT INTO rechnungen (lieferant_key, rechnungsnummer, lieferant, belegdatum_iso, quelle, importiert_am) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (lieferant_key, rechnungsnummer, str(erste["Lieferant"]), zeilen[0][2], quelle,
+                 datetime.datetime.now().isoformat(timespec="seconds")),
+            ).lastrowid
+            platzhalter = ", ".join("?" * (6 + len(SPALTEN)))
+            self.conn.executemany(
+                f"INSERT INTO rechnungszeilen (rechnung_id, position, lieferant_key, belegdatum_iso, menge_wert, netto_ek_wert, "
+                f"{', '.join(SPALTEN.values())}) VALUES ({platzhalter})",
+                [(rechnung_id, *zeile) for zeile in zeilen],
+            )
+            self.conn.execute("RELEASE SAVEPOINT rechnung")
+        except sqlite3.Error as e:
+            self.conn.execute("ROLLBACK TO SAVEPOINT rechnung")
+            self.conn.execute("RELEASE SAVEPOINT rechnung")
+            log.error("sqlite_failed", f"Die Rechnung konnte nicht in der SQLite-Datenbank gespeichert werden: {e}", path=self.path)
+            return False
+
+        self._offen += 1
+        if self._offen >= self.batch_size:
+            self.commit()
+        return True
+
+    def commit(self):
+        self.conn.commit()
+        self._offen = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def find_lines(
+        self,
+        lieferant_key: str | None = None,
+        artikelnummer: str | None = None,
+        artikelnummer_lieferant: str | None = None,
+        rechnungsnummer: str | None = None,
+        von: str | None = None,
+        bis: str | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        """
+        Sucht Rechnungszeilen; alle Filter sind optional und werden kombiniert
+        Args:
+            von / bis (str): Belegdatum als "YYYY-MM-DD" (inklusive)
+        Returns:
+            list[dict]: Zeilen mit den Spalten der Tabelle rechnungszeilen
+        """
+        bedingungen, params = [], []
+        for spalte, wert in (
+            ("lieferant_key", lieferant_key.lower() if lieferant_key else None),
+            ("artikelnummer", artikelnummer),
+            ("artikelnummer_lieferant", artikelnummer_lieferant),
+            ("rechnungsnummer", rechnungsnummer),
+        ):
+            if wert:
+                bedingungen.append(f"{spalte} = ?")
+                params.append(wert)
+        if von:
+            bedingungen.append("belegdatum_iso >= ?")
+            params.append(von)
+        if bis:
+            bedingungen.append("belegdatum_iso <= ?")
+            params.append(bis)
+        sql = "SELECT * FROM rechnungszeilen"
+        if bedingungen:
+            sql += " WHERE " + " AND ".join(bedingungen)
+        sql += " ORDER BY belegdatum_iso, rechnung_id, position"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        cursor = self.conn.execute(sql, params)
+        namen = [beschreibung[0] for beschreibung in cursor.description]
+        return [dict(zip(namen, zeile)) for zeile in cursor]
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Abfragen der SQLite-Ablage geparster Rechnungen")
+    cli.add_argument("db", help="Pfad zur Datenbank")
+    befehle = cli.add_subparsers(dest="befehl", required=True)
+
+    lines = befehle.add_parser("lines", help="Rechnungszeilen suchen (JSON-Zeilen auf stdout)")
+    lines.add_argument("--lieferant", help="Kurzname, z.B. klingspor")
+    lines.add_argument("--artikel", help="Artikelnummer (JTL)")
+    lines.add_argument("--artikel-lieferant", help="Artikelnummer des Lieferanten")
+    lines.add_argument("--rechnung", help="Rechnungsnummer")
+    lines.add_argument("--von", help="Belegdatum ab (YYYY-MM-DD)")
+    lines.add_argument("--bis", help="Belegdatum bis (YYYY-MM-DD)")
+    lines.add_argument("--limit", type=int)
+
+    invoice = befehle.add_parser("invoice", help="Dublettenprüfung: Exit-Code 0, wenn die Rechnung erfasst ist")
+    invoice.add_argument("rechnungsnummer")
+    invoice.add_argument("--lieferant", help="Kurzname, z.B. klingspor")
+
+    args = cli.parse_args()
+    if not os.path.isfile(args.db):
+        print(f"Datenbank nicht gefunden: {args.db}", file=sys.stderr)
+        sys.exit(2)
+    with SqliteStore(args.db) as store:
+        if args.befehl == "invoice":
+            gefunden = store.has_invoice(args.rechnungsnummer, args.lieferant)
+            print("erfasst" if gefunden else "nicht erfasst")
+            sys.exit(0 if gefunden else 1)
+        for zeile in store.find_lines(args.lieferant, args.artikel, args.artikel_lieferant, args.rechnung, args.von, args.bis, args.limit):
+            print(json.dumps(zeile, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
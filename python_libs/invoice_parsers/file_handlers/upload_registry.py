@@ -0,0 +1,184 @@
+"""
+Registry hochgeladener PDFs beim LLM-Anbieter (z.B. Gemini File API), Schlüssel: SHA-256 des Inhalts.
+
+Dieselbe Rechnung wird innerhalb eines Batches oft mehrfach geparst (Nachfrage, Python-Fallback,
+Reparse). Statt sie jedes Mal hochzuladen, wird der noch gültige Datei-Handle wiederverwendet.
+Jeder Upload ist dem Batch zugeordnet, der ihn zuletzt benutzt hat (LLM_UPLOAD_BATCH); am Ende des
+Batches löscht cleanup(batch=...) genau diese Uploads. Uploads ohne Batch bleiben für spätere Aufrufe
+stehen. Einträge laufen vor der Aufbewahrungsfrist des Anbieters ab (Gemini: 48 h); abgelaufene
+Einträge räumt jedes cleanup mit ab. Die Datei wird wie der Zustand von helpers.llm_limiter unter
+einem fcntl-Lock (<path>.lock) gelesen und zusammengeführt, da parallele Parser-Prozesse schreiben.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from helpers.event_log import log
+
+UPLOAD_REGISTRY_PATH = os.getenv(
+    "LLM_UPLOAD_REGISTRY",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "upload_registry.json"),
+)
+# Handles gelten als abgelaufen, bevor der Anbieter die Datei löscht (Gemini: 48 h)
+UPLOAD_TTL_HOURS = float(os.getenv("LLM_UPLOAD_TTL_HOURS", "46"))
+# Kennung des laufenden Batches, vom aufrufenden Batch-Skript für alle Parser-Aufrufe gesetzt
+UPLOAD_BATCH = os.getenv("LLM_UPLOAD_BATCH", "")
+
+
+def content_hash(pdf_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class UploadRegistry:
+    """
+    Args:
+        path (str): JSON-Datei der Registry
+        ttl_hours (float): Gültigkeit eines Handles ab dem Upload
+        batch (str): Kennung des Batches, dem neue und wiederverwendete Uploads zugeordnet werden
+    """
+
+    def __init__(self, path: str = UPLOAD_REGISTRY_PATH, ttl_hours: float = UPLOAD_TTL_HOURS, batch: str = UPLOAD_BATCH):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.batch = batch
+        self.uploads: dict[str, dict] = self._load()
+        # In diesem Prozess eingetragene bzw. entfernte Uploads - nur sie überschreiben den gespeicherten Stand
+        self._eigene: set[str] = set()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("uploads", {})
+        except (OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def _gesperrt(self):
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _zusammenfuehren(self) -> dict[str, dict]:
+        # Andere Prozesse (z.B. parallele Node-Aufrufe) können inzwischen geschrieben haben; nur unter dem Lock
+        uploads = self._load()
+        for sha in self._eigene:
+            eintrag = self.uploads.get(sha)
+            if eintrag is None:
+                uploads.pop(sha, None)
+            else:
+                uploads[sha] = eintrag
+        return uploads
+
+    def _schreiben(self, uploads: dict[str, dict]):
+        ordner = os.path.dirname(self.path) or "."
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=ordner, suffix=".tmp", delete=False) as tmp:
+            json.dump({"version": 1, "uploads": uploads}, tmp, ensure_ascii=False, indent=1)
+        os.replace(tmp.name, self.path)
+        self.uploads = uploads
+        self._eigene.clear()
+
+    def save(self):
+        if not self._eigene:
+            return
+        try:
+            with self._gesperrt():
+                self._schreiben(self._zusammenfuehren())
+        except OSError as e:
+            # Die Registry ist nur ein Beschleuniger - ohne Schreibrechte wird einfach neu hochgeladen
+            log.warning("upload_registry_failed", f"Upload-Registry konnte nicht gespeichert werden: {e}", path=self.path)
+
+    def _gueltig(self, eintrag: dict | None, jetzt: float) -> bool:
+        return bool(eintrag) and jetzt - eintrag.get("uploaded", 0) < self.ttl
+
+    def get(self, sha: str) -> str | None:
+        """Name des Remote-Handles, falls noch gültig."""
+        eintrag = self.uploads.get(sha)
+        return eintrag["name"] if self._gueltig(eintrag, time.time()) else None
+
+    def put(self, sha: str, name: str, uploaded: float | None = None):
+        self.uploads[sha] = {"name": name, "uploaded": uploaded or time.time(), "batch": self.batch}
+        self._eigene.add(sha)
+
+    def forget(self, sha: str):
+        if self.uploads.get(sha) is not None:
+            # None markiert den Eintrag zum Entfernen beim Zusammenführen in save()
+            self.uploads[sha] = None
+            self._eigene.add(sha)
+
+    def get_or_upload(
+        self,
+        pdf_path: str,
+        upload: Callable[[str], Any],
+        fetch: Callable[[str], Any],
+    ) -> tuple[Any, bool]:
+        """
+        Liefert einen Remote-Handle für das PDF und lädt es nur hoch, wenn kein gültiger existiert
+        Args:
+            pdf_path (str): Pfad zur PDF-Datei
+            upload: Lädt die Datei hoch und gibt den Handle zurück (mit Attribut name)
+            fetch: Holt einen Handle über seinen Namen; Ausnahme, wenn er beim Anbieter nicht mehr existiert
+        Returns:
+            tuple: (Handle, ob wiederverwendet)
+        """
+        sha = content_hash(pdf_path)
+        name = self.get(sha)
+        if name:
+            try:
+                handle = fetch(name)
+                log.debug("upload_reused", f"Upload wiederverwendet: {name}", sha=sha[:12])
+                if self.batch and self.uploads[sha].get("batch") != self.batch:
+                    # Der laufende Batch übernimmt den Upload und löscht ihn an seinem Ende;
+                    # ein Aufruf ohne Batch lässt die Zuordnung unverändert
+                    self.put(sha, name, self.uploads[sha]["uploaded"])
+                    # Sofort speichern, damit das cleanup des bisherigen Batches den Upload nicht mehr löscht
+                    self.save()
+                return handle, True
+            except Exception as e:
+                log.info("upload_stale", f"Upload {name} nicht mehr verfügbar, lade neu hoch: {e}", sha=sha[:12])
+                self.forget(sha)
+        with log.timed("llm_upload", bytes=os.path.getsize(pdf_path)):
+            handle = upload(pdf_path)
+        self.put(sha, handle.name)
+        return handle, False
+
+    def cleanup(self, delete: Callable[[str], Any], alle: bool = False, batch: str | None = None) -> int:
+        """
+        Löscht die Uploads des Batches und abgelaufene Uploads (mit alle=True: sämtliche)
+        beim Anbieter und aus der Registry
+        Args:
+            delete: Löscht einen Upload über seinen Namen
+            alle (bool): Auch gültige Uploads anderer Batches löschen
+            batch (str): Kennung des beendeten Batches (siehe LLM_UPLOAD_BATCH)
+        Returns:
+            int: Anzahl entfernter Einträge
+        """
+        jetzt = time.time()
+        entfernt = 0
+        with self._gesperrt():
+            # Maßgeblich ist der gespeicherte Stand: andere Prozesse haben Uploads ggf. inzwischen
+            # registriert oder einem anderen Batch zugeordnet
+            uploads = self._zusammenfuehren()
+            for sha, eintrag in list(uploads.items()):
+                if not alle and self._gueltig(eintrag, jetzt) and not (batch and eintrag.get("batch") == batch):
+                    continue
+                try:
+                    delete(eintrag["name"])
+                except Exception as e:
+                    # Nach Ablauf hat der Anbieter die Datei meist schon selbst gelöscht
+                    log.debug("upload_delete_failed", f"Upload {eintrag['name']} nicht gelöscht: {e}")
+                del uploads[sha]
+                entfernt += 1
+            self._schreiben(uploads)
+        return entfernt
@@ -1,7 +1,67 @@
 import datetime
+from functools import lru_cache
+
+# Formate, für die parse_datum ohne strptime auskommt: Format -> Anzahl Stellen der Jahreszahl
+SCHNELLE_FORMATE = {
+    "%d.%m.%Y": 4,
+    "%d.%m.%y": 2,
+}
+
+
+@lru_cache(maxsize=4096)
+def parse_datum(datum: str, format: str = "%d.%m.%Y") -> datetime.datetime:
+    """
+    Parst ein Datum wie datetime.strptime, für "dd.mm.yyyy" und "dd.mm.yy" aber ohne strptime.
+    Gleiche Eingaben liefern dasselbe (gecachte) datetime-Objekt.
+    Args:
+        datum (str): Das Datum, z.B. "12.03.2025" oder "12.03.25"
+        format (str): Das strptime-Format
+    Returns:
+        datetime.datetime: Das geparste Datum
+    Raises:
+        ValueError: Wenn das Datum nicht zum Format passt
+    """
+    stellen_jahr = SCHNELLE_FORMATE.get(format)
+    teile = datum.split(".")
+    if (
+        stellen_jahr is None
+        or len(teile) != 3
+        or not datum.isascii()
+        or not all(teil.isdigit() for teil in teile)
+        or not 1 <= len(teile[0]) <= 2
+        or not 1 <= len(teile[1]) <= 2
+        or len(teile[2]) != stellen_jahr
+    ):
+        # Alles Ungewöhnliche (andere Formate, Leerzeichen, ...) entscheidet strptime selbst
+        return datetime.datetime.strptime(datum, format)
+
+    jahr = int(teile[2])
+    if stellen_jahr == 2:
+        # Gleiche Jahrhundertregel wie strptime: 69-99 -> 19xx, 00-68 -> 20xx
+        jahr += 2000 if jahr <= 68 else 1900
+    return datetime.datetime(jahr, int(teile[1]), int(teile[0]))
+
+
+@lru_cache(maxsize=128)
+def erster_montag_des_jahres(jahr: int) -> datetime.date:
+    erster_tag_des_jahres = datetime.date(jahr, 1, 1)
+
+    tage_bis_montag = (7 - erster_tag_des_jahres.weekday()) % 7
+
+    return erster_tag_des_jahres + datetime.timedelta(days=tage_bis_montag)
+
+
+@lru_cache(maxsize=1024)
+def _letzter_tag_der_kw(jahr: int, kw: int) -> str:
+    montag_der_kw = erster_montag_des_jahres(jahr) + datetime.timedelta(weeks=kw - 1)
+
+    letzter_tag = montag_der_kw + datetime.timedelta(days=6)
+
+    return letzter_tag.strftime('%d.%m.%y')
+
 
 def letzter_tag_der_woche(jahr: int, kw: int):
-    
+
     if jahr < 100:
         # Wenn nur die letzten beiden Ziffern des Jahres angegeben sind, wird das Jahr berechnet
         current_year = datetime.datetime.now().year
@@ -13,20 +73,11 @@ def letzter_tag_der_woche(jahr: int, kw: int):
         else:
             jahr = current_year - current_year_last_two_digits + 100 + jahr
 
-
-    erster_tag_des_jahres = datetime.date(jahr, 1, 1)
-    
-    tage_bis_montag = (7 - erster_tag_des_jahres.weekday()) % 7
-    
-    erster_montag = erster_tag_des_jahres + datetime.timedelta(days=tage_bis_montag)
-    
-    montag_der_kw = erster_montag + datetime.timedelta(weeks=kw - 1)
-    
-    letzter_tag = montag_der_kw + datetime.timedelta(days=6)
-    
-    return letzter_tag.strftime('%d.%m.%y')
+    # Erst nach der Jahresberechnung cachen, damit ein Jahreswechsel im laufenden Prozess greift
+    return _letzter_tag_der_kw(jahr, kw)
 
 
+@lru_cache(maxsize=4096)
 def zahlbar_bis_x_tage_nach_datum(datum: str, anzahl_tage: int, format = "%d.%m.%Y") -> str:
     """
     Berechnet das "Zahlbar bis"-Datum 30 Tage nach dem Belegdatum
@@ -34,12 +85,11 @@ def zahlbar_bis_x_tage_nach_datum(datum: str, anzahl_tage: int, format = "%d.%m.
         datum (str): Das Belegdatum im Format "dd.mm.yyyy"
     Returns:
         str: Das "Zahlbar bis"-Datum im Format "dd.mm.yyyy"
-    
+
     """
-    belegdatum_datetime = datetime.datetime.strptime(datum, format)
+    belegdatum_datetime = parse_datum(datum, format)
 
     # Berechnung des "Zahlbar bis"-Datums
     zahlbar_bis = belegdatum_datetime + datetime.timedelta(days=anzahl_tage)
 
     return zahlbar_bis.strftime("%d.%m.%Y")
-
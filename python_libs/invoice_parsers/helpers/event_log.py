@@ -0,0 +1,122 @@
+"""
+Strukturiertes Ereignisprotokoll für alle Python-Parser: eine JSON-Zeile pro Ereignis.
+
+stdout bleibt den Ergebnissen vorbehalten (JSON für die Node-Skripte); Meldungen gehen
+nach stderr oder, mit INVOICE_LOG_FILE, in eine Datei (angehängt, auch aus Worker-Prozessen).
+
+Eine Zeile enthält Zeit, Level, Ereignis, Meldung, Prozess, das aktuelle Dokument
+(set_document bzw. RecyclingWorker.begin_document) und die laufende Stufe (set_stage),
+dazu beliebige Felder wie duration_ms:
+    {"ts": "2025-10-14T09:12:03.512", "level": "info", "event": "document_done", "msg": "...",
+     "pid": 4711, "doc": "RE_123.pdf", "stage": "parse", "duration_ms": 512.3}
+
+Auswertung z.B. mit jq: jq -s 'map(select(.event == "document_done")) | length' parser.log
+"""
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from helpers.worker import current_stage
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Mindest-Level und Ziel (Standard: stderr)
+LOG_LEVEL = os.getenv("INVOICE_LOG_LEVEL", "info").lower()
+LOG_FILE = os.getenv("INVOICE_LOG_FILE", "")
+
+_kontext = threading.local()
+
+
+def set_document(doc_id: str | None):
+    """Setzt das Dokument, dem die folgenden Ereignisse dieses Threads zugeordnet werden."""
+    _kontext.doc = doc_id
+
+
+def current_document() -> str | None:
+    return getattr(_kontext, "doc", None)
+
+
+class EventLogger:
+    """
+    Schreibt Ereignisse als JSON-Zeilen
+    Args:
+        path (str): Datei, an die angehängt wird; leer = stderr
+        level (str): Mindest-Level ("debug", "info", "warning", "error")
+    """
+
+    def __init__(self, path: str = LOG_FILE, level: str = LOG_LEVEL):
+        self.path = path
+        self.min_level = LEVELS.get(level, LEVELS["info"])
+        self._datei = None
+        self._lock = threading.Lock()
+
+    def _stream(self):
+        if not self.path:
+            return sys.stderr
+        if self._datei is None:
+            self._datei = open(self.path, "a", encoding="utf-8", buffering=1)
+        return self._datei
+
+    def _nach_fork(self):
+        # Lock und Dateihandle nicht mit dem Elternprozess teilen
+        self._lock = threading.Lock()
+        self._datei = None
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.min_level
+
+    def log(self, level: str, event: str, msg: str = "", **fields):
+        if LEVELS[level] < self.min_level:
+            return
+        eintrag = {
+            "ts": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "level": level,
+            "event": event,
+            "msg": msg,
+            "pid": os.getpid(),
+            "doc": current_document(),
+            "stage": current_stage(),
+        }
+        eintrag.update(fields)
+        zeile = json.dumps(eintrag, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock:
+                stream = self._stream()
+                stream.write(zeile)
+                stream.flush()
+        except (OSError, ValueError):
+            # Das Protokoll darf die Verarbeitung nie abbrechen
+            pass
+
+    def debug(self, event: str, msg: str = "", **fields):
+        self.log("debug", event, msg, **fields)
+
+    def info(self, event: str, msg: str = "", **fields):
+        self.log("info", event, msg, **fields)
+
+    def warning(self, event: str, msg: str = "", **fields):
+        self.log("warning", event, msg, **fields)
+
+    def error(self, event: str, msg: str = "", **fields):
+        self.log("error", event, msg, **fields)
+
+    @contextmanager
+    def timed(self, event: str, msg: str = "", level: str = "info", **fields):
+        """Protokolliert event mit duration_ms, wenn der Block endet (auch bei Ausnahmen, dann mit error)."""
+        start = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields.setdefault("error", f"{type(e).__name__}: {e}")
+            level = "error"
+            raise
+        finally:
+            self.log(level, event, msg, duration_ms=round((time.perf_counter() - start) * 1000, 1), **fields)
+
+
+log = EventLogger()
+os.register_at_fork(after_in_child=log._nach_fork)
@@ -1,10 +1,14 @@
-def divide_nettoEk_by_menge(netto_ek:str, menge:str) -> str:
+from helpers.number_helpers import format_deutsche_zahl, parse_deutsche_zahl, runde
+from helpers.event_log import log
+
+
+def divide_nettoEk_by_menge(netto_ek: str, menge: str | int) -> str:
     """
     Divides the nettoEk by menge and returns the result.
     If menge is 0, returns 0 to avoid division by zero.
     Args:
         netto_ek (str): The nettoEk value as a string.
-        menge (str): The menge value as a string.
+        menge (str | int): The menge value as a string (or int for fixed extra positions).
     Returns:
         str: The result of the division as a string.
     """
@@ -12,17 +16,15 @@ def divide_nettoEk_by_menge(netto_ek:str, menge:str) -> str:
         return "N/A"
     
     try:
-        netto_ek_value = float(
-            netto_ek.replace(".", "").replace(",", ".")
-        )
-        menge_value = float(
-            menge.replace(".", "").replace(",", ".")
-        )
+        netto_ek_value = parse_deutsche_zahl(netto_ek)
+        menge_value = parse_deutsche_zahl(menge)
     except ValueError:
-        print("Error converting netto_ek or menge to float")
+        log.warning("number_invalid", "Error converting netto_ek or menge to a number", netto_ek=netto_ek, menge=menge)
+        return "N/A"
+    if netto_ek_value is None or menge_value is None:
         return "N/A"
     if menge_value == 0:
         return "0"
-    price_per_item = round(netto_ek_value / menge_value, 3)
-    netto_ek = str(price_per_item).replace(".", ",")
-    return netto_ek
\ No newline at end of file
+    # Exakt in Decimal rechnen, kaufmännisch auf 3 Stellen gerundet
+    price_per_item = runde(netto_ek_value / menge_value, 3)
+    return format_deutsche_zahl(price_per_item)
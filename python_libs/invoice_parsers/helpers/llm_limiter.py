@@ -0,0 +1,482 @@
+"""
+Gemeinsame Begrenzung der LLM-Aufrufe aller Python-Prozesse (AIMD-Concurrency und Circuit Breaker).
+
+Die Node-Skripte starten pro Dokument einen eigenen Parser-Prozess. Der Zustand liegt deshalb
+in einer JSON-Datei (LLM_LIMITER_STATE), die unter einem fcntl-Lock gelesen und geschrieben wird:
+
+- Concurrency: Es laufen höchstens floor(limit) Aufrufe gleichzeitig. Jeder schnelle Erfolg
+  erhöht limit um 1/limit (also etwa +1 pro Runde), 429/5xx/Timeouts halbieren es,
+  langsame Antworten (über LLM_LATENCY_TARGET_MS) verringern es leicht.
+- Circuit Breaker: Nach LLM_CIRCUIT_FAILURES Überlastungsfehlern in Folge ist der Circuit für
+  LLM_CIRCUIT_COOLDOWN_S offen. Danach darf ein einzelner Probe-Aufruf durch; klappt er, ist
+  der Circuit wieder geschlossen, sonst beginnt die Wartezeit erneut.
+
+Ist kein Aufruf möglich (Circuit offen oder kein Platz innerhalb LLM_SLOT_WAIT_S), wird
+LlmUnavailable ausgelöst; der Aufrufer stellt das Dokument in die LlmQueue zurück. Läuft der Aufruf
+unter einem Dokumentbudget (helpers.worker), enden Wartezeit und Zeitlimit vor dessen Ablauf, damit das
+Dokument zurückgestellt statt vom Budget abgebrochen wird (within_budget). Nachgeholt wird
+mit emergent_gemini_parser.py --retry-queued (am Ende der Batch-Skripte über scripts/drain-llm-queue.js).
+
+Testen ohne Anbieter: ein lokaler Stub-Server mit Fehlerinjektion und ein Lastgenerator
+    python -m helpers.llm_limiter stub --port 8765 --fail-rate 0.3 --latency-ms 200
+    python -m helpers.llm_limiter load --url http://127.0.0.1:8765 --requests 200 --processes 16
+    python -m helpers.llm_limiter status
+(jeweils aus python_libs/invoice_parsers, mit LLM_LIMITER_STATE auf eine Testdatei).
+"""
+import asyncio
+import fcntl
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from helpers.event_log import log
+from helpers.worker import remaining_budget
+
+_BASIS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LLM_LIMITER_STATE = os.getenv("LLM_LIMITER_STATE", os.path.join(_BASIS, "llm_limiter.json"))
+LLM_QUEUE_DIR = os.getenv("LLM_QUEUE_DIR", os.path.join(_BASIS, "llm_queue"))
+
+# Grenzen und Startwert der gleichzeitigen Aufrufe
+LLM_MIN_CONCURRENCY = 1
+LLM_MAX_CONCURRENCY = float(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_START_CONCURRENCY = 2.0
+# Antworten über dieser Latenz gelten als Zeichen von Überlast
+LLM_LATENCY_TARGET_MS = float(os.getenv("LLM_LATENCY_TARGET_MS", "20000"))
+# Faktor bei 429/5xx/Timeout bzw. bei zu langsamer Antwort
+DECREASE_OVERLOAD = 0.5
+DECREASE_SLOW = 0.9
+# Circuit Breaker
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_COOLDOWN_S = float(os.getenv("LLM_CIRCUIT_COOLDOWN_S", "60"))
+# So lange wartet ein Aufruf höchstens auf einen freien Platz
+LLM_SLOT_WAIT_S = float(os.getenv("LLM_SLOT_WAIT_S", "120"))
+# Zeitlimit eines einzelnen Aufrufs; Plätze abgestürzter Prozesse werden nach dem Doppelten freigegeben
+LLM_CALL_TIMEOUT_S = float(os.getenv("LLM_CALL_TIMEOUT_S", "90"))
+POLL_INTERVAL_S = 0.2
+# Unter einem Dokumentbudget: so viel Zeit bleibt nach dem Abbruch zum Zurückstellen und für die Ausgabe
+BUDGET_RESERVE_S = float(os.getenv("LLM_BUDGET_RESERVE_S", "5"))
+
+OUTCOME_OK = "ok"
+OUTCOME_OVERLOAD = "overload"
+OUTCOME_ERROR = "error"
+# Nicht beim Anbieter gescheitert (Budget): Platz freigeben, limit und Circuit unverändert
+OUTCOME_CANCELLED = "cancelled"
+
+_UEBERLAST_MUSTER = re.compile(
+    r"\b(429|5\d\d)\b|rate.?limit|quota|resource.?exhausted|overloaded|unavailable|timed?.?out|deadline",
+    re.IGNORECASE,
+)
+
+
+class LlmUnavailable(Exception):
+    """Der LLM-Aufruf wurde nicht gestartet (Circuit offen oder kein freier Platz)."""
+
+    def __init__(self, grund: str, retry_in: float = 0.0):
+        self.grund = grund
+        self.retry_in = retry_in
+        super().__init__(f"LLM nicht verfügbar ({grund}), erneut in {retry_in:.0f} s")
+
+
+def within_budget(sekunden: float) -> float:
+    """Begrenzt eine Wartezeit bzw. ein Zeitlimit auf das restliche Dokumentbudget abzüglich BUDGET_RESERVE_S."""
+    rest = remaining_budget()
+    if rest is None:
+        return sekunden
+    return max(0.0, min(sekunden, rest - BUDGET_RESERVE_S))
+
+
+def classify_error(exc: BaseException) -> str:
+    """
+    Ordnet eine Ausnahme des LLM-Clients ein
+    Returns:
+        str: OUTCOME_OVERLOAD für 429/5xx/Timeouts/Verbindungsfehler, OUTCOME_CANCELLED für
+            LlmUnavailable während des Aufrufs, sonst OUTCOME_ERROR
+    """
+    if isinstance(exc, LlmUnavailable):
+        return OUTCOME_CANCELLED
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, socket.timeout, ConnectionError)):
+        return OUTCOME_OVERLOAD
+    for status in (
+        getattr(exc, "status_code", None),
+        getattr(exc, "code", None),
+        getattr(getattr(exc, "response", None), "status_code", None),
+    ):
+        if isinstance(status, int) and 400 <= status < 600:
+            return OUTCOME_OVERLOAD if status == 429 or status >= 500 else OUTCOME_ERROR
+    return OUTCOME_OVERLOAD if _UEBERLAST_MUSTER.search(str(exc)) else OUTCOME_ERROR
+
+
+def _prozess_lebt(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class LlmLimiter:
+    """
+    Args:
+        path (str): JSON-Datei mit dem gemeinsamen Zustand (daneben <path>.lock)
+    """
+
+    def __init__(self, path: str = LLM_LIMITER_STATE):
+        self.path = path
+        self._zaehler = 0
+
+    @contextmanager
+    def _gesperrt(self):
+        """Zustand unter exklusivem Lock lesen und (falls verändert) atomar zurückschreiben."""
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                zustand = self._load()
+                vorher = json.dumps(zustand, sort_keys=True)
+                yield zustand
+                if json.dumps(zustand, sort_keys=True) != vorher:
+                    self._save(zustand)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                zustand = json.load(f)
+        except (OSError, ValueError):
+            zustand = {}
+        zustand.setdefault("limit", LLM_START_CONCURRENCY)
+        zustand.setdefault("in_flight", {})
+        zustand.setdefault("failures", 0)
+        zustand.setdefault("opened_at", None)
+        zustand.setdefault("probe", None)
+        zustand.setdefault("latency_ms", None)
+        return zustand
+
+    def _save(self, zustand: dict):
+        ordner = os.path.dirname(self.path) or "."
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=ordner, suffix=".tmp", delete=False) as tmp:
+            json.dump(zustand, tmp)
+        os.replace(tmp.name, self.path)
+
+    def _aufraeumen(self, zustand: dict, jetzt: float):
+        # Plätze abgestürzter oder hängender Prozesse freigeben
+        for token, eintrag in list(zustand["in_flight"].items()):
+            if not _prozess_lebt(eintrag["pid"]) or jetzt - eintrag["since"] > 2 * LLM_CALL_TIMEOUT_S:
+                del zustand["in_flight"][token]
+                if zustand["probe"] == token:
+                    zustand["probe"] = None
+
+    def try_acquire(self) -> str | None:
+        """
+        Belegt einen Platz, falls frei
+        Returns:
+            str | None: Token für release(), None wenn alle Plätze belegt sind
+        Raises:
+            LlmUnavailable: Circuit offen
+        """
+        jetzt = time.time()
+        with self._gesperrt() as zustand:
+            self._aufraeumen(zustand, jetzt)
+            probe = False
+            if zustand["opened_at"] is not None:
+                rest = zustand["opened_at"] + LLM_CIRCUIT_COOLDOWN_S - jetzt
+                if rest > 0:
+                    raise LlmUnavailable("circuit_open", rest)
+                if zustand["probe"] is not None:
+                    # Halb offen: nur ein Probe-Aufruf gleichzeitig
+                    raise LlmUnavailable("circuit_half_open", LLM_CIRCUIT_COOLDOWN_S)
+                probe = True
+            elif len(zustand["in_flight"]) >= int(zustand["limit"]):
+                return None
+            self._zaehler += 1
+            token = f"{os.getpid()}-{self._zaehler}"
+            zustand["in_flight"][token] = {"pid": os.getpid(), "since": jetzt}
+            if probe:
+                zustand["probe"] = token
+            return token
+
+    def release(self, token: str, outcome: str, latency_ms: float):
+        """Gibt den Platz frei und passt limit und Circuit an das Ergebnis an."""
+        with self._gesperrt() as zustand:
+            zustand["in_flight"].pop(token, None)
+            war_probe = zustand["probe"] == token
+            if war_probe:
+                zustand["probe"] = None
+            if outcome == OUTCOME_CANCELLED:
+                return
+            limit = zustand["limit"]
+
+            if outcome == OUTCOME_OVERLOAD:
+                zustand["limit"] = max(LLM_MIN_CONCURRENCY, limit * DECREASE_OVERLOAD)
+                zustand["failures"] += 1
+                if war_probe or (zustand["opened_at"] is None and zustand["failures"] >= LLM_CIRCUIT_FAILURES):
+                    zustand["opened_at"] = time.time()
+                    log.warning("llm_circuit_open", f"LLM-Circuit geöffnet nach {zustand['failures']} Überlastungsfehlern",
+                                failures=zustand["failures"], cooldown_s=LLM_CIRCUIT_COOLDOWN_S)
+                return
+
+            # Der Anbieter hat geantwortet (auch ein 4xx zählt dazu)
+            zustand["failures"] = 0
+            if war_probe or zustand["opened_at"] is not None:
+                zustand["opened_at"] = None
+                log.info("llm_circuit_closed", "LLM-Circuit wieder geschlossen")
+            letzte = zustand["latency_ms"]
+            zustand["latency_ms"] = round(latency_ms if letzte is None else 0.8 * letzte + 0.2 * latency_ms, 1)
+            if outcome == OUTCOME_OK:
+                if latency_ms <= LLM_LATENCY_TARGET_MS:
+                    zustand["limit"] = min(LLM_MAX_CONCURRENCY, limit + 1 / limit)
+                else:
+                    zustand["limit"] = max(LLM_MIN_CONCURRENCY, limit * DECREASE_SLOW)
+
+    def _abschliessen(self, token: str, start: float, fehler: BaseException | None):
+        latenz = (time.perf_counter() - start) * 1000
+        outcome = OUTCOME_OK if fehler is None else classify_error(fehler)
+        self.release(token, outcome, latenz)
+        if outcome == OUTCOME_OVERLOAD:
+            log.warning("llm_overload", f"LLM überlastet: {fehler}", duration_ms=round(latenz, 1))
+
+    @contextmanager
+    def slot(self, wait_s: float = LLM_SLOT_WAIT_S):
+        """
+        Synchroner Aufruf im Limiter: with limiter.slot(): response = client.call(...)
+        Die Wartezeit endet spätestens vor Ablauf des Dokumentbudgets (within_budget).
+        """
+        ende = time.monotonic() + within_budget(wait_s)
+        token = self.try_acquire()
+        while token is None:
+            if time.monotonic() >= ende:
+                raise LlmUnavailable("no_slot", POLL_INTERVAL_S)
+            time.sleep(POLL_INTERVAL_S)
+            token = self.try_acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._abschliessen(token, start, e)
+            raise
+        self._abschliessen(token, start, None)
+
+    @asynccontextmanager
+    async def aslot(self, wait_s: float = LLM_SLOT_WAIT_S):
+        """Wie slot(), für async-Clients: async with limiter.aslot(): ..."""
+        ende = time.monotonic() + within_budget(wait_s)
+        token = self.try_acquire()
+        while token is None:
+            if time.monotonic() >= ende:
+                raise LlmUnavailable("no_slot", POLL_INTERVAL_S)
+            await asyncio.sleep(POLL_INTERVAL_S)
+            token = self.try_acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._abschliessen(token, start, e)
+            raise
+        self._abschliessen(token, start, None)
+
+    def status(self) -> dict:
+        with self._gesperrt() as zustand:
+            self._aufraeumen(zustand, time.time())
+            return {
+                "limit": round(zustand["limit"], 2),
+                "in_flight": len(zustand["in_flight"]),
+                "failures": zustand["failures"],
+                "circuit": "closed" if zustand["opened_at"] is None else "open",
+                "latency_ms": zustand["latency_ms"],
+            }
+
+    def reset(self):
+        """Zurück auf Startwerte, Circuit geschlossen."""
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class LlmQueue:
+    """
+    Zurückgestellte Dokumente: Kopie des PDFs und eine Zeile in manifest.jsonl, im Format
+    des Batch-Manifests von emergent_gemini_parser.py ({"id", "path", "email_context"})
+    Args:
+        ordner (str): Verzeichnis der Warteschlange
+    """
+
+    def __init__(self, ordner: str = LLM_QUEUE_DIR):
+        self.ordner = ordner
+        self.manifest = os.path.join(ordner, "manifest.jsonl")
+
+    def enqueue(self, pdf_path: str, doc_id: str | None = None, email_context: dict | None = None, grund: str = "") -> str:
+        """
+        Returns:
+            str: Pfad der zurückgestellten Kopie
+        """
+        os.makedirs(self.ordner, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.ordner, suffix=".pdf", delete=False) as tmp:
+            ziel = tmp.name
+        shutil.copyfile(pdf_path, ziel)
+        zeile = {
+            "id": doc_id or os.path.basename(pdf_path),
+            "path": ziel,
+            "email_context": email_context,
+            "queued_at": time.time(),
+            "grund": grund,
+        }
+        with open(self.manifest, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(json.dumps(zeile, ensure_ascii=False) + "\n")
+        log.info("llm_queued", f"Dokument zurückgestellt ({grund})", path=ziel)
+        return ziel
+
+    @contextmanager
+    def _gesperrt(self):
+        """Exklusiv gegenüber anderen Prozessen, die die Warteschlange übernehmen oder zurückgeben."""
+        os.makedirs(self.ordner, exist_ok=True)
+        with open(os.path.join(self.ordner, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _zurueckgeben(self, manifest: str):
+        with open(manifest, "r", encoding="utf-8") as f:
+            zeilen = [zeile for zeile in f if zeile.strip()]
+        if zeilen:
+            with open(self.manifest, "a", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.writelines(zeile if zeile.endswith("\n") else zeile + "\n" for zeile in zeilen)
+        os.unlink(manifest)
+        log.warning("llm_queue_restored", f"{len(zeilen)} Dokumente zurück in die Warteschlange", path=manifest)
+
+    def take(self) -> str | None:
+        """
+        Übernimmt die aktuelle Warteschlange zur Verarbeitung (neue Einträge landen in einer neuen Datei).
+        Manifeste abgestürzter Übernahmen (Prozess beendet, ohne done/restore) kommen vorher zurück in die Warteschlange.
+        Returns:
+            str | None: Pfad des übernommenen Manifests, None wenn leer
+        """
+        if not os.path.isdir(self.ordner):
+            return None
+        with self._gesperrt():
+            for name in os.listdir(self.ordner):
+                teile = name.split(".")
+                if len(teile) == 4 and teile[0] == "manifest" and teile[1].isdigit() and not _prozess_lebt(int(teile[1])):
+                    self._zurueckgeben(os.path.join(self.ordner, name))
+            if not os.path.exists(self.manifest):
+                return None
+            uebernommen = os.path.join(self.ordner, f"manifest.{os.getpid()}.{int(time.time())}.jsonl")
+            os.replace(self.manifest, uebernommen)
+            return uebernommen
+
+    def restore(self, manifest: str):
+        """Gibt ein übernommenes Manifest unverarbeitet zurück (z.B. nach einem Fehler), die PDF-Kopien bleiben."""
+        with self._gesperrt():
+            self._zurueckgeben(manifest)
+
+    def done(self, manifest: str):
+        """Entfernt ein verarbeitetes Manifest mit seinen PDF-Kopien."""
+        with open(manifest, "r", encoding="utf-8") as f:
+            for zeile in f:
+                if zeile.strip():
+                    try:
+                        os.unlink(json.loads(zeile)["path"])
+                    except (OSError, ValueError, KeyError):
+                        pass
+        os.unlink(manifest)
+
+
+limiter = LlmLimiter()
+llm_queue = LlmQueue()
+
+
+def _stub_server(port: int, fail_rate: float, latency_ms: float, fehler_status: int):
+    """Lokaler Test-Server: antwortet nach latency_ms, mit Wahrscheinlichkeit fail_rate mit fehler_status."""
+    import random
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _antwort(self):
+            time.sleep(latency_ms / 1000 * random.uniform(0.5, 1.5))
+            status = fehler_status if random.random() < fail_rate else 200
+            body = json.dumps({"status": status}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _antwort
+        do_POST = _antwort
+
+        def log_message(self, *args):
+            pass
+
+    print(f"Stub-Server auf http://127.0.0.1:{port} (fail_rate={fail_rate}, latency_ms={latency_ms}, status={fehler_status})")
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def _last_worker(url: str, anzahl: int, timeout: float) -> dict:
+    import urllib.request
+
+    ergebnis = {"ok": 0, "overload": 0, "error": 0, "unavailable": 0}
+    for _ in range(anzahl):
+        try:
+            with limiter.slot(wait_s=timeout):
+                with urllib.request.urlopen(url, timeout=timeout) as antwort:
+                    antwort.read()
+            ergebnis["ok"] += 1
+        except LlmUnavailable:
+            ergebnis["unavailable"] += 1
+            time.sleep(POLL_INTERVAL_S)
+        except Exception as e:
+            ergebnis[classify_error(e)] += 1
+    return ergebnis
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="LLM-Limiter: Zustand und Test gegen einen lokalen Stub-Server")
+    befehle = parser.add_subparsers(dest="befehl", required=True)
+    befehle.add_parser("status")
+    befehle.add_parser("reset")
+    stub = befehle.add_parser("stub")
+    stub.add_argument("--port", type=int, default=8765)
+    stub.add_argument("--fail-rate", type=float, default=0.2)
+    stub.add_argument("--latency-ms", type=float, default=200)
+    stub.add_argument("--status", type=int, default=429)
+    last = befehle.add_parser("load")
+    last.add_argument("--url", default="http://127.0.0.1:8765")
+    last.add_argument("--requests", type=int, default=100)
+    last.add_argument("--processes", type=int, default=8)
+    last.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.befehl == "status":
+        print(json.dumps(limiter.status()))
+    elif args.befehl == "reset":
+        limiter.reset()
+    elif args.befehl == "stub":
+        _stub_server(args.port, args.fail_rate, args.latency_ms, args.status)
+    else:
+        pro_prozess = max(1, args.requests // args.processes)
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            teile = pool.starmap(_last_worker, [(args.url, pro_prozess, args.timeout)] * args.processes)
+        summe = {schluessel: sum(teil[schluessel] for teil in teile) for schluessel in teile[0]}
+        summe["seconds"] = round(time.perf_counter() - start, 1)
+        summe["limiter"] = limiter.status()
+        print(json.dumps(summe))
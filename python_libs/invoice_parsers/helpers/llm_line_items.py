@@ -0,0 +1,201 @@
+"""
+Positionen (INVOICE_COLUMNS) aus LLM-Antworten, für Lieferanten ohne regelbasierten Parser.
+
+Lange Rechnungen werden in Abschnitte zu CHUNK_PAGES Seiten geteilt, die unabhängig voneinander
+(und damit parallel) angefragt werden. Seiten mit Textebene gehen als Text an das Modell,
+Abschnitte mit gescannten Seiten als PDF mit der Anweisung, nur diese Seiten auszuwerten.
+Die Positionen aller Abschnitte werden zusammengeführt und gegen den Nettobetrag aus den
+Kopfdaten abgeglichen (reconcile); fehlgeschlagene oder leere Abschnitte werden gemeldet.
+"""
+import datetime
+import os
+from decimal import Decimal
+
+import pandas as pd
+
+from helpers.constants import INVOICE_COLUMNS
+from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
+from helpers.helpers import divide_nettoEk_by_menge
+from helpers.llm_response import clean_text, decode_json, parse_betrag
+from helpers.number_helpers import format_deutsche_zahl, runde
+
+# Seiten pro Abschnitt
+CHUNK_PAGES = int(os.getenv("LLM_CHUNK_PAGES", "4"))
+# Zahlungsziel, wenn die Rechnung keins angibt (wie die meisten regelbasierten Parser)
+ZAHLUNGSZIEL_TAGE = 30
+# Erlaubte Abweichung zwischen Summe der Positionen und Nettobetrag (absolut bzw. relativ)
+ABGLEICH_TOLERANZ = Decimal("0.05")
+ABGLEICH_TOLERANZ_RELATIV = Decimal("0.005")
+
+# Eigene, ebenfalls feste System-Nachricht für die Positionsabfragen
+ITEMS_SYSTEM_PREFIX = """Du bist ein Experte für deutsche Buchhaltung und Rechnungsanalyse.
+
+Du bekommst einen Abschnitt (einige Seiten) einer deutschen Lieferantenrechnung (EK-Rechnung).
+Extrahiere ALLE Rechnungspositionen dieses Abschnitts, auch Fracht, Verpackung, Zuschläge und
+Rabatte als eigene Positionen. Zwischensummen, Überträge, Gesamtsummen und MwSt sind KEINE Positionen.
+"Score Schleifwerkzeuge" ist der Empfänger, nicht der Lieferant.
+
+Formatiere die Antwort als JSON-Objekt:
+{
+  "positionen": [
+    {
+      "position": number,
+      "artikelnummer_lieferant": "string",
+      "kundenartikelnummer": "string oder null",
+      "artikelname": "string",
+      "menge": number,
+      "einzelpreis_netto": number,
+      "gesamtpreis_netto": number,
+      "bestellnummer": "string oder null",
+      "auftragsnummer": "string oder null"
+    }
+  ]
+}
+Beträge als Zahl mit Dezimalpunkt (1.234,56 € = 1234.56), negative Beträge für Rabatte/Gutschriften.
+Ohne Positionen in diesem Abschnitt: {"positionen": []}
+"""
+
+
+def plan_chunks(seiten: int, chunk_pages: int = CHUNK_PAGES) -> list[tuple[int, int]]:
+    """Seitenbereiche (1-basiert, inklusive) der Abschnitte."""
+    chunk_pages = max(1, chunk_pages)
+    return [(von, min(von + chunk_pages - 1, seiten)) for von in range(1, seiten + 1, chunk_pages)]
+
+
+def chunk_prompt(von: int, bis: int, seiten: int, text: str | None = None) -> str:
+    """
+    Nutzer-Nachricht für einen Abschnitt
+    Args:
+        text: Text der Seiten von..bis; None, wenn das ganze PDF angehängt wird
+    """
+    bereich = f"Seite {von}" if von == bis else f"Seiten {von} bis {bis}"
+    if text is None:
+        return (f"Im Anhang ist die ganze Rechnung ({seiten} Seiten). Werte NUR {bereich} aus.\n"
+                "Gib NUR das JSON zurück, keine Erklärungen.")
+    return (f"Text von {bereich} (von {seiten} Seiten) der Rechnung:\n\n{text}\n\n"
+            "Gib NUR das JSON zurück, keine Erklärungen.")
+
+
+def parse_items(antwort: str) -> list[dict] | None:
+    """
+    Positionen aus der Antwort auf chunk_prompt, Beträge als Decimal
+    Returns:
+        list | None: None, wenn die Antwort kein gültiges Objekt mit "positionen" ist
+    """
+    data = decode_json(antwort)
+    if not isinstance(data, dict) or not isinstance(data.get("positionen"), list):
+        return None
+    positionen = []
+    for roh in data["positionen"]:
+        if not isinstance(roh, dict):
+            continue
+        menge = parse_betrag(roh.get("menge"))
+        einzelpreis = parse_betrag(roh.get("einzelpreis_netto"))
+        gesamtpreis = parse_betrag(roh.get("gesamtpreis_netto"))
+        if gesamtpreis is None and einzelpreis is not None and menge is not None:
+            gesamtpreis = einzelpreis * menge
+        name = clean_text(roh.get("artikelname"))
+        if name is None and gesamtpreis is None:
+            continue
+        positionen.append({
+            "position": roh.get("position"),
+            "artikelnummer_lieferant": clean_text(roh.get("artikelnummer_lieferant")),
+            "kundenartikelnummer": clean_text(roh.get("kundenartikelnummer")),
+            "artikelname": name,
+            "menge": menge,
+            "gesamtpreis_netto": gesamtpreis,
+            "bestellnummer": clean_text(roh.get("bestellnummer")),
+            "auftragsnummer": clean_text(roh.get("auftragsnummer")),
+        })
+    return positionen
+
+
+def _gleiche_position(a: dict, b: dict) -> bool:
+    return all(a[feld] == b[feld] for feld in ("position", "artikelnummer_lieferant", "menge", "gesamtpreis_netto"))
+
+
+def merge_chunks(abschnitte: list[list[dict] | None]) -> list[dict]:
+    """
+    Positionen der Abschnitte in Seitenreihenfolge; eine über den Seitenumbruch laufende Position,
+    die am Ende eines und am Anfang des nächsten Abschnitts steht, wird nur einmal übernommen
+    """
+    positionen: list[dict] = []
+    for abschnitt in abschnitte:
+        if not abschnitt:
+            continue
+        if positionen and _gleiche_position(positionen[-1], abschnitt[0]):
+            abschnitt = abschnitt[1:]
+        positionen.extend(abschnitt)
+    return positionen
+
+
+def _zahl_text(wert: Decimal | None) -> str:
+    if wert is None:
+        return "N/A"
+    if wert == wert.to_integral_value():
+        return str(int(wert))
+    return format_deutsche_zahl(wert)
+
+
+def items_to_dataframe(positionen: list[dict], kopf: dict) -> pd.DataFrame:
+    """
+    Zeilen im Format INVOICE_COLUMNS (Netto-EK pro Stück wie bei den regelbasierten Parsern)
+    Args:
+        kopf: Kopfdaten wie von den LLM-Parsern (rechnungsnummer, lieferant, datum YYYY-MM-DD, steuersatz)
+    """
+    try:
+        belegdatum = datetime.date.fromisoformat(kopf.get("datum") or "").strftime("%d.%m.%Y")
+        zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, ZAHLUNGSZIEL_TAGE)
+    except ValueError:
+        belegdatum = zahlbar_bis = "N/A"
+    rechnungsnummer = kopf.get("rechnungsnummer") or "N/A"
+    lieferant = kopf.get("lieferant") or "N/A"
+    mwst = str(kopf.get("steuersatz", "N/A"))
+
+    zeilen = []
+    for position in positionen:
+        menge = _zahl_text(position["menge"])
+        netto_ek = divide_nettoEk_by_menge(_zahl_text(position["gesamtpreis_netto"]), menge)
+        zeilen.append([
+            position["bestellnummer"] or "N/A",
+            rechnungsnummer,
+            position["auftragsnummer"] or "N/A",
+            lieferant,
+            zahlbar_bis,
+            belegdatum,
+            position["kundenartikelnummer"] or "N/A",
+            position["artikelnummer_lieferant"] or "N/A",
+            position["artikelname"] or "N/A",
+            "N/A",
+            menge,
+            netto_ek,
+            mwst,
+        ])
+    return pd.DataFrame(zeilen, columns=INVOICE_COLUMNS)
+
+
+def reconcile(positionen: list[dict], kopf: dict, bereiche: list[tuple[int, int]], abschnitte: list[list[dict] | None]) -> dict:
+    """
+    Abgleich der Positionssumme mit dem Nettobetrag der Kopfdaten
+    Returns:
+        dict: summe_positionen, nettobetrag, differenz, ok, dazu die Seitenbereiche fehlgeschlagener
+              und leerer Abschnitte (Kandidaten für fehlende Positionen)
+    """
+    summe = sum((position["gesamtpreis_netto"] for position in positionen if position["gesamtpreis_netto"] is not None), Decimal(0))
+    netto = parse_betrag(kopf.get("nettobetrag"))
+    fehlgeschlagen = [f"{von}-{bis}" for (von, bis), abschnitt in zip(bereiche, abschnitte) if abschnitt is None]
+    leer = [f"{von}-{bis}" for (von, bis), abschnitt in zip(bereiche, abschnitte) if abschnitt == []]
+    abgleich = {
+        "summe_positionen": float(runde(summe)),
+        "nettobetrag": float(runde(netto)) if netto is not None else None,
+        "differenz": None,
+        "ok": False,
+        "chunks": len(bereiche),
+        "chunks_failed": fehlgeschlagen,
+        "chunks_empty": leer,
+    }
+    if netto is not None and netto != 0:
+        differenz = netto - summe
+        abgleich["differenz"] = float(runde(differenz))
+        abgleich["ok"] = not fehlgeschlagen and abs(differenz) <= max(ABGLEICH_TOLERANZ, abs(netto) * ABGLEICH_TOLERANZ_RELATIV)
+    return abgleich
@@ -0,0 +1,141 @@
+"""
+Prompt-Vorlagen der LLM-Parser, nach Lieferant.
+
+Der lange, für alle Rechnungen gleiche Anweisungsblock steht als SYSTEM_PREFIX in der
+System-Nachricht bzw. system_instruction. Er ändert sich zwischen den Aufrufen nie, damit
+das Prompt-Caching des Anbieters greift. Jede Anfrage beginnt ohne Verlauf: gemini_invoice_parser
+nutzt ein GenerativeModel für alle Aufrufe (generate_content ist zustandslos), emergent_gemini_parser
+öffnet pro Anfrage eine neue LlmChat-Session, weil LlmChat den Verlauf an die Session bindet.
+In die Nutzer-Nachricht kommen nur die Hinweise zum (vermuteten) Lieferanten aus VENDOR_TEMPLATES
+und der E-Mail-Kontext.
+"""
+from file_handlers.pdf_text import extract_pdf_text
+
+SYSTEM_PREFIX = """Du bist ein Experte für deutsche Buchhaltung und Rechnungsanalyse.
+
+Extrahiere die folgenden Informationen aus dieser deutschen Lieferantenrechnung (EK-Rechnung):
+- Rechnungsnummer
+- Rechnungsdatum (Format: YYYY-MM-DD)
+- Lieferantenname (vollständiger Firmenname)
+- Gesamtbetrag (Brutto, mit MwSt) in Euro
+- Nettobetrag (ohne MwSt) in Euro
+- Mehrwertsteuerbetrag in Euro
+- MwSt-Satz (z.B. 19, 7, 0)
+
+KRITISCH WICHTIG:
+- Dies ist eine EINGANGSRECHNUNG (Lieferantenrechnung)
+- Der LIEFERANT ist derjenige, der die Rechnung AUSSTELLT (oben auf der Rechnung)
+- "Score Schleifwerkzeuge" ist NICHT der Lieferant! Das ist der EMPFÄNGER/KUNDE
+- Ignoriere die Empfängeradresse - suche nur nach dem Absender/Rechnungssteller
+- Nutze auch die Informationen aus dem E-Mail-Kontext.
+- Der Lieferantenname kann aus dem E-Mail-Absender stammen.
+- Bei deutschen Beträgen: 1.234,56 € = 1234.56
+- Falls keine Beträge gefunden werden, setze sie auf 0
+- Rechnungsnummer ist oft im Format: RE-123456, Invoice-789, etc.
+
+Formatiere die Antwort als JSON-Objekt:
+{
+  "rechnungsnummer": "string",
+  "datum": "YYYY-MM-DD",
+  "lieferant": "string",
+  "gesamtbetrag": number,
+  "nettobetrag": number,
+  "mehrwertsteuer": number,
+  "mwstSatz": number
+}
+"""
+
+# Lieferant -> Erkennungsmerkmale (Kleinbuchstaben, in E-Mail-Absender/Betreff oder PDF-Text)
+# und Hinweise zu seinen Rechnungen; die Merkmale entsprechen denen der regelbasierten Parser
+VENDOR_TEMPLATES = {
+    "klingspor": {
+        "erkennung": ("klingspor",),
+        "hinweise": "Lieferant ist Klingspor. Die Rechnungsnummer ist der erste Wert unter \"Nummer / Datum\".",
+    },
+    "pferd": {
+        "erkennung": ("august rüggeberg", "rueggeberg", "pferd"),
+        "hinweise": "Lieferant ist August Rüggeberg GmbH & Co. KG (PFERD).",
+    },
+    "vsm": {
+        "erkennung": ("vereinigte schmirgel", "vsm"),
+        "hinweise": "Lieferant ist VSM (Vereinigte Schmirgel- und Maschinen-Fabriken). Die Rechnungsnummer steht hinter \"Rechnungs-Nr.:\".",
+    },
+    "starcke": {
+        "erkennung": ("starcke",),
+        "hinweise": "Lieferant ist Starcke.",
+    },
+    "norton": {
+        "erkennung": ("norton", "saint-gobain"),
+        "hinweise": "Lieferant ist Norton (Saint-Gobain). Rechnungsnummer und -datum stehen hinter \"RECHNUNGSNUMMER\" bzw. \"RECHNUNGSDATUM\".",
+    },
+    "rhodius": {
+        "erkennung": ("rhodius",),
+        "hinweise": "Lieferant ist Rhodius. Die Rechnungsnummer steht hinter \"Rechnung: \".",
+    },
+    "awuko": {
+        "erkennung": ("awuko",),
+        "hinweise": "Lieferant ist Awuko. Die Rechnungsnummer steht hinter \"Rechnung Nr.\".",
+    },
+    "bosch": {
+        "erkennung": ("bosch",),
+        "hinweise": "Lieferant ist Bosch.",
+    },
+    "plastimex": {
+        "erkennung": ("plastimex",),
+        "hinweise": "Lieferant ist Plastimex (polnische Rechnung). Die Rechnungsnummer steht hinter \"Faktura VAT\".",
+    },
+}
+
+
+def _suche(text: str) -> str | None:
+    for key, template in VENDOR_TEMPLATES.items():
+        if any(merkmal in text for merkmal in template["erkennung"]):
+            return key
+    return None
+
+
+def detect_vendor(pdf_path: str | None = None, email_context: dict | None = None) -> str | None:
+    """
+    Vermuteter Lieferant für die Prompt-Vorlage: zuerst aus E-Mail-Absender und Betreff,
+    sonst aus dem Text der ersten Seite (bei Scans leer)
+    Returns:
+        str | None: Key in VENDOR_TEMPLATES
+    """
+    if email_context:
+        key = _suche(f"{email_context.get('from') or ''} {email_context.get('subject') or ''}".lower())
+        if key:
+            return key
+    if pdf_path:
+        try:
+            return _suche(extract_pdf_text(pdf_path, max_pages=1).lower())
+        except Exception:
+            return None
+    return None
+
+
+def build_context_text(email_context: dict = None) -> str:
+    """E-Mail-Kontext (Absender, Betreff, Anfang des Texts) für den Prompt."""
+    context_text = ""
+    if email_context:
+        context_text = "\n\nZUSÄTZLICHER KONTEXT AUS E-MAIL:\n"
+        if email_context.get('from'):
+            context_text += f"Absender: {email_context['from']}\n"
+        if email_context.get('subject'):
+            context_text += f"Betreff: {email_context['subject']}\n"
+        if email_context.get('body'):
+            body = email_context['body'][:500]
+            context_text += f"E-Mail-Text: {body}\n"
+    return context_text
+
+
+def document_prompt(vendor: str | None, email_context: dict = None) -> str:
+    """Der dokumentspezifische Teil: Lieferanten-Hinweise und E-Mail-Kontext (ohne SYSTEM_PREFIX)."""
+    text = ""
+    if vendor in VENDOR_TEMPLATES:
+        text += f"VERMUTETER LIEFERANT: {VENDOR_TEMPLATES[vendor]['hinweise']}\n"
+    return text + build_context_text(email_context)
+
+
+def user_prompt(vendor: str | None, email_context: dict = None) -> str:
+    """Nutzer-Nachricht für eine einzelne Rechnung."""
+    return document_prompt(vendor, email_context) + "\nGib NUR das JSON zurück, keine Erklärungen."
@@ -0,0 +1,241 @@
+"""
+Gemeinsame Auswertung der LLM-Antworten (emergent_gemini_parser, gemini_invoice_parser).
+
+Die Antwort wird gegen INVOICE_SCHEMA geprüft und typische Abweichungen werden ohne weiteren
+Aufruf repariert: deutsche Zahlen ("1.234,56 €"), Prozentangaben ("19 %", 0.19), deutsche
+Datumsformate ("12.03.25") und aus den übrigen Beträgen ableitbare Werte. Nur Felder, die danach
+noch fehlen oder ungültig sind, werden mit einer kurzen Nachfrage (reask_prompt) erneut angefragt.
+"""
+import datetime
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from helpers.date_helpers import parse_datum
+from helpers.number_helpers import parse_deutsche_zahl, runde
+
+# Feld -> Typ der erwarteten JSON-Antwort
+INVOICE_SCHEMA = {
+    "rechnungsnummer": "text",
+    "datum": "datum",
+    "lieferant": "text",
+    "gesamtbetrag": "betrag",
+    "nettobetrag": "betrag",
+    "mehrwertsteuer": "betrag",
+    "mwstSatz": "satz",
+}
+# Nur diese Felder werden nachgefragt, die übrigen lassen sich aus den Beträgen ableiten
+NACHFRAGE_FELDER = ("rechnungsnummer", "datum", "lieferant", "gesamtbetrag")
+
+STANDARD_MWST_SATZ = 19
+# Texte, die das Modell statt "nicht gefunden" liefert
+PLATZHALTER = {"", "n/a", "unbekannt", "unknown", "null", "none", "string", "-"}
+# Der Empfänger der Eingangsrechnungen - nie der Lieferant
+EMPFAENGER = "score schleifwerkzeuge"
+
+_BESCHREIBUNG = {
+    "rechnungsnummer": "Rechnungsnummer (string)",
+    "datum": "Rechnungsdatum (YYYY-MM-DD)",
+    "lieferant": "Lieferant = Rechnungssteller, nicht Score Schleifwerkzeuge (string)",
+    "gesamtbetrag": "Gesamtbetrag brutto in Euro (number)",
+}
+
+_WAEHRUNG = re.compile(r"\s|€|eur\b|euro\b", re.IGNORECASE)
+# Deutsche Schreibweise: Punkte nur als Tausendertrennzeichen in Dreiergruppen, Komma als Dezimalzeichen
+_DEUTSCH = re.compile(r"^-?(\d{1,3}(\.\d{3})+|\d+)(,\d+)?$")
+# Englische Schreibweise: Dezimalpunkt, optional mit Komma als Tausendertrennzeichen ("1,234.56")
+_ENGLISCH = re.compile(r"^-?(\d{1,3}(,\d{3})+\.\d{1,2}|\d+\.\d+)$")
+_ISO_DATUM = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})")
+_DEUTSCHES_DATUM = re.compile(r"^(\d{1,2})[./](\d{1,2})[./](\d{2}|\d{4})$")
+_KOMMA_VOR_KLAMMER = re.compile(r",\s*([}\]])")
+
+
+def decode_json(text: str, array: bool = False):
+    """
+    JSON-Objekt (bzw. -Array) aus einer Modellantwort
+    Entfernt Markdown-Codeblöcke, schneidet Text vor/nach dem JSON ab und repariert
+    nachgestellte Kommas und typografische Anführungszeichen.
+    Returns:
+        dict | list | None: None, wenn die Antwort kein JSON enthält
+    """
+    auf, zu = ("[", "]") if array else ("{", "}")
+    start, ende = text.find(auf), text.rfind(zu)
+    # Schnelle Ablehnung ohne json.loads, wenn keine Klammern vorkommen
+    if start < 0 or ende <= start:
+        return None
+    roh = text[start:ende + 1]
+    try:
+        return json.loads(roh)
+    except ValueError:
+        pass
+    roh = _KOMMA_VOR_KLAMMER.sub(r"\1", roh.replace("“", '"').replace("”", '"').replace("„", '"'))
+    try:
+        return json.loads(roh)
+    except ValueError:
+        return None
+
+
+def parse_betrag(wert) -> Decimal | None:
+    """
+    Betrag aus JSON-Zahl oder Text ("1.234,56 €", "1234.56", "1,234.56", "-12,5"); None wenn ungültig.
+    Text wird nur in eindeutiger deutscher oder englischer Schreibweise angenommen, alles andere
+    ("1,234,56", "1.234.5") ergibt None und wird über reask_prompt nachgefragt.
+    "1.234" gilt wie in parse_deutsche_zahl als Tausenderpunkt.
+    """
+    if isinstance(wert, bool) or wert is None:
+        return None
+    if isinstance(wert, Decimal):
+        return wert if wert.is_finite() else None
+    if isinstance(wert, (int, float)):
+        try:
+            zahl = Decimal(repr(wert))
+        except InvalidOperation:
+            return None
+        return zahl if zahl.is_finite() else None
+    text = _WAEHRUNG.sub("", str(wert))
+    if _DEUTSCH.match(text):
+        return parse_deutsche_zahl(text)
+    if _ENGLISCH.match(text):
+        return Decimal(text.replace(",", ""))
+    return None
+
+
+def parse_satz(wert) -> int | None:
+    """MwSt-Satz in Prozent aus 19, "19 %", "19,0" oder 0.19."""
+    zahl = parse_betrag(str(wert).replace("%", "")) if isinstance(wert, str) else parse_betrag(wert)
+    if zahl is None:
+        return None
+    if 0 < zahl < 1:
+        zahl *= 100
+    satz = int(runde(zahl, 0))
+    return satz if 0 <= satz <= 30 else None
+
+
+def parse_llm_datum(wert) -> str | None:
+    """Datum als YYYY-MM-DD aus ISO- oder deutscher Schreibweise; None wenn ungültig oder unplausibel."""
+    if not isinstance(wert, str):
+        return None
+    text = wert.strip()
+    try:
+        iso = _ISO_DATUM.match(text)
+        deutsch = _DEUTSCHES_DATUM.match(text)
+        if iso:
+            datum = datetime.date(int(iso.group(1)), int(iso.group(2)), int(iso.group(3)))
+        elif deutsch:
+            format = "%d.%m.%Y" if len(deutsch.group(3)) == 4 else "%d.%m.%y"
+            datum = parse_datum(f"{deutsch.group(1)}.{deutsch.group(2)}.{deutsch.group(3)}", format).date()
+        else:
+            return None
+    except ValueError:
+        return None
+    if not 2000 <= datum.year <= datetime.date.today().year + 1:
+        return None
+    return datum.isoformat()
+
+
+def clean_text(wert) -> str | None:
+    if isinstance(wert, (int, float)) and not isinstance(wert, bool):
+        wert = str(wert)
+    if not isinstance(wert, str):
+        return None
+    text = wert.strip()
+    return None if text.lower() in PLATZHALTER else text
+
+
+def validate_invoice(data) -> tuple[dict, list[str]]:
+    """
+    Prüft und repariert die Felder einer Rechnung gemäß INVOICE_SCHEMA
+    Returns:
+        tuple: (gültige Felder mit Decimal-Beträgen, noch fehlende/ungültige Felder aus NACHFRAGE_FELDER)
+    """
+    if not isinstance(data, dict):
+        return {}, list(NACHFRAGE_FELDER)
+    felder = {}
+    for feld, typ in INVOICE_SCHEMA.items():
+        wert = data.get(feld)
+        if typ == "text":
+            wert = clean_text(wert)
+        elif typ == "datum":
+            wert = parse_llm_datum(wert)
+        elif typ == "betrag":
+            wert = parse_betrag(wert)
+        else:
+            wert = parse_satz(wert)
+        if wert is not None:
+            felder[feld] = wert
+
+    if EMPFAENGER in felder.get("lieferant", "").lower():
+        del felder["lieferant"]
+
+    # Ableitbare Beträge ergänzen statt nachzufragen
+    brutto, netto, mwst = (felder.get(feld) for feld in ("gesamtbetrag", "nettobetrag", "mehrwertsteuer"))
+    if brutto is None and netto is not None and mwst is not None:
+        felder["gesamtbetrag"] = netto + mwst
+    elif brutto is not None and netto is None and mwst is not None:
+        felder["nettobetrag"] = brutto - mwst
+    elif brutto is not None and netto is not None and mwst is None:
+        felder["mehrwertsteuer"] = brutto - netto
+    if "mwstSatz" not in felder and felder.get("nettobetrag") and felder.get("mehrwertsteuer") is not None:
+        felder["mwstSatz"] = parse_satz(felder["mehrwertsteuer"] / felder["nettobetrag"] * 100)
+        if felder["mwstSatz"] is None:
+            del felder["mwstSatz"]
+
+    return felder, [feld for feld in NACHFRAGE_FELDER if feld not in felder]
+
+
+def reask_prompt(fehlende: list[str]) -> str:
+    """Kurze Nachfrage nur nach den fehlenden Feldern."""
+    zeilen = "\n".join(f'- "{feld}": {_BESCHREIBUNG[feld]}' for feld in fehlende)
+    return (
+        "Aus dieser deutschen Lieferantenrechnung fehlen noch folgende Angaben:\n"
+        f"{zeilen}\n"
+        "Antworte NUR mit einem JSON-Objekt mit genau diesen Schlüsseln; "
+        "Beträge als Zahl mit Dezimalpunkt, nicht gefundene Werte als null."
+    )
+
+
+def merge_reask(felder: dict, antwort: str, fehlende: list[str]) -> tuple[dict, list[str]]:
+    """
+    Übernimmt aus der Antwort auf reask_prompt nur die nachgefragten Felder
+    Returns:
+        tuple: (ergänzte Felder, weiterhin fehlende Felder)
+    """
+    nachtrag = decode_json(antwort)
+    if not isinstance(nachtrag, dict):
+        return felder, fehlende
+    kombiniert = dict(felder)
+    kombiniert.update({feld: nachtrag[feld] for feld in fehlende if feld in nachtrag})
+    return validate_invoice(kombiniert)
+
+
+def invoice_result(felder: dict, fehlende: list[str], parsing_method: str, confidence: int, confidence_ohne_betrag: int) -> dict:
+    """
+    Ergebnis-Dict der LLM-Parser; fehlende Felder bekommen die bisherigen Standardwerte
+    und stehen zusätzlich in "invalid_fields"
+    """
+    brutto = felder.get("gesamtbetrag", Decimal(0))
+    netto = felder.get("nettobetrag", Decimal(0))
+    mwst = felder.get("mehrwertsteuer", Decimal(0))
+    satz = felder.get("mwstSatz", STANDARD_MWST_SATZ)
+
+    # Wenn netto fehlt aber brutto da ist, berechne
+    if brutto > 0 and netto == 0:
+        netto = brutto / (1 + Decimal(satz) / 100)
+        mwst = brutto - netto
+
+    result = {
+        "success": True,
+        "lieferant": felder.get("lieferant", "Unbekannt"),
+        "rechnungsnummer": felder.get("rechnungsnummer", "Unbekannt"),
+        "datum": felder.get("datum", datetime.datetime.now().strftime("%Y-%m-%d")),
+        "gesamtbetrag": float(runde(brutto)),
+        "nettobetrag": float(runde(netto)),
+        "steuerbetrag": float(runde(mwst)),
+        "steuersatz": satz,
+        "kreditor": None,
+        "parsing_method": parsing_method,
+        "confidence": confidence if brutto > 0 else confidence_ohne_betrag,
+    }
+    if fehlende:
+        result["invalid_fields"] = fehlende
+    return result
@@ -0,0 +1,93 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import lru_cache
+
+import pandas as pd
+
+# Werte, die in den Rechnungstabellen für "kein Wert" stehen
+LEERE_WERTE = {"", "N/A"}
+
+# Deutsche Schreibweise in einem Durchlauf normalisieren: Tausenderpunkt entfernen, Komma -> Punkt
+_DEUTSCH_NACH_DECIMAL = str.maketrans({".": None, ",": "."})
+
+CENT = Decimal("0.01")
+
+
+@lru_cache(maxsize=8192)
+def _parse_text(text: str) -> Decimal | None:
+    text = text.strip()
+    if text in LEERE_WERTE:
+        return None
+    try:
+        wert = Decimal(text.translate(_DEUTSCH_NACH_DECIMAL))
+    except InvalidOperation:
+        raise ValueError(f"Keine gültige Zahl: {text!r}") from None
+    if not wert.is_finite():
+        raise ValueError(f"Keine gültige Zahl: {text!r}")
+    return wert
+
+
+def parse_deutsche_zahl(wert: str | int | Decimal | None) -> Decimal | None:
+    """
+    Parst eine Zahl in deutscher Schreibweise exakt als Decimal.
+    Punkte sind immer Tausendertrennzeichen, das Komma ist das Dezimaltrennzeichen.
+    Args:
+        wert: z.B. "1.234,56", "12,5", "-3,00", "N/A" oder bereits eine Zahl
+    Returns:
+        Decimal | None: Der Wert, None für "N/A" bzw. leere Werte
+    Raises:
+        ValueError: Wenn der Text keine Zahl ist
+    """
+    if wert is None:
+        return None
+    if isinstance(wert, Decimal):
+        return wert
+    if isinstance(wert, int):
+        return Decimal(wert)
+    if isinstance(wert, float):
+        # Python-Zahlen haben bereits einen Dezimalpunkt, keine deutsche Schreibweise
+        return _parse_text(repr(wert).replace(".", ","))
+    return _parse_text(str(wert))
+
+
+def in_cent(wert: str | int | Decimal | None) -> int | None:
+    """Wie parse_deutsche_zahl, aber als ganze Cent (kaufmännisch gerundet)."""
+    zahl = parse_deutsche_zahl(wert)
+    if zahl is None:
+        return None
+    return int((zahl * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def runde(wert: Decimal, stellen: int = 2) -> Decimal:
+    """Kaufmännisches Runden auf die angegebene Anzahl Nachkommastellen."""
+    return wert.quantize(Decimal(1).scaleb(-stellen), rounding=ROUND_HALF_UP)
+
+
+def format_deutsche_zahl(wert: Decimal) -> str:
+    """
+    Formatiert ein Decimal mit Komma und mindestens einer Nachkommastelle,
+    wie bisher str(float).replace(".", ","): 125 -> "125,0", 1.5 -> "1,5".
+    """
+    text = format(wert.normalize(), "f")
+    if "." not in text:
+        text += ".0"
+    return text.replace(".", ",")
+
+
+def parse_spalte(spalte: pd.Series) -> pd.Series:
+    """
+    Parst eine ganze Spalte deutscher Zahlen zu Decimal/None.
+    Jeder unterschiedliche Wert wird nur einmal geparst, ungültige Werte werden zu None.
+    """
+    geparst = {}
+    for wert in spalte.unique():
+        try:
+            geparst[wert] = parse_deutsche_zahl(wert)
+        except (ValueError, TypeError):
+            geparst[wert] = None
+    return spalte.map(geparst)
+
+
+def spalte_in_cent(spalte: pd.Series) -> pd.Series:
+    """Wie parse_spalte, aber als ganze Cent (nullable Int64)."""
+    cent = parse_spalte(spalte).map(lambda zahl: None if zahl is None else in_cent(zahl))
+    return cent.astype("Int64")
@@ -0,0 +1,136 @@
+"""
+Profiling von Parser-Läufen (--profile bei main.py und fibu_invoice_parser.py).
+
+Ein Sampling-Profiler liest in festen Abständen den Stack des verarbeitenden Threads und
+zählt ihn im "collapsed stack"-Format (eine Zeile "stufe:parse;modul:funktion;... anzahl"),
+das flamegraph.pl, speedscope oder inferno direkt als Flame Graph darstellen. Die erste
+Ebene ist die per set_stage gemeldete Stufe.
+
+Dazu kommt die Liste der langsamsten Dokumente mit ihren Stufenzeiten.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Any, Callable
+
+from helpers.worker import current_stage, set_stage
+
+# Abstand der Stichproben in Millisekunden
+PROFILE_INTERVAL_MS = float(os.getenv("INVOICE_PROFILE_INTERVAL_MS", "5"))
+# So viele langsamste Dokumente werden aufgelistet
+PROFILE_TOP = 10
+# Standard-Ausgabedatei für die Stacks
+PROFILE_PATH = "profile.folded"
+
+
+def _frame_name(frame) -> str:
+    modul = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{modul}:{frame.f_code.co_name}"
+
+
+class StackSampler:
+    """
+    Zählt die Stacks eines Threads, solange er läuft
+    Args:
+        interval_ms (float): Abstand der Stichproben
+        thread_id (int): Zu beobachtender Thread, Standard: der aufrufende
+        root: Frame, ab dem (exklusive) der Stack abgeschnitten wird, z.B. die Worker-Schleife
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, thread_id: int | None = None, root=None):
+        self.interval = max(0.001, interval_ms / 1000)
+        self.thread_id = thread_id or threading.get_ident()
+        self.root = root
+        self.stacks: Counter[str] = Counter()
+        self._beendet = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        eigene_datei = __file__
+        while not self._beendet.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            namen = []
+            while frame is not None and frame is not self.root:
+                if frame.f_code.co_filename != eigene_datei:
+                    namen.append(_frame_name(frame))
+                frame = frame.f_back
+            if not namen:
+                continue
+            stufe = current_stage()
+            if stufe is not None:
+                namen.append(f"stufe:{stufe}")
+            self.stacks[";".join(reversed(namen))] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter[str]:
+        self._beendet.set()
+        self._thread.join()
+        return self.stacks
+
+
+def profiled(stage: str, func: Callable, *args) -> tuple[Any, dict[str, int]]:
+    """
+    Führt func(*args) als Stufe stage mit Sampling-Profiler aus (für RecyclingWorker(profile=True))
+    Returns:
+        tuple: (Ergebnis von func, gezählte Stacks ab func)
+    """
+    if current_stage() is None:
+        set_stage(stage)
+    sampler = StackSampler(root=sys._getframe()).start()
+    try:
+        result = func(*args)
+    finally:
+        stacks = sampler.stop()
+    return result, dict(stacks)
+
+
+class ProfileReport:
+    """Sammelt Stacks und Stufenzeiten mehrerer Dokumente (threadsicher)."""
+
+    def __init__(self):
+        self.stacks: Counter[str] = Counter()
+        self.dokumente: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, doc_id: str, total_ms: float, stages: dict[str, float], stacks: dict[str, int] | None = None):
+        with self._lock:
+            self.dokumente.append({"id": doc_id, "total_ms": round(total_ms, 1), "stages": stages})
+            if stacks:
+                self.stacks.update(stacks)
+
+    def write_collapsed(self, path: str) -> bool:
+        """
+        Schreibt die Stacks im collapsed-Format, z.B. für flamegraph.pl profile.folded > profile.svg
+        Returns:
+            success (bool): Ob das Schreiben erfolgreich war
+        """
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, anzahl in sorted(self.stacks.items()):
+                    f.write(f"{stack} {anzahl}\n")
+            return True
+        except OSError as e:
+            print(f"Fehler beim Schreiben des Profils {path}: {e}", file=sys.stderr)
+            return False
+
+    def slowest(self, n: int = PROFILE_TOP) -> list[dict]:
+        return sorted(self.dokumente, key=lambda dokument: dokument["total_ms"], reverse=True)[:n]
+
+    def summary(self, n: int = PROFILE_TOP) -> str:
+        """Die n langsamsten Dokumente mit Stufenzeiten als Text."""
+        zeilen = [f"Langsamste Dokumente ({min(n, len(self.dokumente))} von {len(self.dokumente)}):"]
+        for dokument in self.slowest(n):
+            stufen = ", ".join(f"{stufe} {ms:.0f} ms" for stufe, ms in sorted(dokument["stages"].items(), key=lambda s: -s[1]))
+            zeilen.append(f"  {dokument['total_ms']:>9.0f} ms  {dokument['id']}  ({stufen})")
+        zeilen.append(f"Stichproben: {sum(self.stacks.values())} à {PROFILE_INTERVAL_MS:g} ms")
+        return "\n".join(zeilen)
+
+    def finish(self, path: str, n: int = PROFILE_TOP, stream=sys.stderr):
+        """Schreibt die Stacks nach path und die Übersicht nach stream."""
+        if self.write_collapsed(path):
+            print(f"Profil gespeichert: {path} (collapsed stacks, z.B. flamegraph.pl {path} > profile.svg)", file=stream)
+        print(self.summary(n), file=stream)
@@ -0,0 +1,393 @@
+"""
+Parser-Worker in einem eigenen Prozess, der sich selbst erneuert und jedes Dokument überwacht.
+
+Auch mit seitenweise freigegebenem Cache (file_handlers.pdf_text) gibt Python einmal belegten
+Speicher selten an das System zurück. Der Worker wird deshalb nach einer festen Anzahl
+Dokumente oder sobald sein RSS die Obergrenze erreicht beendet; beim nächsten Dokument wird
+ein frischer Prozess gestartet.
+
+Jedes Dokument hat zusätzlich ein Zeit- und Speicherbudget. Überschreitet es eines davon,
+wird der Worker hart beendet und DocumentTimeout mit der laufenden Stufe ausgelöst - der
+Batch läuft mit dem nächsten Dokument weiter.
+
+Die Worker-Prozesse startet ein Forkserver, nicht fork() im aufrufenden Prozess: im Batch von
+fibu_invoice_parser starten und erneuern die Threads des Pools ihre Worker selbst, und ein fork()
+neben laufenden Threads erbt deren gerade gehaltene Locks (Logging, stdout, malloc). Dafür importiert
+jeder neue Worker seine Module selbst (einige 100 ms, nur beim Start und nach dem Erneuern).
+"""
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+# Nach so vielen Dokumenten wird der Worker erneuert
+WORKER_MAX_DOCUMENTS = int(os.getenv("INVOICE_WORKER_MAX_DOCUMENTS", "100"))
+# Ab diesem RSS (MB) wird der Worker nach dem aktuellen Dokument erneuert
+WORKER_MAX_RSS_MB = float(os.getenv("INVOICE_WORKER_MAX_RSS_MB", "1024"))
+# Budget pro Dokument: Sekunden bzw. RSS (MB), bei Überschreitung wird abgebrochen
+DOCUMENT_TIMEOUT = float(os.getenv("INVOICE_DOCUMENT_TIMEOUT", "120"))
+DOCUMENT_MAX_RSS_MB = float(os.getenv("INVOICE_DOCUMENT_MAX_RSS_MB", "2048"))
+
+# Wie oft das Budget geprüft wird (Sekunden)
+WATCHDOG_INTERVAL = 0.25
+
+STATUS_TIMEOUT = "timeout"
+QUARANTINE_LOG = "quarantaene.jsonl"
+
+# Worker-Prozesse kommen aus dem Forkserver (siehe oben)
+_kontext = multiprocessing.get_context("forkserver")
+
+# Funktionen, die ein Worker-Prozess beim regulären Beenden ausführt (at_worker_exit)
+_beim_beenden: list[Callable[[], Any]] = []
+
+
+class DocumentTimeout(Exception):
+    """Ein Dokument hat sein Zeit- oder Speicherbudget überschritten."""
+
+    def __init__(self, stage: str, grund: str, sekunden: float, rss: float):
+        self.stage = stage
+        self.grund = grund
+        self.sekunden = sekunden
+        self.rss = rss
+        super().__init__(f"Budget überschritten ({grund}) in Stufe '{stage}' nach {sekunden:.1f} s, {rss:.0f} MB")
+
+    def as_dict(self) -> dict:
+        return {
+            "status": STATUS_TIMEOUT,
+            "stage": self.stage,
+            "grund": self.grund,
+            "sekunden": round(self.sekunden, 1),
+            "rss_mb": round(self.rss),
+        }
+
+
+def rss_mb(pid: int | None = None) -> float:
+    """Aktueller Resident Set Size in MB (eigener Prozess ohne /proc: nur der Spitzenwert, fremder: 0)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        if pid is not None:
+            return 0.0
+        spitze = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS liefert Bytes, Linux KB
+        return spitze / (1024 * 1024) if sys.platform == "darwin" else spitze / 1024
+
+
+_aktiver_watchdog = None
+# Im Worker-Prozess: geteilter Puffer, aus dem der Elternprozess bei Timeout die Stufe liest
+_stufen_puffer = None
+_stufen_zeiten: dict[str, float] = {}
+_laufende_stufe: tuple[str, float] | None = None
+# Im Worker-Prozess: Ende des Budgets des aktuellen Dokuments (time.monotonic, vom Elternprozess)
+_frist: float | None = None
+
+
+def _stufe_abschliessen(jetzt: float):
+    if _laufende_stufe is not None:
+        name, start = _laufende_stufe
+        _stufen_zeiten[name] = _stufen_zeiten.get(name, 0.0) + (jetzt - start) * 1000
+
+
+def set_stage(stage: str):
+    """
+    Meldet den Beginn einer Verarbeitungsstufe: für Timeout-Meldungen (Watchdog bzw. Worker)
+    und für die Stufenzeiten (stage_timings). Die vorige Stufe endet damit.
+    """
+    global _laufende_stufe
+    jetzt = time.perf_counter()
+    _stufe_abschliessen(jetzt)
+    _laufende_stufe = (stage, jetzt)
+    if _aktiver_watchdog is not None:
+        _aktiver_watchdog.stage = stage
+    if _stufen_puffer is not None:
+        _stufen_puffer.value = stage.encode()[:63]
+
+
+def current_stage() -> str | None:
+    """Die zuletzt per set_stage gemeldete, noch laufende Stufe."""
+    stufe = _laufende_stufe
+    return stufe[0] if stufe is not None else None
+
+
+def stage_timings() -> dict[str, float]:
+    """Dauer der Stufen seit dem letzten Aufruf in ms; setzt die Messung zurück."""
+    global _laufende_stufe
+    _stufe_abschliessen(time.perf_counter())
+    zeiten = {name: round(ms, 1) for name, ms in _stufen_zeiten.items()}
+    _stufen_zeiten.clear()
+    _laufende_stufe = None
+    return zeiten
+
+
+def remaining_budget() -> float | None:
+    """
+    Restliches Zeitbudget des aktuellen Dokuments in Sekunden (Watchdog bzw. Batch-Worker),
+    z.B. um Wartezeiten darauf zu begrenzen statt vom Budget abgebrochen zu werden
+    Returns:
+        float | None: None, wenn kein Budget überwacht wird
+    """
+    watchdog = _aktiver_watchdog
+    if watchdog is not None:
+        frist = watchdog._start + watchdog.timeout
+    elif _frist is not None:
+        frist = _frist
+    else:
+        return None
+    return max(0.0, frist - time.monotonic())
+
+
+def at_worker_exit(func: Callable[[], Any]):
+    """
+    Registriert func für das Ende des Worker-Prozesses (erneuert oder Batch-Ende), z.B. um einen
+    Index einmal zu speichern statt nach jedem Dokument. Nach einem Abbruch (Budget) entfällt der Aufruf.
+    """
+    if func not in _beim_beenden:
+        _beim_beenden.append(func)
+
+
+def _worker_loop(conn, stufen_puffer):
+    global _stufen_puffer, _frist
+    from helpers.event_log import log, set_document
+    _stufen_puffer = stufen_puffer
+    while True:
+        try:
+            auftrag = conn.recv()
+        except EOFError:
+            break
+        if auftrag is None:
+            break
+        func, args, doc_id, _frist = auftrag
+        set_document(doc_id)
+        stage_timings()
+        try:
+            result, error = func(*args), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        _frist = None
+        conn.send((result, error, rss_mb(), stage_timings()))
+    set_document(None)
+    for func in _beim_beenden:
+        try:
+            func()
+        except Exception as e:
+            log.warning("worker_exit_failed", f"{type(e).__name__}: {e}")
+    conn.close()
+
+
+class RecyclingWorker:
+    """
+    Führt die Stufen eines Dokuments nacheinander in einem Kindprozess aus
+    Args:
+        max_documents (int): Dokumente pro Prozess
+        max_rss_mb (float): Ab diesem RSS wird der Prozess nach dem Dokument erneuert
+        timeout (float): Zeitbudget pro Dokument in Sekunden
+        document_max_rss_mb (float): Speicherbudget pro Dokument in MB
+        profile (bool): Stufen im Worker mit dem Sampling-Profiler ausführen (helpers.profiling)
+    """
+
+    def __init__(
+        self,
+        max_documents: int = WORKER_MAX_DOCUMENTS,
+        max_rss_mb: float = WORKER_MAX_RSS_MB,
+        timeout: float = DOCUMENT_TIMEOUT,
+        document_max_rss_mb: float = DOCUMENT_MAX_RSS_MB,
+        profile: bool = False,
+    ):
+        self.max_documents = max(1, max_documents)
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.document_max_rss_mb = document_max_rss_mb
+        self.recycled = 0
+        self.rss = 0.0
+        # Dauer der Stufen (set_stage) im letzten run() in ms
+        self.timings: dict[str, float] = {}
+        # Dauer der run()-Stufen des aktuellen Dokuments in ms
+        self.document_timings: dict[str, float] = {}
+        self.profile = profile
+        # Mit profile: gezählte Stacks des aktuellen Dokuments
+        self.stacks: dict[str, int] = {}
+        self._dokumente = 0
+        self._start_dokument = None
+        self._doc_id = None
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        self._conn, child_conn = _kontext.Pipe()
+        self._stufe = _kontext.Array("c", 64)
+        self._process = _kontext.Process(target=_worker_loop, args=(child_conn, self._stufe), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._dokumente = 0
+
+    def _stop(self, kill: bool = False):
+        if self._process is None:
+            return
+        if kill:
+            self._process.kill()
+        else:
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+        self._conn.close()
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._process = None
+        self._conn = None
+
+    def begin_document(self, doc_id: str | None = None):
+        """Startet das Budget für das nächste Dokument; doc_id erscheint im Ereignisprotokoll des Workers."""
+        self._start_dokument = time.monotonic()
+        self._doc_id = doc_id
+        self.document_timings = {}
+        self.stacks = {}
+
+    def end_document(self):
+        """Erneuert den Worker, wenn er genug Dokumente verarbeitet hat oder zu groß geworden ist."""
+        self._start_dokument = None
+        if self._process is None:
+            return
+        self._dokumente += 1
+        if self._dokumente >= self.max_documents or self.rss >= self.max_rss_mb:
+            self._stop()
+            self.recycled += 1
+
+    def run(self, stage: str, func: Callable, *args) -> tuple[Any, str | None, float]:
+        """
+        Führt eine Stufe des aktuellen Dokuments im Worker aus
+        Args:
+            stage (str): Name der Stufe für Meldungen, z.B. "identify" oder "parse"
+            func: Funktion auf Modulebene (wird an den Kindprozess übergeben)
+        Returns:
+            tuple: (Ergebnis von func, Fehlermeldung oder None, RSS des Workers in MB)
+        Raises:
+            DocumentTimeout: Zeit- oder Speicherbudget des Dokuments überschritten,
+                mit der innersten per set_stage gemeldeten Stufe, sonst stage
+        """
+        if self._start_dokument is None:
+            self.begin_document()
+        if self._process is None or not self._process.is_alive():
+            self._stop(kill=True)
+            self._start()
+        self.timings = {}
+        self._stufe.value = b""
+        start = time.perf_counter()
+        if self.profile:
+            from helpers.profiling import profiled
+            func, args = profiled, (stage, func, *args)
+        try:
+            deadline = self._start_dokument + self.timeout
+            self._conn.send((func, args, self._doc_id, deadline))
+            while not self._conn.poll(max(0.0, min(WATCHDOG_INTERVAL, deadline - time.monotonic()))):
+                sekunden = time.monotonic() - self._start_dokument
+                rss = rss_mb(self._process.pid)
+                if sekunden >= self.timeout or rss >= self.document_max_rss_mb:
+                    stage = self._stufe.value.decode(errors="replace") or stage
+                    self._stop(kill=True)
+                    raise DocumentTimeout(stage, "zeit" if sekunden >= self.timeout else "speicher", sekunden, rss)
+            result, error, self.rss, self.timings = self._conn.recv()
+        except (EOFError, OSError):
+            # Worker abgestürzt (z.B. vom System wegen Speicher beendet) - beim nächsten Aufruf neu starten
+            self._stop(kill=True)
+            return None, f"Worker-Prozess in Stufe '{stage}' unerwartet beendet", 0.0
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.document_timings[stage] = round(self.document_timings.get(stage, 0.0) + ms, 1)
+        if self.profile and error is None:
+            result, stacks = result
+            for stack, anzahl in stacks.items():
+                self.stacks[stack] = self.stacks.get(stack, 0) + anzahl
+        return result, error, self.rss
+
+    def close(self):
+        self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Watchdog:
+    """
+    Budget für Prozesse, die genau ein Dokument verarbeiten (z.B. fibu_invoice_parser.py).
+    Ein Thread prüft Laufzeit und RSS; bei Überschreitung wird on_exceeded(DocumentTimeout)
+    aufgerufen und der Prozess sofort beendet. Das reguläre Ergebnis wird innerhalb von
+    final_output() ausgegeben, damit nur eines von beiden auf stdout landet.
+    """
+
+    def __init__(
+        self,
+        on_exceeded: Callable[[DocumentTimeout], None],
+        timeout: float = DOCUMENT_TIMEOUT,
+        max_rss_mb: float = DOCUMENT_MAX_RSS_MB,
+        exit_code: int = 0,
+    ):
+        self.on_exceeded = on_exceeded
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.exit_code = exit_code
+        self.stage = "start"
+        self._start = time.monotonic()
+        self._beendet = threading.Event()
+        # Gehalten während on_exceeded bzw. final_output
+        self._ausgabe = threading.Lock()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self) -> "Watchdog":
+        global _aktiver_watchdog
+        _aktiver_watchdog = self
+        self._thread.start()
+        return self
+
+    def stop(self):
+        global _aktiver_watchdog
+        self._beendet.set()
+        if _aktiver_watchdog is self:
+            _aktiver_watchdog = None
+
+    @contextmanager
+    def final_output(self):
+        """
+        Beendet die Überwachung für die Ausgabe des Ergebnisses; on_exceeded schreibt danach nichts mehr.
+        Hat das Budget schon ausgelöst, kehrt der Aufruf nicht zurück - der Prozess endet mit dem Timeout-Ergebnis.
+        """
+        with self._ausgabe:
+            self.stop()
+            yield
+
+    def _watch(self):
+        while not self._beendet.wait(WATCHDOG_INTERVAL):
+            sekunden = time.monotonic() - self._start
+            rss = rss_mb()
+            if sekunden >= self.timeout or rss >= self.max_rss_mb:
+                with self._ausgabe:
+                    if self._beendet.is_set():
+                        # Das Ergebnis ist inzwischen ausgegeben
+                        return
+                    try:
+                        self.on_exceeded(DocumentTimeout(self.stage, "zeit" if sekunden >= self.timeout else "speicher", sekunden, rss))
+                    finally:
+                        os._exit(self.exit_code)
+
+
+def quarantine_dir(ordner_bearbeitete_pdfs: str) -> str:
+    """Quarantäne-Ordner neben dem Ordner für bearbeitete PDFs."""
+    return os.path.join(os.path.dirname(os.path.abspath(ordner_bearbeitete_pdfs)), "quarantaene")
+
+
+def record_quarantine(ordner: str, dateiname: str, timeout: DocumentTimeout):
+    """Hängt einen Eintrag an das Quarantäne-Protokoll (eine JSON-Zeile pro Dokument) an."""
+    eintrag = {"datei": dateiname, "zeit": time.strftime("%Y-%m-%dT%H:%M:%S"), **timeout.as_dict()}
+    with open(os.path.join(ordner, QUARANTINE_LOG), "a", encoding="utf-8") as f:
+        f.write(json.dumps(eintrag, ensure_ascii=False) + "\n")
@@ -1,79 +1,187 @@
+import argparse
 import os
 import sys
+import time
 import shutil
 from datetime import datetime
 import pandas as pd
 from typing import Literal
 
-import pdfplumber
 
-from file_handlers.pdf_handler import get_parser
+from file_handlers.pdf_handler import get_parser, has_parser, plugin_firmen
+from file_handlers.fingerprint_index import FingerprintIndex, fallback_to_text, fingerprint_keys, identify_with_fingerprints
+from file_handlers.pdf_inspect import PDF_SCAN, classify_pdf, read_pdf_metadata
+from file_handlers.pdf_text import extract_pdf_text
 from file_handlers.csv_manager import save_csv_files
+from file_handlers.sqlite_store import SQLITE_PATH, SqliteStore
+from file_handlers.price_history import PriceHistory
+from helpers.worker import DocumentTimeout, RecyclingWorker, quarantine_dir, record_quarantine
+from helpers.profiling import PROFILE_PATH, PROFILE_TOP, ProfileReport
+from helpers.event_log import log, set_document
 
 
 def main():
-    if len(sys.argv) < 6:
+    # Optional: --profile [--profile-out DATEI] [--top N] samples every document (helpers.profiling)
+    optionen = argparse.ArgumentParser(add_help=False)
+    optionen.add_argument("--profile", action="store_true")
+    optionen.add_argument("--profile-out", default=PROFILE_PATH)
+    optionen.add_argument("--top", type=int, default=PROFILE_TOP)
+    flags, argumente = optionen.parse_known_args()
+    argumente = [sys.argv[0], *argumente]
+    if len(argumente) < 6:
         print("Falsche Anzahl an Argumenten. Erwartete Argumente:")
-        print("main.py pfad_ordner_mit_pdfs pfad_ordner_bearbeitete_pdfs pfad_ordner_tabellen pfad_gesammelte_tabelle dokument_typ")
+        print("main.py pfad_ordner_mit_pdfs pfad_ordner_bearbeitete_pdfs pfad_ordner_tabellen pfad_gesammelte_tabelle dokument_typ [pfad_sqlite] [--profile [--profile-out DATEI] [--top N]]")
         return
 
-    ORDNER_MIT_PDFS = sys.argv[1]
-    ORDNER_BEARBEITETE_PDFS = sys.argv[2]
-    ORDNER_TABELLEN = sys.argv[3]
-    GESAMMELTE_TABELLE = sys.argv[4]
-    dokument_typ_str = sys.argv[5]
+    ORDNER_MIT_PDFS = argumente[1]
+    ORDNER_BEARBEITETE_PDFS = argumente[2]
+    ORDNER_TABELLEN = argumente[3]
+    GESAMMELTE_TABELLE = argumente[4]
+    dokument_typ_str = argumente[5]
     if dokument_typ_str not in ["AB", "invoice"]:
         print("Ungültiger Dokumenttyp. Erwartet: 'AB' oder 'invoice'")
         return
     DOKUMENT_TYP: Literal['AB', 'invoice'] = dokument_typ_str  # type: ignore # "AB" or "invoice"
+    # Optional: additionally store all lines in an indexed SQLite database (argument or INVOICE_SQLITE_PATH)
+    SQLITE_DB = argumente[6] if len(argumente) > 6 else SQLITE_PATH
     pdf_files = [f for f in os.listdir(ORDNER_MIT_PDFS) if f.lower().endswith(".pdf")]
+    fingerprint_index = FingerprintIndex()
+    store = SqliteStore(SQLITE_DB) if SQLITE_DB else None
+    price_history = PriceHistory() if DOKUMENT_TYP == "invoice" else None
+    # All PDF work runs in a worker process that recycles itself (INVOICE_WORKER_MAX_DOCUMENTS / INVOICE_WORKER_MAX_RSS_MB)
+    # and is killed when a document exceeds its budget (INVOICE_DOCUMENT_TIMEOUT / INVOICE_DOCUMENT_MAX_RSS_MB)
+    worker = RecyclingWorker(profile=flags.profile)
+    profile = ProfileReport() if flags.profile else None
+    try:
+        log.info("batch_start", f"{len(pdf_files)} PDFs in {ORDNER_MIT_PDFS}", documents=len(pdf_files), document_type=DOKUMENT_TYP)
+        batch_start = time.perf_counter()
+        for pdf_file in pdf_files:
+            set_document(pdf_file)
+            worker.begin_document(pdf_file)
+            start = time.perf_counter()
+            status = "error"
+            try:
+                status = process_pdf(pdf_file, ORDNER_MIT_PDFS, ORDNER_BEARBEITETE_PDFS, ORDNER_TABELLEN, GESAMMELTE_TABELLE, DOKUMENT_TYP, fingerprint_index, worker, store, price_history)
+            except DocumentTimeout as timeout:
+                status = "timeout"
+                quarantine_pdf(pdf_file, ORDNER_MIT_PDFS, ORDNER_BEARBEITETE_PDFS, timeout)
+            finally:
+                dauer_ms = (time.perf_counter() - start) * 1000
+                log.info("document_done", f"{pdf_file}: {status}", status=status, duration_ms=round(dauer_ms, 1),
+                         stages=worker.document_timings, rss_mb=round(worker.rss))
+                if profile is not None:
+                    profile.add(pdf_file, dauer_ms, worker.document_timings, worker.stacks)
+                worker.end_document()
+        set_document(None)
+        log.info("batch_done", f"{len(pdf_files)} PDFs verarbeitet", documents=len(pdf_files),
+                 duration_ms=round((time.perf_counter() - batch_start) * 1000, 1), workers_recycled=worker.recycled)
+    finally:
+        worker.close()
+        if profile is not None:
+            profile.finish(flags.profile_out, flags.top)
+        fingerprint_index.save()
+        if store is not None:
+            store.close()
+        if price_history is not None:
+            price_history.save()
+
+
+def parse_pdf(firma: str, document_type: Literal['AB', 'invoice'], pdf_path: str) -> tuple[pd.DataFrame, str]:
+    """Runs inside the worker process, so the parser module and its memory live there."""
+    return get_parser(firma, document_type).parse(pdf_path)
+
+
+def quarantine_pdf(pdf_file: str, ORDNER_MIT_PDFS: str, ORDNER_BEARBEITETE_PDFS: str, timeout: DocumentTimeout):
+    log.warning("quarantine", f"{pdf_file}: {timeout}. Verschiebe Datei in die Quarantäne.", **timeout.as_dict())
+    ordner = quarantine_dir(ORDNER_BEARBEITETE_PDFS)
+    try:
+        os.makedirs(ordner, exist_ok=True)
+        shutil.move(os.path.join(ORDNER_MIT_PDFS, pdf_file), os.path.join(ordner, pdf_file))
+        record_quarantine(ordner, pdf_file, timeout)
+    except (OSError, shutil.Error) as e:
+        log.error("move_failed", f"Fehler beim Verschieben der Datei {pdf_file} in die Quarantäne: {e}")
+
+
+def process_pdf(pdf_file: str, ORDNER_MIT_PDFS: str, ORDNER_BEARBEITETE_PDFS: str, ORDNER_TABELLEN: str,
+                GESAMMELTE_TABELLE: str, DOKUMENT_TYP: Literal['AB', 'invoice'], fingerprint_index: FingerprintIndex,
+                worker: RecyclingWorker, store: SqliteStore | None = None, price_history: PriceHistory | None = None) -> str:
+    """Returns the status of the document for the event log, e.g. "ok", "unknown_vendor" or "parse_error"."""
+    pdf_path = os.path.join(ORDNER_MIT_PDFS, pdf_file)
+    log.debug("document_start", f"Verarbeite Datei: {pdf_file}")
 
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(ORDNER_MIT_PDFS, pdf_file)
-        print(f"Verarbeite Datei: {pdf_file}")
-
-        # Identify the company and get the appropriate parser
-        firma, erfolgreich_firma_ausgelesen = identify_company(pdf_path)
-        if not erfolgreich_firma_ausgelesen:
-            print(f"Firma konnte nicht erkannt werden. Überspringe Datei: {pdf_file}")
-            continue
-
-        parser = get_parser(firma, DOKUMENT_TYP)
-        if not parser:
-            print(f"Kein Parser verfügbar für {firma} und Typ {DOKUMENT_TYP}. Überspringe Datei.")
-            continue
-
-        # Parse the PDF
-        df, identifier = parser.parse(pdf_path)
-        if df.empty:
-            print(f"Keine Daten extrahiert aus {pdf_file}. Überspringe Datei.")
-            continue
-        identifier = identifier.replace(" ", "-").replace("/", "-").replace("\\", "-").replace(":", "-")
-        # Save data to specific and ongoing CSV files
-        specific_csv_path = os.path.join(ORDNER_TABELLEN, f"{identifier}_{datetime.now().strftime('%Y-%m-%d_%H.%M.%S')}.csv")
-        # print("Path: ", specific_csv_path)
-        success = save_csv_files(ongoing_csv_path=GESAMMELTE_TABELLE, specific_csv_path=specific_csv_path, new_data_df=df)
-
-        if not success:
-            print(f"Fehler beim Speichern der Daten für {pdf_file}. Überspringe Datei.")
-            continue
-
-        # Move processed PDF to the archive folder
-        try:
-            archive_name = f"{os.path.splitext(pdf_file)[0]}_{identifier}_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.pdf"
-            shutil.move(pdf_path, os.path.join(ORDNER_BEARBEITETE_PDFS, archive_name))
-            print(f"Datei {pdf_file} erfolgreich verarbeitet und verschoben.")
-        except shutil.Error as e:
-            print(f"Fehler beim Verschieben der Datei {pdf_file}: {e}")
+    def identify_text(path: str) -> tuple[str, bool]:
+        ergebnis, _, _ = worker.run("identify", identify_company, path)
+        return ergebnis or ("", False)
+
+    pdf_typ, _, _ = worker.run("classify", classify_pdf, pdf_path)
+    if pdf_typ == PDF_SCAN:
+        log.info("document_skipped", f"Gescanntes PDF ohne Textebene (nur per LLM auslesbar). Überspringe Datei: {pdf_file}", reason="scan")
+        return "scan"
+
+    # Identify the company (PDF metadata / file name first, then the text) and get the appropriate parser
+    metadata, _, _ = worker.run("metadata", read_pdf_metadata, pdf_path)
+    keys = fingerprint_keys(metadata or {}, pdf_file)
+    firma, erfolgreich_firma_ausgelesen, fingerprint = identify_with_fingerprints(
+        fingerprint_index, keys, pdf_path, identify_text, lambda firma: has_parser(firma, DOKUMENT_TYP)
+    )
+    if not erfolgreich_firma_ausgelesen:
+        log.warning("document_skipped", f"Firma konnte nicht erkannt werden. Überspringe Datei: {pdf_file}", reason="unknown_vendor")
+        return "unknown_vendor"
+
+    if not has_parser(firma, DOKUMENT_TYP):
+        log.warning("document_skipped", f"Kein Parser verfügbar für {firma} und Typ {DOKUMENT_TYP}. Überspringe Datei.", reason="no_parser", vendor=firma)
+        return "no_parser"
+
+    # Parse the PDF
+    ergebnis, fehler, rss = worker.run("parse", parse_pdf, firma, DOKUMENT_TYP, pdf_path)
+    df, identifier = ergebnis if ergebnis else (pd.DataFrame(), "")
+    if fingerprint and not fehler and (df.empty or not identifier):
+        # No positions or invoice number: the fingerprint may be stale - fall back to the text based detection
+        firma, abweichend = fallback_to_text(fingerprint_index, fingerprint, firma, pdf_path, identify_text)
+        if abweichend and has_parser(firma, DOKUMENT_TYP):
+            ergebnis, fehler, rss = worker.run("parse", parse_pdf, firma, DOKUMENT_TYP, pdf_path)
+            df, identifier = ergebnis if ergebnis else (pd.DataFrame(), "")
+    log.debug("worker_rss", f"Speicher (RSS) des Workers nach {pdf_file}: {rss:.0f} MB", rss_mb=round(rss))
+    if fehler:
+        log.error("parse_failed", f"Fehler beim Parsen von {pdf_file}: {fehler}. Überspringe Datei.", vendor=firma)
+        return "parse_error"
+    if df.empty:
+        log.warning("document_skipped", f"Keine Daten extrahiert aus {pdf_file}. Überspringe Datei.", reason="empty", vendor=firma)
+        return "empty"
+    fingerprint_index.learn(keys, firma)
+    identifier = identifier.replace(" ", "-").replace("/", "-").replace("\\", "-").replace(":", "-")
+    # Save data to specific and ongoing CSV files
+    specific_csv_path = os.path.join(ORDNER_TABELLEN, f"{identifier}_{datetime.now().strftime('%Y-%m-%d_%H.%M.%S')}.csv")
+    # print("Path: ", specific_csv_path)
+    success = save_csv_files(ongoing_csv_path=GESAMMELTE_TABELLE, specific_csv_path=specific_csv_path, new_data_df=df)
+
+    if not success:
+        log.error("save_failed", f"Fehler beim Speichern der Daten für {pdf_file}. Überspringe Datei.")
+        return "save_error"
+
+    if store is not None:
+        if store.has_invoice(str(df.iloc[0]["Fremdbelegnummer (Eingangsrechnung)"]), firma):
+            log.warning("duplicate_invoice", f"Rechnung {identifier} von {firma} ist bereits in der Datenbank und wird ersetzt.", invoice=identifier, vendor=firma)
+        store.add_invoice(df, firma, quelle=pdf_file)
+    if price_history is not None:
+        for aenderung in price_history.add_invoice(df, firma):
+            prozent = f" ({aenderung['prozent']:+.1f} %)" if aenderung["prozent"] is not None else ""
+            log.info("ek_changed", f"EK-Änderung {firma} {aenderung['artikel']} am {aenderung['datum']}: {aenderung['alt']} -> {aenderung['neu']}{prozent}", **aenderung)
+
+    # Move processed PDF to the archive folder
+    try:
+        archive_name = f"{os.path.splitext(pdf_file)[0]}_{identifier}_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.pdf"
+        shutil.move(pdf_path, os.path.join(ORDNER_BEARBEITETE_PDFS, archive_name))
+        log.debug("document_archived", f"Datei {pdf_file} erfolgreich verarbeitet und verschoben.", invoice=identifier, vendor=firma, lines=len(df))
+    except shutil.Error as e:
+        log.error("move_failed", f"Fehler beim Verschieben der Datei {pdf_file}: {e}")
+    return "ok"
 
 
 def identify_company(pdf_path: str) -> tuple[str, bool]:
     try:
         with open(pdf_path, "rb") as f:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text().lower() + "\n"
+            text = extract_pdf_text(pdf_path).lower()
             if "klingspor" in text:
                 return "Klingspor", True
             elif "saint-gobain" in text:
@@ -93,9 +201,13 @@ def identify_company(pdf_path: str) -> tuple[str, bool]:
             elif "plastimex" in text:
                 return "Plastimex", True
             else:
+                # Lieferanten aus Plugins werden über ihren Namen erkannt
+                for firma in plugin_firmen():
+                    if firma in text:
+                        return firma, True
                 return "", False
     except Exception as e:
-        print(f"Fehler beim Erkennen der Firma: {e}")
+        log.error("identify_failed", f"Fehler beim Erkennen der Firma: {e}")
         return "", False
 
 
@@ -2,6 +2,9 @@ from abc import ABC, abstractmethod
 import pandas as pd
 
 class BaseParser(ABC):
+    # Optional feste Version; ohne Angabe gilt ein Hash über den Quelltext (file_handlers.pdf_handler.parser_version)
+    PARSER_VERSION: str | None = None
+
     @abstractmethod
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         """Parse a PDF and return a DataFrame and identifier (e.g., invoice/order number)"""
@@ -0,0 +1,191 @@
+"""
+Zeilenbasierte Zustandsmaschine für Rechnungsparser.
+
+Ein Lieferant wird über eine geordnete Liste von LineRule-Objekten beschrieben
+(Kopfdaten, Positionsbeginn, Fortsetzungszeilen, Seitenumbruch, Fußzeilen).
+Die Engine läuft genau einmal über alle Zeilen; Regeln dürfen nur begrenzt
+nach vorne/hinten schauen (LineContext.peek), mehrzeilige Blöcke werden über
+Zustände gesammelt statt über innere while-Schleifen.
+"""
+import re
+from typing import Callable, Iterable
+
+import pandas as pd
+from file_handlers.pdf_text import extract_pdf_text
+
+from helpers.constants import INVOICE_COLUMNS
+from helpers.helpers import divide_nettoEk_by_menge
+from helpers.event_log import log
+from parsers.base_parser import BaseParser
+
+# Spalten, die pro Position geführt werden (Reihenfolge wie in INVOICE_COLUMNS)
+POSITION_COLUMNS = [
+    "bestellnummer",
+    "fremdbelegnummer_lieferantenbestellung",
+    "artikelnummer",
+    "artikelnummer_lieferant",
+    "artikelname",
+    "hinweis",
+    "menge",
+    "netto_ek",
+]
+
+# Platzhalter für Spalten-Defaults: Wert der vorherigen Position übernehmen
+CARRY = object()
+
+START_STATE = "kopf"
+
+
+class LineRule:
+    def __init__(
+        self,
+        match: "re.Pattern | str | Callable[[str, LineContext], object]",
+        action: "Callable[[LineContext, str, object], None] | None" = None,
+        states: Iterable[str] | None = None,
+        next_state: str | None = None,
+        stop: bool = True,
+    ):
+        """
+        Eine Zeilenregel.
+        Args:
+            match: Kompilierte Regex (match am Zeilenanfang), Teilstring oder Funktion (line, ctx) -> Treffer
+            action: Wird mit (ctx, line, treffer) aufgerufen, wenn die Regel greift
+            states: Zustände, in denen die Regel aktiv ist (None = immer)
+            next_state: Zustand nach der Aktion (None = unverändert bzw. von der Aktion gesetzt)
+            stop: Wie `continue` in den handgeschriebenen Schleifen - weitere Regeln für diese Zeile überspringen
+        """
+        self.match = match
+        self.action = action
+        self.states = frozenset(states) if states is not None else None
+        self.next_state = next_state
+        self.stop = stop
+
+    def test(self, line: str, ctx: "LineContext"):
+        if isinstance(self.match, re.Pattern):
+            return self.match.match(line)
+        if isinstance(self.match, str):
+            return self.match in line
+        return self.match(line, ctx)
+
+
+class LineContext:
+    def __init__(self, lines: list[str], defaults: dict, max_lookahead: int):
+        self.lines = lines
+        self.index = 0
+        self.state = START_STATE
+        self.max_lookahead = max_lookahead
+        self.defaults = defaults
+        # Kopfdaten der Rechnung
+        self.fremdbelegnummer_eingangsrechnung = "" # Rechnungsnummer des Lieferanten ohne Datum
+        self.zahlbar_bis = ""
+        self.belegdatum = ""
+        # Spalten pro Position und Anzahl der begonnenen Positionen
+        self.columns: dict[str, list] = {column: [] for column in POSITION_COLUMNS}
+        self.positions = 0
+        # Lieferantenspezifische Zwischenwerte (z.B. letzte Positionsnummer, Namenspuffer)
+        self.vars: dict = {}
+
+    def peek(self, offset: int = 1) -> str:
+        """Liefert die Zeile im Abstand offset zur aktuellen Zeile ("" außerhalb des Dokuments)."""
+        if abs(offset) > self.max_lookahead:
+            raise ValueError(f"Lookahead {offset} überschreitet das Limit von {self.max_lookahead} Zeilen")
+        index = self.index + offset
+        if 0 <= index < len(self.lines):
+            return self.lines[index]
+        return ""
+
+    def default(self, column: str):
+        default = self.defaults.get(column, "N/A")
+        if default is CARRY:
+            values = self.columns[column]
+            return values[-1] if values else "N/A"
+        if callable(default):
+            return default(self)
+        return default
+
+    def pad(self, count: int):
+        """Füllt alle Positionsspalten mit ihren Defaults bis zur Länge count auf."""
+        for column, values in self.columns.items():
+            while len(values) < count:
+                values.append(self.default(column))
+
+    def new_position(self):
+        """Beginnt eine neue Position; fehlende Werte der vorherigen Positionen werden aufgefüllt."""
+        self.pad(self.positions)
+        self.positions += 1
+
+    def add(self, column: str, value):
+        self.columns[column].append(value)
+
+
+class LineEngine:
+    def __init__(self, rules: list[LineRule], max_lookahead: int = 2):
+        self.rules = rules
+        self.max_lookahead = max_lookahead
+
+    def run(self, lines: list[str], defaults: dict | None = None) -> LineContext:
+        """
+        Läuft einmal über alle Zeilen. Pro Zeile werden die Regeln in Reihenfolge gegen den
+        Zustand zu Beginn der Zeile geprüft; Zustandswechsel gelten ab der nächsten Zeile.
+        """
+        ctx = LineContext(lines, defaults or {}, self.max_lookahead)
+        for ctx.index, line in enumerate(lines):
+            state = ctx.state
+            for rule in self.rules:
+                if rule.states is not None and state not in rule.states:
+                    continue
+                treffer = rule.test(line, ctx)
+                if not treffer:
+                    continue
+                if rule.action:
+                    rule.action(ctx, line, treffer)
+                if rule.next_state:
+                    ctx.state = rule.next_state
+                if rule.stop:
+                    break
+        return ctx
+
+
+class RuleBasedInvoiceParser(BaseParser):
+    """
+    Basisklasse für Lieferanten, die über Regeln statt über eigene Schleifen beschrieben werden.
+    Unterklassen setzen lieferant, MwST, rules und ggf. defaults / finish().
+    """
+    lieferant = ""
+    MwST = "19" # Nur bei Plastimex 0
+    rules: list[LineRule] = []
+    defaults: dict = {}
+    max_lookahead = 2
+
+    def finish(self, ctx: LineContext):
+        """Hook für Zusatzzeilen (Porto, Auftragskosten, ...) nach dem Durchlauf."""
+        pass
+
+    def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
+        try:
+            text = extract_pdf_text(pdf_path)
+            lines = text.split('\n')
+
+            ctx = LineEngine(self.rules, self.max_lookahead).run(lines, self.defaults)
+            ctx.pad(ctx.positions)
+            self.finish(ctx)
+
+            return build_invoice_dataframe(ctx, self.lieferant, self.MwST), ctx.fremdbelegnummer_eingangsrechnung
+
+        except Exception as e:
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
+            return pd.DataFrame(), ""
+
+
+def build_invoice_dataframe(ctx: LineContext, lieferant: str, MwST: str) -> pd.DataFrame:
+    """Baut aus den gesammelten Positionen die Tabelle mit INVOICE_COLUMNS (Netto-EK pro Stück)."""
+    spalten = ctx.columns
+    artikel_data = []
+    for i in range(len(spalten["artikelname"])):
+        netto_ek = divide_nettoEk_by_menge(spalten["netto_ek"][i], spalten["menge"][i])
+        artikel_data.append([
+            spalten["bestellnummer"][i], ctx.fremdbelegnummer_eingangsrechnung, spalten["fremdbelegnummer_lieferantenbestellung"][i],
+            lieferant, ctx.zahlbar_bis, ctx.belegdatum, spalten["artikelnummer"][i], spalten["artikelnummer_lieferant"][i],
+            spalten["artikelname"][i], spalten["hinweis"][i], spalten["menge"][i], netto_ek, MwST
+        ])
+    return pd.DataFrame(artikel_data, columns=INVOICE_COLUMNS)
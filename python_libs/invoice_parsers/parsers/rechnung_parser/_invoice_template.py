@@ -1,58 +1,61 @@
-from parsers.base_parser import BaseParser
-import pandas as pd
-import pdfplumber
-from helpers.constants import INVOICE_COLUMNS
-
-class InvoiceTemplateParser(BaseParser):
-    def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
-            lines = text.split('\n')
-            # print(lines)
-
-
-            ### TODO: Hier die spezifischen Parsing-Regeln für die Rechnung einfügen 
-            bestellnummer = []
-            fremdbelegnummer_eingangsrechnung = "" # Rechnungsnummer des Lieferanten ohne Datum
-            fremdbelegnummer_lieferantenbestellung: list[str] = [] # Auftragsnummer des Lieferanten ohne Datum
-            lieferant = "KLINGSPOR Schleifsysteme GmbH & Co.KG"
-            zahlbar_bis = ""
-            belegdatum = ""
-            artikelnummer = [] # SKU
-            artikelnummer_lieferant = [] # Artikelnummer des Lieferanten - Nicht die EAN
-            artikelname = []
-            hinweis = []
-            menge = []
-            netto_ek = [] # Kosten der gesamten POS
-            MwST = "19" # Nur bei Plastimex 0
-            zahlungsbedingung = 60
-
-
-            for i, line in enumerate(lines):
-                pass
-
-                
-            if len(artikelnummer) < len(artikelname):
-                artikelnummer.append("N/A")
-            if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
-                fremdbelegnummer_lieferantenbestellung.append("N/A")
-            if len(bestellnummer) < len(artikelname):
-                bestellnummer.append("N/A")
-            if len(hinweis) < len(artikelname):
-                hinweis.append("N/A")
-
-
-            artikel_data = []
-            for i in range(len(artikelname)):
-                artikel_data.append([bestellnummer[i], fremdbelegnummer_eingangsrechnung, fremdbelegnummer_lieferantenbestellung[i], lieferant, zahlbar_bis, belegdatum, artikelnummer[i], artikelnummer_lieferant[i], artikelname[i], hinweis[i], menge[i], netto_ek[i], MwST])
-            df = pd.DataFrame(artikel_data, columns=INVOICE_COLUMNS)
-
-            return df, fremdbelegnummer_eingangsrechnung
-
-        except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
-            return pd.DataFrame(), ""
+import re
 
+from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
+
+from parsers.line_engine import LineContext, LineRule, RuleBasedInvoiceParser
+
+### TODO: Hier die spezifischen Parsing-Regeln für die Rechnung einfügen
+# Positionszeile: "<Pos> <Artikel> <Menge> ... <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?P<artikel>\S+)\s+(?P<menge>\S+)\s+(?:.*\s)?(?P<preis>\S+)\s*$")
+
+ZAHLUNGSBEDINGUNG = 60
+
+
+def _kopf(ctx: LineContext, line: str, _):
+    kopf = ctx.peek(1).split()
+    ctx.fremdbelegnummer_eingangsrechnung = kopf[0] # Rechnungsnummer des Lieferanten ohne Datum
+    ctx.belegdatum = kopf[-1]
+    ctx.zahlbar_bis = zahlbar_bis_x_tage_nach_datum(ctx.belegdatum, ZAHLUNGSBEDINGUNG)
+
+
+def _position(ctx: LineContext, line: str, position):
+    ctx.new_position()
+    ctx.add("artikelnummer_lieferant", position["artikel"]) # Artikelnummer des Lieferanten - Nicht die EAN
+    ctx.add("menge", position["menge"])
+    ctx.add("netto_ek", position["preis"]) # Kosten der gesamten POS
+    ctx.vars["name"] = []
+
+
+def _bezeichnung_fertig(ctx: LineContext, line: str, _):
+    ctx.add("artikelname", " ".join(ctx.vars["name"]))
+
+
+def _bezeichnung(ctx: LineContext, line: str, _):
+    ctx.vars["name"].append(line)
+
+
+def _kundenartikelnummer(ctx: LineContext, line: str, _):
+    ctx.add("artikelnummer", line.split()[-1]) # SKU
+
+
+class InvoiceTemplateParser(RuleBasedInvoiceParser):
+    lieferant = "KLINGSPOR Schleifsysteme GmbH & Co.KG"
+    MwST = "19" # Nur bei Plastimex 0
+    # Fehlende Werte einer Position; CARRY übernimmt den Wert der vorherigen Position
+    defaults = {}
+
+    # Regeln werden pro Zeile in dieser Reihenfolge geprüft (gegen den Zustand zu Beginn der Zeile)
+    rules = [
+        # Fortsetzungszeilen: Artikelbezeichnung bis zur Zeile mit der Kundenartikelnummer
+        LineRule(lambda line, _: line.startswith("Kundenartikelnummer"), _bezeichnung_fertig, states=["name"], next_state="kopf", stop=False),
+        LineRule(lambda line, _: True, _bezeichnung, states=["name"], stop=False),
+        # Kopfdaten
+        LineRule(lambda line, ctx: "Nummer / Datum" in line and ctx.fremdbelegnummer_eingangsrechnung == "", _kopf),
+        # Positionsbeginn und Zusatzzeilen
+        LineRule(POSITION_LINE, _position, next_state="name"),
+        LineRule(lambda line, _: line.startswith("Kundenartikelnummer"), _kundenartikelnummer),
+    ]
+
+    def finish(self, ctx: LineContext):
+        # Zusatzpositionen wie Porto oder Auftragskosten hier mit ctx.new_position() / ctx.add() anhängen
+        pass
@@ -1,17 +1,21 @@
+import re
+
 from parsers.base_parser import BaseParser
 import pandas as pd
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
 from helpers.constants import INVOICE_COLUMNS
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
 from helpers.helpers import divide_nettoEk_by_menge
+from helpers.event_log import log
+
+# Positionszeile: "<Pos>. <Bezeichnung> <Menge> ... <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\.\s+(?P<name>\S+)\s+(?P<menge>\S+)\s+(?:.*\s)?(?P<preis>\S+)\s*$")
+
 
 class InvoiceAwukoParser(BaseParser):
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
+            text = extract_pdf_text(pdf_path)
             lines = text.split('\n')
             # print(lines)
 
@@ -38,7 +42,8 @@ class InvoiceAwukoParser(BaseParser):
                     belegdatum = lines[i-1].split()[-1]
                     zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, zahlungsbedingung)
 
-                if len(line.split()) > 3 and line.split()[0][:-1].isnumeric() and line.split()[0][-1] == "." and not "50933" in line and not "köln" in line.lower() and not "34346" in line:
+                position = POSITION_LINE.match(line)
+                if position and not "50933" in line and not "köln" in line.lower() and not "34346" in line:
                     if len(artikelnummer) < len(artikelname):
                         artikelnummer.append("N/A")
                     if len(artikelnummer_lieferant) < len(artikelname):
@@ -50,10 +55,10 @@ class InvoiceAwukoParser(BaseParser):
                     if len(hinweis) < len(artikelname):
                         hinweis.append("N/A")
                     
-                    artikelname.append(line.split()[1])
+                    artikelname.append(position["name"])
                     artikelname[-1] += " " + lines[i+1]
-                    menge.append(line.split()[2])
-                    netto_ek.append(line.split()[-1])
+                    menge.append(position["menge"])
+                    netto_ek.append(position["preis"])
 
                 if line.startswith("Artikelnr.:"):
                     artikelnummer_lieferant.append(line.split()[1])
@@ -62,8 +67,9 @@ class InvoiceAwukoParser(BaseParser):
                     artikelnummer.append(line.split()[-1])
 
                 if line.startswith("Unser Auftrag:"):
-                    fremdbelegnummer_lieferantenbestellung.append(line.split()[1])
-                    bestellnummer.append(" ".join(line.split()[5:-1]))
+                    teile = line.split()
+                    fremdbelegnummer_lieferantenbestellung.append(teile[1])
+                    bestellnummer.append(" ".join(teile[5:-1]))
                 
             if len(artikelnummer) < len(artikelname):
                 artikelnummer.append("N/A")
@@ -86,5 +92,5 @@ class InvoiceAwukoParser(BaseParser):
             return df, fremdbelegnummer_eingangsrechnung
 
         except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
             return pd.DataFrame(), ""
@@ -1,104 +1,84 @@
-from parsers.base_parser import BaseParser
-import pandas as pd
-import pdfplumber
-from helpers.constants import INVOICE_COLUMNS
+import re
+
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
-from helpers.helpers import divide_nettoEk_by_menge
-
-class InvoiceBoschParser(BaseParser):
-    def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
-            lines = text.split('\n')
-            # print(lines)
-
-
-            bestellnummer = []
-            fremdbelegnummer_eingangsrechnung = "" # Rechnungsnummer des Lieferanten ohne Datum
-            fremdbelegnummer_lieferantenbestellung: list[str] = [] # Auftragsnummer des Lieferanten ohne Datum
-            lieferant = "Robert Bosch Power Tools GmbH"
-            zahlbar_bis = ""
-            belegdatum = ""
-            artikelnummer = [] # SKU - Gibt es hier nicht
-            artikelnummer_lieferant = [] # Artikelnummer des Lieferanten - Nicht die EAN
-            artikelname = []
-            hinweis = []
-            menge = []
-            netto_ek = [] # Kosten der gesamten POS
-            MwST = "19" # Nur bei Plastimex 0
-            zahlungsbedingung = 14
-
-            auftragskosten = ""
-            letzte_bestellnummer = ""
-            letzte_fremdbelegnummer_lieferantenbestellung = ""
-
-            for i, line in enumerate(lines):
-                if line == "70538 Stuttgart, Deutschland" and belegdatum == "":
-                    belegdatum = lines[i+1].split()[-2]
-                    zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, zahlungsbedingung)
-                    fremdbelegnummer_eingangsrechnung = lines[i+1].split()[-1]
-
-                if line.startswith("Ihre Bestellung ") and not "Auftragspauschale" in lines[i-1]:
-                    letzte_bestellnummer = line.split()[-1]
-
-                if line.startswith("Unser(e) Standardauftr"):
-                    letzte_fremdbelegnummer_lieferantenbestellung = ", ".join(line.split()[2:])
-
-                if len(line.split()) > 4 and line.split()[0].isnumeric() and line.split()[1].replace(".", "").isnumeric() and line.split()[2].isnumeric():
-                    if len(artikelnummer) < len(artikelname):
-                        artikelnummer.append("N/A")
-                    if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
-                        fremdbelegnummer_lieferantenbestellung.append(letzte_fremdbelegnummer_lieferantenbestellung)
-                    if len(bestellnummer) < len(artikelname):
-                        bestellnummer.append(letzte_bestellnummer)
-                    if len(hinweis) < len(artikelname):
-                        hinweis.append("N/A")
-
-                    artikelnummer_lieferant.append(line.split()[1])
-                    menge.append(line.split()[2])
-                    netto_ek.append(line.split()[-1])
-                    j = 1
-                    while lines[i+j].split()[0].isnumeric() == False and not ("(D)" in lines[i+j] or "(L)" in lines[i+j]):
-                        j += 1
-
-                    artikelname.append(" ".join(lines[i+1:i+j]).strip())
-
-                if line.startswith("Auftragspauschale"):
-                    auftragskosten = lines[i+1].split()[-1]
-
-                
-            if len(artikelnummer) < len(artikelname):
-                artikelnummer.append("N/A")
-            if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
-                fremdbelegnummer_lieferantenbestellung.append(letzte_fremdbelegnummer_lieferantenbestellung)
-            if len(bestellnummer) < len(artikelname):
-                bestellnummer.append(letzte_bestellnummer)
-            if len(hinweis) < len(artikelname):
-                hinweis.append("N/A")
-
-            bestellnummer.append(letzte_bestellnummer)
-            fremdbelegnummer_lieferantenbestellung.append(letzte_fremdbelegnummer_lieferantenbestellung)
-            hinweis.append("N/A")
-            artikelnummer.append("N/A")
-            artikelnummer_lieferant.append("N/A")
-            artikelname.append("Auftragspauschale")
-            menge.append("1")
-            netto_ek.append(auftragskosten)
-
-
-
-            artikel_data = []
-            for i in range(len(artikelname)):
-                netto_ek[i] = divide_nettoEk_by_menge(netto_ek[i], menge[i])
-                artikel_data.append([bestellnummer[i], fremdbelegnummer_eingangsrechnung, fremdbelegnummer_lieferantenbestellung[i], lieferant, zahlbar_bis, belegdatum, artikelnummer[i], artikelnummer_lieferant[i], artikelname[i], hinweis[i], menge[i], netto_ek[i], MwST])
-            df = pd.DataFrame(artikel_data, columns=INVOICE_COLUMNS)
-
-            return df, fremdbelegnummer_eingangsrechnung
-
-        except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
-            return pd.DataFrame(), ""
 
+from parsers.line_engine import LineContext, LineRule, RuleBasedInvoiceParser
+
+# Positionszeile: "<Pos> <Sachnummer 2.608.601.234> <Menge> ... <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?P<artikel>[\d.]*\d[\d.]*)\s+(?P<menge>\d+)\s+\S+\s+(?:.*\s)?(?P<preis>\S+)\s*$")
+
+ZAHLUNGSBEDINGUNG = 14
+
+
+def _kopf(ctx: LineContext, line: str, _):
+    kopf = ctx.peek(1).split()
+    ctx.belegdatum = kopf[-2]
+    ctx.zahlbar_bis = zahlbar_bis_x_tage_nach_datum(ctx.belegdatum, ZAHLUNGSBEDINGUNG)
+    ctx.fremdbelegnummer_eingangsrechnung = kopf[-1]
+
+
+def _ihre_bestellung(ctx: LineContext, line: str, _):
+    ctx.vars["letzte_bestellnummer"] = line.split()[-1]
+
+
+def _standardauftrag(ctx: LineContext, line: str, _):
+    ctx.vars["letzte_fremdbelegnummer_lieferantenbestellung"] = ", ".join(line.split()[2:])
+
+
+def _position(ctx: LineContext, line: str, position):
+    ctx.new_position()
+    ctx.add("artikelnummer_lieferant", position["artikel"])
+    ctx.add("menge", position["menge"])
+    ctx.add("netto_ek", position["preis"])
+    ctx.vars["name"] = []
+
+
+def _ende_bezeichnung(line: str, _) -> bool:
+    teile = line.split()
+    return bool(teile) and teile[0].isnumeric() or "(D)" in line or "(L)" in line
+
+
+def _bezeichnung_fertig(ctx: LineContext, line: str, _):
+    ctx.add("artikelname", " ".join(ctx.vars["name"]).strip())
+
+
+def _bezeichnung(ctx: LineContext, line: str, _):
+    ctx.vars["name"].append(line)
+
+
+def _auftragspauschale(ctx: LineContext, line: str, _):
+    ctx.vars["auftragskosten"] = ctx.peek(1).split()[-1]
+
+
+class InvoiceBoschParser(RuleBasedInvoiceParser):
+    lieferant = "Robert Bosch Power Tools GmbH"
+    MwST = "19" # Nur bei Plastimex 0
+    defaults = {
+        "fremdbelegnummer_lieferantenbestellung": lambda ctx: ctx.vars.get("letzte_fremdbelegnummer_lieferantenbestellung", ""),
+        "bestellnummer": lambda ctx: ctx.vars.get("letzte_bestellnummer", ""),
+    }
+
+    rules = [
+        # Artikelbezeichnung läuft bis zur nächsten Position bzw. Ursprungszeile "(D)" / "(L)"
+        LineRule(_ende_bezeichnung, _bezeichnung_fertig, states=["name"], next_state="kopf", stop=False),
+        LineRule(lambda line, _: True, _bezeichnung, states=["name"], stop=False),
+        # Kopfdaten
+        LineRule(lambda line, ctx: line == "70538 Stuttgart, Deutschland" and ctx.belegdatum == "", _kopf, stop=False),
+        LineRule(lambda line, ctx: line.startswith("Ihre Bestellung ") and not "Auftragspauschale" in ctx.peek(-1), _ihre_bestellung, stop=False),
+        LineRule(lambda line, _: line.startswith("Unser(e) Standardauftr"), _standardauftrag, stop=False),
+        # Positionen und Fußzeilen
+        LineRule(POSITION_LINE, _position, next_state="name", stop=False),
+        LineRule(lambda line, _: line.startswith("Auftragspauschale"), _auftragspauschale, stop=False),
+    ]
+
+    def finish(self, ctx: LineContext):
+        # Die Auftragspauschale wird als eigene Position angehängt
+        ctx.new_position()
+        ctx.add("bestellnummer", ctx.vars.get("letzte_bestellnummer", ""))
+        ctx.add("fremdbelegnummer_lieferantenbestellung", ctx.vars.get("letzte_fremdbelegnummer_lieferantenbestellung", ""))
+        ctx.add("hinweis", "N/A")
+        ctx.add("artikelnummer", "N/A")
+        ctx.add("artikelnummer_lieferant", "N/A")
+        ctx.add("artikelname", "Auftragspauschale")
+        ctx.add("menge", "1")
+        ctx.add("netto_ek", ctx.vars.get("auftragskosten", ""))
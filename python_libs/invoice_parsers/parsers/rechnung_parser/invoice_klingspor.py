@@ -1,17 +1,21 @@
+import re
+
 from parsers.base_parser import BaseParser
 import pandas as pd
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
 from helpers.constants import INVOICE_COLUMNS
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
 from helpers.helpers import divide_nettoEk_by_menge
+from helpers.event_log import log
+
+# Positionszeile: "<Pos> Artikelnr. <Artikel> <Menge> ... <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+\S+\s+(?P<artikel>\S+)\s+(?P<menge>\S+)(?:.*\s(?P<preis>\S+))?\s*$")
+
 
 class InvoiceKlingsporParser(BaseParser):
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
+            text = extract_pdf_text(pdf_path)
             lines = text.split('\n')
             # print(lines)
 
@@ -32,12 +36,14 @@ class InvoiceKlingsporParser(BaseParser):
 
             for i, line in enumerate(lines):
                 if "Nummer / Datum" in line and fremdbelegnummer_eingangsrechnung == "":
-                    fremdbelegnummer_eingangsrechnung = lines[i+1].split()[0]
-                    belegdatum = lines[i+1].split()[-1]
+                    kopf = lines[i+1].split()
+                    fremdbelegnummer_eingangsrechnung = kopf[0]
+                    belegdatum = kopf[-1]
                     zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, zahlungsbedingung)
                     continue
 
-                if "Artikelnr." in line and line.split()[0].isnumeric():
+                position = POSITION_LINE.match(line) if "Artikelnr." in line else None
+                if position:
                     if len(artikelnummer) < len(artikelname):
                         artikelnummer.append("N/A")
                     if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
@@ -47,9 +53,9 @@ class InvoiceKlingsporParser(BaseParser):
                     if len(hinweis) < len(artikelname):
                         hinweis.append("N/A")
                     
-                    artikelnummer_lieferant.append(line.split()[2])
-                    menge.append(line.split()[3])
-                    netto_ek.append(line.split()[-1])
+                    artikelnummer_lieferant.append(position["artikel"])
+                    menge.append(position["menge"])
+                    netto_ek.append(position["preis"] or position["menge"])
                     artikelname.append(lines[i+1] + " "+  lines[i+2])
                     continue
                 
@@ -84,6 +90,6 @@ class InvoiceKlingsporParser(BaseParser):
             return df, fremdbelegnummer_eingangsrechnung
 
         except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
             return pd.DataFrame(), ""
 
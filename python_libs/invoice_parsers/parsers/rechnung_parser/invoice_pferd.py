@@ -1,19 +1,25 @@
+import re
+
 import pandas as pd
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
 from helpers.constants import INVOICE_COLUMNS
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
 from helpers.helpers import divide_nettoEk_by_menge
+from helpers.event_log import log
 
 from parsers.base_parser import BaseParser
 
 
+# Positionszeile: "<Pos> <Artikel> <Bezeichnung ...>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?P<artikel>\d+)\s+(?P<name>\S.*?)\s*$")
+# Preiszeile: "<Menge> ... - % ... <Gesamtpreis>"
+PREIS_LINE = re.compile(r"^\s*(?P<menge>\S+)\s(?:.*\s)?(?P<preis>\S+)\s*$")
+
+
 class InvoicePferdParser(BaseParser):
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
+            text = extract_pdf_text(pdf_path)
             lines = text.split('\n')
 
             bestellnummer = ""
@@ -37,8 +43,9 @@ class InvoicePferdParser(BaseParser):
             # print(lines)
             for i, line in enumerate(lines):
                 if "Nummer/Datum" in line:
-                    fremdbelegnummer_eingangsrechnung = lines[i+1].split()[-3]
-                    belegdatum = lines[i+1].split()[-1]
+                    kopf = lines[i+1].split()
+                    fremdbelegnummer_eingangsrechnung = kopf[-3]
+                    belegdatum = kopf[-1]
                     zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, zahlungsbedingung)
                     continue
                 
@@ -57,22 +64,24 @@ class InvoicePferdParser(BaseParser):
                 if line.startswith("Auftrag "):
                     neueste_auftragsnummer = line.split()[1]
 
-                if len(line.split()) > 2 and line.split()[0].isnumeric() and line.split()[1].isnumeric() and not "50937" in line and not "- % " in line:
+                position = POSITION_LINE.match(line)
+                if position and not "50937" in line and not "- % " in line:
                     if len(artikelnummer) < len(artikelname):
                         artikelnummer.append("N/A")
                     if len(hinweis) < len(artikelname):
                         hinweis.append("")
                     fremdbelegnummer_lieferantenbestellung.append(neueste_auftragsnummer)
-                    artikelname.append(" ".join(line.split()[2:]))
-                    artikelnummer_lieferant.append(line.split()[1])
+                    artikelname.append(" ".join(position["name"].split()))
+                    artikelnummer_lieferant.append(position["artikel"])
                     continue
 
                 if line.startswith("Kundenartikelnummer "):
                     artikelnummer.append(line.split()[1])
 
-                if "- % " in line:
-                    netto_ek.append(line.split()[-1])
-                    menge.append(line.split()[0])
+                preise = PREIS_LINE.match(line) if "- % " in line else None
+                if preise:
+                    netto_ek.append(preise["preis"])
+                    menge.append(preise["menge"])
                     
 
             if len(artikelnummer) < len(artikelname):
@@ -99,5 +108,5 @@ class InvoicePferdParser(BaseParser):
             return df, fremdbelegnummer_eingangsrechnung
 
         except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
             return pd.DataFrame(), ""
@@ -1,18 +1,22 @@
+import re
+
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
 from helpers.helpers import divide_nettoEk_by_menge
 
 from parsers.base_parser import BaseParser
 import pandas as pd
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
 from helpers.constants import INVOICE_COLUMNS
+from helpers.event_log import log
+
+# Positionszeile: "<Lp.> <Nazwa ...> <Artikel> <Menge> <4 Spalten> <Wartość netto>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?:(?P<name>.*?)\s+)?(?P<artikel>\S+)\s+(?P<menge>\S+)(?:\s+\S+){4}\s+(?P<preis>\S*,\S*)\s*$")
+
 
 class InvoicePlastimexParser(BaseParser):
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
+            text = extract_pdf_text(pdf_path)
             lines = text.split('\n')
             # print(lines)
 
@@ -41,11 +45,12 @@ class InvoicePlastimexParser(BaseParser):
                 if line.startswith("Faktura VAT") and not fremdbelegnummer_eingangsrechnung:
                     fremdbelegnummer_eingangsrechnung = line.split(" ")[-1]
 
-                if len(line.split()) > 4 and line.split()[0].isnumeric() and "," in line.split()[-1]:
-                    netto_ek.append(line.split()[-1])
-                    menge.append(line.split()[-6])
-                    artikelnummer_lieferant.append(line.split()[-7])
-                    artikelname.append(" ".join(line.split()[1:-7]))
+                position = POSITION_LINE.match(line)
+                if position:
+                    netto_ek.append(position["preis"])
+                    menge.append(position["menge"])
+                    artikelnummer_lieferant.append(position["artikel"])
+                    artikelname.append(" ".join((position["name"] or "").split()))
                     bestellnummer.append(belegdatum)
                     fremdbelegnummer_lieferantenbestellung.append("N/A")
                     hinweis.append("N/A")
@@ -72,6 +77,6 @@ class InvoicePlastimexParser(BaseParser):
             return df, fremdbelegnummer_eingangsrechnung
 
         except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
             return pd.DataFrame(), ""
 
@@ -1,113 +1,91 @@
-from operator import le
+import re
+
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
-from helpers.helpers import divide_nettoEk_by_menge
-
-from parsers.base_parser import BaseParser
-import pandas as pd
-import pdfplumber
-from helpers.constants import INVOICE_COLUMNS
-
-class InvoiceRhodiusParser(BaseParser):
-    def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
-            lines = text.split('\n')
-            # print(lines)
-
-
-            bestellnummer = []
-            fremdbelegnummer_eingangsrechnung = "" # Rechnungsnummer des Lieferanten ohne Datum
-            fremdbelegnummer_lieferantenbestellung: list[str] = [] # Auftragsnummer des Lieferanten ohne Datum
-            lieferant = "RHODIUS Abrasives GmbH"
-            zahlbar_bis = ""
-            belegdatum = ""
-            artikelnummer = [] # SKU
-            artikelnummer_lieferant = [] # Artikelnummer des Lieferanten - Nicht die EAN
-            artikelname = []
-            hinweis = []
-            menge = []
-            netto_ek = [] # Kosten der gesamten POS
-            MwST = "19" # Nur bei Plastimex 0
-            zahlungsbedingung = 14
-
-            lieferkosten = ""
-            letzte_pos = 0
-
-            for i, line in enumerate(lines):
-                if "Rechnung: " in line and fremdbelegnummer_eingangsrechnung == "":
-                    index_rechnung = line.index("Rechnung: ")
-                    index_datum = line.index("Datum : ")
-                    fremdbelegnummer_eingangsrechnung = line[index_rechnung + 10:index_datum].strip()
-                    belegdatum = line[index_datum:].split()[2]
-                    zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, zahlungsbedingung)
-                    continue
-                    
-                if line.startswith("VK-Auftrag"):
-                    fremdbelegnummer_lieferantenbestellung.append(line.split()[2] + " " + line.split()[3])
-                    bestellnummer.append(line.split()[-1])
-                    continue
-
-                if len(line.split()) > 3 and line.split()[0].isnumeric() and line.split()[1].isnumeric() and int(line.split()[0]) == letzte_pos + 1:
-                    if len(artikelnummer) < len(artikelname):
-                        artikelnummer.append("N/A")
-                    if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
-                        fremdbelegnummer_lieferantenbestellung.append(fremdbelegnummer_lieferantenbestellung[-1])
-                    if len(bestellnummer) < len(artikelname):
-                        bestellnummer.append(bestellnummer[-1])
-                    if len(hinweis) < len(artikelname):
-                        hinweis.append("N/A")
-                    letzte_pos += 1
-                    artikelnummer_lieferant.append(line.split()[1])
-                    for data in line.split()[2:]:
-                        if data.isnumeric():
-                            artikelnummer_lieferant[-1] += ", " + data
-                        else:
-                            menge.append(data)
-                            break
-                    netto_ek.append(line.split()[-1])
-                
-                    j = 1
-                    while not lines[i+j].split()[0].isnumeric() and not lines[i+j].startswith("AU20"):
-                        j += 1
-
-                    artikelname.append(" ".join(lines[i+1:i+j]))
-                
-                if line.startswith("PORTO / FRACHTKOSTEN"):
-                    lieferkosten = lines[i-1].split()[-1]
-                    
-                
-            if len(artikelnummer) < len(artikelname):
-                artikelnummer.append("N/A")
-            if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
-                fremdbelegnummer_lieferantenbestellung.append(fremdbelegnummer_lieferantenbestellung[-1])
-            if len(bestellnummer) < len(artikelname):
-                bestellnummer.append(bestellnummer[-1])
-            if len(hinweis) < len(artikelname):
-                hinweis.append("N/A")
-
-
-            bestellnummer.append(bestellnummer[-1])
-            fremdbelegnummer_lieferantenbestellung.append("N/A")
-            lieferant = "RHODIUS Abrasives GmbH"
-            artikelnummer.append("N/A")
-            artikelnummer_lieferant.append("900101")
-            artikelname.append("Porto / Frachtkosten")
-            hinweis.append("N/A")
-            menge.append("1")
-            netto_ek.append(lieferkosten)
-
-            artikel_data = []
-            for i in range(len(artikelname)):
-                netto_ek[i] = divide_nettoEk_by_menge(netto_ek[i], menge[i])
-                artikel_data.append([bestellnummer[i], fremdbelegnummer_eingangsrechnung, fremdbelegnummer_lieferantenbestellung[i], lieferant, zahlbar_bis, belegdatum, artikelnummer[i], artikelnummer_lieferant[i], artikelname[i], hinweis[i], menge[i], netto_ek[i], MwST])
-            df = pd.DataFrame(artikel_data, columns=INVOICE_COLUMNS)
-
-            return df, fremdbelegnummer_eingangsrechnung
-
-        except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
-            return pd.DataFrame(), ""
 
+from parsers.line_engine import CARRY, LineContext, LineRule, RuleBasedInvoiceParser
+
+# Positionszeile: "<Pos> <Artikel> [<weitere Artikel>] <Menge> ... <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?P<artikel>\d+(?:\s+\d+)*)\s+(?P<menge>\S*[^\d\s]\S*)\s+(?:.*\s)?(?P<preis>\S+)\s*$")
+
+ZAHLUNGSBEDINGUNG = 14
+
+
+def _kopf(ctx: LineContext, line: str, _):
+    index_rechnung = line.index("Rechnung: ")
+    index_datum = line.index("Datum : ")
+    ctx.fremdbelegnummer_eingangsrechnung = line[index_rechnung + 10:index_datum].strip()
+    ctx.belegdatum = line[index_datum:].split()[2]
+    ctx.zahlbar_bis = zahlbar_bis_x_tage_nach_datum(ctx.belegdatum, ZAHLUNGSBEDINGUNG)
+
+
+def _vk_auftrag(ctx: LineContext, line: str, _):
+    teile = line.split()
+    ctx.add("fremdbelegnummer_lieferantenbestellung", teile[2] + " " + teile[3])
+    ctx.add("bestellnummer", teile[-1])
+
+
+def _ist_position(line: str, ctx: LineContext):
+    position = POSITION_LINE.match(line)
+    if position and int(position["pos"]) == ctx.vars.get("letzte_pos", 0) + 1:
+        return position
+    return None
+
+
+def _position(ctx: LineContext, line: str, position):
+    ctx.new_position()
+    ctx.vars["letzte_pos"] = ctx.vars.get("letzte_pos", 0) + 1
+    ctx.add("artikelnummer_lieferant", ", ".join(position["artikel"].split()))
+    ctx.add("menge", position["menge"])
+    ctx.add("netto_ek", position["preis"])
+    ctx.vars["name"] = []
+
+
+def _ende_bezeichnung(line: str, _) -> bool:
+    teile = line.split()
+    return bool(teile) and teile[0].isnumeric() or line.startswith("AU20")
+
+
+def _bezeichnung_fertig(ctx: LineContext, line: str, _):
+    ctx.add("artikelname", " ".join(ctx.vars["name"]))
+
+
+def _bezeichnung(ctx: LineContext, line: str, _):
+    ctx.vars["name"].append(line)
+
+
+def _frachtkosten(ctx: LineContext, line: str, _):
+    ctx.vars["lieferkosten"] = ctx.peek(-1).split()[-1]
+
+
+class InvoiceRhodiusParser(RuleBasedInvoiceParser):
+    lieferant = "RHODIUS Abrasives GmbH"
+    MwST = "19" # Nur bei Plastimex 0
+    defaults = {
+        "fremdbelegnummer_lieferantenbestellung": CARRY,
+        "bestellnummer": CARRY,
+    }
+
+    rules = [
+        # Artikelbezeichnung läuft bis zur nächsten Position bzw. Auftragszeile "AU20..."
+        LineRule(_ende_bezeichnung, _bezeichnung_fertig, states=["name"], next_state="kopf", stop=False),
+        LineRule(lambda line, _: True, _bezeichnung, states=["name"], stop=False),
+        # Kopfdaten
+        LineRule(lambda line, ctx: "Rechnung: " in line and ctx.fremdbelegnummer_eingangsrechnung == "", _kopf),
+        LineRule(lambda line, _: line.startswith("VK-Auftrag"), _vk_auftrag),
+        # Positionen und Fußzeilen
+        LineRule(_ist_position, _position, next_state="name", stop=False),
+        LineRule(lambda line, _: line.startswith("PORTO / FRACHTKOSTEN"), _frachtkosten, stop=False),
+    ]
+
+    def finish(self, ctx: LineContext):
+        # Porto / Frachtkosten werden als eigene Position angehängt
+        bestellnummer = ctx.default("bestellnummer")
+        ctx.new_position()
+        ctx.add("bestellnummer", bestellnummer)
+        ctx.add("fremdbelegnummer_lieferantenbestellung", "N/A")
+        ctx.add("artikelnummer", "N/A")
+        ctx.add("artikelnummer_lieferant", "900101")
+        ctx.add("artikelname", "Porto / Frachtkosten")
+        ctx.add("hinweis", "N/A")
+        ctx.add("menge", "1")
+        ctx.add("netto_ek", ctx.vars.get("lieferkosten", ""))
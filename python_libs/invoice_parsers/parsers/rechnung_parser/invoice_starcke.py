@@ -1,15 +1,20 @@
+import re
+
 from parsers.base_parser import BaseParser
 import pandas as pd
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
 from helpers.constants import INVOICE_COLUMNS
 from helpers.helpers import divide_nettoEk_by_menge
+from helpers.event_log import log
+
+# Positionszeile: "<Pos> <Artikel> <Bezeichnung ...> <Menge> <Einzelpreis> [<Rabatt %>] <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?P<artikel>\S+)\s+\S+\s+(?:.*\s)?(?P<preis>\S+)\s*$")
+
+
 class InvoiceStarckeParser(BaseParser):
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
+            text = extract_pdf_text(pdf_path)
             lines = text.split('\n')
             # print(lines)
 
@@ -35,16 +40,19 @@ class InvoiceStarckeParser(BaseParser):
                     zahlbar_bis = line.split()[-4]
 
                 if line == "Nr." and belegdatum == "":
-                    belegdatum = lines[i+1].split()[-1]
-                    fremdbelegnummer_eingangsrechnung = lines[i+1].split()[-4]
+                    kopf = lines[i+1].split()
+                    belegdatum = kopf[-1]
+                    fremdbelegnummer_eingangsrechnung = kopf[-4]
 
                 if line.startswith("Auftrags-Nr.:"):
-                    fremdbelegnummer_lieferantenbestellung.append(line.split()[-2] + " " + line.split()[-1])
+                    teile = line.split()
+                    fremdbelegnummer_lieferantenbestellung.append(teile[-2] + " " + teile[-1])
 
                 if line.startswith("Bestell-Nr/"):
                     bestellnummer.append(line.split()[-1])
 
-                if len(line.split()) > 3 and line.split()[0].isnumeric() and not "50933" in line and not "koeln" in line.lower():
+                position = POSITION_LINE.match(line)
+                if position and not "50933" in line and not "koeln" in line.lower():
                     if len(artikelnummer) < len(artikelname):
                         artikelnummer.append("N/A")
                     if len(fremdbelegnummer_lieferantenbestellung) < len(artikelname):
@@ -54,11 +62,12 @@ class InvoiceStarckeParser(BaseParser):
                     if len(hinweis) < len(artikelname):
                         hinweis.append("N/A")
 
-                    artikelnummer_lieferant.append(line.split()[1])
-                    netto_ek.append(line.split()[-1])
+                    artikelnummer_lieferant.append(position["artikel"])
+                    netto_ek.append(position["preis"])
                     artikelname.append(" ")
                     count_preise = 0
                     menge_fertig = False
+                    # Menge und Bezeichnung stehen zwischen Artikel und Preisen, daher von hinten lesen
                     for element in reversed(line.split()):
                         if "," in element and not "%" in element:
                             count_preise += 1
@@ -99,6 +108,6 @@ class InvoiceStarckeParser(BaseParser):
             return df, fremdbelegnummer_eingangsrechnung
 
         except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
             return pd.DataFrame(), ""
 
@@ -1,18 +1,22 @@
+import re
+
 from helpers.date_helpers import zahlbar_bis_x_tage_nach_datum
 from helpers.helpers import divide_nettoEk_by_menge
 
 from parsers.base_parser import BaseParser
 import pandas as pd
-import pdfplumber
+from file_handlers.pdf_text import extract_pdf_text
 from helpers.constants import INVOICE_COLUMNS
+from helpers.event_log import log
+
+# Positionszeile: "<Pos> <Artikel> <Bezeichnung ...> <Menge> <3 Spalten> <Gesamtpreis>"
+POSITION_LINE = re.compile(r"^\s*(?P<pos>\d+)\s+(?P<artikel>\d+)\s+(?:(?P<name>.*?)\s+)?(?P<menge>\S+)(?:\s+\S+){3}\s+(?P<preis>\S+)\s*$")
+
 
 class InvoiceVSMParser(BaseParser):
     def parse(self, pdf_path: str) -> tuple[pd.DataFrame, str]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text = text  + page.extract_text() + "\n"
+            text = extract_pdf_text(pdf_path)
             lines = text.split('\n')
             # print(lines)
 
@@ -44,19 +48,21 @@ class InvoiceVSMParser(BaseParser):
                     zahlbar_bis = zahlbar_bis_x_tage_nach_datum(belegdatum, zahlungsbedingung, format="%d.%m.%y")
 
                 if line.startswith("Ihre Bestellung"):
-                    bestellnummer = line.split()[2]
-                    fremdbelegnummer_lieferantenbestellung = line.split()[-1]
+                    teile = line.split()
+                    bestellnummer = teile[2]
+                    fremdbelegnummer_lieferantenbestellung = teile[-1]
 
-                if len(line.split()) > 3 and line.split()[0].isnumeric() and line.split()[1].isnumeric() and int(line.split()[0]) == letzte_pos + 1:
+                position = POSITION_LINE.match(line)
+                if position and int(position["pos"]) == letzte_pos + 1:
                     if len(artikelnummer) < len(artikelname):
                         artikelnummer.append("N/A")
                     if len(hinweis) < len(artikelname):
                         hinweis.append("N/A")
                     letzte_pos += 1
-                    netto_ek.append(line.split()[-1])
-                    menge.append(line.split()[-5])
-                    artikelnummer_lieferant.append(line.split()[1] + " / " + lines[i+1].split()[0])
-                    artikelname.append(" ".join(line.split()[2:-5]))
+                    netto_ek.append(position["preis"])
+                    menge.append(position["menge"])
+                    artikelnummer_lieferant.append(position["artikel"] + " / " + lines[i+1].split()[0])
+                    artikelname.append(" ".join((position["name"] or "").split()))
                     if not lines[i+1].startswith("Ihre Nr."):
                         artikelname[-1] += " " + lines[i+1]
                 
@@ -82,5 +88,5 @@ class InvoiceVSMParser(BaseParser):
             return df, fremdbelegnummer_eingangsrechnung
 
         except Exception as e:
-            print(f"Fehler beim Parsen der Rechnung: {e}")
+            log.error("parse_failed", f"Fehler beim Parsen der Rechnung: {e}", parser=type(self).__name__)
             return pd.DataFrame(), ""
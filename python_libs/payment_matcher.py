@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Payment Matcher
+Ordnet Zahlungen (Amazon, PayPal, Commerzbank, Postbank, Mollie) offenen VK-/EK-Rechnungen zu, mit den
+Strategien aus app/lib/fibu/dual-matcher.ts und matching-engine.ts, aber ohne die Rechnungen pro Zahlung
+zu durchsuchen:
+
+- Invertierter Index: normalisierte Rechnungs-, Bestell- und Amazon-Order-Nummern -> Rechnungen.
+  Referenzen im Verwendungszweck (RE2025-97899, XRE-3695, AU_12345_SW6, 305-1234567-1234567) werden
+  mit demselben Muster wie im bank_csv_importer gefunden und per Dictionary nachgeschlagen.
+- Betragsindex: Bruttobeträge in Cent sortiert; Kandidaten für Betrag ± Toleranz per Binärsuche,
+  danach Datumsfenster und Bewertung wie calculateBetragDatumScore.
+
+Reihenfolge pro Zahlung: exakt (Referenz + gleicher Betrag), referenz (Referenz, Betrag abweichend),
+betrag_datum (nur offene, noch nicht vergebene Rechnungen). Nennt eine Zahlung nur Rechnungen, die schon
+einer anderen Zahlung zugeordnet sind (doppelte oder zurückgebuchte Zahlung), wird sie mit "doppelt": true
+und höchstens confidence "medium" gemeldet.
+
+CLI:
+    payment_matcher.py --rechnungen rechnungen.jsonl --zahlungen zahlungen.jsonl [-o zuordnungen.jsonl]
+    payment_matcher.py --benchmark [--faktor 10]
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import random
+import argparse
+import datetime
+
+import numpy as np
+
+# Add invoice_parsers to path (Ereignisprotokoll)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'invoice_parsers'))
+
+from helpers.event_log import log
+from bank_csv_importer import REFERENZ_MUSTER
+
+# Betrag + Datum: Toleranz in Cent und Fenster Zahlungsdatum - Rechnungsdatum in Tagen (dual-matcher.ts)
+BETRAG_TOLERANZ_CENT = 50
+BETRAG_MAX_DIFFERENZ_CENT = 25
+DATUM_FENSTER_TAGE = (-7, 3)
+# Referenz-Treffer gilt bis zu dieser relativen Abweichung als bezahlt (Gebühren/Rundung, getAutoVkMatch)
+REFERENZ_TOLERANZ = 0.02
+# Zahlungen im Oktober 2025 (fibu_zahlungen_test.py), Grundlage für --benchmark
+OKTOBER_ZAHLUNGEN = 8500
+
+AMAZON_ORDER_MUSTER = re.compile(r"\d{3}-\d{7}-\d{7}")
+_TRENNER = re.compile(r"[\s_/.\-]+")
+
+RECHNUNG_FELDER = {
+    "id": ("id", "uniqueId", "_id"),
+    "rechnungsnummer": ("rechnungsnummer", "cRechnungsNr", "belegnummer", "rechnungsNr"),
+    "bestellnummer": ("bestellnummer", "cBestellNr", "order_id", "orderId"),
+    "brutto": ("brutto", "gesamtbetrag", "betrag"),
+    "datum": ("datum", "rechnungsdatum", "belegdatum"),
+}
+ZAHLUNG_FELDER = {
+    "id": ("id", "_id", "transaktionsId", "uniqueKey"),
+    "betrag": ("betrag", "Betrag"),
+    "datum": ("datum", "datumDate", "Buchungstag"),
+}
+# Felder der Zahlung, die schon eine Referenz enthalten (bank_csv_importer, amazon_settlement_importer, JTL)
+ZAHLUNG_REFERENZ_FELDER = (
+    "zugeordneteRechnung", "rechnungsnummer", "rechnungsNr", "auftragsnummer", "au_nummer", "referenz",
+    "order_id", "orderId", "merchantOrderId",
+)
+ZAHLUNG_TEXT_FELDER = ("verwendungszweck", "beschreibung")
+
+
+def normalize_nummer(text: str) -> str:
+    """Schlüssel für den Index: Großbuchstaben ohne Leer- und Trennzeichen ("re 2025/97899" -> "RE202597899")."""
+    return _TRENNER.sub("", text.upper())
+
+
+def _feld(datensatz: dict, namen: tuple):
+    for name in namen:
+        wert = datensatz.get(name)
+        if wert not in (None, ""):
+            return wert["$oid"] if isinstance(wert, dict) and "$oid" in wert else wert
+    return None
+
+
+def _cent(wert) -> int | None:
+    try:
+        return round(float(wert) * 100)
+    except (TypeError, ValueError):
+        return None
+
+
+def _tag(wert) -> int | None:
+    """Datum (YYYY-MM-DD..., ISO-Zeitstempel oder Mongo {"$date": ...}) als Tagesnummer."""
+    if isinstance(wert, dict):
+        wert = wert.get("$date")
+    if isinstance(wert, (datetime.date, datetime.datetime)):
+        return wert.toordinal()
+    try:
+        return datetime.date.fromisoformat(str(wert)[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def invoice_keys(rechnung: dict) -> set[str]:
+    """Indexschlüssel einer Rechnung: Rechnungs- und Bestellnummer sowie die darin enthaltenen Referenzen."""
+    schluessel = set()
+    for feld in ("rechnungsnummer", "bestellnummer"):
+        wert = _feld(rechnung, RECHNUNG_FELDER[feld])
+        if wert:
+            wert = str(wert)
+            schluessel.add(normalize_nummer(wert))
+            schluessel.update(normalize_nummer(treffer.group(0)) for treffer in REFERENZ_MUSTER.finditer(wert))
+    return schluessel
+
+
+def payment_keys(zahlung: dict) -> list[str]:
+    """Referenzen einer Zahlung in Reihenfolge: zuerst die Referenzfelder, dann Treffer im Verwendungszweck."""
+    schluessel = []
+    for feld in ZAHLUNG_REFERENZ_FELDER:
+        wert = zahlung.get(feld)
+        if wert:
+            schluessel.append(normalize_nummer(str(wert)))
+    for referenz in zahlung.get("referenzen") or ():
+        schluessel.append(normalize_nummer(referenz))
+    for feld in ZAHLUNG_TEXT_FELDER:
+        text = zahlung.get(feld)
+        if text:
+            schluessel.extend(normalize_nummer(treffer.group(0)) for treffer in REFERENZ_MUSTER.finditer(text))
+            schluessel.extend(normalize_nummer(treffer) for treffer in AMAZON_ORDER_MUSTER.findall(text))
+    return list(dict.fromkeys(schluessel))
+
+
+class PaymentMatcher:
+    """
+    Index über die offenen Posten
+    Args:
+        rechnungen: Rechnungen (Felder siehe RECHNUNG_FELDER; "art": "VK"/"EK" schränkt das Vorzeichen ein)
+    """
+
+    def __init__(self, rechnungen: list[dict]):
+        self.rechnungen = rechnungen
+        self.index: dict[str, list[int]] = {}
+        cent = np.zeros(len(rechnungen), dtype=np.int64)
+        tage = np.zeros(len(rechnungen), dtype=np.int64)
+        gueltig = np.zeros(len(rechnungen), dtype=bool)
+        for position, rechnung in enumerate(rechnungen):
+            for schluessel in invoice_keys(rechnung):
+                self.index.setdefault(schluessel, []).append(position)
+            brutto = _cent(_feld(rechnung, RECHNUNG_FELDER["brutto"]))
+            tag = _tag(_feld(rechnung, RECHNUNG_FELDER["datum"]))
+            if brutto is not None and tag is not None:
+                cent[position], tage[position], gueltig[position] = abs(brutto), tag, True
+        self._cent = cent
+        # Betragsindex: Positionen nach Betrag sortiert, ohne Rechnungen ohne Betrag/Datum
+        reihenfolge = np.flatnonzero(gueltig)
+        reihenfolge = reihenfolge[np.argsort(cent[reihenfolge], kind="stable")]
+        self._sortiert_position = reihenfolge
+        self._sortiert_cent = cent[reihenfolge]
+        self._sortiert_tag = tage[reihenfolge]
+        self._art = np.array([str(rechnung.get("art") or "").upper() for rechnung in rechnungen], dtype=object)
+        self._vergeben = np.zeros(len(rechnungen), dtype=bool)
+
+    def _ergebnis(self, zahlung_id, position: int | None, method: str | None, confidence: str | None, **details) -> dict:
+        rechnung = self.rechnungen[position] if position is not None else None
+        return {
+            "zahlung_id": zahlung_id,
+            "rechnung_id": str(_feld(rechnung, RECHNUNG_FELDER["id"])) if rechnung else None,
+            "rechnungsnummer": _feld(rechnung, RECHNUNG_FELDER["rechnungsnummer"]) if rechnung else None,
+            "method": method,
+            "confidence": confidence,
+            **details,
+        }
+
+    def _passt_vorzeichen(self, position: int, cent: int) -> bool:
+        art = self._art[position]
+        return not art or (art == "EK") == (cent < 0)
+
+    def match(self, zahlung: dict, schluessel: list[str] | None = None) -> dict:
+        """
+        Zuordnung einer Zahlung
+        Args:
+            schluessel: bereits ermittelte payment_keys(zahlung)
+        Returns:
+            dict: zahlung_id, rechnung_id, rechnungsnummer, method (exakt/referenz/betrag_datum oder None),
+                  confidence (high/medium/low), betrag_differenz und ggf. tage bzw. doppelt
+        """
+        zahlung_id = _feld(zahlung, ZAHLUNG_FELDER["id"])
+        cent = _cent(_feld(zahlung, ZAHLUNG_FELDER["betrag"]))
+        if cent is None:
+            return self._ergebnis(zahlung_id, None, None, None)
+        betrag = abs(cent)
+
+        # Referenzen: unter allen Treffern der mit dem passendsten Betrag, noch nicht vergebene zuerst
+        kandidaten = []
+        for referenz in payment_keys(zahlung) if schluessel is None else schluessel:
+            kandidaten.extend(self.index.get(referenz, ()))
+        kandidaten = [position for position in dict.fromkeys(kandidaten) if self._passt_vorzeichen(position, cent)]
+        if kandidaten:
+            offen = [position for position in kandidaten if not self._vergeben[position]]
+            position = min(offen or kandidaten, key=lambda p: abs(int(self._cent[p]) - betrag))
+            differenz = betrag - int(self._cent[position])
+            method = "exakt" if differenz == 0 else "referenz"
+            bezahlt = abs(differenz) <= self._cent[position] * REFERENZ_TOLERANZ
+            if not offen:
+                # Die Rechnung ist schon bezahlt: doppelte oder zurückgebuchte Zahlung, nur zur Prüfung melden
+                return self._ergebnis(zahlung_id, position, method, "medium" if bezahlt else "low",
+                                      betrag_differenz=differenz / 100, doppelt=True)
+            self._vergeben[position] = True
+            return self._ergebnis(zahlung_id, position, method, "high" if bezahlt else "medium",
+                                  betrag_differenz=differenz / 100)
+
+        # Betrag ± Toleranz im sortierten Index, dann Datumsfenster
+        tag = _tag(_feld(zahlung, ZAHLUNG_FELDER["datum"]))
+        if tag is None:
+            return self._ergebnis(zahlung_id, None, None, None)
+        von = np.searchsorted(self._sortiert_cent, betrag - BETRAG_TOLERANZ_CENT, side="left")
+        bis = np.searchsorted(self._sortiert_cent, betrag + BETRAG_TOLERANZ_CENT, side="right")
+        if von == bis:
+            return self._ergebnis(zahlung_id, None, None, None)
+        tage = tag - self._sortiert_tag[von:bis]
+        positionen = self._sortiert_position[von:bis]
+        offen = (tage >= DATUM_FENSTER_TAGE[0]) & (tage <= DATUM_FENSTER_TAGE[1]) & ~self._vergeben[positionen]
+        if not offen.any():
+            return self._ergebnis(zahlung_id, None, None, None)
+        differenzen = np.abs(self._sortiert_cent[von:bis] - betrag)
+        score = np.where(offen, differenzen / 100 + np.abs(tage) * 0.1, np.inf)
+        for i in np.argsort(score, kind="stable"):
+            if not offen[i]:
+                break
+            position = int(positionen[i])
+            if differenzen[i] >= BETRAG_MAX_DIFFERENZ_CENT or not self._passt_vorzeichen(position, cent):
+                continue
+            self._vergeben[position] = True
+            confidence = "high" if score[i] < 0.25 else "medium" if score[i] < 1.0 else "low"
+            return self._ergebnis(zahlung_id, position, "betrag_datum", confidence,
+                                  betrag_differenz=float(differenzen[i]) / 100, tage=int(tage[i]))
+        return self._ergebnis(zahlung_id, None, None, None)
+
+    def match_all(self, zahlungen):
+        """Zuordnungen in der Reihenfolge der Zahlungen; zuerst alle Referenz-Treffer, damit betrag_datum
+        keine Rechnung vergibt, die eine spätere Zahlung per Referenz bezahlt. Zahlungen ohne ID bekommen
+        ihre Position in zahlungen als zahlung_id."""
+        zahlungen = list(zahlungen)
+        ergebnisse: list[dict | None] = [None] * len(zahlungen)
+        ohne_referenz = []
+        for nummer, zahlung in enumerate(zahlungen):
+            schluessel = payment_keys(zahlung)
+            if any(referenz in self.index for referenz in schluessel):
+                ergebnisse[nummer] = self.match(zahlung, schluessel)
+            else:
+                ohne_referenz.append(nummer)
+        for nummer in ohne_referenz:
+            ergebnisse[nummer] = self.match(zahlungen[nummer])
+        for nummer, ergebnis in enumerate(ergebnisse):
+            if ergebnis["zahlung_id"] is None:
+                ergebnis["zahlung_id"] = nummer
+        return ergebnisse
+
+
+def naive_match(zahlung: dict, rechnungen: list[dict]) -> str | None:
+    """Bisheriges Vorgehen zum Vergleich: alle Rechnungen pro Zahlung durchsuchen (dual-matcher.ts)."""
+    text = " ".join(str(zahlung.get(feld) or "") for feld in ZAHLUNG_TEXT_FELDER)
+    for treffer in REFERENZ_MUSTER.finditer(text):
+        for rechnung in rechnungen:
+            nummer = str(_feld(rechnung, RECHNUNG_FELDER["rechnungsnummer"]) or "")
+            bestellnummer = str(_feld(rechnung, RECHNUNG_FELDER["bestellnummer"]) or "")
+            if treffer.group(0) in (nummer, bestellnummer) or (bestellnummer and treffer.group(0) in bestellnummer):
+                return nummer
+    cent, tag = abs(_cent(zahlung["betrag"])), _tag(zahlung["datum"])
+    kandidaten = [
+        r for r in rechnungen
+        if abs(_cent(r["brutto"]) - cent) < BETRAG_TOLERANZ_CENT
+        and DATUM_FENSTER_TAGE[0] <= tag - _tag(r["datum"]) <= DATUM_FENSTER_TAGE[1]
+    ]
+    kandidaten.sort(key=lambda r: abs(_cent(r["brutto"]) - cent))
+    if kandidaten and abs(_cent(kandidaten[0]["brutto"]) - cent) < BETRAG_MAX_DIFFERENZ_CENT:
+        return kandidaten[0]["rechnungsnummer"]
+    return None
+
+
+def benchmark_data(anzahl: int, seed: int = 42) -> tuple[list[dict], list[dict]]:
+    """
+    Synthetische Rechnungen und Zahlungen im Mix der Oktober-Daten
+    Returns:
+        tuple: (Rechnungen, Zahlungen mit "erwartet" = Rechnungsnummer)
+    """
+    zufall = random.Random(seed)
+    start = datetime.date(2025, 10, 1).toordinal()
+    rechnungen, zahlungen = [], []
+    for i in range(anzahl):
+        datum = datetime.date.fromordinal(start + zufall.randrange(31))
+        brutto = zufall.randrange(500, 250000) / 100
+        art = zufall.random()
+        if art < 0.45:
+            nummer, bestellnummer = f"XRE-{10000 + i}", f"{zufall.randrange(100, 999)}-{zufall.randrange(10**6, 10**7)}-{i:07d}"
+            text = f"Amazon {bestellnummer}"
+        elif art < 0.70:
+            nummer, bestellnummer = f"RE2025-{90000 + i}", f"AU_{20000 + i}_SW6"
+            text = f"PayPal Zahlung {bestellnummer}"
+        elif art < 0.85:
+            nummer, bestellnummer = f"RE2025-{90000 + i}", None
+            text = f"Rechnung {nummer} Kunde {i}"
+        else:
+            nummer, bestellnummer, text = f"RE2025-{90000 + i}", None, f"Kunde {i} Danke"
+        rechnungen.append({"id": str(i), "rechnungsnummer": nummer, "bestellnummer": bestellnummer,
+                           "brutto": brutto, "datum": datum.isoformat(), "art": "VK"})
+        # Gebühren bei einem Teil der Referenz-Zahlungen
+        betrag = brutto if text.startswith("Kunde") or zufall.random() < 0.7 else round(brutto * 0.985, 2)
+        zahlungen.append({"id": f"z{i}", "betrag": betrag, "verwendungszweck": text, "erwartet": nummer,
+                          "datum": (datum + datetime.timedelta(days=zufall.randrange(4))).isoformat()})
+    zufall.shuffle(zahlungen)
+    return rechnungen, zahlungen
+
+
+def run_benchmark(faktor: int = 10) -> dict:
+    anzahl = OKTOBER_ZAHLUNGEN * faktor
+    rechnungen, zahlungen = benchmark_data(anzahl)
+
+    start = time.perf_counter()
+    matcher = PaymentMatcher(rechnungen)
+    index_sekunden = time.perf_counter() - start
+    start = time.perf_counter()
+    ergebnisse = matcher.match_all(zahlungen)
+    match_sekunden = time.perf_counter() - start
+
+    methoden: dict[str, int] = {}
+    richtig = 0
+    for zahlung, ergebnis in zip(zahlungen, ergebnisse):
+        methoden[ergebnis["method"] or "ohne"] = methoden.get(ergebnis["method"] or "ohne", 0) + 1
+        richtig += ergebnis["rechnungsnummer"] == zahlung["erwartet"]
+
+    # Bisheriges Durchsuchen nur an einer Stichprobe messen und hochrechnen
+    stichprobe = zahlungen[:50]
+    start = time.perf_counter()
+    for zahlung in stichprobe:
+        naive_match(zahlung, rechnungen)
+    naive_pro_zahlung = (time.perf_counter() - start) / len(stichprobe)
+
+    return {
+        "zahlungen": anzahl,
+        "rechnungen": len(rechnungen),
+        "index_sekunden": round(index_sekunden, 3),
+        "match_sekunden": round(match_sekunden, 3),
+        "mikrosekunden_pro_zahlung": round(match_sekunden / anzahl * 1e6, 1),
+        "methoden": methoden,
+        "richtig": round(richtig / anzahl, 4),
+        "naive_sekunden_hochgerechnet": round(naive_pro_zahlung * anzahl, 1),
+    }
+
+
+def _jsonl(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(zeile) for zeile in f if zeile.strip()]
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Zahlungen offenen Rechnungen zuordnen")
+    cli.add_argument("--rechnungen", help="JSON-Zeilen mit offenen VK-/EK-Rechnungen")
+    cli.add_argument("--zahlungen", help="JSON-Zeilen mit Zahlungen (z.B. aus bank_csv_importer)")
+    cli.add_argument("-o", "--output", default="-", help="Ziel für die Zuordnungen (Standard: stdout)")
+    cli.add_argument("--benchmark", action="store_true", help="Synthetischer Benchmark statt Zuordnung")
+    cli.add_argument("--faktor", type=int, default=10, help="Benchmark: Vielfaches des Oktober-Volumens")
+    args = cli.parse_args()
+
+    if args.benchmark:
+        with log.timed("payment_match_benchmark", factor=args.faktor):
+            print(json.dumps(run_benchmark(args.faktor), ensure_ascii=False))
+        return
+    if not args.rechnungen or not args.zahlungen:
+        cli.error("--rechnungen und --zahlungen (oder --benchmark) angeben")
+
+    try:
+        with log.timed("payment_match") as felder:
+            matcher = PaymentMatcher(_jsonl(args.rechnungen))
+            ergebnisse = matcher.match_all(_jsonl(args.zahlungen))
+            felder.update(payments=len(ergebnisse), matched=sum(1 for e in ergebnisse if e["method"]),
+                          duplicates=sum(1 for e in ergebnisse if e.get("doppelt")))
+        ausgabe = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            ausgabe.writelines(json.dumps(ergebnis, ensure_ascii=False) + "\n" for ergebnis in ergebnisse)
+        finally:
+            if ausgabe is not sys.stdout:
+                ausgabe.close()
+    except (OSError, ValueError) as e:
+        log.error("payment_match_failed", str(e))
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@
 const { MongoClient, ObjectId } = require('mongodb');
 const { spawn } = require('child_process');
 const fs = require('fs');
+const { cleanupUploads, drainLlmQueue, markQueued, startUploadBatch } = require('./drain-llm-queue');
 
 // Lade ENV
 const envContent = fs.readFileSync('/app/.env', 'utf-8');
@@ -18,7 +19,7 @@ envContent.split('\n').forEach(line => {
 const MONGO_URL = env.MONGO_URL || 'mongodb://localhost:27017/score_zentrale';
 const EMERGENT_LLM_KEY = env.GOOGLE_API_KEY || env.EMERGENT_LLM_KEY || '';
 
-async function callGeminiParser(pdfBase64, emailContext) {
+async function callGeminiParser(pdfBase64, emailContext, id) {
   return new Promise((resolve, reject) => {
     const python = spawn('python3', ['/app/python_libs/emergent_gemini_parser.py'], {
       env: { 
@@ -54,6 +55,7 @@ async function callGeminiParser(pdfBase64, emailContext) {
     });
     
     const input = {
+      id,
       pdf_base64: pdfBase64,
       filename: '',
       email_context: emailContext
@@ -66,6 +68,7 @@ async function callGeminiParser(pdfBase64, emailContext) {
 async function main() {
   const batchSize = parseInt(process.argv[2] || '50', 10);
   const dryRun = process.argv.includes('--dry-run');
+  startUploadBatch('batch-gemini-only');
   
   console.log('🤖 Gemini-Only Batch-Processing\n');
   console.log(`Batch-Size: ${batchSize}`);
@@ -86,12 +89,15 @@ async function main() {
   
   if (toProcess.length === 0) {
     console.log('✅ Keine PDFs zu verarbeiten!');
+    await drainLlmQueue(db, { dryRun });
+    await cleanupUploads();
     await client.close();
     return;
   }
   
   let successCount = 0;
   let errorCount = 0;
+  let queuedCount = 0;
   let parsedWithAmount = 0;
   let totalAmount = 0;
   
@@ -108,7 +114,15 @@ async function main() {
         body: email.bodyText || ''
       };
       
-      const parsed = await callGeminiParser(email.pdfBase64, emailContext);
+      const parsed = await callGeminiParser(email.pdfBase64, emailContext, email._id.toString());
+      
+      if (parsed.queued) {
+        // Gemini überlastet: liegt in der LLM-Warteschlange, wird am Ende nachgeholt
+        console.log(`   ⏸️  Zurückgestellt (${parsed.error})`);
+        if (!dryRun) await markQueued(inboxCol, email, parsed);
+        queuedCount++;
+        continue;
+      }
       
       if (!parsed.success) {
         console.log(`   ❌ ${parsed.error}`);
@@ -173,6 +187,9 @@ async function main() {
     }
   }
   
+  // Zurückgestellte PDFs (auch aus früheren Läufen) nachholen
+  const drained = await drainLlmQueue(db, { dryRun });
+  
   console.log('\n' + '='.repeat(60));
   console.log('📊 ZUSAMMENFASSUNG');
   console.log('='.repeat(60));
@@ -181,6 +198,8 @@ async function main() {
   console.log(`💰 Mit Betrag: ${parsedWithAmount}`);
   console.log(`💶 Gesamt-Betrag: ${totalAmount.toFixed(2)}€`);
   console.log(`❌ Fehler:   ${errorCount}`);
+  console.log(`⏸️  Zurückgestellt: ${queuedCount}`);
+  console.log(`   └─ nachgeholt: ${drained.success}, erneut zurückgestellt: ${drained.queued}, Fehler: ${drained.failed}`);
   
   if (!dryRun) {
     const totalEK = await ekCol.countDocuments();
@@ -191,6 +210,8 @@ async function main() {
     console.log(`Mit Betrag > 0: ${withBetrag} (${(withBetrag/totalEK*100).toFixed(1)}%)`);
   }
   
+  // Gemini-Uploads dieses Laufs löschen (siehe drain-llm-queue.js)
+  await cleanupUploads();
   await client.close();
   console.log('\n✅ Fertig!');
 }
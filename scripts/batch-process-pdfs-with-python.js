@@ -17,9 +17,48 @@ envContent.split('\n').forEach(line => {
 
 const MONGO_URL = env.MONGO_URL || 'mongodb://localhost:27017/score_zentrale';
 
+// Budget pro PDF (Sekunden). Der Python-Parser bricht selbst mit status 'timeout' ab,
+// der Prozess wird zur Sicherheit kurz danach hart beendet.
+const DOCUMENT_TIMEOUT_S = parseFloat(process.env.INVOICE_DOCUMENT_TIMEOUT || env.INVOICE_DOCUMENT_TIMEOUT || '120');
+const KILL_GRACE_MS = 15000;
+
+function watchProcess(python, stage, resolve) {
+  const timer = setTimeout(() => {
+    python.kill('SIGKILL');
+    resolve({
+      success: false,
+      status: 'timeout',
+      stage,
+      error: `Prozess nach ${DOCUMENT_TIMEOUT_S} s ohne Ergebnis beendet`
+    });
+  }, DOCUMENT_TIMEOUT_S * 1000 + KILL_GRACE_MS);
+  python.on('close', () => clearTimeout(timer));
+}
+
+async function quarantineEmail(inboxCol, email, parsed) {
+  // Nicht erneut verarbeiten - gleiche Rolle wie der Quarantäne-Ordner bei main.py
+  await inboxCol.updateOne(
+    { _id: email._id },
+    {
+      $set: {
+        status: 'quarantine',
+        quarantine: {
+          status: parsed.status,
+          stage: parsed.stage,
+          error: parsed.error,
+          at: new Date()
+        }
+      }
+    }
+  );
+}
+
 async function callPythonParser(pdfBase64, filename) {
   return new Promise((resolve, reject) => {
-    const python = spawn('python3', ['/app/python_libs/fibu_invoice_parser.py']);
+    const python = spawn('python3', ['/app/python_libs/fibu_invoice_parser.py'], {
+      env: { ...process.env, INVOICE_DOCUMENT_TIMEOUT: String(DOCUMENT_TIMEOUT_S) }
+    });
+    watchProcess(python, 'python-parser', resolve);
     
     let stdout = '';
     let stderr = '';
@@ -87,6 +126,7 @@ async function main() {
   
   let successCount = 0;
   let errorCount = 0;
+  let quarantineCount = 0;
   let parsedWithAmount = 0;
   let totalAmount = 0;
   
@@ -100,6 +140,13 @@ async function main() {
       // Rufe Python-Parser auf
       const parsed = await callPythonParser(email.pdfBase64, email.filename);
       
+      if (parsed.status === 'timeout') {
+        console.log(`   ⏱️  Timeout in Stufe ${parsed.stage} - Quarantäne`);
+        if (!dryRun) await quarantineEmail(inboxCol, email, parsed);
+        quarantineCount++;
+        continue;
+      }
+      
       if (!parsed.success) {
         console.log(`   ⚠️  ${parsed.error}`);
         errorCount++;
@@ -128,6 +175,7 @@ async function main() {
           parsing: {
             method: parsed.parsing_method,
             confidence: parsed.confidence,
+            parserVersion: parsed.parser_version || null,
             parsedAt: new Date()
           },
           needsManualReview: !parsed.kreditor || parsed.gesamtbetrag === 0,
@@ -180,6 +228,7 @@ async function main() {
   console.log(`💰 Mit Betrag: ${parsedWithAmount}`);
   console.log(`💶 Gesamt-Betrag: ${totalAmount.toFixed(2)}€`);
   console.log(`❌ Fehler:   ${errorCount}`);
+  console.log(`⏱️  Quarantäne: ${quarantineCount}`);
   console.log(`📊 Erfolgsrate: ${(successCount/toProcess.length*100).toFixed(1)}%`);
   
   if (!dryRun) {
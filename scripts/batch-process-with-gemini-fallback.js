@@ -7,6 +7,7 @@
 const { MongoClient, ObjectId } = require('mongodb');
 const { spawn } = require('child_process');
 const fs = require('fs');
+const { cleanupUploads, drainLlmQueue, markQueued, startUploadBatch } = require('./drain-llm-queue');
 
 // Lade ENV
 const envContent = fs.readFileSync('/app/.env', 'utf-8');
@@ -24,9 +25,57 @@ if (!EMERGENT_LLM_KEY) {
   console.log('⚠️  WARNUNG: GOOGLE_API_KEY nicht gesetzt. Gemini-Fallback deaktiviert.');
 }
 
-async function callPythonParser(pdfBase64, filename) {
+let useGeminiFallback = false;
+
+// Budget pro PDF (Sekunden). Der Python-Parser bricht selbst mit status 'timeout' ab,
+// der Prozess wird zur Sicherheit kurz danach hart beendet.
+const DOCUMENT_TIMEOUT_S = parseFloat(process.env.INVOICE_DOCUMENT_TIMEOUT || env.INVOICE_DOCUMENT_TIMEOUT || '120');
+const KILL_GRACE_MS = 15000;
+
+function watchProcess(python, stage, resolve) {
+  const timer = setTimeout(() => {
+    python.kill('SIGKILL');
+    resolve({
+      success: false,
+      status: 'timeout',
+      stage,
+      error: `Prozess nach ${DOCUMENT_TIMEOUT_S} s ohne Ergebnis beendet`
+    });
+  }, DOCUMENT_TIMEOUT_S * 1000 + KILL_GRACE_MS);
+  python.on('close', () => clearTimeout(timer));
+}
+
+async function quarantineEmail(inboxCol, email, parsed) {
+  // Nicht erneut verarbeiten - gleiche Rolle wie der Quarantäne-Ordner bei main.py
+  await inboxCol.updateOne(
+    { _id: email._id },
+    {
+      $set: {
+        status: 'quarantine',
+        quarantine: {
+          status: parsed.status,
+          stage: parsed.stage,
+          error: parsed.error,
+          at: new Date()
+        }
+      }
+    }
+  );
+}
+
+async function callPythonParser(pdfBase64, filename, emailContext, id) {
   return new Promise((resolve, reject) => {
-    const python = spawn('python3', ['/app/python_libs/fibu_invoice_parser.py']);
+    // Gescannte PDFs gibt der Python-Parser selbst an Gemini weiter (braucht dafür Key + E-Mail-Kontext)
+    const python = spawn('python3', ['/app/python_libs/fibu_invoice_parser.py'], {
+      env: { 
+        ...process.env,
+        EMERGENT_LLM_KEY: EMERGENT_LLM_KEY,
+        GOOGLE_API_KEY: GOOGLE_API_KEY,
+        FIBU_SCAN_LLM: useGeminiFallback ? '1' : '0',
+        INVOICE_DOCUMENT_TIMEOUT: String(DOCUMENT_TIMEOUT_S)
+      }
+    });
+    watchProcess(python, 'python-parser', resolve);
     
     let stdout = '';
     let stderr = '';
@@ -53,12 +102,12 @@ async function callPythonParser(pdfBase64, filename) {
       }
     });
     
-    python.stdin.write(JSON.stringify({ pdf_base64: pdfBase64, filename }));
+    python.stdin.write(JSON.stringify({ id, pdf_base64: pdfBase64, filename, email_context: emailContext }));
     python.stdin.end();
   });
 }
 
-async function callGeminiParser(pdfBase64, emailContext) {
+async function callGeminiParser(pdfBase64, emailContext, id) {
   return new Promise((resolve, reject) => {
     const python = spawn('python3', ['/app/python_libs/emergent_gemini_parser.py'], {
       env: { 
@@ -67,6 +116,7 @@ async function callGeminiParser(pdfBase64, emailContext) {
         GOOGLE_API_KEY: GOOGLE_API_KEY
       }
     });
+    watchProcess(python, 'gemini-parser', resolve);
     
     let stdout = '';
     let stderr = '';
@@ -95,6 +145,7 @@ async function callGeminiParser(pdfBase64, emailContext) {
     
     // Sende Input via stdin
     const input = {
+      id,
       pdf_base64: pdfBase64,
       filename: '',
       email_context: emailContext
@@ -107,7 +158,9 @@ async function callGeminiParser(pdfBase64, emailContext) {
 async function main() {
   const batchSize = parseInt(process.argv[2] || '200', 10);
   const dryRun = process.argv.includes('--dry-run');
+  startUploadBatch('batch-process-with-gemini-fallback');
   const useGemini = process.argv.includes('--gemini') || !process.argv.includes('--no-gemini');
+  useGeminiFallback = useGemini && !!GOOGLE_API_KEY;
   
   console.log('🤖 Hybrid Batch-Processing: Python + Gemini\n');
   console.log(`Batch-Size: ${batchSize}`);
@@ -134,6 +187,8 @@ async function main() {
   
   if (toProcess.length === 0) {
     console.log('✅ Keine PDFs zu verarbeiten!');
+    if (useGeminiFallback) await drainLlmQueue(db, { dryRun });
+    await cleanupUploads();
     await client.close();
     return;
   }
@@ -142,6 +197,8 @@ async function main() {
   let errorCount = 0;
   let pythonSuccessCount = 0;
   let geminiSuccessCount = 0;
+  let quarantineCount = 0;
+  let queuedCount = 0;
   let parsedWithAmount = 0;
   let totalAmount = 0;
   
@@ -154,28 +211,59 @@ async function main() {
     let parsed = null;
     let parsingMethod = 'none';
     
+    const emailContext = {
+      from: email.emailFrom,
+      subject: email.subject,
+      body: email.bodyText || ''
+    };
+    
     try {
-      // 1. Versuche Python-Parser
-      parsed = await callPythonParser(email.pdfBase64, email.filename);
+      // 1. Versuche Python-Parser (Scans gehen dort direkt an Gemini)
+      parsed = await callPythonParser(email.pdfBase64, email.filename, emailContext, email._id.toString());
       
-      if (parsed.success) {
+      if (parsed.queued) {
+        // Scan, Gemini überlastet: liegt in der LLM-Warteschlange, wird am Ende nachgeholt
+        console.log(`   ⏸️  [Gemini, Scan] Zurückgestellt (${parsed.error})`);
+        if (!dryRun) await markQueued(inboxCol, email, parsed);
+        queuedCount++;
+        continue;
+      } else if (parsed.status === 'timeout') {
+        // Pathologisches PDF: nicht an Gemini weitergeben, sondern zurückstellen
+        console.log(`   ⏱️  [Python] Timeout in Stufe ${parsed.stage} - Quarantäne`);
+        if (!dryRun) await quarantineEmail(inboxCol, email, parsed);
+        quarantineCount++;
+        continue;
+      } else if (parsed.success && parsed.pdf_typ === 'scan') {
+        parsingMethod = 'gemini';
+        geminiSuccessCount++;
+        console.log(`   ✅ [Gemini, Scan] ${parsed.lieferant}`);
+      } else if (parsed.success) {
         parsingMethod = 'python';
         pythonSuccessCount++;
         console.log(`   ✅ [Python] ${parsed.lieferant}`);
+      } else if (parsed.pdf_typ === 'scan' && useGeminiFallback) {
+        // Scan wurde bereits von Gemini versucht - kein zweiter Aufruf
+        console.log(`   ❌ [Gemini, Scan] ${parsed.error}`);
+        errorCount++;
+        continue;
       } else {
         // 2. Fallback zu Gemini
         if (useGemini && GOOGLE_API_KEY) {
           console.log(`   🔄 [Python] ${parsed.error} - Versuche Gemini...`);
           
-          const emailContext = {
-            from: email.emailFrom,
-            subject: email.subject,
-            body: email.bodyText || ''
-          };
-          
-          parsed = await callGeminiParser(email.pdfBase64, emailContext);
+          parsed = await callGeminiParser(email.pdfBase64, emailContext, email._id.toString());
           
-          if (parsed.success) {
+          if (parsed.queued) {
+            console.log(`   ⏸️  [Gemini] Zurückgestellt (${parsed.error})`);
+            if (!dryRun) await markQueued(inboxCol, email, parsed);
+            queuedCount++;
+            continue;
+          } else if (parsed.status === 'timeout') {
+            console.log(`   ⏱️  [Gemini] Timeout - Quarantäne`);
+            if (!dryRun) await quarantineEmail(inboxCol, email, parsed);
+            quarantineCount++;
+            continue;
+          } else if (parsed.success) {
             parsingMethod = 'gemini';
             geminiSuccessCount++;
             console.log(`   ✅ [Gemini] ${parsed.lieferant}`);
@@ -213,6 +301,7 @@ async function main() {
           parsing: {
             method: parsed.parsing_method,
             confidence: parsed.confidence,
+            parserVersion: parsed.parser_version || null,
             parsedAt: new Date()
           },
           needsManualReview: !parsed.kreditor || parsed.gesamtbetrag === 0,
@@ -252,6 +341,9 @@ async function main() {
     }
   }
   
+  // Zurückgestellte PDFs (auch aus früheren Läufen) nachholen
+  const drained = useGeminiFallback ? await drainLlmQueue(db, { dryRun }) : { success: 0, failed: 0, queued: 0 };
+  
   console.log('\n' + '='.repeat(60));
   console.log('📊 ZUSAMMENFASSUNG');
   console.log('='.repeat(60));
@@ -262,6 +354,9 @@ async function main() {
   console.log(`💰 Mit Betrag: ${parsedWithAmount}`);
   console.log(`💶 Gesamt-Betrag: ${totalAmount.toFixed(2)}€`);
   console.log(`❌ Fehler:   ${errorCount}`);
+  console.log(`⏱️  Quarantäne: ${quarantineCount}`);
+  console.log(`⏸️  Zurückgestellt: ${queuedCount}`);
+  console.log(`   └─ nachgeholt: ${drained.success}, erneut zurückgestellt: ${drained.queued}, Fehler: ${drained.failed}`);
   console.log(`📊 Erfolgsrate: ${(successCount/toProcess.length*100).toFixed(1)}%`);
   
   if (!dryRun) {
@@ -277,6 +372,8 @@ async function main() {
     console.log('\n⚠️  DRY-RUN: Keine Änderungen gespeichert!');
   }
   
+  // Gemini-Uploads dieses Laufs löschen (siehe drain-llm-queue.js)
+  await cleanupUploads();
   await client.close();
   console.log('\n✅ Fertig!');
 }
@@ -0,0 +1,248 @@
+#!/usr/bin/env node
+
+/**
+ * Zurückgestellte Gemini-Dokumente nachverarbeiten
+ *
+ * Ist der LLM-Anbieter überlastet (Circuit offen, siehe python_libs/invoice_parsers/helpers/llm_limiter.py),
+ * stellen die Parser das PDF in die LLM-Warteschlange zurück und antworten mit queued: true.
+ * Die Batch-Skripte setzen die E-Mail dann auf status 'llm_queued' und rufen am Ende drainLlmQueue() auf;
+ * Dokumente, die dabei erneut zurückgestellt werden, holt der nächste Lauf ab.
+ *
+ * Uploads bei Gemini (python_libs/invoice_parsers/file_handlers/upload_registry.py): startUploadBatch() setzt
+ * LLM_UPLOAD_BATCH für alle Parser-Prozesse des Laufs, cleanupUploads() löscht am Ende genau deren Uploads.
+ *
+ * Eigenständig (z.B. als Cron alle 15 Minuten):
+ *   node /app/scripts/drain-llm-queue.js
+ * (mit --dry-run bleibt die Warteschlange unangetastet)
+ */
+
+const { MongoClient, ObjectId } = require('mongodb');
+const { spawn } = require('child_process');
+const fs = require('fs');
+
+// Lade ENV
+const envContent = fs.existsSync('/app/.env') ? fs.readFileSync('/app/.env', 'utf-8') : '';
+const env = {};
+envContent.split('\n').forEach(line => {
+  const match = line.match(/^([^=]+)=(.*)$/);
+  if (match) env[match[1]] = match[2];
+});
+
+const MONGO_URL = env.MONGO_URL || 'mongodb://localhost:27017/score_zentrale';
+const EMERGENT_LLM_KEY = env.GOOGLE_API_KEY || env.EMERGENT_LLM_KEY || '';
+
+function retryQueued() {
+  return new Promise((resolve, reject) => {
+    const python = spawn('python3', ['/app/python_libs/emergent_gemini_parser.py', '--retry-queued'], {
+      env: {
+        ...process.env,
+        EMERGENT_LLM_KEY: EMERGENT_LLM_KEY,
+        GOOGLE_API_KEY: EMERGENT_LLM_KEY
+      }
+    });
+
+    let stdout = '';
+    let stderr = '';
+
+    python.stdout.on('data', (data) => {
+      stdout += data.toString();
+    });
+
+    python.stderr.on('data', (data) => {
+      stderr += data.toString();
+    });
+
+    python.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(`Gemini exited with code ${code}: ${stderr}`));
+        return;
+      }
+
+      // Eine Zeile {"id", "result"} pro Dokument; ohne Key/Paket nur eine Statuszeile ohne id
+      const results = [];
+      for (const line of stdout.split('\n')) {
+        if (!line.trim()) continue;
+        try {
+          const row = JSON.parse(line);
+          if (row.id) {
+            results.push(row);
+          } else {
+            console.log(`   ⚠️  ${row.error || line}`);
+          }
+        } catch (error) {
+          reject(new Error(`JSON parse error: ${error.message}`));
+          return;
+        }
+      }
+      resolve(results);
+    });
+
+    python.stdin.end();
+  });
+}
+
+function startUploadBatch(name) {
+  // Von allen Parser-Prozessen geerbt (spawn mit ...process.env bzw. ohne env)
+  if (!process.env.LLM_UPLOAD_BATCH) {
+    process.env.LLM_UPLOAD_BATCH = `${name}-${process.pid}-${Date.now()}`;
+  }
+  return process.env.LLM_UPLOAD_BATCH;
+}
+
+function cleanupUploads(batch = process.env.LLM_UPLOAD_BATCH) {
+  return new Promise((resolve) => {
+    if (!batch) {
+      resolve(0);
+      return;
+    }
+    const python = spawn('python3', ['/app/python_libs/gemini_invoice_parser.py', '--cleanup', '--upload-batch', batch], {
+      env: {
+        ...process.env,
+        GOOGLE_API_KEY: EMERGENT_LLM_KEY
+      }
+    });
+
+    let stdout = '';
+
+    python.stdout.on('data', (data) => {
+      stdout += data.toString();
+    });
+
+    python.on('close', () => {
+      // Ohne google-generativeai/Key gibt es nichts aufzuräumen; abgelaufene Uploads holt der nächste Lauf
+      try {
+        const result = JSON.parse(stdout);
+        if (result.success) {
+          resolve(result.deleted);
+          return;
+        }
+        console.log(`   ⚠️  Uploads nicht aufgeräumt: ${result.error}`);
+      } catch (error) {
+        console.log(`   ⚠️  Uploads nicht aufgeräumt: ${error.message}`);
+      }
+      resolve(0);
+    });
+
+    python.stdin.end();
+  });
+}
+
+async function markQueued(inboxCol, email, parsed) {
+  // Nicht erneut als pending abholen - die Warteschlange liefert das Ergebnis nach
+  await inboxCol.updateOne(
+    { _id: email._id, status: 'pending' },
+    {
+      $set: {
+        status: 'llm_queued',
+        llmQueue: {
+          error: parsed.error,
+          retryIn: parsed.retry_in,
+          at: new Date()
+        }
+      }
+    }
+  );
+}
+
+async function drainLlmQueue(db, { dryRun = false } = {}) {
+  const counts = { success: 0, failed: 0, queued: 0 };
+  if (dryRun) return counts;
+
+  const ekCol = db.collection('fibu_ek_rechnungen');
+  const inboxCol = db.collection('fibu_email_inbox');
+
+  let results;
+  try {
+    results = await retryQueued();
+  } catch (error) {
+    // Das Ergebnis des Batch-Laufs bleibt davon unberührt
+    console.log(`   ⚠️  LLM-Warteschlange nicht verarbeitet: ${error.message}`);
+    return counts;
+  }
+  if (results.length > 0) {
+    console.log(`\n⏸️  ${results.length} zurückgestellte PDFs aus der LLM-Warteschlange`);
+  }
+
+  for (const { id, result: parsed } of results) {
+    const emailId = ObjectId.isValid(id) ? new ObjectId(id) : null;
+
+    if (parsed && parsed.queued) {
+      console.log(`   ⏸️  ${id} erneut zurückgestellt (${parsed.error})`);
+      counts.queued++;
+      continue;
+    }
+    if (!emailId) {
+      console.log(`   ⚠️  ${id}: keine E-Mail-ID, Ergebnis verworfen`);
+      counts.failed++;
+      continue;
+    }
+    if (!parsed || !parsed.success) {
+      console.log(`   ❌ ${id} ${parsed ? parsed.error : 'kein Ergebnis'}`);
+      // Zurück in den normalen Ablauf
+      await inboxCol.updateOne(
+        { _id: emailId, status: 'llm_queued' },
+        { $set: { status: 'pending' }, $unset: { llmQueue: '' } }
+      );
+      counts.failed++;
+      continue;
+    }
+
+    const ekRechnung = {
+      lieferantName: parsed.lieferant,
+      rechnungsNummer: parsed.rechnungsnummer,
+      rechnungsdatum: new Date(parsed.datum),
+      gesamtBetrag: parsed.gesamtbetrag,
+      nettoBetrag: parsed.nettobetrag,
+      steuerBetrag: parsed.steuerbetrag,
+      steuersatz: parsed.steuersatz,
+      kreditorKonto: parsed.kreditor,
+      aufwandskonto: '5200',
+      sourceEmailId: id,
+      parsing: {
+        method: parsed.parsing_method,
+        confidence: parsed.confidence,
+        parserVersion: parsed.parser_version || null,
+        parsedAt: new Date()
+      },
+      needsManualReview: !parsed.kreditor || parsed.gesamtbetrag === 0
+    };
+
+    await ekCol.updateOne(
+      { sourceEmailId: id },
+      { $set: ekRechnung, $setOnInsert: { created_at: new Date() } },
+      { upsert: true }
+    );
+    await inboxCol.updateOne(
+      { _id: emailId },
+      { $set: { status: 'processed', processedAt: new Date() }, $unset: { llmQueue: '' } }
+    );
+
+    console.log(`   ✅ [Gemini, nachgeholt] ${parsed.lieferant} | ${parsed.gesamtbetrag}€`);
+    counts.success++;
+  }
+
+  return counts;
+}
+
+async function main() {
+  const dryRun = process.argv.includes('--dry-run');
+
+  console.log(`[${new Date().toISOString()}] LLM-Warteschlange nachverarbeiten...`);
+
+  const client = await MongoClient.connect(MONGO_URL);
+  try {
+    const counts = await drainLlmQueue(client.db(), { dryRun });
+    console.log(`✅ Erfolg: ${counts.success} | ❌ Fehler: ${counts.failed} | ⏸️  Zurückgestellt: ${counts.queued}`);
+  } finally {
+    await client.close();
+  }
+}
+
+module.exports = { cleanupUploads, drainLlmQueue, markQueued, startUploadBatch };
+
+if (require.main === module) {
+  main().catch(err => {
+    console.error('❌ Fehler:', err);
+    process.exit(1);
+  });
+}
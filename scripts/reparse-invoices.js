@@ -5,16 +5,21 @@
  * 
  * Findet alle processed Email-Inbox Items die keine entsprechende EK-Rechnung haben
  * und verarbeitet sie neu
+ *
+ * --stale [--method python-pferd-parser]
+ *   Verarbeitet nur EK-Rechnungen neu, deren Python-Parser sich seit dem Parsen geändert hat
+ *   (parsing.parserVersion weicht von fibu_invoice_parser.py --versions ab)
  */
 
-const { MongoClient } = require('mongodb')
+const { MongoClient, ObjectId } = require('mongodb')
 const { spawn } = require('child_process')
 const path = require('path')
+const { cleanupUploads, drainLlmQueue, startUploadBatch } = require('./drain-llm-queue')
 
 const MONGO_URL = process.env.MONGO_URL || 'mongodb://localhost:27017'
 const DB_NAME = 'score_zentrale'
 
-async function parseInvoiceWithGemini(pdfBase64) {
+async function parseInvoiceWithGemini(pdfBase64, id) {
   return new Promise((resolve, reject) => {
     const pythonScript = path.join(__dirname, '../python_libs/emergent_gemini_parser.py')
     const python = spawn('python3', [pythonScript])
@@ -63,18 +68,148 @@ async function parseInvoiceWithGemini(pdfBase64) {
     })
     
     // Sende PDF als Base64 via stdin (Format das Python erwartet)
-    python.stdin.write(JSON.stringify({ pdf_base64: pdfBase64 }))
+    python.stdin.write(JSON.stringify({ id, pdf_base64: pdfBase64 }))
     python.stdin.end()
   })
 }
 
+function runFibuParser(args, input) {
+  return new Promise((resolve, reject) => {
+    const pythonScript = path.join(__dirname, '../python_libs/fibu_invoice_parser.py')
+    const python = spawn('python3', [pythonScript, ...args])
+    
+    let stdout = ''
+    let stderr = ''
+    
+    python.stdout.on('data', (data) => {
+      stdout += data.toString()
+    })
+    
+    python.stderr.on('data', (data) => {
+      stderr += data.toString()
+    })
+    
+    python.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(`Python exited with code ${code}: ${stderr}`))
+        return
+      }
+      try {
+        resolve(JSON.parse(stdout))
+      } catch (e) {
+        reject(new Error(`Failed to parse JSON: ${stdout}`))
+      }
+    })
+    
+    python.stdin.end(input ? JSON.stringify(input) : undefined)
+  })
+}
+
+async function reparseStale(db, methodFilter) {
+  const versions = await runFibuParser(['--versions'])
+  const methods = Object.keys(versions)
+    .filter(method => method.startsWith('python-'))
+    .filter(method => !methodFilter || method === methodFilter)
+  
+  if (methods.length === 0) {
+    console.log(`⚠️  Keine Python-Parser für ${methodFilter}`)
+    return
+  }
+  
+  // Pro Methode: gespeicherte Version fehlt oder weicht ab
+  const stale = await db.collection('fibu_ek_rechnungen')
+    .find({
+      $or: methods.map(method => ({
+        'parsing.method': method,
+        'parsing.parserVersion': { $ne: versions[method] }
+      }))
+    })
+    .project({ _id: 1, sourceEmailId: 1, 'parsing.method': 1 })
+    .toArray()
+  
+  console.log(`🔄 ${stale.length} EK-Rechnungen mit veraltetem Parser\n`)
+  
+  let success = 0
+  let failed = 0
+  let queued = 0
+  
+  for (let i = 0; i < stale.length; i++) {
+    const rechnung = stale[i]
+    process.stdout.write(`[${i+1}/${stale.length}] ${rechnung.parsing.method} ${rechnung._id}... `)
+    
+    try {
+      const email = rechnung.sourceEmailId && ObjectId.isValid(rechnung.sourceEmailId)
+        ? await db.collection('fibu_email_inbox').findOne({ _id: new ObjectId(rechnung.sourceEmailId) })
+        : null
+      if (!email || !email.pdfBase64) {
+        console.log('⚠️  Kein PDF in der Inbox')
+        failed++
+        continue
+      }
+      
+      const parsed = await runFibuParser([], { id: rechnung.sourceEmailId, pdf_base64: email.pdfBase64, filename: email.filename || '' })
+      if (parsed.queued) {
+        // Scan, Gemini überlastet: wird am Ende aus der LLM-Warteschlange nachgeholt
+        console.log(`⏸️  Zurückgestellt (${parsed.error})`)
+        queued++
+        continue
+      }
+      if (!parsed.success) {
+        console.log(`❌ ${parsed.error}`)
+        failed++
+        continue
+      }
+      
+      await db.collection('fibu_ek_rechnungen').updateOne(
+        { _id: rechnung._id },
+        {
+          $set: {
+            lieferantName: parsed.lieferant,
+            rechnungsNummer: parsed.rechnungsnummer,
+            rechnungsdatum: new Date(parsed.datum),
+            gesamtBetrag: parsed.gesamtbetrag,
+            nettoBetrag: parsed.nettobetrag,
+            steuerBetrag: parsed.steuerbetrag,
+            steuersatz: parsed.steuersatz,
+            'parsing.method': parsed.parsing_method,
+            'parsing.confidence': parsed.confidence,
+            'parsing.parserVersion': parsed.parser_version || null,
+            'parsing.parsedAt': new Date(),
+            updated_at: new Date()
+          }
+        }
+      )
+      console.log(`✅ ${parsed.lieferant} | ${parsed.gesamtbetrag}€`)
+      success++
+    } catch (error) {
+      console.log(`❌ ${error.message}`)
+      failed++
+    }
+  }
+  
+  const drained = await drainLlmQueue(db)
+  
+  console.log('\n' + '='.repeat(80))
+  console.log(`✅ Success: ${success}`)
+  console.log(`❌ Failed:  ${failed}`)
+  console.log(`⏸️  Queued:  ${queued} (nachgeholt: ${drained.success}, erneut zurückgestellt: ${drained.queued})`)
+  console.log('='.repeat(80))
+}
+
 async function main() {
   const client = new MongoClient(MONGO_URL)
+  startUploadBatch('reparse-invoices')
   
   try {
     await client.connect()
     const db = client.db(DB_NAME)
     
+    if (process.argv.includes('--stale')) {
+      const methodIndex = process.argv.indexOf('--method')
+      await reparseStale(db, methodIndex !== -1 ? process.argv[methodIndex + 1] : null)
+      return
+    }
+    
     console.log('🔍 Suche PDFs ohne zugehörige EK-Rechnung...\n')
     
     // Hole alle processed emails mit PDF
@@ -111,6 +246,7 @@ async function main() {
     
     let success = 0
     let failed = 0
+    let queued = 0
     
     for (let i = 0; i < toReparse.length; i++) {
       const email = toReparse[i]
@@ -120,9 +256,13 @@ async function main() {
       
       try {
         // Parse mit Gemini
-        const result = await parseInvoiceWithGemini(email.pdfBase64)
+        const result = await parseInvoiceWithGemini(email.pdfBase64, email._id.toString())
         
-        if (result.success && result.data) {
+        if (result.queued) {
+          // Gemini überlastet: wird am Ende aus der LLM-Warteschlange nachgeholt
+          console.log(`⏸️  Zurückgestellt (${result.error})`)
+          queued++
+        } else if (result.success && result.data) {
           const data = result.data
           
           // Speichere in MongoDB
@@ -163,9 +303,12 @@ async function main() {
       await new Promise(resolve => setTimeout(resolve, 1000))
     }
     
+    const drained = await drainLlmQueue(db)
+    
     console.log('\n' + '='.repeat(80))
     console.log(`✅ Success: ${success}`)
     console.log(`❌ Failed:  ${failed}`)
+    console.log(`⏸️  Queued:  ${queued} (nachgeholt: ${drained.success}, erneut zurückgestellt: ${drained.queued})`)
     console.log('='.repeat(80))
     
     // Neuer Status
@@ -183,6 +326,8 @@ async function main() {
     console.error('❌ Fehler:', error.message)
     process.exit(1)
   } finally {
+    // Gemini-Uploads dieses Laufs löschen (siehe drain-llm-queue.js)
+    await cleanupUploads()
     await client.close()
   }
 }
@@ -0,0 +1,12 @@
+"""
+Die Python-Skripte unter python_libs werden direkt ausgeführt und importieren ihre Hilfsmodule
+über sys.path (siehe fibu_invoice_parser.py); die Tests richten denselben Suchpfad ein.
+"""
+import os
+import sys
+
+PYTHON_LIBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python_libs")
+
+for pfad in (PYTHON_LIBS, os.path.join(PYTHON_LIBS, "invoice_parsers")):
+    if pfad not in sys.path:
+        sys.path.insert(0, pfad)
@@ -0,0 +1,94 @@
+import json
+import os
+
+import pandas as pd
+
+from amazon_settlement_importer import (
+    ART_OTHER, ART_SERVICEFEE, ART_TRANSFER, BLOCK_GEBUEHREN, BLOCK_REFUND, BLOCK_UMSATZ, BLOCK_VORSTEUER,
+    BuchungsWriter, classify, import_settlements, parse_betraege, parse_zeitpunkte, read_chunks,
+)
+
+JTL_ROHDATEN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jtl-amazon-oktober-2025-ROHDATEN.csv")
+
+# Auszug aus dem JTL-Export (nur die benötigten Spalten), die Zeilen einer Order über mehrere Blöcke verteilt
+ROHDATEN = """\
+kMessageId;PostedDateTime;TransactionType;OrderID;AmountType;AmountDescription;Amount
+1;Wed Oct 01 2025 09:18:38 GMT+0000 (GMT);Order;028-0366737-4611515;ItemPrice;Principal;12.64
+2;Wed Oct 01 2025 09:18:38 GMT+0000 (GMT);Order;028-0366737-4611515;ItemPrice;Tax;2.4
+3;Wed Oct 01 2025 09:18:38 GMT+0000 (GMT);Order;028-0366737-4611515;ItemFees;Commission;-2.28
+4;Wed Oct 01 2025 09:18:38 GMT+0000 (GMT);Order;028-0366737-4611515;ItemFees;DigitalServicesFee;-0.05
+5;Wed Oct 01 2025 14:24:17 GMT+0000 (GMT);Refund;305-4606460-9340307;ItemPrice;Principal;-10
+6;Wed Oct 01 2025 14:24:17 GMT+0000 (GMT);Refund;305-4606460-9340307;ItemFees;Commission;1.5
+7;Thu Oct 02 2025 03:21:38 GMT+0000 (GMT);ServiceFee;;Cost of Advertising;TransactionTotalAmount;-36.82
+8;Thu Oct 02 2025 05:00:00 GMT+0200 (CEST);other-transaction;;other-transaction;Subscription Fee;-39
+9;Fri Oct 03 2025 08:00:00 GMT+0000 (GMT);Order;028-0366737-4611515;ItemPrice;Shipping;4.12
+10;Fri Oct 03 2025 08:00:00 GMT+0000 (GMT);Order;028-0366737-4611515;ItemWithheldTax;MarketplaceFacilitatorVAT-Principal;-2.4
+11;Fri Oct 03 2025 08:00:00 GMT+0000 (GMT);Transfer;;Transfer;Transfer;-500
+"""
+
+
+def _rohdaten(tmp_path) -> str:
+    path = tmp_path / "rohdaten.csv"
+    path.write_text(ROHDATEN, encoding="utf-8")
+    return str(path)
+
+
+def test_parse_betraege():
+    betraege = parse_betraege(pd.Series(["12.64", "-2.28", "1.234,56", "-0,05", "", None, "abc"]))
+    assert betraege.tolist() == [1264, -228, 123456, -5, pd.NA, pd.NA, pd.NA]
+
+
+def test_parse_zeitpunkte():
+    zeit = parse_zeitpunkte(pd.Series([
+        "Wed Oct 01 2025 09:18:38 GMT+0000 (GMT)",
+        "Thu Oct 02 2025 05:00:00 GMT+0200 (CEST)",
+        "2025-10-03T08:00:00Z",
+        "kein Datum",
+    ]))
+    assert zeit.tolist()[:3] == [
+        pd.Timestamp("2025-10-01 09:18:38"), pd.Timestamp("2025-10-02 03:00:00"), pd.Timestamp("2025-10-03 08:00:00"),
+    ]
+    assert pd.isna(zeit.iloc[3])
+
+
+def test_classify(tmp_path):
+    chunk = next(read_chunks(_rohdaten(tmp_path)))
+    art, block = classify(chunk)
+    assert art.tolist() == ["", "", "", "", "", "", ART_SERVICEFEE, ART_OTHER, "", "", ART_TRANSFER]
+    assert block.tolist() == [
+        BLOCK_UMSATZ, BLOCK_UMSATZ, BLOCK_GEBUEHREN, "", BLOCK_REFUND, BLOCK_REFUND, "", "", BLOCK_UMSATZ, BLOCK_VORSTEUER, "",
+    ]
+
+
+def _import(paths, ausgabe, chunk_rows: int) -> tuple[dict, list[dict]]:
+    writer = BuchungsWriter(str(ausgabe))
+    try:
+        zusammenfassung = import_settlements(paths, writer, chunk_rows=chunk_rows)
+    finally:
+        writer.close()
+    zusammenfassung.pop("sekunden")
+    with open(ausgabe, encoding="utf-8") as f:
+        return zusammenfassung, [json.loads(zeile) for zeile in f]
+
+
+def test_order_ueber_mehrere_bloecke(tmp_path):
+    zusammenfassung, buchungen = _import([_rohdaten(tmp_path)], tmp_path / "buchungen.jsonl", chunk_rows=3)
+    assert (zusammenfassung["zeilen"], zusammenfassung["ignoriert"], zusammenfassung["ignoriert_betrag"]) == (11, 1, -0.05)
+
+    aggregiert = {buchung["transaktionsId"]: buchung for buchung in buchungen if buchung["order_id"]}
+    umsatz = aggregiert["1"]
+    assert (umsatz["betrag"], umsatz["gegenkonto_konto_nr"], umsatz["amount_description"]) == (19.16, "69001", "Principal, Tax, Shipping")
+    assert umsatz["datum"] == "2025-10-01"
+    assert aggregiert["1_fees"]["betrag"] == -2.28
+    assert aggregiert["1_vorsteuer"]["betrag"] == -2.4
+    refund = aggregiert["5_refund"]
+    assert (refund["betrag"], refund["gegenkonto_konto_nr"], refund["rechnungsnummer"]) == (-8.5, "148328", "XRK-305-4606460-9340307")
+    assert sorted(buchung["transaktionsId"] for buchung in buchungen if not buchung["order_id"]) == [
+        "11_transfer", "7_servicefee", "8_other",
+    ]
+
+
+def test_bloecke_aendern_das_ergebnis_nicht(tmp_path):
+    ganz = _import([JTL_ROHDATEN], tmp_path / "ganz.jsonl", chunk_rows=50000)
+    assert ganz[0]["zeilen"] == 7881
+    assert _import([JTL_ROHDATEN], tmp_path / "bloecke.jsonl", chunk_rows=700) == ganz
@@ -0,0 +1,106 @@
+import io
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from bank_csv_importer import BankFormatFehler, extract_references, import_files, parse_betraege, read_transactions
+from payment_matcher import PaymentMatcher
+
+TEST_POSTBANK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test-postbank.csv")
+
+POSTBANK = """\
+Umsätze Girokonto;;;;;;;;;
+Zeitraum: 01.10.2025 - 31.10.2025;;;;;;;;;
+;;;;;;;;;
+Buchungstag;Wert;Umsatzart;Begünstigter / Auftraggeber;Verwendungszweck;IBAN / Kontonummer;BIC;Soll;Haben;Währung
+30.10.2025;30.10.2025;Gutschrift;Max Mustermann;Zahlung RE2025-97899;DE02100100100006820101;PBNKDEFF;;1.041,07;EUR
+29.10.2025;29.10.2025;Lastschrift;Lieferant AG;Einkauf AU_12345_SW6;DE02100100100006820102;PBNKDEFF;-150,00;;EUR
+;;;;Kontostand;;;;;
+"""
+
+COMMERZBANK = """\
+Buchungstag;Wertstellung;Umsatzart;Buchungstext;Betrag;Währung;Auftraggeberkonto;Bankleitzahl Auftraggeberkonto;IBAN Auftraggeberkonto;Kategorie;Umsatzreferenz
+31.10.2025;31.10.2025;Gutschrift;Müller GmbH Rechnung GU2025-00012 und XRE-5056;-23,80;EUR;;;DE89370400440532013000;Sonstiges;2025103100001
+30.10.2025;30.10.2025;Lastschrift;Auftrag AU2025-62889;0,00;EUR;;;;;
+"""
+
+
+def _lesen(path, **kwargs) -> pd.DataFrame:
+    return pd.concat([transaktionen for transaktionen, _ in read_transactions(str(path), **kwargs)])
+
+
+def test_postbank_alt():
+    transaktionen = _lesen(TEST_POSTBANK)
+    assert transaktionen["format"].unique().tolist() == ["postbank_alt"]
+    assert transaktionen["betrag"].tolist() == [41.07, 87.0, -150.0]
+    assert transaktionen["rechnungsnummer"].tolist() == ["RE2025-97899", "XRE-5056", None]
+    assert transaktionen["auftragsnummer"].tolist() == [None, None, "AU_12345_SW6"]
+
+
+def test_postbank_mit_vorspann_und_soll_haben(tmp_path):
+    path = tmp_path / "postbank.csv"
+    path.write_bytes(POSTBANK.encode("cp1252"))
+    transaktionen = _lesen(path)
+    assert transaktionen["format"].tolist() == ["postbank", "postbank"]
+    assert transaktionen["betrag"].tolist() == [1041.07, -150.0]
+    assert transaktionen["datum"].tolist() == ["2025-10-30", "2025-10-29"]
+    assert transaktionen["auftraggeber"].tolist() == ["Max Mustermann", "Lieferant AG"]
+    assert transaktionen["iban"].iloc[0] == "DE02100100100006820101"
+    assert transaktionen["auftragsnummer"].tolist() == [None, "AU_12345_SW6"]
+
+
+def test_commerzbank(tmp_path):
+    path = tmp_path / "commerzbank.csv"
+    path.write_text(COMMERZBANK, encoding="utf-8-sig")
+    ausgabe = io.StringIO()
+    zusammenfassung = import_files([str(path)], ausgabe)
+    assert (zusammenfassung["transaktionen"], zusammenfassung["verworfen"], zusammenfassung["mit_referenz"]) == (1, 1, 1)
+    assert zusammenfassung["summen"] == {"Commerzbank": -23.8}
+
+    transaktion = json.loads(ausgabe.getvalue())
+    assert transaktion["format"] == "commerzbank"
+    assert transaktion["verwendungszweck"].startswith("Müller GmbH")
+    assert transaktion["referenz"] == "2025103100001"
+    assert transaktion["rechnungsnummer"] == "GU2025-00012"
+    assert transaktion["referenzen"] == ["GU2025-00012", "XRE-5056"]
+
+
+def test_profil_vorgeben(tmp_path):
+    path = tmp_path / "commerzbank.csv"
+    path.write_text(COMMERZBANK, encoding="utf-8")
+    with pytest.raises(BankFormatFehler):
+        _lesen(path, profil="postbank")
+
+
+def test_parse_betraege():
+    betraege = parse_betraege(pd.Series(["1.234,56", "-150,00 €", "+41,07", "", "abc"]))
+    assert betraege.tolist() == [123456, -15000, 4107, pd.NA, pd.NA]
+
+
+def test_extract_references():
+    referenzen = extract_references(pd.Series([
+        "AU_12345_SW6 zu RE2025-97899",
+        "AU_12345_SW7, AU2025-62889 und AU-18279",
+        "Bestellung AU_4711_Shop",
+        "FXRE-1 ohne Treffer",
+        "",
+    ], index=[10, 11, 12, 13, 14]))
+    assert referenzen.index.tolist() == [10, 11, 12, 13, 14]
+    assert referenzen["rechnungsnummer"].tolist() == ["RE2025-97899", None, None, None, None]
+    # Das Shop-Kürzel gehört zur Auftragsnummer, ein kleingeschriebener Zusatz nicht
+    assert referenzen["auftragsnummer"].tolist() == ["AU_12345_SW6", "AU_12345_SW7", "AU_4711", None, None]
+    assert referenzen["referenzen"].tolist() == [
+        ["AU_12345_SW6", "RE2025-97899"], ["AU_12345_SW7", "AU2025-62889", "AU-18279"], ["AU_4711"], [], [],
+    ]
+
+
+def test_auftraege_verschiedener_shops_bleiben_getrennt():
+    matcher = PaymentMatcher([
+        {"id": "1", "rechnungsnummer": "RE2025-1", "bestellnummer": "AU_12345_SW6", "brutto": 10.0, "datum": "2025-10-01", "art": "VK"},
+        {"id": "2", "rechnungsnummer": "RE2025-2", "bestellnummer": "AU_12345_SW7", "brutto": 20.0, "datum": "2025-10-01", "art": "VK"},
+    ])
+    ergebnis = matcher.match({"id": "z1", "betrag": 20.0, "datum": "2025-10-02", "verwendungszweck": "AU_12345_SW7"})
+    assert ergebnis["rechnung_id"] == "2"
+    assert "doppelt" not in ergebnis
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+import fibu_invoice_parser
+from file_handlers.fingerprint_index import FingerprintIndex
+from helpers.constants import INVOICE_COLUMNS
+
+KEYS = ["meta:producer=klingspor sap"]
+
+
+class _Parser:
+    def __init__(self, lieferant: str, zeilen: int, identifier: str | None):
+        self.lieferant, self.zeilen, self.identifier = lieferant, zeilen, identifier
+
+    def parse(self, pdf_path):
+        df = pd.DataFrame([
+            {**dict.fromkeys(INVOICE_COLUMNS, "N/A"), "Lieferant": self.lieferant, "Belegdatum": "01.10.2025",
+             "Menge": "2", "Netto-EK": "10,00", "MwST": "19"}
+            for _ in range(self.zeilen)
+        ], columns=INVOICE_COLUMNS)
+        return df, self.identifier
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    """Fingerprint sagt Klingspor, der Text sagt Pferd; der Klingspor-Parser findet keine Rechnungsnummer."""
+    index = FingerprintIndex(str(tmp_path / "index.json"))
+    monkeypatch.setattr(fibu_invoice_parser, "classify_pdf", lambda pdf_path: "text")
+    monkeypatch.setattr(fibu_invoice_parser, "get_fingerprint_index", lambda: index)
+    monkeypatch.setattr(index, "keys_for", lambda pdf_path, filename: KEYS)
+    monkeypatch.setattr(
+        fibu_invoice_parser, "identify_with_fingerprints", lambda *args: ("klingspor", True, KEYS[0])
+    )
+    monkeypatch.setattr(fibu_invoice_parser, "identify_company", lambda pdf_path: ("pferd", True))
+    return index
+
+
+def _parsers(monkeypatch, pferd: _Parser):
+    parsers = {"Klingspor": _Parser("Klingspor", 1, None), "Pferd": pferd}
+    monkeypatch.setattr(fibu_invoice_parser, "get_parser", lambda firma, art: parsers.get(firma))
+    monkeypatch.setattr(fibu_invoice_parser, "parser_version", lambda firma: f"{firma}-1")
+
+
+def test_fallback_ohne_positionen_behaelt_den_lieferanten(index, monkeypatch):
+    _parsers(monkeypatch, _Parser("Pferd", 0, None))
+    ergebnis = fibu_invoice_parser.parse_invoice_file("rechnung.pdf")
+    assert ergebnis["success"] is True
+    assert (ergebnis["lieferant"], ergebnis["parsing_method"], ergebnis["kreditor"]) == (
+        "Klingspor", "python-klingspor-parser", "70004"
+    )
+    assert ergebnis["parser_version"] == "Klingspor-1"
+    eintrag = index.fingerprints[KEYS[0]]
+    assert eintrag["vendors"] == {"klingspor": 1}
+    assert eintrag["disagreements"] == 1
+
+
+def test_fallback_mit_positionen_wechselt_den_lieferanten(index, monkeypatch):
+    _parsers(monkeypatch, _Parser("Pferd", 2, "RE-4711"))
+    ergebnis = fibu_invoice_parser.parse_invoice_file("rechnung.pdf")
+    assert (ergebnis["lieferant"], ergebnis["rechnungsnummer"], ergebnis["parsing_method"], ergebnis["kreditor"]) == (
+        "Pferd", "RE-4711", "python-pferd-parser", "70005"
+    )
+    assert ergebnis["nettobetrag"] == 40.0
+    assert index.fingerprints[KEYS[0]]["vendors"] == {"pferd": 1}
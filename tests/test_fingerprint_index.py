@@ -0,0 +1,108 @@
+import json
+import multiprocessing
+import os
+
+from helpers.worker import RecyclingWorker, at_worker_exit
+from file_handlers.fingerprint_index import MIN_OBSERVATIONS, FingerprintIndex, filename_fingerprint
+
+KEYS = ["meta:producer=klingspor sap", "name:re_#.pdf"]
+
+
+def test_filename_fingerprint():
+    assert filename_fingerprint("Pferd_RE_2025-123456.pdf") == "name:pferd_re_#-#.pdf"
+    assert filename_fingerprint("Scan_0042.pdf") is None
+    assert filename_fingerprint("12345.pdf") is None
+
+
+def test_lookup_nach_mehreren_beobachtungen(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "index.json"))
+    for _ in range(MIN_OBSERVATIONS - 1):
+        index.learn(KEYS, "Klingspor")
+    assert index.lookup(KEYS) == (None, None, False)
+    index.learn(KEYS, "klingspor")
+    assert index.lookup(KEYS)[:2] == ("klingspor", KEYS[0])
+
+    # Ein zweiter Lieferant macht den Fingerprint mehrdeutig
+    index.learn(KEYS[:1], "pferd")
+    assert index.lookup(KEYS)[:2] == ("klingspor", KEYS[1])
+
+
+def test_treffer_allein_schreiben_nicht(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = FingerprintIndex(path)
+    index.learn(KEYS, "klingspor")
+    index.learn(KEYS, "klingspor")
+    index.save()
+    vorher = os.stat(path).st_mtime_ns
+
+    index = FingerprintIndex(path)
+    assert index.lookup(KEYS)[0] == "klingspor"
+    index.save()
+    assert os.stat(path).st_mtime_ns == vorher
+
+    # Mit der nächsten Änderung werden die Treffer mitgeschrieben
+    index.learn(KEYS, "klingspor")
+    index.save()
+    assert FingerprintIndex(path).fingerprints[KEYS[0]]["hits"] == 1
+
+
+def test_speichern_fuehrt_parallele_aenderungen_zusammen(tmp_path):
+    path = str(tmp_path / "index.json")
+    erster, zweiter = FingerprintIndex(path), FingerprintIndex(path)
+    erster.learn(KEYS, "klingspor")
+    zweiter.learn(KEYS, "klingspor")
+    zweiter.record_disagreement(KEYS[1])
+    erster.save()
+    zweiter.save()
+    erster.learn(KEYS[:1], "klingspor")
+    erster.save()
+
+    with open(path, encoding="utf-8") as f:
+        fingerprints = json.load(f)["fingerprints"]
+    assert fingerprints[KEYS[0]] == {"vendors": {"klingspor": 3}, "hits": 0, "disagreements": 0}
+    assert fingerprints[KEYS[1]] == {"vendors": {"klingspor": 2}, "hits": 0, "disagreements": 1}
+
+
+def _lerne(path, vendor, anzahl):
+    index = FingerprintIndex(path)
+    for _ in range(anzahl):
+        index.learn(KEYS, vendor)
+        index.save()
+
+
+def test_parallele_prozesse(tmp_path):
+    path = str(tmp_path / "index.json")
+    prozesse = [multiprocessing.Process(target=_lerne, args=(path, vendor, 25)) for vendor in ("klingspor", "pferd", "klingspor", "vsm")]
+    for prozess in prozesse:
+        prozess.start()
+    for prozess in prozesse:
+        prozess.join()
+
+    vendors = FingerprintIndex(path).fingerprints[KEYS[0]]["vendors"]
+    assert vendors == {"klingspor": 50, "pferd": 25, "vsm": 25}
+
+
+_worker_index: FingerprintIndex | None = None
+
+
+def _lerne_im_worker(path, vendor):
+    global _worker_index
+    if _worker_index is None:
+        _worker_index = FingerprintIndex(path)
+        at_worker_exit(_worker_index.save)
+    _worker_index.learn(KEYS, vendor)
+    return os.path.exists(path)
+
+
+def test_worker_speichert_beim_erneuern(tmp_path):
+    path = str(tmp_path / "index.json")
+    with RecyclingWorker(max_documents=3) as worker:
+        for _ in range(5):
+            worker.begin_document()
+            gespeichert, error, _ = worker.run("learn", _lerne_im_worker, path, "klingspor")
+            assert error is None
+            worker.end_document()
+        # Der erste Worker hat nach drei Dokumenten gespeichert, der zweite erst beim Schließen
+        assert gespeichert
+        assert FingerprintIndex(path).fingerprints[KEYS[0]]["vendors"] == {"klingspor": 3}
+    assert FingerprintIndex(path).fingerprints[KEYS[0]]["vendors"] == {"klingspor": 5}
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import llm_limiter
+from helpers.llm_limiter import (
+    LLM_CIRCUIT_FAILURES,
+    LLM_START_CONCURRENCY,
+    OUTCOME_OK,
+    OUTCOME_OVERLOAD,
+    LlmLimiter,
+    LlmQueue,
+    LlmUnavailable,
+    classify_error,
+    within_budget,
+)
+from helpers.worker import RecyclingWorker, Watchdog
+
+
+def _stub(fail_rate: float) -> str:
+    """Startet den Stub-Server des Moduls (python -m helpers.llm_limiter stub) auf einem freien Port."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    threading.Thread(target=llm_limiter._stub_server, args=(port, fail_rate, 1, 429), daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(50):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return url
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Stub-Server nicht erreichbar")
+
+
+@pytest.fixture(scope="module")
+def ok_url():
+    return _stub(0.0)
+
+
+@pytest.fixture(scope="module")
+def fehler_url():
+    return _stub(1.0)
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return LlmLimiter(str(tmp_path / "llm_limiter.json"))
+
+
+def aufruf(limiter: LlmLimiter, url: str) -> str:
+    """Ein Aufruf über slot() wie in den Parsern; Ergebnis wie classify_error bzw. OUTCOME_OK."""
+    try:
+        with limiter.slot(wait_s=0):
+            with urllib.request.urlopen(url, timeout=5) as antwort:
+                antwort.read()
+    except LlmUnavailable:
+        raise
+    except Exception as e:
+        return classify_error(e)
+    return OUTCOME_OK
+
+
+def test_erfolge_erhoehen_das_limit_additiv(limiter, ok_url, monkeypatch):
+    monkeypatch.setattr(llm_limiter, "LLM_MAX_CONCURRENCY", 4.0)
+    assert aufruf(limiter, ok_url) == OUTCOME_OK
+    assert limiter.status()["limit"] == LLM_START_CONCURRENCY + 1 / LLM_START_CONCURRENCY
+
+    for _ in range(20):
+        aufruf(limiter, ok_url)
+    status = limiter.status()
+    assert status["limit"] == 4.0
+    assert status["in_flight"] == 0
+    assert status["latency_ms"] is not None
+
+
+def test_ueberlast_halbiert_das_limit(limiter, ok_url, fehler_url):
+    for _ in range(6):
+        aufruf(limiter, ok_url)
+    vorher = limiter.status()["limit"]
+
+    assert aufruf(limiter, fehler_url) == OUTCOME_OVERLOAD
+    status = limiter.status()
+    assert status["limit"] == pytest.approx(vorher / 2, abs=0.01)
+    assert status["failures"] == 1
+
+    # Ein Erfolg setzt den Fehlerzähler zurück, das Limit wächst wieder langsam
+    aufruf(limiter, ok_url)
+    assert limiter.status()["failures"] == 0
+    for _ in range(3):
+        aufruf(limiter, fehler_url)
+    assert limiter.status()["limit"] == 1
+
+
+def test_langsame_antworten_senken_das_limit(limiter, ok_url, monkeypatch):
+    monkeypatch.setattr(llm_limiter, "LLM_LATENCY_TARGET_MS", 0.0)
+    aufruf(limiter, ok_url)
+    assert limiter.status()["limit"] == round(LLM_START_CONCURRENCY * 0.9, 2)
+
+
+def test_kein_freier_platz(limiter):
+    tokens = [limiter.try_acquire() for _ in range(int(LLM_START_CONCURRENCY))]
+    assert all(tokens)
+    assert limiter.try_acquire() is None
+    with pytest.raises(LlmUnavailable) as fehler:
+        with limiter.slot(wait_s=0):
+            pass
+    assert fehler.value.grund == "no_slot"
+
+    limiter.release(tokens[0], OUTCOME_OK, 10)
+    assert limiter.try_acquire() is not None
+
+
+def _belege(path):
+    LlmLimiter(path).try_acquire()
+
+
+def test_plaetze_beendeter_prozesse_werden_frei(limiter):
+    for _ in range(int(LLM_START_CONCURRENCY)):
+        prozess = multiprocessing.Process(target=_belege, args=(limiter.path,))
+        prozess.start()
+        prozess.join()
+    assert limiter.try_acquire() is not None
+    assert limiter.status()["in_flight"] == 1
+
+
+def test_circuit_oeffnet_nach_ueberlastfehlern(limiter, fehler_url):
+    for _ in range(LLM_CIRCUIT_FAILURES - 1):
+        aufruf(limiter, fehler_url)
+    assert limiter.status()["circuit"] == "closed"
+
+    aufruf(limiter, fehler_url)
+    assert limiter.status()["circuit"] == "open"
+    with pytest.raises(LlmUnavailable) as fehler:
+        aufruf(limiter, fehler_url)
+    assert fehler.value.grund == "circuit_open"
+    assert 0 < fehler.value.retry_in <= llm_limiter.LLM_CIRCUIT_COOLDOWN_S
+
+
+def test_probe_nach_der_wartezeit(limiter, ok_url, fehler_url, monkeypatch):
+    for _ in range(LLM_CIRCUIT_FAILURES):
+        aufruf(limiter, fehler_url)
+    monkeypatch.setattr(llm_limiter, "LLM_CIRCUIT_COOLDOWN_S", 0.0)
+
+    # Halb offen: nur ein Probe-Aufruf gleichzeitig
+    probe = limiter.try_acquire()
+    assert probe is not None
+    with pytest.raises(LlmUnavailable) as fehler:
+        limiter.try_acquire()
+    assert fehler.value.grund == "circuit_half_open"
+
+    # Fehlgeschlagene Probe öffnet den Circuit erneut
+    limiter.release(probe, OUTCOME_OVERLOAD, 10)
+    monkeypatch.setattr(llm_limiter, "LLM_CIRCUIT_COOLDOWN_S", 60.0)
+    with pytest.raises(LlmUnavailable):
+        limiter.try_acquire()
+
+    # Erfolgreiche Probe schließt ihn
+    monkeypatch.setattr(llm_limiter, "LLM_CIRCUIT_COOLDOWN_S", 0.0)
+    assert aufruf(limiter, ok_url) == OUTCOME_OK
+    status = limiter.status()
+    assert status["circuit"] == "closed"
+    assert status["failures"] == 0
+    assert limiter.try_acquire() is not None
+
+
+def test_reset(limiter, fehler_url):
+    for _ in range(LLM_CIRCUIT_FAILURES):
+        aufruf(limiter, fehler_url)
+    limiter.reset()
+    assert limiter.status() == {
+        "limit": LLM_START_CONCURRENCY, "in_flight": 0, "failures": 0, "circuit": "closed", "latency_ms": None,
+    }
+
+
+def test_warteschlange(tmp_path):
+    queue = LlmQueue(str(tmp_path / "queue"))
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF a")
+    assert queue.take() is None
+
+    kopie = queue.enqueue(str(pdf), "65a0c0ffee", {"from": "x@y.de"}, "circuit_open")
+    manifest = queue.take()
+    with open(manifest, encoding="utf-8") as f:
+        assert '"id": "65a0c0ffee"' in f.read()
+    assert queue.take() is None
+
+    queue.done(manifest)
+    assert not os.path.exists(kopie)
+
+
+class _HaengenderChat:
+    async def send_message(self, user_message):
+        await asyncio.sleep(60)
+
+
+def _parse_im_budget(state_path: str, queue_dir: str, pdf_path: str) -> dict:
+    """Läuft im RecyclingWorker: Scan-Parsing wie parse_scan_with_llm, ohne Anbieter."""
+    import emergent_gemini_parser as parser
+
+    llm_limiter.BUDGET_RESERVE_S = 1.0
+    parser.limiter = LlmLimiter(state_path)
+    parser.llm_queue = LlmQueue(queue_dir)
+    parser.FileContentWithMimeType = SimpleNamespace
+    parser.UserMessage = SimpleNamespace
+    parser.new_chat = _HaengenderChat
+    return asyncio.run(parser.parse_invoice_with_emergent_gemini(pdf_path, {"from": "x@y.de"}))
+
+
+def _queued_im_budget(tmp_path, limiter: LlmLimiter) -> dict:
+    pdf = tmp_path / "scan.pdf"
+    pdf.write_bytes(b"%PDF scan")
+    start = time.monotonic()
+    with RecyclingWorker(timeout=3) as worker:
+        worker.begin_document("65a0c0ffee")
+        ergebnis, error, _ = worker.run("scan", _parse_im_budget, limiter.path, str(tmp_path / "queue"), str(pdf))
+    assert error is None
+    assert time.monotonic() - start < 3
+    assert ergebnis["queued"] is True
+    manifest = LlmQueue(str(tmp_path / "queue")).take()
+    with open(manifest, encoding="utf-8") as f:
+        assert json.loads(f.readline())["id"] == "65a0c0ffee"
+    return ergebnis
+
+
+def test_belegte_plaetze_stellen_zurueck_statt_budget_abbruch(tmp_path, limiter):
+    tokens = [limiter.try_acquire() for _ in range(int(LLM_START_CONCURRENCY))]
+    assert all(tokens)
+    ergebnis = _queued_im_budget(tmp_path, limiter)
+    assert "no_slot" in ergebnis["error"]
+
+
+def test_langsamer_aufruf_stellt_zurueck_statt_budget_abbruch(tmp_path, limiter):
+    ergebnis = _queued_im_budget(tmp_path, limiter)
+    assert "budget" in ergebnis["error"]
+    # Der Abbruch wegen des Budgets zählt nicht als Überlastung des Anbieters
+    assert limiter.status() == {
+        "limit": LLM_START_CONCURRENCY, "in_flight": 0, "failures": 0, "circuit": "closed", "latency_ms": None,
+    }
+
+
+def test_wartezeit_im_watchdog(monkeypatch):
+    monkeypatch.setattr(llm_limiter, "BUDGET_RESERVE_S", 5.0)
+    assert within_budget(120) == 120
+    watchdog = Watchdog(lambda timeout: None, timeout=30).start()
+    try:
+        assert 24 < within_budget(120) <= 25
+        assert within_budget(10) == 10
+    finally:
+        watchdog.stop()
+    assert within_budget(120) == 120
+
+
+def _uebernimm(ordner: str):
+    LlmQueue(ordner).take()
+
+
+def test_warteschlange_nach_fehler_und_absturz(tmp_path):
+    ordner = str(tmp_path / "queue")
+    queue = LlmQueue(ordner)
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF a")
+    kopie = queue.enqueue(str(pdf), "a")
+
+    # Fehler bei der Verarbeitung: das Manifest kommt mit seinen Kopien zurück
+    queue.restore(queue.take())
+    assert os.path.exists(kopie)
+    queue.enqueue(str(pdf), "b")
+
+    # Der übernehmende Prozess endet ohne done(): der nächste take() holt die Einträge zurück
+    prozess = multiprocessing.Process(target=_uebernimm, args=(ordner,))
+    prozess.start()
+    prozess.join()
+    assert not os.path.exists(queue.manifest)
+
+    manifest = queue.take()
+    with open(manifest, encoding="utf-8") as f:
+        assert [json.loads(zeile)["id"] for zeile in f] == ["a", "b"]
+    assert not [name for name in os.listdir(ordner) if name.startswith("manifest.") and name != os.path.basename(manifest)]
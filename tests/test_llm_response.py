@@ -0,0 +1,79 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from helpers.llm_response import parse_betrag, parse_llm_datum, parse_satz, validate_invoice
+
+
+@pytest.mark.parametrize("wert, erwartet", [
+    ("1.234,56 €", Decimal("1234.56")),
+    ("1.234.567,89", Decimal("1234567.89")),
+    ("-12,5", Decimal("-12.5")),
+    ("1234.56", Decimal("1234.56")),
+    ("0.1234", Decimal("0.1234")),
+    ("1,234.56", Decimal("1234.56")),
+    ("-1,234,567.8 EUR", Decimal("-1234567.8")),
+    ("1.234", Decimal("1234")),
+    (1234.56, Decimal("1234.56")),
+    (12, Decimal("12")),
+    (Decimal("3.10"), Decimal("3.10")),
+])
+def test_parse_betrag(wert, erwartet):
+    assert parse_betrag(wert) == erwartet
+
+
+@pytest.mark.parametrize("wert", [
+    None, True, "", "N/A", "abc", "1,234,56", "1.234.5", "1,234.567", "1.234,56.7", "12,34.5",
+    float("nan"), Decimal("Infinity"),
+])
+def test_parse_betrag_ungueltig(wert):
+    assert parse_betrag(wert) is None
+
+
+def test_englischer_betrag_wird_nicht_falsch_gelesen():
+    felder, fehlende = validate_invoice({
+        "rechnungsnummer": "RE-1", "datum": "2025-10-01", "lieferant": "Klingspor",
+        "gesamtbetrag": "1,234.56",
+    })
+    assert felder["gesamtbetrag"] == Decimal("1234.56")
+    assert fehlende == []
+
+    felder, fehlende = validate_invoice({
+        "rechnungsnummer": "RE-1", "datum": "2025-10-01", "lieferant": "Klingspor",
+        "gesamtbetrag": "1,234,56",
+    })
+    assert "gesamtbetrag" not in felder
+    assert fehlende == ["gesamtbetrag"]
+
+
+@pytest.mark.parametrize("wert, erwartet", [
+    (19, 19), ("19 %", 19), ("19,0", 19), ("7.0", 7), (0.19, 19), ("0,07", 7), (0, 0),
+])
+def test_parse_satz(wert, erwartet):
+    assert parse_satz(wert) == erwartet
+
+
+@pytest.mark.parametrize("wert", [None, "", "neunzehn", 31, "-5 %", "1,234.56"])
+def test_parse_satz_ungueltig(wert):
+    assert parse_satz(wert) is None
+
+
+@pytest.mark.parametrize("wert, erwartet", [
+    ("2025-03-12", "2025-03-12"),
+    ("2025-3-5T00:00:00", "2025-03-05"),
+    ("12.03.2025", "2025-03-12"),
+    ("12.03.25", "2025-03-12"),
+    ("1/2/2024", "2024-02-01"),
+    (" 31.12.2024 ", "2024-12-31"),
+])
+def test_parse_llm_datum(wert, erwartet):
+    assert parse_llm_datum(wert) == erwartet
+
+
+@pytest.mark.parametrize("wert", [
+    None, 20250312, "", "März 2025", "2025-02-30", "31.04.2025", "01.01.1999",
+    f"01.01.{datetime.date.today().year + 2}",
+])
+def test_parse_llm_datum_ungueltig(wert):
+    assert parse_llm_datum(wert) is None
@@ -0,0 +1,80 @@
+from payment_matcher import PaymentMatcher, normalize_nummer, payment_keys
+
+
+def rechnungen():
+    return [
+        {"id": "1", "rechnungsnummer": "RE2025-97899", "brutto": 119.0, "datum": "2025-10-01", "art": "VK"},
+        {"id": "2", "rechnungsnummer": "XRE-3695", "bestellnummer": "305-1234567-1234567", "brutto": 49.9, "datum": "2025-10-02", "art": "VK"},
+        {"id": "3", "rechnungsnummer": "RE2025-97900", "bestellnummer": "AU_12345_SW6", "brutto": 250.0, "datum": "2025-10-03", "art": "VK"},
+        {"id": "4", "rechnungsnummer": "RE2025-97901", "brutto": 75.5, "datum": "2025-10-10", "art": "VK"},
+        {"id": "5", "rechnungsnummer": "ER-4711", "brutto": 300.0, "datum": "2025-10-05", "art": "EK"},
+    ]
+
+
+def test_normalize_und_payment_keys():
+    assert normalize_nummer("re 2025/97899") == "RE202597899"
+    assert payment_keys({"rechnungsnummer": "XRE-3695", "verwendungszweck": "Amazon 305-1234567-1234567 XRE-3695"}) == [
+        "XRE3695", "30512345671234567",
+    ]
+
+
+def test_referenzen():
+    matcher = PaymentMatcher(rechnungen())
+    exakt = matcher.match({"id": "z1", "betrag": 119.0, "verwendungszweck": "Rechnung RE2025-97899 Danke"})
+    assert (exakt["rechnung_id"], exakt["method"], exakt["confidence"], exakt["betrag_differenz"]) == ("1", "exakt", "high", 0.0)
+    assert "doppelt" not in exakt
+
+    amazon = matcher.match({"id": "z2", "betrag": 49.3, "verwendungszweck": "Amazon 305-1234567-1234567"})
+    assert (amazon["rechnung_id"], amazon["method"], amazon["confidence"]) == ("2", "referenz", "high")
+    assert amazon["betrag_differenz"] == -0.6
+
+    teilzahlung = matcher.match({"id": "z3", "betrag": 100.0, "verwendungszweck": "PayPal AU_12345_SW6"})
+    assert (teilzahlung["rechnung_id"], teilzahlung["method"], teilzahlung["confidence"]) == ("3", "referenz", "medium")
+
+
+def test_betrag_datum():
+    matcher = PaymentMatcher(rechnungen())
+    treffer = matcher.match({"id": "z1", "betrag": 75.5, "datum": "2025-10-12", "verwendungszweck": "Kunde Danke"})
+    assert (treffer["rechnung_id"], treffer["method"], treffer["confidence"], treffer["tage"]) == ("4", "betrag_datum", "high", 2)
+    # Dieselbe Rechnung wird über Betrag + Datum nicht zweimal vergeben, außerhalb des Fensters gibt es keinen Treffer
+    assert matcher.match({"id": "z2", "betrag": 75.5, "datum": "2025-10-12"})["method"] is None
+    assert PaymentMatcher(rechnungen()).match({"id": "z3", "betrag": 75.5, "datum": "2025-10-20"})["method"] is None
+
+
+def test_vorzeichen():
+    matcher = PaymentMatcher(rechnungen())
+    assert matcher.match({"id": "z1", "betrag": 300.0, "datum": "2025-10-05"})["method"] is None
+    assert matcher.match({"id": "z2", "betrag": -300.0, "datum": "2025-10-05"})["rechnung_id"] == "5"
+
+
+def test_doppelte_zahlung_wird_markiert():
+    matcher = PaymentMatcher(rechnungen())
+    erste = matcher.match({"id": "z1", "betrag": 119.0, "verwendungszweck": "RE2025-97899"})
+    zweite = matcher.match({"id": "z2", "betrag": 119.0, "verwendungszweck": "RE2025-97899"})
+    assert (erste["confidence"], erste.get("doppelt")) == ("high", None)
+    assert (zweite["rechnung_id"], zweite["method"], zweite["confidence"], zweite["doppelt"]) == ("1", "exakt", "medium", True)
+
+    abweichend = matcher.match({"id": "z3", "betrag": 50.0, "verwendungszweck": "RE2025-97899"})
+    assert (abweichend["confidence"], abweichend["doppelt"]) == ("low", True)
+
+
+def test_offene_rechnung_vor_vergebener():
+    daten = rechnungen() + [
+        {"id": "6", "rechnungsnummer": "RE2025-97902", "bestellnummer": "AU_12345_SW6", "brutto": 250.0, "datum": "2025-10-04", "art": "VK"},
+    ]
+    matcher = PaymentMatcher(daten)
+    ergebnisse = [matcher.match({"id": f"z{i}", "betrag": 250.0, "verwendungszweck": "AU_12345_SW6"}) for i in range(3)]
+    assert [(e["rechnung_id"], e["confidence"], e.get("doppelt", False)) for e in ergebnisse] == [
+        ("3", "high", False), ("6", "high", False), ("3", "medium", True),
+    ]
+
+
+def test_match_all_referenzen_zuerst():
+    daten = rechnungen()
+    zahlungen = [
+        # Ohne Referenz, aber mit Betrag und Datum von Rechnung 1, die eine spätere Zahlung per Referenz bezahlt
+        {"betrag": 119.0, "datum": "2025-10-02", "verwendungszweck": "Kunde Danke"},
+        {"id": "z2", "betrag": 119.0, "datum": "2025-10-02", "verwendungszweck": "RE2025-97899"},
+    ]
+    ergebnisse = PaymentMatcher(daten).match_all(zahlungen)
+    assert [(e["zahlung_id"], e["rechnung_id"], e["method"]) for e in ergebnisse] == [(0, None, None), ("z2", "1", "exakt")]
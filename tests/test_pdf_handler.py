@@ -0,0 +1,20 @@
+import inspect
+
+from file_handlers import pdf_handler
+
+
+def test_parser_version_haengt_von_den_hilfsmodulen_ab(monkeypatch):
+    gehasht = []
+    monkeypatch.setattr(pdf_handler, "source_hash", lambda paths: gehasht.append(paths) or "v")
+    monkeypatch.setattr(pdf_handler, "_parser_versions", {})
+
+    assert pdf_handler.parser_version("norton") == "v"
+    dateien = gehasht[0]
+    assert dateien[0] == inspect.getsourcefile(pdf_handler._load_parser_class("Invoice_norton"))
+    for modul in ("helpers/helpers.py", "helpers/number_helpers.py", "helpers/date_helpers.py", "parsers/line_engine.py"):
+        assert sum(datei.endswith(modul) for datei in dateien) == 1
+
+
+def test_parser_version_ist_stabil():
+    assert pdf_handler.parser_version("bosch") == pdf_handler.parser_version("bosch")
+    assert pdf_handler.parser_version("unbekannt") is None
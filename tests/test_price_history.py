@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+import pandas as pd
+
+from file_handlers.price_history import PriceHistory
+from helpers.constants import INVOICE_COLUMNS
+
+
+def rechnung(belegdatum, zeilen, rechnungsnummer="RE-1"):
+    """Rechnungszeilen (Artikelnummer, Artikelnummer Lieferant, Netto-EK) als DataFrame mit INVOICE_COLUMNS."""
+    return pd.DataFrame([
+        {
+            "Bestellnummer (JTL-Wawi)": "N/A",
+            "Fremdbelegnummer (Eingangsrechnung)": rechnungsnummer,
+            "Fremdbelegnummer (Liererantenbestellung)": "N/A",
+            "Lieferant": "Klingspor",
+            "Zahlbar bis": "N/A",
+            "Belegdatum": belegdatum,
+            "Artikelnummer": artikelnummer,
+            "Artikelnummer Lieferant": artikel_lieferant,
+            "Artikelnname": "Schleifband",
+            "Hinweis": "N/A",
+            "Menge": "10",
+            "Netto-EK": netto_ek,
+            "MwST": "19",
+        }
+        for artikelnummer, artikel_lieferant, netto_ek in zeilen
+    ], columns=INVOICE_COLUMNS)
+
+
+def test_preis_zum_datum_und_aenderungen(tmp_path):
+    history = PriceHistory(str(tmp_path / "preise.json"))
+    assert history.add_invoice(rechnung("01.07.2025", [("A1", "302501", "12,345")]), "klingspor") == []
+    aenderungen = history.add_invoice(rechnung("01.09.2025", [("A1", "302501", "13,5")]), "klingspor")
+
+    assert [(a["alt"], a["neu"], a["prozent"]) for a in aenderungen] == [(Decimal("12.345"), Decimal("13.500"), 9.4)]
+    assert history.price_at("klingspor", "302501", "2025-06-30") is None
+    assert history.price_at("klingspor", "302501", "2025-08-31") == Decimal("12.345")
+    assert history.price_at("KLINGSPOR", "302501", "2025-09-01") == Decimal("13.500")
+    # Eine ältere Rechnung, die später eingelesen wird, landet an der richtigen Stelle
+    history.add_invoice(rechnung("01.08.2025", [("A1", "302501", "12,9")]), "klingspor")
+    assert history.series("klingspor", "302501") == [
+        ("2025-07-01", Decimal("12.345")), ("2025-08-01", Decimal("12.900")), ("2025-09-01", Decimal("13.500")),
+    ]
+
+
+def test_speichern_und_laden(tmp_path):
+    path = str(tmp_path / "preise.json")
+    history = PriceHistory(path)
+    history.add_invoice(rechnung("01.07.2025", [("A1", "302501", "12,345"), ("N/A", "302502", "3,2")]), "klingspor")
+    history.save()
+
+    geladen = PriceHistory(path)
+    assert geladen.price_at("klingspor", "302501", "2025-07-01") == Decimal("12.345")
+    assert geladen.price_at("klingspor", "302502", "2025-07-01") == Decimal("3.200")
+    assert geladen.prices_for_article("A1", "2025-07-01") == {"klingspor": Decimal("12.345")}
+
+
+def test_geaenderte_artikelnummer_verlaesst_alten_index(tmp_path):
+    path = str(tmp_path / "preise.json")
+    history = PriceHistory(path)
+    history.add_invoice(rechnung("01.07.2025", [("A1", "302501", "12,345")]), "klingspor")
+    history.add_invoice(rechnung("01.08.2025", [("A2", "302501", "12,345")]), "klingspor")
+
+    assert history.prices_for_article("A1", "2025-08-01") == {}
+    assert history.prices_for_article("A2", "2025-08-01") == {"klingspor": Decimal("12.345")}
+
+    # Die neue Nummer wird auch ohne Preisänderung gespeichert
+    history.save()
+    geladen = PriceHistory(path)
+    assert geladen.prices_for_article("A1", "2025-08-01") == {}
+    assert geladen.prices_for_article("A2", "2025-08-01") == {"klingspor": Decimal("12.345")}
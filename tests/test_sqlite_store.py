@@ -0,0 +1,92 @@
+import pandas as pd
+
+from file_handlers.sqlite_store import SqliteStore, belegdatum_iso
+from helpers.constants import INVOICE_COLUMNS
+
+
+def rechnung(rechnungsnummer, belegdatum, zeilen):
+    """Rechnungszeilen (Artikelnummer, Artikelnummer Lieferant, Menge, Netto-EK) als DataFrame mit INVOICE_COLUMNS."""
+    return pd.DataFrame([
+        {
+            "Bestellnummer (JTL-Wawi)": "N/A",
+            "Fremdbelegnummer (Eingangsrechnung)": rechnungsnummer,
+            "Fremdbelegnummer (Liererantenbestellung)": "N/A",
+            "Lieferant": "Klingspor",
+            "Zahlbar bis": "N/A",
+            "Belegdatum": belegdatum,
+            "Artikelnummer": artikelnummer,
+            "Artikelnummer Lieferant": artikel_lieferant,
+            "Artikelnname": "Schleifband",
+            "Hinweis": "N/A",
+            "Menge": menge,
+            "Netto-EK": netto_ek,
+            "MwST": "19",
+        }
+        for artikelnummer, artikel_lieferant, menge, netto_ek in zeilen
+    ], columns=INVOICE_COLUMNS)
+
+
+def test_belegdatum_iso():
+    assert belegdatum_iso("12.03.2025") == "2025-03-12"
+    assert belegdatum_iso("12.03.25") == "2025-03-12"
+    assert belegdatum_iso("N/A") is None
+
+
+def test_speichern_und_suchen(tmp_path):
+    path = str(tmp_path / "rechnungen.db")
+    with SqliteStore(path, batch_size=2) as store:
+        assert store.add_invoice(rechnung("4711", "01.07.2025", [("A1", "302501", "10", "1.234,5"), ("A2", "302502", "2", "3,2")]), "Klingspor", "4711.pdf")
+        assert store.add_invoice(rechnung("4712", "01.09.2025", [("A1", "302501", "5", "13,5")]), "klingspor")
+        assert not store.add_invoice(rechnung("4713", "01.09.2025", []), "klingspor")
+
+    with SqliteStore(path) as store:
+        assert store.has_invoice("4711")
+        assert store.has_invoice("4711", "KLINGSPOR")
+        assert not store.has_invoice("4711", "bosch")
+        assert not store.has_invoice("4713")
+
+        zeilen = store.find_lines(lieferant_key="klingspor", artikelnummer_lieferant="302501")
+        assert [(z["rechnungsnummer"], z["belegdatum_iso"], z["netto_ek"], z["netto_ek_wert"], z["menge_wert"]) for z in zeilen] == [
+            ("4711", "2025-07-01", "1.234,5", 1234.5, 10.0),
+            ("4712", "2025-09-01", "13,5", 13.5, 5.0),
+        ]
+        assert [z["rechnungsnummer"] for z in store.find_lines(artikelnummer="A1", von="2025-08-01")] == ["4712"]
+        assert [z["position"] for z in store.find_lines(rechnungsnummer="4711")] == [1, 2]
+        assert len(store.find_lines(limit=1)) == 1
+
+
+def test_erneut_gespeicherte_rechnung_ersetzt_die_alte(tmp_path):
+    path = str(tmp_path / "rechnungen.db")
+    with SqliteStore(path) as store:
+        store.add_invoice(rechnung("4711", "01.07.2025", [("A1", "302501", "10", "12,5"), ("A2", "302502", "2", "3,2")]), "klingspor")
+        store.add_invoice(rechnung("4711", "01.07.2025", [("A1", "302501", "10", "12,9")]), "klingspor")
+
+        zeilen = store.find_lines(rechnungsnummer="4711")
+        assert [(z["artikelnummer"], z["netto_ek"]) for z in zeilen] == [("A1", "12,9")]
+        assert store.conn.execute("SELECT COUNT(*) FROM rechnungen").fetchone() == (1,)
+
+
+def test_fehlende_spalte_wird_abgelehnt(tmp_path):
+    with SqliteStore(str(tmp_path / "rechnungen.db")) as store:
+        df = rechnung("4711", "01.07.2025", [("A1", "302501", "10", "12,5")]).drop(columns=["Netto-EK"])
+        assert not store.add_invoice(df, "klingspor")
+        assert not store.has_invoice("4711")
+
+
+def test_rechnungen_ohne_nummer_ersetzen_sich_nicht(tmp_path):
+    path = str(tmp_path / "rechnungen.db")
+    with SqliteStore(path) as store:
+        assert store.add_invoice(rechnung("N/A", "01.07.2025", [("A1", "302501", "10", "12,5")]), "klingspor", "a.pdf")
+        assert store.add_invoice(rechnung("N/A", "02.07.2025", [("A2", "302502", "2", "3,2")]), "klingspor", "b.pdf")
+        assert store.add_invoice(rechnung("", "03.07.2025", [("A3", "302503", "1", "7,0")]), "klingspor")
+        assert store.add_invoice(rechnung("", "04.07.2025", [("A4", "302504", "1", "8,0")]), "klingspor")
+        # Dieselbe Quelle erneut geparst: ersetzt nur ihre eigene Rechnung
+        assert store.add_invoice(rechnung("N/A", "01.07.2025", [("A1", "302501", "10", "12,9")]), "klingspor", "a.pdf")
+
+        assert store.conn.execute("SELECT COUNT(*) FROM rechnungen").fetchone() == (4,)
+        zeilen = store.find_lines(lieferant_key="klingspor")
+        assert sorted((z["artikelnummer"], z["netto_ek"]) for z in zeilen) == [
+            ("A1", "12,9"), ("A2", "3,2"), ("A3", "7,0"), ("A4", "8,0"),
+        ]
+        assert [z["rechnungsnummer"] for z in store.find_lines(artikelnummer="A2")] == ["N/A"]
+        assert not store.has_invoice("N/A")
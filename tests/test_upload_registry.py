@@ -0,0 +1,158 @@
+import multiprocessing
+import time
+from types import SimpleNamespace
+
+from file_handlers.upload_registry import UploadRegistry, content_hash
+
+
+class Anbieter:
+    """File API im Speicher: upload/fetch/delete wie genai.upload_file/get_file/delete_file."""
+
+    def __init__(self):
+        self.dateien = set()
+        self.uploads = 0
+
+    def upload(self, pdf_path):
+        self.uploads += 1
+        name = f"files/{self.uploads}"
+        self.dateien.add(name)
+        return SimpleNamespace(name=name)
+
+    def fetch(self, name):
+        if name not in self.dateien:
+            raise LookupError(name)
+        return SimpleNamespace(name=name)
+
+    def delete(self, name):
+        self.dateien.remove(name)
+
+
+def pdf(tmp_path, name, inhalt):
+    pfad = tmp_path / name
+    pfad.write_bytes(inhalt)
+    return str(pfad)
+
+
+def test_wiederverwendung_im_batch(tmp_path):
+    anbieter = Anbieter()
+    registry = UploadRegistry(str(tmp_path / "uploads.json"), batch="b1")
+    a = pdf(tmp_path, "a.pdf", b"%PDF a")
+
+    handle, wiederverwendet = registry.get_or_upload(a, anbieter.upload, anbieter.fetch)
+    assert (handle.name, wiederverwendet) == ("files/1", False)
+    handle, wiederverwendet = registry.get_or_upload(a, anbieter.upload, anbieter.fetch)
+    assert (handle.name, wiederverwendet) == ("files/1", True)
+
+    # Beim Anbieter bereits gelöscht: neu hochladen
+    anbieter.dateien.clear()
+    handle, wiederverwendet = registry.get_or_upload(a, anbieter.upload, anbieter.fetch)
+    assert (handle.name, wiederverwendet) == ("files/2", False)
+    assert anbieter.uploads == 2
+
+
+def test_cleanup_loescht_die_uploads_des_batches(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    anbieter = Anbieter()
+    a, b, c = (pdf(tmp_path, f"{name}.pdf", f"%PDF {name}".encode()) for name in "abc")
+
+    # Parallele Prozesse zweier Batches schreiben in dieselbe Registry
+    for batch, datei in (("b1", a), ("b1", b), ("b2", c)):
+        registry = UploadRegistry(path, batch=batch)
+        registry.get_or_upload(datei, anbieter.upload, anbieter.fetch)
+        registry.save()
+
+    assert UploadRegistry(path).cleanup(anbieter.delete, batch="b1") == 2
+    assert anbieter.dateien == {"files/3"}
+    rest = UploadRegistry(path)
+    assert rest.get(content_hash(a)) is None
+    assert rest.get(content_hash(c)) == "files/3"
+
+
+def test_wiederverwendeter_upload_gehoert_zum_neuen_batch(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    anbieter = Anbieter()
+    a = pdf(tmp_path, "a.pdf", b"%PDF a")
+
+    alt = UploadRegistry(path, batch="b1")
+    alt.get_or_upload(a, anbieter.upload, anbieter.fetch)
+    alt.save()
+    neu = UploadRegistry(path, batch="b2")
+    assert neu.get_or_upload(a, anbieter.upload, anbieter.fetch)[1]
+    neu.save()
+
+    assert UploadRegistry(path).cleanup(anbieter.delete, batch="b2") == 1
+    assert anbieter.dateien == set()
+
+
+def test_cleanup_ohne_batch_nur_abgelaufene(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    anbieter = Anbieter()
+    registry = UploadRegistry(path, batch="b1")
+    registry.get_or_upload(pdf(tmp_path, "a.pdf", b"%PDF a"), anbieter.upload, anbieter.fetch)
+    registry.get_or_upload(pdf(tmp_path, "b.pdf", b"%PDF b"), anbieter.upload, anbieter.fetch)
+    # Ein abgebrochener Batch von vor zwei Tagen
+    registry.put("alt", "files/alt", time.time() - 48 * 3600)
+    anbieter.dateien.add("files/alt")
+    registry.save()
+
+    assert UploadRegistry(path).cleanup(anbieter.delete) == 1
+    assert anbieter.dateien == {"files/1", "files/2"}
+    assert UploadRegistry(path).cleanup(anbieter.delete, alle=True) == 2
+    assert anbieter.dateien == set()
+
+
+def test_ohne_batch_bleibt_der_upload_stehen(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    anbieter = Anbieter()
+    a = pdf(tmp_path, "a.pdf", b"%PDF a")
+
+    batch = UploadRegistry(path, batch="b1")
+    batch.get_or_upload(a, anbieter.upload, anbieter.fetch)
+    batch.save()
+
+    # Ein einzelner Aufruf nutzt den Upload des Batches, ohne ihn zu übernehmen
+    einzeln = UploadRegistry(path, batch="")
+    assert einzeln.get_or_upload(a, anbieter.upload, anbieter.fetch) == (SimpleNamespace(name="files/1"), True)
+    einzeln.save()
+    assert UploadRegistry(path).uploads[content_hash(a)]["batch"] == "b1"
+
+    # Eigene Uploads ohne Batch stehen dem nächsten Aufruf zur Verfügung
+    b = pdf(tmp_path, "b.pdf", b"%PDF b")
+    einzeln.get_or_upload(b, anbieter.upload, anbieter.fetch)
+    einzeln.save()
+    assert UploadRegistry(path, batch="").get_or_upload(b, anbieter.upload, anbieter.fetch)[1]
+    assert UploadRegistry(path).cleanup(anbieter.delete, batch="b1") == 1
+    assert anbieter.dateien == {"files/2"}
+
+
+def test_cleanup_loescht_keine_uploads_eines_anderen_batches(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    anbieter = Anbieter()
+    a = pdf(tmp_path, "a.pdf", b"%PDF a")
+
+    alt = UploadRegistry(path, batch="b1")
+    alt.get_or_upload(a, anbieter.upload, anbieter.fetch)
+    alt.save()
+    # Ein laufender zweiter Batch übernimmt den Upload, während b1 noch seinen alten Stand im Speicher hat
+    UploadRegistry(path, batch="b2").get_or_upload(a, anbieter.upload, anbieter.fetch)
+
+    assert alt.cleanup(anbieter.delete, batch="b1") == 0
+    assert anbieter.dateien == {"files/1"}
+    assert UploadRegistry(path).uploads[content_hash(a)]["batch"] == "b2"
+
+
+def _registriere(path: str, nummer: int):
+    for i in range(20):
+        registry = UploadRegistry(path, batch="b1")
+        registry.put(f"{nummer}-{i}", f"files/{nummer}-{i}")
+        registry.save()
+
+
+def test_paralleles_speichern(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    prozesse = [multiprocessing.Process(target=_registriere, args=(path, nummer)) for nummer in range(4)]
+    for prozess in prozesse:
+        prozess.start()
+    for prozess in prozesse:
+        prozess.join()
+    assert len(UploadRegistry(path).uploads) == 80
@@ -0,0 +1,128 @@
+"""
+Regressionstests der auf parsers.line_engine umgestellten Lieferanten-Parser: fester extrahierter Text
+je Lieferant, erwartet werden genau die Zeilen, die die Parser vor der Umstellung geliefert haben.
+"""
+import pytest
+
+from helpers.constants import INVOICE_COLUMNS
+from file_handlers.pdf_handler import get_parser
+
+NORTON_SEITEN = [
+    """Saint-Gobain Abrasives GmbH
+RECHNUNGSDATUM 12.03.2025
+RECHNUNGSNUMMER 90001
+50937 Koeln
+1 66254411 20 ST 3,00
+12 60,00
+PRODUKT Vulcan Disc
+125x1
+Nettogewicht 1 kg
+Auftragsnummer: 5555 vom 01.02.2025 Ihre Bestellung AU-1
+SKU ABC-1
+2 66254412 10 ST""",
+    """Saint-Gobain Abrasives GmbH Seite 2
+RECHNUNGSNUMMER 90001
+PRODUKTBEZEICHNUNG
+1 100,00
+BISHERIGE / KUNDEN ART. NR.: xyz
+Disc 2
+Nettogewicht 2 kg
+3 66254413 1 ST 7,00 7,00
+Saint-Gobain Abrasives GmbH Seite 3
+PRODUKTBEZEICHNUNG
+Disc 3
+Nettogewicht 3 kg
+Ende""",
+]
+NORTON_ZEILEN = [
+    ["AU-1", "90001", "5555", "Saint-Gobain Abrasives GmbH", "11.04.2025", "12.03.2025", "ABC-1", "66254411", "PRODUKT Vulcan Disc 125x1", "N/A", "20", "3,0", "19"],
+    ["N/A", "90001", "N/A", "Saint-Gobain Abrasives GmbH", "11.04.2025", "12.03.2025", "N/A", "66254412", "Disc 2", "N/A", "10", "10,0", "19"],
+    ["N/A", "90001", "N/A", "Saint-Gobain Abrasives GmbH", "11.04.2025", "12.03.2025", "N/A", "66254413", "Disc 3", "N/A", "1", "7,0", "19"],
+]
+
+BOSCH_SEITEN = [
+    """Robert Bosch Power Tools GmbH
+70538 Stuttgart, Deutschland
+Rechnung 12.03.2025 9100001
+Ihre Bestellung AU-77
+Unser(e) Standardauftr. 123 456
+10 2.608.601.234 5 ST 12,00 60,00
+Trennscheibe X
+125 mm
+(D) Ursprung
+20 2.608.601.235 2 ST 5,00 10,00
+Schruppscheibe
+(L) x
+Auftragspauschale
+Pauschale 1 15,00
+Ihre Bestellung AU-78
+Ende""",
+]
+BOSCH_ZEILEN = [
+    ["AU-77", "9100001", "123, 456", "Robert Bosch Power Tools GmbH", "26.03.2025", "12.03.2025", "N/A", "2.608.601.234", "Trennscheibe X", "N/A", "5", "12,0", "19"],
+    ["AU-78", "9100001", "123, 456", "Robert Bosch Power Tools GmbH", "26.03.2025", "12.03.2025", "N/A", "2.608.601.235", "Schruppscheibe", "N/A", "2", "5,0", "19"],
+    ["AU-78", "9100001", "123, 456", "Robert Bosch Power Tools GmbH", "26.03.2025", "12.03.2025", "N/A", "N/A", "Auftragspauschale", "N/A", "1", "15,0", "19"],
+]
+
+RHODIUS_SEITEN = [
+    """Rechnung: RE-555 Datum : 12.03.2025
+VK-Auftrag Nr 4711 vom AU-99
+1 800123 10,000 ST 5,00 50,00
+Scheibe A
+Zusatz
+2 800124 800125 3,000 ST 1,00 3,00
+Scheibe B
+AU2025-1
+4,90
+PORTO / FRACHTKOSTEN""",
+]
+RHODIUS_ZEILEN = [
+    ["AU-99", "RE-555", "4711 vom", "RHODIUS Abrasives GmbH", "26.03.2025", "12.03.2025", "N/A", "800123", "Scheibe A Zusatz", "N/A", "10,000", "5,0", "19"],
+    ["AU-99", "RE-555", "4711 vom", "RHODIUS Abrasives GmbH", "26.03.2025", "12.03.2025", "N/A", "800124, 800125", "Scheibe B", "N/A", "3,000", "1,0", "19"],
+    ["AU-99", "RE-555", "N/A", "RHODIUS Abrasives GmbH", "26.03.2025", "12.03.2025", "N/A", "900101", "Porto / Frachtkosten", "N/A", "1", "4,9", "19"],
+]
+
+# Zwei Seiten, zweiter VK-Auftrag und Seitenumbruch innerhalb einer Artikelbezeichnung
+RHODIUS_SEITENUMBRUCH_SEITEN = [
+    """RHODIUS Schleifwerkzeuge GmbH & Co. KG
+Rechnung: 2025-10417 Datum : 01.10.2025
+VK-Auftrag Nr 334455 vom 22.09.2025 AU2025-88
+Pos Artikel Menge Einheit Preis Betrag
+1 211431 25,000 ST 1,62 40,50
+XT70 125 x 1,0 x 22,23
+Trennscheibe
+2 207834 100,000 ST 0,49 49,00
+FS 40 Fächerschleifscheibe""",
+    """Seite 2
+VK-Auftrag Nr 334456 vom 23.09.2025 AU2025-89
+3 303101 303102 5,000 ST 3,10 15,50
+Topfbürste
+AU2025-89
+Nettowarenwert 105,00
+8,90
+PORTO / FRACHTKOSTEN
+Gesamt 113,90""",
+]
+RHODIUS_SEITENUMBRUCH_ZEILEN = [
+    ["AU2025-88", "2025-10417", "334455 vom", "RHODIUS Abrasives GmbH", "15.10.2025", "01.10.2025", "N/A", "211431", "XT70 125 x 1,0 x 22,23 Trennscheibe", "N/A", "25,000", "1,62", "19"],
+    ["AU2025-89", "2025-10417", "334456 vom", "RHODIUS Abrasives GmbH", "15.10.2025", "01.10.2025", "N/A", "207834", "FS 40 Fächerschleifscheibe Seite 2 VK-Auftrag Nr 334456 vom 23.09.2025 AU2025-89", "N/A", "100,000", "0,49", "19"],
+    ["AU2025-89", "2025-10417", "334456 vom", "RHODIUS Abrasives GmbH", "15.10.2025", "01.10.2025", "N/A", "303101, 303102", "Topfbürste", "N/A", "5,000", "3,1", "19"],
+    ["AU2025-89", "2025-10417", "N/A", "RHODIUS Abrasives GmbH", "15.10.2025", "01.10.2025", "N/A", "900101", "Porto / Frachtkosten", "N/A", "1", "8,9", "19"],
+]
+
+
+@pytest.mark.parametrize("firma, seiten, rechnungsnummer, zeilen", [
+    ("norton", NORTON_SEITEN, "90001", NORTON_ZEILEN),
+    ("bosch", BOSCH_SEITEN, "9100001", BOSCH_ZEILEN),
+    ("rhodius", RHODIUS_SEITEN, "RE-555", RHODIUS_ZEILEN),
+    ("rhodius", RHODIUS_SEITENUMBRUCH_SEITEN, "2025-10417", RHODIUS_SEITENUMBRUCH_ZEILEN),
+])
+def test_rechnungszeilen(monkeypatch, firma, seiten, rechnungsnummer, zeilen):
+    # extract_pdf_text schließt jede Seite mit "\n" ab
+    monkeypatch.setattr("parsers.line_engine.extract_pdf_text", lambda pdf_path: "".join(seite + "\n" for seite in seiten))
+
+    df, nummer = get_parser(firma, "invoice").parse("rechnung.pdf")
+
+    assert nummer == rechnungsnummer
+    assert list(df.columns) == INVOICE_COLUMNS
+    assert df.values.tolist() == zeilen
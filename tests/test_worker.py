@@ -0,0 +1,63 @@
+import multiprocessing
+import threading
+import time
+
+from helpers.worker import RecyclingWorker, Watchdog
+
+# Hält ein anderer Thread dieses Lock, während ein Worker startet, darf der Worker es nicht gesperrt erben
+_lock = threading.Lock()
+
+
+def _sperren() -> bool:
+    if not _lock.acquire(timeout=1):
+        return False
+    _lock.release()
+    return True
+
+
+def test_worker_aus_einem_thread_erbt_keine_gesperrten_locks():
+    ergebnisse = []
+
+    def verarbeite():
+        with RecyclingWorker(timeout=10, max_documents=1) as worker:
+            for _ in range(2):
+                worker.begin_document()
+                ergebnisse.append(worker.run("lock", _sperren)[:2])
+                worker.end_document()
+
+    with _lock:
+        thread = threading.Thread(target=verarbeite)
+        thread.start()
+        thread.join()
+    assert ergebnisse == [(True, None), (True, None)]
+
+
+def _einzelner_prozess(path: str, vor_der_ausgabe: float, ausgabe_dauer: float):
+    """Prozess mit Watchdog wie fibu_invoice_parser.main: Timeout-Ergebnis oder Ergebnis nach path."""
+    def schreibe(text):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    watchdog = Watchdog(lambda timeout: schreibe("timeout"), timeout=0.5).start()
+    time.sleep(vor_der_ausgabe)
+    with watchdog.final_output():
+        time.sleep(ausgabe_dauer)
+        schreibe("ergebnis")
+
+
+def _ausgabe(tmp_path, vor_der_ausgabe: float, ausgabe_dauer: float) -> list[str]:
+    path = tmp_path / "stdout.txt"
+    prozess = multiprocessing.Process(target=_einzelner_prozess, args=(str(path), vor_der_ausgabe, ausgabe_dauer))
+    prozess.start()
+    prozess.join(timeout=10)
+    assert prozess.exitcode == 0
+    return path.read_text(encoding="utf-8").split()
+
+
+def test_watchdog_schreibt_nicht_nach_dem_ergebnis(tmp_path):
+    # Das Budget läuft während der Ausgabe ab
+    assert _ausgabe(tmp_path, 0.2, 1.0) == ["ergebnis"]
+
+
+def test_kein_ergebnis_nach_dem_timeout(tmp_path):
+    assert _ausgabe(tmp_path, 1.5, 0.0) == ["timeout"]